@@ -0,0 +1,152 @@
+"""
+Module: archive_cache.py
+Purpose: Persistent on-disk cache of archive API responses, keyed by a hash of the request
+Used by: archive_fetcher.py, historical_weather.py
+Author: Dom Barry
+
+Example (evict entries older than a year, then trim the cache to 500 MB):
+    python analysis/archive_cache.py --max-age-days 365 --max-size-mb 500
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from weather_config import DATA_DIR
+
+# Define file paths
+CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'archive')
+
+def normalise_coordinates(value):
+    """Rounds a coordinate (or comma separated list) to 4 decimal places (~10m)"""
+    return [round(float(item), 4) for item in str(value).split(',')]
+
+def normalise_variables(value):
+    """Returns variables as a sorted list whether given as a list or comma separated string"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return sorted(value)
+
+def cache_key(params, base_url=''):
+    """
+    Builds a stable hash for a request so that equivalent requests share a cache entry
+    Parameter order, variable order and coordinate formatting do not change the key
+    """
+    normalised = {
+        'endpoint': base_url,
+        'latitude': normalise_coordinates(params['latitude']),
+        'longitude': normalise_coordinates(params['longitude']),
+        'start_date': str(params['start_date']),
+        'end_date': str(params['end_date']),
+        'daily': normalise_variables(params.get('daily')),
+        'hourly': normalise_variables(params.get('hourly')),
+        'timezone': params.get('timezone', 'GMT')
+    }
+    encoded = json.dumps(normalised, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+class ArchiveCache:
+    """
+    Stores each response as gzip-compressed JSON under cache_dir/<key[:2]>/<key>.json.gz
+    - cache_only: never go to the network; misses are reported as failures
+    - max_bytes / max_age_days: limits applied by evict()
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, cache_only=False, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.cache_only = cache_only
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json.gz')
+
+    def get(self, params, base_url=''):
+        """Returns the cached response for a request, or None on a miss"""
+        path = self.path_for(cache_key(params, base_url))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, EOFError, OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Touch the entry so size-based eviction removes least recently used first
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, params, data, base_url=''):
+        """Stores a response, writing to a temporary file first so entries are never partial"""
+        path = self.path_for(cache_key(params, base_url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=9) as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def entries(self):
+        """Lists (path, size, last used time) for every cache entry"""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.json.gz'):
+                    path = os.path.join(root, filename)
+                    stat = os.stat(path)
+                    found.append((path, stat.st_size, stat.st_mtime))
+        return found
+
+    def evict(self, max_bytes=None, max_age_days=None):
+        """
+        Removes entries unused for more than max_age_days, then removes the least
+        recently used entries until the cache is no larger than max_bytes
+        Returns the number of entries removed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        removed = 0
+
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 86400
+            while entries and entries[0][2] < cutoff:
+                os.remove(entries.pop(0)[0])
+                removed += 1
+
+        if max_bytes is not None:
+            total_bytes = sum(size for _, size, _ in entries)
+            while entries and total_bytes > max_bytes:
+                path, size, _ = entries.pop(0)
+                os.remove(path)
+                total_bytes -= size
+                removed += 1
+
+        return removed
+
+def main(argv=None):
+    """
+    Reports cache size and applies any requested eviction limits
+    """
+    parser = argparse.ArgumentParser(description='Inspect and evict the archive response cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--max-size-mb', type=float)
+    parser.add_argument('--max-age-days', type=float)
+    args = parser.parse_args(argv)
+
+    cache = ArchiveCache(args.cache_dir)
+    max_bytes = args.max_size_mb * 1024 * 1024 if args.max_size_mb is not None else None
+    removed = cache.evict(max_bytes, args.max_age_days)
+    entries = cache.entries()
+    print(f"Removed {removed} entries")
+    print(f"Cache now holds {len(entries)} entries ({sum(size for _, size, _ in entries) / 1024 / 1024:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Module: archive_fetcher.py
+Purpose: Concurrent Open-Meteo archive client with a shared token-bucket rate limiter
+Used by: historical_weather.py
+Author: Dom Barry
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from run_metrics import RunMetrics
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+# Open-Meteo free tier quotas, measured in API calls
+RATE_LIMITS = {
+    'per_minute': 600,
+    'per_hour': 5000,
+    'per_day': 10000
+}
+
+# Open-Meteo counts a request as several calls once it covers more than
+# 2 weeks or 10 variables per location
+CALL_DAYS = 14
+CALL_VARIABLES = 10
+
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 5
+BACKOFF_BASE = 2  # seconds, doubled on each retry
+BACKOFF_CAP = 300  # never wait longer than 5 minutes between retries
+REQUEST_TIMEOUT = 60
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at capacity/period tokens per second
+    A request costing more than the capacity waits for a full bucket and leaves it in debt,
+    so later requests wait until the whole cost has been refilled
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        """Seconds until a request of this cost may start (0 if it may start now)"""
+        self._refill()
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            return 0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, cost):
+        self.tokens -= cost
+
+class RateLimiter:
+    """
+    Enforces the per-minute, per-hour and per-day quotas across all workers
+    A 429 response pauses every worker, not just the one that received it
+    """
+
+    def __init__(self, limits=None):
+        limits = {**RATE_LIMITS, **(limits or {})}
+        periods = {'per_minute': 60, 'per_hour': 3600, 'per_day': 86400}
+        self.buckets = [TokenBucket(limits[name], periods[name]) for name in periods if name in limits]
+        self.blocked_until = 0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Blocks all new requests for the given number of seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self, cost=1):
+        """Waits until a request of the given cost fits within every quota, then charges it"""
+        while True:
+            # The lock only covers checking and charging the buckets, so waiting workers never queue behind a sleeper
+            async with self.lock:
+                wait = max(
+                    [self.blocked_until - time.monotonic()] +
+                    [bucket.wait_time(cost) for bucket in self.buckets]
+                )
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket.consume(cost)
+                    return
+            await asyncio.sleep(wait)
+
+def build_archive_params(lat, long, start_date, end_date, daily=None, timezone='Europe/London', hourly=None):
+    """
+    Builds the archive API query parameters for one location and date range
+    - hourly: hourly variables to request instead of the daily aggregates
+    """
+    params = {
+        'latitude': float(lat),
+        'longitude': float(long),
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'timezone': timezone
+    }
+    if hourly:
+        params['hourly'] = list(hourly)
+    else:
+        params['daily'] = daily or ['temperature_2m_max', 'temperature_2m_min', 'precipitation_sum', 'rain_sum',
+                                    'windspeed_10m_max']
+    return params
+
+def build_multi_location_params(cells, start_date, end_date, daily=None, timezone='Europe/London', hourly=None):
+    """
+    Builds one archive request for many locations sharing a date range
+    The API takes comma separated latitude/longitude lists and returns one result per location
+    """
+    params = build_archive_params(0, 0, start_date, end_date, daily, timezone, hourly)
+    params['latitude'] = ','.join(str(lat) for lat, _ in cells)
+    params['longitude'] = ','.join(str(long) for _, long in cells)
+    return params
+
+def split_locations(weather_data, location_count):
+    """
+    Splits a multi-location response into one payload per location
+    Single-location responses come back as an object rather than a list
+    """
+    if weather_data is None:
+        return [None] * location_count
+    if isinstance(weather_data, dict):
+        return [weather_data]
+    return list(weather_data)
+
+def estimate_call_weight(params):
+    """
+    Estimates how many API calls the provider will charge for a request
+    Each location counts separately, scaled up for long spans or many variables
+    """
+    days = (date.fromisoformat(params['end_date']) - date.fromisoformat(params['start_date'])).days + 1
+    variables = len(params.get('daily') or []) + len(params.get('hourly') or [])
+    locations = len(str(params['latitude']).split(','))
+    return locations * max(1.0, days / CALL_DAYS) * max(1.0, variables / CALL_VARIABLES)
+
+def backoff_delay(attempt):
+    """Exponential back-off with full jitter"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def parse_retry_after(value):
+    """
+    Reads a Retry-After header given either as seconds or as an HTTP date
+    Returns None if the header is missing or unreadable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def create_session(concurrency=MAX_CONCURRENCY):
+    """Creates a keep-alive HTTP session with one pooled connection per worker"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+async def fetch_json(session, executor, limiter, params, base_url=ARCHIVE_URL, max_retries=MAX_RETRIES,
+                     metrics=None):
+    """
+    Fetches one archive request, retrying on rate limits, server errors and
+    connection problems. Returns the decoded JSON or None if all retries fail
+    - metrics: RunMetrics recording latency, bytes, retries and time spent waiting (see run_metrics.py)
+    """
+    loop = asyncio.get_running_loop()
+    cost = estimate_call_weight(params)
+    metrics = metrics or RunMetrics('fetch')
+
+    for attempt in range(max_retries):
+        # Time held back by the quotas (or a 429 pause) is kept apart from time on the network
+        waiting = time.monotonic()
+        await limiter.acquire(cost)
+        started = time.monotonic()
+        metrics.increment('quota_wait_seconds', started - waiting)
+        metrics.increment('requests')
+        metrics.increment('call_weight', cost)
+        try:
+            response = await loop.run_in_executor(
+                executor, lambda: session.get(base_url, params=params, timeout=REQUEST_TIMEOUT)
+            )
+        except requests.exceptions.RequestException as e:
+            metrics.increment('network_seconds', time.monotonic() - started)
+            metrics.increment('connection_errors')
+            print(f"Error fetching data: {e}")
+            wait_time = backoff_delay(attempt)
+        else:
+            elapsed = time.monotonic() - started
+            metrics.observe('request_latency_seconds', elapsed)
+            metrics.increment('network_seconds', elapsed)
+            metrics.increment('bytes_received', len(response.content))
+            if response.status_code == 429:
+                metrics.increment('rate_limited')
+                # Honour the server's Retry-After and hold back every worker
+                wait_time = parse_retry_after(response.headers.get('Retry-After'))
+                if wait_time is None:
+                    wait_time = backoff_delay(attempt)
+                limiter.pause(wait_time)
+                print(f"Rate limit hit. Waiting {wait_time:.1f} seconds...")
+            elif response.status_code >= 500:
+                metrics.increment('server_errors')
+                wait_time = backoff_delay(attempt)
+                print(f"Server error {response.status_code}")
+            elif response.status_code >= 400:
+                metrics.increment('client_errors')
+                metrics.increment('failed_requests')
+                print(f"Error fetching data: {response.status_code} {response.text[:200]}")
+                return None
+            else:
+                return response.json()
+
+        if attempt < max_retries - 1:
+            print(f"Retrying in {wait_time:.1f} seconds...")
+            metrics.increment('retries')
+            metrics.increment('backoff_seconds', wait_time)
+            await asyncio.sleep(wait_time)
+    metrics.increment('failed_requests')
+    return None
+
+async def _fetch_all(params_list, concurrency, limits, base_url, max_retries, cache, on_result, metrics):
+    limiter = RateLimiter(limits)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(params):
+        if cache is not None:
+            data = cache.get(params, base_url)
+            if data is not None:
+                metrics.increment('cache_hits')
+            if data is not None or cache.cache_only:
+                return data
+        async with semaphore:
+            data = await fetch_json(session, executor, limiter, params, base_url, max_retries, metrics)
+        if data is not None and cache is not None:
+            cache.put(params, data, base_url)
+        return data
+
+    async def worker(position, params):
+        data = await fetch_one(params)
+        if on_result is None:
+            return data
+        # Hand the response over as soon as it arrives rather than holding every result
+        on_result(position, data)
+        return data is not None
+
+    with create_session(concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(*(worker(position, params) for position, params in enumerate(params_list)))
+
+def fetch_all(params_list, concurrency=MAX_CONCURRENCY, limits=None, base_url=ARCHIVE_URL, max_retries=MAX_RETRIES,
+              cache=None, on_result=None, metrics=None):
+    """
+    Fetches many archive requests concurrently within the provider's quotas
+    Returns results in the same order as params_list (None for failures)
+    Parameters:
+    - concurrency: maximum number of requests in flight (None for MAX_CONCURRENCY)
+    - limits: quota overrides, e.g. {'per_minute': 600, 'per_hour': 5000}
+    - base_url: archive endpoint, or None for ARCHIVE_URL (point at mock_archive_server.py for local runs)
+    - cache: optional archive_cache.ArchiveCache checked before each request
+    - on_result: optional callback(position, data) called as each request completes;
+      results are then not kept and a list of success flags is returned instead
+    - metrics: optional run_metrics.RunMetrics to record request latency, retries, 429s,
+      bytes received and time spent waiting on quotas, back-off and the network
+    """
+    if not params_list:
+        return []
+    concurrency = concurrency or MAX_CONCURRENCY
+    base_url = base_url or ARCHIVE_URL
+    metrics = metrics or RunMetrics('fetch')
+    return asyncio.run(_fetch_all(params_list, concurrency, limits, base_url, max_retries, cache, on_result, metrics))
@@ -0,0 +1,141 @@
+"""
+Module: checkpoint_manifest.py
+Purpose: Transactional record of completed (festival_id, year) windows for resumable collection
+Used by: historical_weather.py
+Author: Dom Barry
+
+Rows for each window are appended to a part file for the current run, and a
+SQLite manifest records where they landed only once they are safely on disk.
+A crash can therefore lose at most the windows still in flight, and the final
+dataset is built by copying each window's bytes in key order, without parsing
+or re-sorting the part files.
+"""
+
+import io
+import os
+import sqlite3
+import time
+
+import pyarrow.csv as pa_csv
+
+# Column order of the historical weather dataset
+COLUMNS = [
+    'festival_id', 'festival_name', 'historical_year', 'calendar_date', 'full_date',
+    'max_temp_c', 'min_temp_c', 'rainfall_mm', 'total_precipitation_mm', 'max_windspeed_kmh',
+    'lat', 'long'
+]
+
+# Part files hold headerless CSV rows; combine() writes the single header
+WRITE_OPTIONS = pa_csv.WriteOptions(include_header=False, quoting_style='needed')
+
+class CheckpointManifest:
+    """
+    Tracks completed windows in checkpoint_dir/manifest.sqlite
+    Each run appends to its own part file, so concurrent or interrupted runs never overwrite each other
+    """
+
+    def __init__(self, checkpoint_dir):
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(checkpoint_dir, 'manifest.sqlite'))
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS windows (
+                festival_id INTEGER NOT NULL,
+                historical_year INTEGER NOT NULL,
+                part_file TEXT NOT NULL,
+                byte_offset INTEGER NOT NULL,
+                byte_length INTEGER NOT NULL,
+                record_count INTEGER NOT NULL,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (festival_id, historical_year)
+            )
+        ''')
+        self.connection.commit()
+        self.part_file = f'part_{time.strftime("%Y%m%d_%H%M%S")}_{os.getpid()}.csv'
+        self.part_handle = None
+
+    def completed_windows(self):
+        """Returns the set of (festival_id, year) windows already saved"""
+        rows = self.connection.execute('SELECT festival_id, historical_year FROM windows')
+        return set(rows)
+
+    def record_windows(self, windows):
+        """
+        Saves completed windows in a single transaction
+        - windows: list of (festival_id, year, batch) where batch is a pyarrow RecordBatch with COLUMNS
+        Returns the number of records written
+        """
+        if not windows:
+            return 0
+        if self.part_handle is None:
+            self.part_handle = open(os.path.join(self.checkpoint_dir, self.part_file), 'ab')
+
+        # Append every window's rows, remembering where each one starts
+        entries = []
+        completed_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        for festival_id, year, batch in windows:
+            buffer = io.BytesIO()
+            pa_csv.write_csv(batch.select(COLUMNS), buffer, WRITE_OPTIONS)
+            data = buffer.getvalue()
+            offset = self.part_handle.tell()
+            self.part_handle.write(data)
+            entries.append((int(festival_id), int(year), self.part_file, offset, len(data), batch.num_rows, completed_at))
+
+        # Data must be on disk before the manifest points at it
+        self.part_handle.flush()
+        os.fsync(self.part_handle.fileno())
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO windows VALUES (?, ?, ?, ?, ?, ?, ?)', entries)
+        return sum(entry[5] for entry in entries)
+
+    def forget_windows(self, keys):
+        """Removes (festival_id, year) windows so the next run fetches them again"""
+        with self.connection:
+            self.connection.executemany(
+                'DELETE FROM windows WHERE festival_id = ? AND historical_year = ?',
+                [(int(festival_id), int(year)) for festival_id, year in keys]
+            )
+
+    def combine(self, output_file, first_id=None, last_id=None):
+        """
+        Writes every saved window (optionally limited to a festival_id range) to output_file
+        Windows are copied in (festival_id, year) order straight from the part files
+        Returns (record count, sorted list of festival ids)
+        """
+        query = 'SELECT festival_id, part_file, byte_offset, byte_length, record_count FROM windows'
+        params = ()
+        if first_id is not None and last_id is not None:
+            query += ' WHERE festival_id BETWEEN ? AND ?'
+            params = (int(first_id), int(last_id))
+        rows = self.connection.execute(query + ' ORDER BY festival_id, historical_year', params)
+
+        if self.part_handle is not None:
+            self.part_handle.flush()
+
+        total_records = 0
+        festival_ids = []
+        handles = {}
+        temp_file = f'{output_file}.tmp'
+        try:
+            with open(temp_file, 'wb') as out:
+                out.write((','.join(COLUMNS) + '\n').encode('utf-8'))
+                for festival_id, part_file, offset, length, record_count in rows:
+                    if part_file not in handles:
+                        handles[part_file] = open(os.path.join(self.checkpoint_dir, part_file), 'rb')
+                    handle = handles[part_file]
+                    handle.seek(offset)
+                    out.write(handle.read(length))
+                    total_records += record_count
+                    if not festival_ids or festival_ids[-1] != festival_id:
+                        festival_ids.append(festival_id)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        os.replace(temp_file, output_file)
+        return total_records, festival_ids
+
+    def close(self):
+        if self.part_handle is not None:
+            self.part_handle.close()
+            self.part_handle = None
+        self.connection.close()
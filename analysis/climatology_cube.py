@@ -0,0 +1,377 @@
+"""
+Module: climatology_cube.py
+Purpose: A gridded UK daily climatology for scoring any location and date window without the network
+Used by: run directly to build the cube and score new or hypothetical events
+Author: Dom Barry
+
+The cube holds, for every point of a regular lat/long grid over the UK and every
+calendar day, the same mergeable statistics festival_stats.py keeps per festival
+and year (days, rain days and each measure's count, mean, sum of squared
+deviations, min and max across the historical years). It is filled once from the archive API through
+archive_fetcher.fetch_all, packing many grid points into each request, and saved
+as .npy arrays under data/climatology_cube that are memory-mapped when opened.
+
+An event is scored by merging the statistics of its days at the four grid points
+around it, weighted bilinearly, into a festival state. That state goes through the
+summary script's festival_metrics_from_states and calculate_weather_scores along
+with every festival in festivals.csv scored the same way, so the event's weather
+score and rank are directly comparable. A lookup takes milliseconds.
+
+Only the festival season is collected by default, as the API charges a call per
+location for every 14 days: the default half-degree grid from May to September
+costs about 145,000 calls, which the quota limiter spreads over roughly 15 days
+on the free tier. Responses are kept in the archive cache, so an interrupted build
+resumes without refetching; points with missing years are reported after the build.
+
+Example:
+    python analysis/climatology_cube.py --build
+    python analysis/climatology_cube.py 51.50 -0.12 19/06/2025 22/06/2025 --name "Hyde Park event"
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from archive_cache import ArchiveCache
+from archive_fetcher import (ARCHIVE_URL, MAX_CONCURRENCY, build_multi_location_params, estimate_call_weight,
+                             fetch_all, split_locations)
+from festival_calendar import HISTORICAL_YEARS
+from festival_stats import RAIN_THRESHOLD_MM, STATE_COLUMNS, merge_moments
+from run_metrics import RunMetrics
+from weather_config import DATA_DIR, replace_directory
+from weather_store import DAILY_VARIABLES, MEASURE_COLUMNS
+
+# Define file paths
+CUBE_DIR = os.path.join(DATA_DIR, 'climatology_cube')
+FESTIVALS_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+
+# Grid covering Great Britain and Northern Ireland (lat min, lat max, long min, long max)
+UK_BOUNDS = (49.9, 60.9, -8.2, 1.8)
+
+# Degrees between grid points (the archive's ERA5 grid is 0.25)
+DEFAULT_RESOLUTION = 0.5
+
+# First and last month collected
+DEFAULT_MONTHS = (5, 9)
+
+# Grid points packed into one request
+LOCATIONS_PER_REQUEST = 50
+
+# Statistics kept per grid point and calendar day, named as in festival_stats.partial_states
+STAT_FIELDS = STATE_COLUMNS
+
+# Calendar days are numbered 0-365 through a leap year, so 29 February has its own slot
+LEAP_MONTH_STARTS = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+CALENDAR_DAYS = 366
+
+def day_slots(dates):
+    """Calendar day slot (0-365) of each date in an array of datetime64 values"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    month_numbers = months.astype('int64') % 12
+    return LEAP_MONTH_STARTS[month_numbers] + (dates - months.astype('datetime64[D]')).astype('int64')
+
+def grid_axes(bounds=UK_BOUNDS, resolution=DEFAULT_RESOLUTION):
+    """Latitudes and longitudes of the grid, snapped to multiples of the resolution"""
+    lat_min, lat_max, long_min, long_max = bounds
+
+    def axis(low, high):
+        first, last = np.ceil(low / resolution), np.floor(high / resolution)
+        return np.round(np.arange(first, last + 1) * resolution, 4)
+
+    return axis(lat_min, lat_max), axis(long_min, long_max)
+
+def season_spans(months=DEFAULT_MONTHS, years=HISTORICAL_YEARS):
+    """One (start, end) date span per year covering the given months"""
+    first, last = months
+    spans = []
+    for year in years:
+        end = date(year + 1, 1, 1) if last == 12 else date(year, last + 1, 1)
+        spans.append((date(year, first, 1), date.fromordinal(end.toordinal() - 1)))
+    return spans
+
+def plan_cube_requests(lats, longs, spans, locations_per_request=LOCATIONS_PER_REQUEST):
+    """
+    Packs every grid point and season span into multi-location requests
+    Returns a list of dicts with cells ((row, column) grid positions), coordinates and start/end dates
+    """
+    points = [(row, column) for row in range(len(lats)) for column in range(len(longs))]
+    plan = []
+    for start_date, end_date in spans:
+        for first in range(0, len(points), locations_per_request):
+            cells = points[first:first + locations_per_request]
+            plan.append({
+                'cells': cells,
+                'coordinates': [(float(lats[row]), float(longs[column])) for row, column in cells],
+                'start_date': start_date,
+                'end_date': end_date
+            })
+    return plan
+
+def empty_stats(shape):
+    """Statistics array ready to accumulate into (zero counts and moments, +/-inf minima and maxima)"""
+    stats = np.zeros(shape + (CALENDAR_DAYS, len(STAT_FIELDS)), dtype='float64')
+    for position, field in enumerate(STAT_FIELDS):
+        if field.endswith('_min'):
+            stats[..., position] = np.inf
+        elif field.endswith('_max'):
+            stats[..., position] = -np.inf
+    return stats
+
+def accumulate_payload(block, payload, rain_threshold=RAIN_THRESHOLD_MM):
+    """
+    Adds one location's daily archive payload to its (calendar day x field) statistics block
+    The payload's per-day count, mean and M2 are merged into the block's with festival_stats.merge_moments
+    Returns False if the payload holds no daily data
+    """
+    if not payload or not payload.get('daily') or not payload['daily'].get('time'):
+        return False
+    daily = payload['daily']
+    slots = day_slots(daily['time'])
+    fields = {field: position for position, field in enumerate(STAT_FIELDS)}
+
+    block[:, fields['days']] += np.bincount(slots, minlength=CALENDAR_DAYS)
+    rain = np.array(daily[DAILY_VARIABLES['rainfall_mm']], dtype='float64')
+    block[:, fields['rain_days']] += np.bincount(slots, weights=rain > rain_threshold, minlength=CALENDAR_DAYS)
+    for measure in MEASURE_COLUMNS:
+        values = np.array(daily[DAILY_VARIABLES[measure]], dtype='float64')
+        present = ~np.isnan(values)
+        present_slots, values = slots[present], values[present]
+        count = np.bincount(present_slots, minlength=CALENDAR_DAYS).astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(present_slots, weights=values, minlength=CALENDAR_DAYS) / count
+        deviations = values - mean[present_slots]
+        m2 = np.bincount(present_slots, weights=deviations * deviations, minlength=CALENDAR_DAYS)
+        columns = [fields[f'{measure}_{stat}'] for stat in ('count', 'mean', 'm2')]
+        parts = [np.stack([block[:, column], new]) for column, new in zip(columns, (count, mean, m2))]
+        block[:, columns] = np.column_stack(merge_moments(*parts))
+        np.minimum.at(block[:, fields[f'{measure}_min']], present_slots, values)
+        np.maximum.at(block[:, fields[f'{measure}_max']], present_slots, values)
+    return True
+
+def build_cube(resolution=DEFAULT_RESOLUTION, bounds=UK_BOUNDS, months=DEFAULT_MONTHS, years=HISTORICAL_YEARS,
+               cube_dir=CUBE_DIR, concurrency=MAX_CONCURRENCY, base_url=ARCHIVE_URL, use_cache=True,
+               cache_only=False, limits=None):
+    """
+    Fetches daily weather for every grid point and fills the climatology cube
+    Parameters:
+    - resolution: degrees between grid points
+    - bounds: (lat min, lat max, long min, long max) of the grid
+    - months: (first, last) month of each year to collect
+    - years: historical years to collect
+    - use_cache / cache_only: reuse archived responses, so a rerun only fetches what is missing
+    - limits: API quota overrides (see archive_fetcher.RATE_LIMITS)
+    Returns the number of grid points missing at least one year
+    """
+    lats, longs = grid_axes(bounds, resolution)
+    spans = season_spans(months, years)
+    plan = plan_cube_requests(lats, longs, spans)
+    params_list = [
+        build_multi_location_params(request['coordinates'], request['start_date'], request['end_date'],
+                                    daily=list(DAILY_VARIABLES.values()))
+        for request in plan
+    ]
+    calls = sum(estimate_call_weight(params) for params in params_list)
+    print(f"Grid of {len(lats)} x {len(longs)} points at {resolution:g} degrees, months {months[0]}-{months[1]} "
+          f"of {len(spans)} years: {len(plan)} requests, about {calls:,.0f} API calls")
+
+    stats = empty_stats((len(lats), len(longs)))
+    years_filled = np.zeros((len(lats), len(longs)), dtype='int16')
+    metrics = RunMetrics('climatology_cube', live=True)
+
+    def save_response(position, weather_data):
+        request = plan[position]
+        payloads = split_locations(weather_data, len(request['cells']))
+        for (row, column), payload in zip(request['cells'], payloads):
+            if accumulate_payload(stats[row, column], payload):
+                years_filled[row, column] += 1
+        metrics.increment('requests_done')
+        metrics.progress(metrics.counters['requests_done'], len(plan), 'requests')
+
+    cache = ArchiveCache(cache_only=cache_only) if use_cache or cache_only else None
+    try:
+        with metrics.stage('fetch'):
+            fetch_all(params_list, concurrency=concurrency, limits=limits, base_url=base_url, cache=cache,
+                      on_result=save_response, metrics=metrics)
+    finally:
+        print(f"Run metrics saved to {metrics.write()}")
+
+    # Days never seen keep no minimum or maximum
+    stats[np.isinf(stats)] = np.nan
+    meta = {
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'resolution': resolution,
+        'bounds': list(bounds),
+        'months': list(months),
+        'years': [min(years), max(years)],
+        'year_count': len(spans),
+        'rain_threshold': RAIN_THRESHOLD_MM,
+        'lats': lats.tolist(),
+        'longs': longs.tolist(),
+        'fields': STAT_FIELDS
+    }
+
+    # Built aside and swapped in by replace_directory, so readers never see a partial cube
+    # and the old one stays readable until the swap
+    with replace_directory(cube_dir) as temp_dir:
+        np.save(os.path.join(temp_dir, 'stats.npy'), stats.astype('float32'))
+        np.save(os.path.join(temp_dir, 'years.npy'), years_filled)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    incomplete = int((years_filled < len(spans)).sum())
+    print(f"Saved climatology cube to {cube_dir} ({stats.size * 4 / 1e6:.0f} MB)")
+    if incomplete:
+        print(f"{incomplete} of {years_filled.size} grid points are missing years; rerun --build to fill them")
+    return incomplete
+
+class ClimatologyCube:
+    """Read-only, memory-mapped view of a built climatology cube"""
+
+    def __init__(self, cube_dir=CUBE_DIR):
+        meta_file = os.path.join(cube_dir, 'meta.json')
+        if not os.path.exists(meta_file):
+            raise FileNotFoundError(f"No climatology cube in {cube_dir} (build it with --build)")
+        with open(meta_file) as f:
+            self.meta = json.load(f)
+        self.lats = np.array(self.meta['lats'])
+        self.longs = np.array(self.meta['longs'])
+        self.resolution = self.meta['resolution']
+        self.stats = np.load(os.path.join(cube_dir, 'stats.npy'), mmap_mode='r')
+        self.years = np.load(os.path.join(cube_dir, 'years.npy'), mmap_mode='r')
+        self.fields = self.meta['fields']
+        if self.fields != STAT_FIELDS:
+            raise ValueError(f"The climatology cube in {cube_dir} holds other statistics; rebuild it with --build")
+        self.extreme = np.array([field.endswith(('_min', '_max')) for field in self.fields])
+        self.maxima = np.array([field.endswith('_max') for field in self.fields])
+
+    def point_weights(self, lat, long):
+        """
+        Bilinear weights of the (up to four) filled grid points around a location
+        Returns a list of ((row, column), weight); raises ValueError outside the grid or with no filled neighbours
+        """
+        row = (float(lat) - self.lats[0]) / self.resolution
+        column = (float(long) - self.longs[0]) / self.resolution
+        if not (0 <= row <= len(self.lats) - 1 and 0 <= column <= len(self.longs) - 1):
+            raise ValueError(f"({lat}, {long}) is outside the climatology cube")
+        low_row = min(int(np.floor(row)), len(self.lats) - 2) if len(self.lats) > 1 else 0
+        low_column = min(int(np.floor(column)), len(self.longs) - 2) if len(self.longs) > 1 else 0
+        row_fraction, column_fraction = row - low_row, column - low_column
+
+        weights = []
+        for row_step, row_weight in ((0, 1 - row_fraction), (1, row_fraction)):
+            for column_step, column_weight in ((0, 1 - column_fraction), (1, column_fraction)):
+                cell = (low_row + row_step, low_column + column_step)
+                weight = row_weight * column_weight
+                if weight > 0 and cell[0] < len(self.lats) and cell[1] < len(self.longs) and self.years[cell] > 0:
+                    weights.append((cell, weight))
+        total = sum(weight for _, weight in weights)
+        if not total:
+            raise ValueError(f"No collected grid points around ({lat}, {long})")
+        return [(cell, weight / total) for cell, weight in weights]
+
+    def window_state(self, lat, long, start_date, end_date):
+        """
+        Merged statistics of a location's date window, as a festival_stats state {field: value}
+        Dates are DD/MM/YYYY (as in festivals.csv); only the day and month are used
+        """
+        dates = pd.date_range(pd.to_datetime(start_date, format='%d/%m/%Y'),
+                              pd.to_datetime(end_date, format='%d/%m/%Y'))
+        if len(dates) == 0:
+            raise ValueError(f"Window {start_date} to {end_date} is empty")
+        slots = day_slots(dates.to_numpy())
+        points = self.point_weights(lat, long)
+        rows = np.concatenate([np.asarray(self.stats[cell][slots], dtype='float64') for cell, _ in points])
+        weights = np.repeat([weight for _, weight in points], len(slots))[:, None]
+
+        # Day counts, measure counts and M2 scale with each point's weight; means, minima and maxima do not
+        merged = (weights * rows).sum(axis=0)
+        merged[self.maxima] = np.fmax.reduce(rows[:, self.maxima], axis=0)
+        minima = self.extreme & ~self.maxima
+        merged[minima] = np.fmin.reduce(rows[:, minima], axis=0)
+        fields = {field: position for position, field in enumerate(self.fields)}
+        for measure in MEASURE_COLUMNS:
+            count, mean, m2 = (fields[f'{measure}_{stat}'] for stat in ('count', 'mean', 'm2'))
+            merged[[count, mean, m2]] = merge_moments(weights[:, 0] * rows[:, count], rows[:, mean],
+                                                      weights[:, 0] * rows[:, m2])
+        if not merged[fields['days']]:
+            raise ValueError(f"The cube holds no days for {start_date} to {end_date} "
+                             f"(months {self.meta['months'][0]}-{self.meta['months'][1]} were collected)")
+        return dict(zip(self.fields, merged))
+
+    def score_events(self, events):
+        """
+        Scores events alongside every festival in festivals.csv, all from the cube
+        - events: DataFrame with Title, lat, long, startDate and endDate columns (as in festivals.csv)
+        Returns (festival metrics with weather scores, titles skipped as outside the cube)
+        """
+        reference = pd.read_csv(FESTIVALS_FILE) if os.path.exists(FESTIVALS_FILE) else events.iloc[:0]
+        candidates = pd.concat([events, reference[~reference['Title'].isin(events['Title'])]], ignore_index=True)
+        states, skipped = [], []
+        for position, event in candidates.iterrows():
+            try:
+                state = self.window_state(event['lat'], event['long'], event['startDate'], event['endDate'])
+            except ValueError:
+                skipped.append(event['Title'])
+                continue
+            states.append({'festival_id': position, 'festival_name': event['Title'], 'historical_year': 0, **state})
+
+        import festival_weather_summary_5mm as summary
+        festival_metrics = summary.festival_metrics_from_states(pd.DataFrame(states))
+        return summary.calculate_weather_scores(festival_metrics), skipped
+
+def main(argv=None):
+    """
+    Command line entry point: builds the cube or scores a location and date window
+    """
+    parser = argparse.ArgumentParser(description='Build the gridded UK climatology or score a location from it')
+    parser.add_argument('lat', nargs='?', type=float, help='latitude of the event')
+    parser.add_argument('long', nargs='?', type=float, help='longitude of the event')
+    parser.add_argument('start', nargs='?', help='first day of the event (DD/MM/YYYY)')
+    parser.add_argument('end', nargs='?', help='last day of the event (DD/MM/YYYY, default: the first day)')
+    parser.add_argument('--name', default='New event', help='name to show for the event')
+    parser.add_argument('--build', action='store_true', help=f'fetch weather for the grid and (re)build {CUBE_DIR}')
+    parser.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION, help='degrees between grid points')
+    parser.add_argument('--months', type=int, nargs=2, default=DEFAULT_MONTHS, metavar=('FIRST', 'LAST'),
+                        help='months of each year to collect')
+    parser.add_argument('--cache-only', action='store_true', help='build only from archived responses')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        build_cube(args.resolution, months=tuple(args.months), cache_only=args.cache_only)
+    if args.lat is None:
+        if not args.build:
+            parser.error('give a location and date window to score, or --build')
+        return
+    if args.long is None or args.start is None:
+        parser.error('scoring needs a latitude, longitude and start date')
+
+    try:
+        cube = ClimatologyCube()
+        started = time.perf_counter()
+        # Checked on its own first, so an event the cube cannot score reports why
+        cube.window_state(args.lat, args.long, args.start, args.end or args.start)
+        event = pd.DataFrame([{'Title': args.name, 'lat': args.lat, 'long': args.long,
+                               'startDate': args.start, 'endDate': args.end or args.start}])
+        scores, skipped = cube.score_events(event)
+        elapsed = time.perf_counter() - started
+    except (FileNotFoundError, ValueError) as e:
+        parser.error(str(e))
+
+    row = scores.loc[args.name]
+    rank = int((scores['weather_score'] > row['weather_score']).sum()) + 1
+    print(f"\n{args.name} at ({args.lat}, {args.long}), {args.start} to {args.end or args.start}:")
+    print(row[['mean_max_temp', 'mean_min_temp', 'avg_daily_rainfall', 'pct_rain_days', 'mean_max_wind',
+               'weather_score']].to_string())
+    print(f"\nRanks {rank} of {len(scores)} by weather score against the festivals in {FESTIVALS_FILE}")
+    if skipped:
+        print(f"({len(skipped)} festivals outside the cube's grid or months were left out)")
+    print(f"Scored in {elapsed * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
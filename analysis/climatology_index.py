@@ -0,0 +1,356 @@
+"""
+Module: climatology_index.py
+Purpose: Precomputed per-festival, per-calendar-date weather distributions with fast lookups
+Used by: weather_pipeline.py, and run directly to answer festival weather questions
+Author: Dom Barry
+
+The index holds, for every (festival_id, calendar_date), each measure's values
+across the historical years sorted into one contiguous run, so a quantile is an
+interpolation between two neighbouring values and an exceedance probability is
+a single binary search. Means, standard quantiles and the rain-day exceedance
+probabilities are also stored precomputed. Everything is saved as .npy arrays
+under data/climatology_index and memory-mapped when opened, so a lookup reads a
+few pages rather than loading the weather dataset.
+
+Keys are festival_id * 10000 + MMDD (e.g. 10627 for festival 1 on 27 June),
+sorted, and found by binary search. Samples are float32 like the stored measures
+(see weather_store.py) and are rounded back to MEASURE_DECIMALS when returned.
+
+Example:
+    python analysis/climatology_index.py --build
+    python analysis/climatology_index.py Glastonbury 06-27 --measure rainfall_mm --above 5
+    python analysis/climatology_index.py Reading --measure min_temp_c
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from weather_config import (CSV_FILE, DATA_DIR, DATASET_DIR, MEASURE_COLUMNS, MEASURE_DECIMALS, dataset_exists,
+                            replace_directory, source_fingerprint)
+
+# Define file paths
+INDEX_DIR = os.path.join(DATA_DIR, 'climatology_index')
+
+# Columns the build reads from the weather data
+INPUT_COLUMNS = ['festival_id', 'festival_name', 'calendar_date'] + MEASURE_COLUMNS
+
+# Quantiles stored precomputed for every measure (any other is interpolated at query time)
+STORED_QUANTILES = [0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95]
+
+# Exceedance probabilities stored precomputed, as P(value > threshold)
+STORED_EXCEEDANCE = {
+    'rainfall_mm': [1, 5, 10],
+    'total_precipitation_mm': [1, 5, 10],
+    'max_temp_c': [25, 30],
+    'max_windspeed_kmh': [40, 60]
+}
+
+# Formats accepted for a calendar date; a leap year is supplied so 29 February parses
+DATE_FORMATS = ['%m-%d', '%Y-%m-%d', '%d/%m', '%d/%m/%Y', '%d %B', '%d %b', '%B %d', '%b %d']
+
+def date_code(calendar_date):
+    """
+    Converts a calendar date such as '06-27', '27/06', '27 June' or '2025-06-27' to its MMDD code (627)
+    Raises ValueError for anything else
+    """
+    text = str(calendar_date).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            if '%Y' in date_format:
+                parsed = datetime.strptime(text, date_format)
+            else:
+                parsed = datetime.strptime(f'2000 {text}', f'%Y {date_format}')
+        except ValueError:
+            continue
+        return parsed.month * 100 + parsed.day
+    raise ValueError(f"Invalid calendar date: {calendar_date} (use e.g. 06-27 or '27 June')")
+
+def format_date_code(code):
+    return f'{code // 100:02d}-{code % 100:02d}'
+
+def stat_columns():
+    """Names of the precomputed statistics, as '<measure>:<stat>'"""
+    columns = []
+    for measure in MEASURE_COLUMNS:
+        columns.append(f'{measure}:mean')
+        columns.extend(f'{measure}:p{round(q * 100):02d}' for q in STORED_QUANTILES)
+        columns.extend(f'{measure}:>{threshold:g}' for threshold in STORED_EXCEEDANCE.get(measure, []))
+    return columns
+
+def segment_quantiles(sorted_values, starts, valid, q):
+    """
+    Quantile q of every segment of sorted_values, using numpy's linear interpolation
+    Each segment starts at starts[i] and its first valid[i] values are non-missing; empty segments give NaN
+    """
+    position = q * np.maximum(valid - 1, 0)
+    low = np.floor(position).astype('int64')
+    high = np.minimum(low + 1, np.maximum(valid - 1, 0))
+    fraction = position - low
+    with np.errstate(invalid='ignore'):
+        result = sorted_values[starts + low] * (1 - fraction) + sorted_values[starts + high] * fraction
+    return np.where(valid > 0, result, np.nan)
+
+def build_index(df=None, index_dir=INDEX_DIR):
+    """
+    Builds the climatology index from the weather data (loaded if df is not given)
+    Returns the number of (festival, calendar date) keys indexed
+    """
+    if df is None:
+        # Imported here so opening the index for a lookup does not load pandas and pyarrow
+        from weather_loader import load_weather
+        df = load_weather(columns=INPUT_COLUMNS, measure_dtype='float32')
+    source = DATASET_DIR if dataset_exists(DATASET_DIR) else CSV_FILE
+
+    # MMDD code for each calendar date category, then one int64 key per row
+    dates = df['calendar_date'].astype('category')
+    category_codes = np.array([date_code(value) for value in dates.cat.categories], dtype='int64')
+    row_keys = df['festival_id'].to_numpy().astype('int64') * 10000 + category_codes[dates.cat.codes.to_numpy()]
+
+    keys, starts = np.unique(np.sort(row_keys), return_index=True)
+    offsets = np.append(starts, len(row_keys)).astype('int64')
+    starts = starts.astype('int64')
+
+    samples = np.empty((len(MEASURE_COLUMNS), len(row_keys)), dtype='float32')
+    valid = np.empty((len(MEASURE_COLUMNS), len(keys)), dtype='int32')
+    stats = []
+    for position, measure in enumerate(MEASURE_COLUMNS):
+        values = df[measure].to_numpy().astype('float32')
+        # Sorting by key then value leaves each key's values ascending, with missing values last
+        samples[position] = values[np.lexsort((values, row_keys))]
+        present = ~np.isnan(samples[position])
+        valid[position] = np.add.reduceat(present, starts) if len(starts) else []
+        widened = samples[position].astype('float64')
+
+        totals = np.add.reduceat(np.where(present, widened, 0.0), starts) if len(starts) else np.zeros(0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats.append(np.where(valid[position] > 0, totals / valid[position], np.nan))
+        for q in STORED_QUANTILES:
+            stats.append(segment_quantiles(widened, starts, valid[position], q))
+        for threshold in STORED_EXCEEDANCE.get(measure, []):
+            above = np.add.reduceat(present & (widened > threshold), starts) if len(starts) else np.zeros(0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stats.append(np.where(valid[position] > 0, above / valid[position], np.nan))
+
+    names = df[['festival_id', 'festival_name']].drop_duplicates('festival_id')
+    meta = {
+        'source': source,
+        'source_fingerprint': source_fingerprint(source),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'measures': MEASURE_COLUMNS,
+        'measure_decimals': MEASURE_DECIMALS,
+        'stats': stat_columns(),
+        'festivals': {str(int(row.festival_id)): str(row.festival_name) for row in names.itertuples()},
+        'keys': len(keys),
+        'samples': len(row_keys)
+    }
+
+    # Built aside and swapped in by replace_directory, so readers never see a partial index
+    # and the old one stays readable until the swap
+    with replace_directory(index_dir) as temp_dir:
+        np.save(os.path.join(temp_dir, 'keys.npy'), keys)
+        np.save(os.path.join(temp_dir, 'offsets.npy'), offsets)
+        np.save(os.path.join(temp_dir, 'valid.npy'), valid)
+        np.save(os.path.join(temp_dir, 'samples.npy'), samples)
+        np.save(os.path.join(temp_dir, 'stats.npy'), np.column_stack(stats) if stats else np.zeros((len(keys), 0)))
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+    return len(keys)
+
+class ClimatologyIndex:
+    """
+    Read-only, memory-mapped view of a built climatology index
+    Festivals may be given as an ID or a (case-insensitive, unambiguous part of a) name,
+    and dates as an MMDD code or any format date_code accepts. Passing calendar_date=None
+    pools every indexed date of the festival, i.e. its whole festival window.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        meta_file = os.path.join(index_dir, 'meta.json')
+        if not os.path.exists(meta_file):
+            raise FileNotFoundError(f"No climatology index in {index_dir} (build it with --build)")
+        with open(meta_file) as f:
+            self.meta = json.load(f)
+        self.measures = self.meta['measures']
+        self.decimals = self.meta.get('measure_decimals', MEASURE_DECIMALS)
+        self.stat_positions = {name: position for position, name in enumerate(self.meta['stats'])}
+        self.festival_names = {int(festival_id): name for festival_id, name in self.meta['festivals'].items()}
+        arrays = {
+            name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r')
+            for name in ('keys', 'offsets', 'valid', 'samples', 'stats')
+        }
+        self.keys = arrays['keys']
+        self.offsets = arrays['offsets']
+        self.valid = arrays['valid']
+        self.sample_values = arrays['samples']
+        self.stats = arrays['stats']
+
+    def is_current(self):
+        """Whether the weather data is unchanged since the index was built"""
+        source = self.meta['source']
+        return os.path.exists(source) and source_fingerprint(source) == self.meta['source_fingerprint']
+
+    def festival_id(self, festival):
+        """
+        Resolves a festival ID or name to its ID
+        Raises KeyError if it is not indexed or a name matches more than one festival
+        """
+        if isinstance(festival, (int, np.integer)) or str(festival).isdigit():
+            if int(festival) in self.festival_names:
+                return int(festival)
+            raise KeyError(f"Festival {festival} is not in the climatology index")
+        text = str(festival).strip().lower()
+        exact = [festival_id for festival_id, name in self.festival_names.items() if name.lower() == text]
+        matches = exact or [festival_id for festival_id, name in self.festival_names.items() if text in name.lower()]
+        if len(matches) != 1:
+            found = ', '.join(sorted(self.festival_names[festival_id] for festival_id in matches)[:10])
+            raise KeyError(f"'{festival}' matches {len(matches)} festivals" + (f": {found}" if found else ""))
+        return matches[0]
+
+    def positions(self, festival, calendar_date=None):
+        """Key positions for a festival on one calendar date, or on every indexed date if calendar_date is None"""
+        festival_id = self.festival_id(festival)
+        if calendar_date is None:
+            low, high = np.searchsorted(self.keys, [festival_id * 10000, (festival_id + 1) * 10000])
+            return np.arange(low, high)
+        code = calendar_date if isinstance(calendar_date, (int, np.integer)) else date_code(calendar_date)
+        position = int(np.searchsorted(self.keys, festival_id * 10000 + code))
+        if position == len(self.keys) or self.keys[position] != festival_id * 10000 + code:
+            raise KeyError(f"{self.festival_names[festival_id]} has no data for {format_date_code(code)}")
+        return np.array([position])
+
+    def dates(self, festival):
+        """Calendar dates (MM-DD) indexed for a festival"""
+        return [format_date_code(int(key) % 10000) for key in self.keys[self.positions(festival)]]
+
+    def measure_position(self, measure):
+        if measure not in self.measures:
+            raise KeyError(f"Unknown measure: {measure} (choose from {', '.join(self.measures)})")
+        return self.measures.index(measure)
+
+    def samples(self, festival, calendar_date, measure):
+        """The measure's non-missing values across the historical years, ascending"""
+        row = self.sample_values[self.measure_position(measure)]
+        valid = self.valid[self.measure_position(measure)]
+        segments = [row[self.offsets[position]:self.offsets[position] + valid[position]]
+                    for position in self.positions(festival, calendar_date)]
+        values = segments[0] if len(segments) == 1 else np.sort(np.concatenate(segments))
+        return values.astype('float64').round(self.decimals)
+
+    def quantile(self, festival, calendar_date, measure, q):
+        values = self.samples(festival, calendar_date, measure)
+        return float(np.quantile(values, q)) if len(values) else float('nan')
+
+    def exceedance(self, festival, calendar_date, measure, threshold, below=False):
+        """Share of years with the measure above the threshold (or below it, if below is set)"""
+        values = self.samples(festival, calendar_date, measure)
+        if not len(values):
+            return float('nan')
+        if below:
+            return np.searchsorted(values, threshold, side='left') / len(values)
+        return (len(values) - np.searchsorted(values, threshold, side='right')) / len(values)
+
+    def mean(self, festival, calendar_date, measure):
+        values = self.samples(festival, calendar_date, measure)
+        return float(values.mean()) if len(values) else float('nan')
+
+    def summary(self, festival, calendar_date=None):
+        """
+        Precomputed statistics for a festival on one calendar date, as {measure: {stat: value}}
+        With calendar_date None the statistics are computed from the festival's pooled samples
+        """
+        if calendar_date is not None:
+            row = self.stats[self.positions(festival, calendar_date)[0]]
+            result = {measure: {} for measure in self.measures}
+            for name, position in self.stat_positions.items():
+                measure, stat = name.split(':')
+                result[measure][stat] = round(float(row[position]), 4)
+            for position, measure in enumerate(self.measures):
+                result[measure]['years'] = int(self.valid[position, self.positions(festival, calendar_date)[0]])
+            return result
+
+        result = {}
+        for measure in self.measures:
+            values = self.samples(festival, None, measure)
+            stats = {'mean': round(float(values.mean()), 4) if len(values) else float('nan')}
+            for q in STORED_QUANTILES:
+                stats[f'p{round(q * 100):02d}'] = round(float(np.quantile(values, q)), 4) if len(values) else float('nan')
+            for threshold in STORED_EXCEEDANCE.get(measure, []):
+                stats[f'>{threshold:g}'] = round(float((values > threshold).mean()), 4) if len(values) else float('nan')
+            stats['days'] = len(values)
+            result[measure] = stats
+        return result
+
+def print_summary(summary, measures):
+    """Prints a summary as one row per measure"""
+    for measure in measures:
+        stats = summary[measure]
+        print(f"\n{measure}:")
+        print("  " + ", ".join(f"{stat} {value:g}" for stat, value in stats.items()))
+
+def main(argv=None):
+    """
+    Command line entry point: builds the index or answers a lookup
+    """
+    parser = argparse.ArgumentParser(description='Look up festival weather distributions from the climatology index')
+    parser.add_argument('festival', nargs='?', help='festival ID or (part of its) name')
+    parser.add_argument('date', nargs='?',
+                        help="calendar date, e.g. 06-27 or '27 June' (default: the festival's whole window)")
+    parser.add_argument('--build', action='store_true', help=f'(re)build the index in {INDEX_DIR} first')
+    parser.add_argument('--measure', choices=MEASURE_COLUMNS, help='only show this measure')
+    parser.add_argument('--above', type=float, metavar='VALUE', help='probability the measure is above VALUE')
+    parser.add_argument('--below', type=float, metavar='VALUE', help='probability the measure is below VALUE')
+    parser.add_argument('--quantiles', type=float, nargs='+', metavar='Q', help='quantiles to report, e.g. 0.1 0.9')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        print("Building climatology index...")
+        started = time.perf_counter()
+        keys = build_index()
+        print(f"Indexed {keys} festival calendar dates in {time.perf_counter() - started:.1f}s -> {INDEX_DIR}")
+    if not args.festival:
+        if not args.build:
+            parser.error('give a festival to look up, or --build')
+        return
+    if (args.above is not None or args.below is not None or args.quantiles) and not args.measure:
+        parser.error('--above, --below and --quantiles need --measure')
+
+    try:
+        index = ClimatologyIndex()
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if not index.is_current():
+        print(f"Note: the weather data changed after the index was built on {index.meta['built_at']}; rebuild with --build")
+    try:
+        festival_id = index.festival_id(args.festival)
+        started = time.perf_counter()
+        summary = index.summary(festival_id, args.date)
+        answers = []
+        if args.above is not None:
+            answers.append((f"P({args.measure} > {args.above:g})",
+                            index.exceedance(festival_id, args.date, args.measure, args.above)))
+        if args.below is not None:
+            answers.append((f"P({args.measure} < {args.below:g})",
+                            index.exceedance(festival_id, args.date, args.measure, args.below, below=True)))
+        for q in args.quantiles or []:
+            answers.append((f"{args.measure} quantile {q:g}", index.quantile(festival_id, args.date, args.measure, q)))
+        elapsed = time.perf_counter() - started
+    except (KeyError, ValueError) as e:
+        parser.error(str(e).strip('"'))
+
+    window = index.dates(festival_id)
+    when = f"on {format_date_code(date_code(args.date))}" if args.date else f"over {window[0]} to {window[-1]}"
+    print(f"{index.festival_names[festival_id]} {when}:")
+    print_summary(summary, [args.measure] if args.measure else index.measures)
+    if answers:
+        print()
+        for label, value in answers:
+            print(f"{label}: {value:.3f}")
+    print(f"\nLooked up in {elapsed * 1e6:.0f} microseconds")
+
+if __name__ == "__main__":
+    main()
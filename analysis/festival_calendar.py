@@ -0,0 +1,127 @@
+"""
+Module: festival_calendar.py
+Purpose: Festival date windows for every historical year, and the exact days the dataset should hold
+Used by: historical_weather.py, weather_data_validator_detailed.py
+Author: Dom Barry
+
+A festival's 2025 dates (DD/MM/YYYY in festivals.csv) are moved to the same day
+and month in each historical year. The expected (festival_id, full_date) index
+is built with numpy date arithmetic rather than a loop per festival and year,
+and compared with the data as sorted integer keys, so millions of expected days
+take well under a second.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Years collected by a full run; later seasons are added with historical_weather.py --refresh
+HISTORICAL_YEARS = range(1995, 2025)
+
+# Issues reported by find_gaps
+GAP_ISSUES = ['missing', 'duplicate', 'out_of_window']
+
+def historical_windows(start_dates, end_dates, years=HISTORICAL_YEARS):
+    """
+    Moves festival dates to each historical year
+    - start_dates / end_dates: festival dates in UK format (DD/MM/YYYY)
+    - years: years to build windows for
+    Returns (start, end) datetime64[D] arrays of shape (festivals, years)
+    Raises ValueError if a day does not exist in one of the years (e.g. 29/02)
+    """
+    starts = pd.to_datetime(pd.Series(start_dates), format='%d/%m/%Y')
+    ends = pd.to_datetime(pd.Series(end_dates), format='%d/%m/%Y')
+    years = np.asarray(list(years), dtype='int64')
+
+    def move(dates):
+        months = (years[None, :] - 1970) * 12 + (dates.dt.month.to_numpy()[:, None] - 1)
+        days = dates.dt.day.to_numpy()[:, None]
+        moved = months.astype('datetime64[M]').astype('datetime64[D]') + (days - 1)
+        # A day past the end of its month rolls into the next month, which the calendar does not allow
+        if np.any(moved.astype('datetime64[M]') != months.astype('datetime64[M]')):
+            raise ValueError("Festival date does not exist in every historical year")
+        return moved
+
+    return move(starts), move(ends)
+
+def expected_days(festivals, years=HISTORICAL_YEARS):
+    """
+    Builds the index of every day the dataset should contain
+    - festivals: DataFrame with ID, startDate and endDate columns (as in festivals.csv)
+    Returns a DataFrame of festival_id, historical_year and full_date (datetime64), one row per day
+    """
+    years = np.asarray(list(years), dtype='int64')
+    starts, ends = historical_windows(festivals['startDate'], festivals['endDate'], years)
+    lengths = ((ends - starts).astype('int64') + 1).clip(min=0).ravel()
+
+    # Repeat each window's start once per day, then add each day's offset within its window
+    window_starts = np.repeat(starts.ravel(), lengths)
+    first_rows = np.cumsum(lengths) - lengths
+    offsets = np.arange(lengths.sum()) - np.repeat(first_rows, lengths)
+    return pd.DataFrame({
+        'festival_id': np.repeat(np.repeat(festivals['ID'].to_numpy(), len(years)), lengths),
+        'historical_year': np.repeat(np.tile(years, len(festivals)), lengths),
+        'full_date': (window_starts + offsets).astype('datetime64[ns]')
+    })
+
+def day_keys(festival_ids, dates):
+    """Packs (festival_id, date) pairs into sortable int64 keys (festival_id * 1,000,000 + days since 1970)"""
+    days = np.asarray(dates, dtype='datetime64[D]').astype('int64')
+    return np.asarray(festival_ids, dtype='int64') * 1_000_000 + days
+
+def day_counts(df):
+    """
+    Counts the records of every (festival_id, full_date) in df
+    Returns (sorted day keys, historical_year of each day's first record, record counts)
+    """
+    keys, first_rows, counts = np.unique(
+        day_keys(df['festival_id'], df['full_date']), return_index=True, return_counts=True
+    )
+    return keys, df['historical_year'].to_numpy()[first_rows], counts
+
+def find_gaps(df, festivals, years=HISTORICAL_YEARS):
+    """
+    Compares the data with the expected days of every festival window
+    - df: weather data with festival_id, historical_year and full_date columns
+    - years: expected years (years present in the data are always included)
+    Returns a DataFrame with festival_id, historical_year, full_date, issue and records, where issue is
+    - missing: an expected day with no record
+    - duplicate: a day recorded more than once (records says how many times)
+    - out_of_window: a record outside its festival's window, or for an unknown festival
+    """
+    return gaps_from_counts(*day_counts(df), festivals, years)
+
+def gaps_from_counts(data_keys, data_years, counts, festivals, years=HISTORICAL_YEARS):
+    """
+    Builds the gap report (see find_gaps) from the output of day_counts
+    Lets the day counts be gathered batch by batch instead of from one DataFrame
+    """
+    years = sorted(set(years) | set(int(year) for year in np.unique(data_years)))
+    expected = expected_days(festivals, years)
+    expected_keys = day_keys(expected['festival_id'], expected['full_date'])
+
+    missing = expected[~np.isin(expected_keys, data_keys, assume_unique=True)]
+    recorded = pd.DataFrame({
+        'festival_id': data_keys // 1_000_000,
+        'historical_year': data_years,
+        'full_date': (data_keys % 1_000_000).astype('datetime64[D]').astype('datetime64[ns]')
+    })
+    in_window = np.isin(data_keys, expected_keys, assume_unique=True)
+
+    reports = [
+        missing.assign(issue='missing', records=0),
+        recorded[counts > 1].assign(issue='duplicate', records=counts[counts > 1]),
+        recorded[~in_window].assign(issue='out_of_window', records=counts[~in_window])
+    ]
+    report = pd.concat(reports, ignore_index=True)
+    report['issue'] = pd.Categorical(report['issue'], categories=GAP_ISSUES)
+    return report.sort_values(['festival_id', 'full_date', 'issue'], ignore_index=True)
+
+def gap_windows(report, festivals=None):
+    """
+    Lists the (festival_id, historical_year) windows that need fetching again
+    Windows of festivals not in festivals (if given) are left out, as they cannot be fetched
+    """
+    windows = report[['festival_id', 'historical_year']].drop_duplicates()
+    if festivals is not None:
+        windows = windows[windows['festival_id'].isin(festivals['ID'])]
+    return sorted((int(festival_id), int(year)) for festival_id, year in windows.itertuples(index=False))
@@ -0,0 +1,343 @@
+"""
+Module: festival_similarity.py
+Purpose: Nearest-neighbour search for festivals with similar weather, optionally near a place or date
+Used by: weather_pipeline.py, and run directly for "festivals like X" questions
+Author: Dom Barry
+
+Each festival is described by its metrics from the festival summary (temperature,
+overnight lows and their spread, rainfall, rain days and wind), z-scored across
+festivals so every metric counts equally. With --profile, the festival's average
+maximum temperature, rainfall and wind on each day of its window are added from
+the climatology index, resampled to PROFILE_DAYS days and scaled so the profile
+as a whole counts as much as the metrics. The vectors are saved under
+data/similarity_index, and a query builds a scipy cKDTree over them once and then
+answers k-nearest-neighbour lookups in well under a millisecond.
+
+Constraints narrow the candidates before the weather comparison: a distance from a
+place (a second tree over the festivals' positions on the unit sphere), a range of
+start dates (day and month) and bounds relative to the query festival, such as
+fewer rain days. When few festivals pass, their distances are computed directly;
+otherwise the weather tree is asked for more neighbours until k of them pass.
+
+Example:
+    python analysis/festival_similarity.py --build --profile
+    python analysis/festival_similarity.py Glastonbury --starts-between 20/08 31/08
+    python analysis/festival_similarity.py "Isle of Wight" --lower pct_rain_days --within-km 150
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from climatology_index import INDEX_DIR, ClimatologyIndex, date_code, format_date_code
+from weather_config import DATA_DIR, replace_directory
+
+# Define file paths
+SIMILARITY_DIR = os.path.join(DATA_DIR, 'similarity_index')
+COMPARISON_FILE = os.path.join(DATA_DIR, 'festival_weather_comparison.csv')
+FESTIVALS_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+
+# Festival metrics compared, from the festival summary
+SIMILARITY_METRICS = ['mean_max_temp', 'mean_min_temp', 'temp_std_dev', 'avg_daily_rainfall', 'pct_rain_days',
+                      'mean_max_wind', 'overall_max_wind']
+
+# Measures in the per-day profile, and the number of days each festival's window is resampled to
+PROFILE_MEASURES = ['max_temp_c', 'rainfall_mm', 'max_windspeed_kmh']
+PROFILE_DAYS = 5
+
+# Neighbours returned when no number is given
+DEFAULT_K = 5
+
+# Constrained queries with at most this many candidates compare them directly instead of searching the tree
+DIRECT_CANDIDATES = 2048
+
+EARTH_RADIUS_KM = 6371.0
+
+def unit_vectors(lat, long):
+    """Positions on the unit sphere, so straight-line (chord) distance orders points as great-circle distance does"""
+    lat, long = np.radians(lat), np.radians(long)
+    return np.column_stack([np.cos(lat) * np.cos(long), np.cos(lat) * np.sin(long), np.sin(lat)])
+
+def chord_length(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+def standardise_columns(values):
+    """z-scores each column (ddof 0); missing values become the column mean and constant columns zero"""
+    means = np.nanmean(values, axis=0)
+    values = np.where(np.isnan(values), means, values)
+    stds = values.std(axis=0)
+    return (values - means) / np.where(stds > 0, stds, 1)
+
+def window_profiles(index, festival_ids):
+    """
+    Each festival's mean of PROFILE_MEASURES on PROFILE_DAYS evenly spaced days of its window
+    Returns a (festival x PROFILE_DAYS * len(PROFILE_MEASURES)) array, NaN for festivals not in the index
+    """
+    columns = [index.stat_positions[f'{measure}:mean'] for measure in PROFILE_MEASURES]
+    profiles = np.full((len(festival_ids), PROFILE_DAYS * len(PROFILE_MEASURES)), np.nan)
+    for row, festival_id in enumerate(festival_ids):
+        if festival_id not in index.festival_names:
+            continue
+        positions = index.positions(festival_id)
+        if not len(positions):
+            continue
+        days = positions[np.linspace(0, len(positions) - 1, PROFILE_DAYS).round().astype('int64')]
+        profiles[row] = np.asarray(index.stats[days][:, columns], dtype='float64').ravel(order='F')
+    return profiles
+
+def build_similarity_index(festival_metrics=None, profile=False, similarity_dir=SIMILARITY_DIR,
+                           festivals_file=FESTIVALS_FILE, index_dir=INDEX_DIR):
+    """
+    Builds the festival feature vectors for similarity search
+    Parameters:
+    - festival_metrics: festival metrics indexed by festival_name (default: read from COMPARISON_FILE)
+    - profile: also compare the per-day weather profile from the climatology index
+    - festivals_file: festival IDs, dates and locations, matched by name
+    Returns the number of festivals indexed
+    """
+    if festival_metrics is None:
+        festival_metrics = pd.read_csv(COMPARISON_FILE, index_col='festival_name')
+    festivals = pd.read_csv(festivals_file).drop_duplicates('Title').set_index('Title')
+    festivals = festivals.reindex(festival_metrics.index.astype(str))
+
+    # The summary leaves the rain-day share blank for festivals without any rain days
+    metrics = festival_metrics[SIMILARITY_METRICS].fillna({'pct_rain_days': 0}).to_numpy(dtype='float64')
+    features = standardise_columns(metrics)
+    columns = list(SIMILARITY_METRICS)
+    if profile:
+        index = ClimatologyIndex(index_dir)
+        profiles = window_profiles(index, festivals['ID'].fillna(-1).astype('int64').to_numpy())
+        # Scaled so the profile block and the metrics block count equally
+        scale = np.sqrt(len(SIMILARITY_METRICS) / profiles.shape[1])
+        features = np.column_stack([features, standardise_columns(profiles) * scale])
+        columns += [f'{measure}:day{day + 1}' for measure in PROFILE_MEASURES for day in range(PROFILE_DAYS)]
+
+    starts = pd.to_datetime(festivals['startDate'], format='%d/%m/%Y', errors='coerce')
+    arrays = {
+        'features': features,
+        'metrics': metrics,
+        'lat': festivals['lat'].to_numpy(dtype='float64'),
+        'long': festivals['long'].to_numpy(dtype='float64'),
+        # MMDD of each festival's start (0 if unknown)
+        'start_codes': (starts.dt.month * 100 + starts.dt.day).fillna(0).to_numpy(dtype='int32')
+    }
+    meta = {
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'festivals': festival_metrics.index.astype(str).tolist(),
+        'metrics': SIMILARITY_METRICS,
+        'features': columns,
+        'profile': profile
+    }
+
+    # Built aside and swapped in by replace_directory, so readers never see a partial index
+    # and the old one stays readable until the swap
+    with replace_directory(similarity_dir) as temp_dir:
+        for name, array in arrays.items():
+            np.save(os.path.join(temp_dir, f'{name}.npy'), array)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+    return len(features)
+
+class FestivalSimilarity:
+    """
+    Nearest-neighbour queries over the saved festival feature vectors
+    Festivals may be given as a position or a (case-insensitive, unambiguous part of a) name.
+    Festivals without a known location or start date never pass a place or date constraint.
+    """
+
+    def __init__(self, similarity_dir=SIMILARITY_DIR):
+        meta_file = os.path.join(similarity_dir, 'meta.json')
+        if not os.path.exists(meta_file):
+            raise FileNotFoundError(f"No similarity index in {similarity_dir} (build it with --build)")
+        with open(meta_file) as f:
+            self.meta = json.load(f)
+        self.names = self.meta['festivals']
+        self.metric_names = self.meta['metrics']
+        arrays = {name: np.load(os.path.join(similarity_dir, f'{name}.npy'))
+                  for name in ('features', 'metrics', 'lat', 'long', 'start_codes')}
+        self.features = arrays['features']
+        self.metrics = arrays['metrics']
+        self.lat, self.long = arrays['lat'], arrays['long']
+        self.start_codes = arrays['start_codes']
+        self.tree = cKDTree(self.features)
+        located = np.flatnonzero(~np.isnan(self.lat) & ~np.isnan(self.long))
+        self.located = located
+        self.geo_tree = cKDTree(unit_vectors(self.lat[located], self.long[located]))
+
+    def position(self, festival):
+        """
+        Resolves a festival name (or position) to its position
+        Raises KeyError if it is not indexed or a name matches more than one festival
+        """
+        if isinstance(festival, (int, np.integer)):
+            return int(festival)
+        text = str(festival).strip().lower()
+        exact = [position for position, name in enumerate(self.names) if name.lower() == text]
+        matches = exact or [position for position, name in enumerate(self.names) if text in name.lower()]
+        if len(matches) != 1:
+            found = ', '.join(sorted(self.names[position] for position in matches)[:10])
+            raise KeyError(f"'{festival}' matches {len(matches)} festivals" + (f": {found}" if found else ""))
+        return matches[0]
+
+    def candidate_mask(self, festival=None, near=None, within_km=None, starts_between=None, lower=(), higher=()):
+        """
+        Festivals passing every given constraint, or None if there are none
+        Parameters:
+        - festival: query festival, for within_km without near and for lower/higher
+        - near: (lat, long) to measure within_km from (default: the query festival's location)
+        - within_km: only festivals at most this far away
+        - starts_between: (first, last) start dates as day and month, e.g. ('20/08', '31/08')
+        - lower / higher: metrics that must be lower / higher than the query festival's
+        """
+        mask = None
+
+        def combine(condition):
+            return condition if mask is None else mask & condition
+
+        if within_km is not None:
+            if near is None:
+                if festival is None:
+                    raise ValueError("within_km needs a place (near) or a query festival")
+                near = (self.lat[festival], self.long[festival])
+            if np.isnan(near[0]) or np.isnan(near[1]):
+                raise ValueError("The query festival has no known location")
+            nearby = self.geo_tree.query_ball_point(unit_vectors([near[0]], [near[1]])[0], chord_length(within_km))
+            condition = np.zeros(len(self.names), dtype=bool)
+            condition[self.located[nearby]] = True
+            mask = combine(condition)
+        if starts_between is not None:
+            first, last = (code if isinstance(code, (int, np.integer)) else date_code(code) for code in starts_between)
+            codes = self.start_codes
+            if first <= last:
+                condition = (codes >= first) & (codes <= last)
+            else:
+                # A range across the new year, e.g. 15/12 to 15/01
+                condition = ((codes >= first) | (codes <= last)) & (codes > 0)
+            mask = combine(condition)
+        for metrics, compare in ((lower, np.less), (higher, np.greater)):
+            for metric in metrics:
+                if metric not in self.metric_names:
+                    raise KeyError(f"Unknown metric: {metric} (choose from {', '.join(self.metric_names)})")
+                if festival is None:
+                    raise ValueError("lower and higher compare against a query festival")
+                column = self.metrics[:, self.metric_names.index(metric)]
+                mask = combine(compare(column, column[festival]))
+        return mask
+
+    def nearest(self, vector, k=DEFAULT_K, mask=None, exclude=None):
+        """
+        Positions and distances of the k festivals closest to a feature vector, closest first
+        - mask: boolean array of festivals allowed (see candidate_mask)
+        - exclude: a position to leave out (the query festival itself)
+        """
+        allowed = np.ones(len(self.names), dtype=bool) if mask is None else mask.copy()
+        if exclude is not None:
+            allowed[exclude] = False
+        available = int(allowed.sum()) if mask is not None else len(self.names) - (exclude is not None)
+        k = min(k, available)
+        if k <= 0:
+            return np.zeros(0, dtype='int64'), np.zeros(0)
+
+        if mask is not None and available <= DIRECT_CANDIDATES:
+            rows = np.flatnonzero(allowed)
+            distances = np.sqrt(((self.features[rows] - vector) ** 2).sum(axis=1))
+            best = np.argpartition(distances, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+            best = best[np.argsort(distances[best], kind='stable')]
+            return rows[best], distances[best]
+
+        # Ask the tree for more neighbours until k of them are allowed
+        wanted = k + (exclude is not None)
+        while True:
+            wanted = min(wanted, len(self.names))
+            distances, positions = self.tree.query(vector, k=wanted)
+            distances, positions = np.atleast_1d(distances), np.atleast_1d(positions)
+            keep = allowed[positions]
+            if keep.sum() >= k or wanted == len(self.names):
+                return positions[keep][:k], distances[keep][:k]
+            wanted *= 4
+
+    def similar(self, festival, k=DEFAULT_K, **constraints):
+        """
+        The k festivals with weather most like the given festival's (see candidate_mask for constraints)
+        Returns a DataFrame indexed by festival_name with the weather distance, start date,
+        distance in km from the query festival and the compared metrics
+        """
+        position = self.position(festival)
+        mask = self.candidate_mask(position, **constraints)
+        positions, distances = self.nearest(self.features[position], k, mask, exclude=position)
+        return self.frame(position, positions, distances)
+
+    def frame(self, query, positions, distances):
+        """Neighbours from nearest() as a DataFrame, with distances in km from the query festival"""
+        lat1, long1 = np.radians(self.lat[query]), np.radians(self.long[query])
+        lat2, long2 = np.radians(self.lat[positions]), np.radians(self.long[positions])
+        km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(
+            np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2))
+        result = pd.DataFrame({
+            'weather_distance': distances.round(3),
+            'starts': [format_date_code(int(code)) if code else '' for code in self.start_codes[positions]],
+            'km_away': km.round(0)
+        }, index=pd.Index([self.names[position] for position in positions], name='festival_name'))
+        for column, metric in enumerate(self.metric_names):
+            result[metric] = self.metrics[positions, column]
+        return result
+
+def main(argv=None):
+    """
+    Command line entry point: builds the index or finds festivals with similar weather
+    """
+    parser = argparse.ArgumentParser(description='Find festivals with weather like a given festival')
+    parser.add_argument('festival', nargs='?', help='festival name (or an unambiguous part of it)')
+    parser.add_argument('--build', action='store_true',
+                        help=f'(re)build {SIMILARITY_DIR} from {COMPARISON_FILE} first')
+    parser.add_argument('--profile', action='store_true',
+                        help='with --build, also compare the per-day weather profile (needs the climatology index)')
+    parser.add_argument('-k', type=int, default=DEFAULT_K, help='number of festivals to return')
+    parser.add_argument('--within-km', type=float, help='only festivals within this distance')
+    parser.add_argument('--near', type=float, nargs=2, metavar=('LAT', 'LONG'),
+                        help='measure --within-km from here instead of from the festival')
+    parser.add_argument('--starts-between', nargs=2, metavar=('FIRST', 'LAST'),
+                        help="only festivals starting between these dates, e.g. 20/08 31/08 or '20 August' '31 August'")
+    parser.add_argument('--lower', nargs='+', default=[], choices=SIMILARITY_METRICS, metavar='METRIC',
+                        help=f"only festivals with lower values of these metrics, e.g. pct_rain_days "
+                             f"(choose from {', '.join(SIMILARITY_METRICS)})")
+    parser.add_argument('--higher', nargs='+', default=[], choices=SIMILARITY_METRICS, metavar='METRIC',
+                        help='only festivals with higher values of these metrics, e.g. mean_max_temp')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        print("Building similarity index...")
+        festivals = build_similarity_index(profile=args.profile)
+        print(f"Indexed {festivals} festivals -> {SIMILARITY_DIR}")
+    if not args.festival:
+        if not args.build:
+            parser.error('give a festival to compare, or --build')
+        return
+
+    try:
+        similarity = FestivalSimilarity()
+        position = similarity.position(args.festival)
+        starts_between = [date_code(date) for date in args.starts_between] if args.starts_between else None
+        started = time.perf_counter()
+        mask = similarity.candidate_mask(position, near=args.near, within_km=args.within_km,
+                                         starts_between=starts_between, lower=args.lower, higher=args.higher)
+        positions, distances = similarity.nearest(similarity.features[position], args.k, mask, exclude=position)
+        elapsed = time.perf_counter() - started
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        parser.error(str(e).strip('"'))
+
+    query = similarity.frame(position, np.array([position]), np.zeros(1)).drop(columns=['weather_distance', 'km_away'])
+    print(f"{similarity.names[position]}:")
+    print(query.to_string(index=False))
+    print(f"\nMost similar weather{' (per-day profile included)' if similarity.meta['profile'] else ''}:")
+    result = similarity.frame(position, positions, distances)
+    print(result.to_string() if len(result) else "No festivals match the constraints")
+    print(f"\nSearched {len(similarity.names)} festivals in {elapsed * 1e3:.2f} milliseconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Module: festival_stats.py
+Purpose: Mergeable per-festival, per-year weather statistics
+Used by: festival_weather_summary_5mm.py, weather_pipeline.py
+Author: Dom Barry
+
+Each (festival_id, year) is reduced once to a partial state: day and rain-day
+counts plus the count, mean, sum of squared deviations from the mean (M2), min
+and max of every measure. Partial states merge with Chan et al.'s parallel form
+of Welford's update (as streaming_stats.MeasureSketch does), which keeps the
+standard deviation accurate where a sum of squares would cancel, so festival
+metrics over any set of years are a fast reduction of a small state table rather
+than a pass over every daily row. The state table is kept in
+data/cache/festival_stats.parquet along with a fingerprint of each year partition
+it was built from, and only years whose data changed are recomputed.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from streaming_stats import stream_frames
+from weather_config import DATA_DIR, MEASURE_DECIMALS, source_fingerprint
+from weather_loader import load_weather, widen_measure
+from weather_store import CSV_FILE, DATASET_DIR, MEASURE_COLUMNS, dataset_exists, read_frame
+
+# Define file paths
+STATS_FILE = os.path.join(DATA_DIR, 'cache', 'festival_stats.parquet')
+
+# Days with more rain than this count as rain days
+RAIN_THRESHOLD_MM = 5
+
+KEY_COLUMNS = ['festival_id', 'festival_name', 'historical_year']
+
+# Columns partial_states needs from the weather data
+INPUT_COLUMNS = KEY_COLUMNS + MEASURE_COLUMNS
+
+# Statistics a partial state keeps for every measure, as <measure>_<stat> columns
+MEASURE_STATS = ['count', 'mean', 'm2', 'min', 'max']
+
+# State columns, after the keys, of a table built from every measure
+STATE_COLUMNS = ['days', 'rain_days'] + [f'{column}_{stat}' for column in MEASURE_COLUMNS for stat in MEASURE_STATS]
+
+def partial_states(df, rain_threshold=RAIN_THRESHOLD_MM, keys=KEY_COLUMNS):
+    """
+    Reduces daily weather rows to one partial state per (festival_id, festival_name, historical_year)
+    - keys: columns to group by instead, e.g. ['festival_id', 'month'] (see weather_rollup.py)
+    Returns a DataFrame with days, rain_days and <measure>_<count|mean|m2|min|max> columns
+    """
+    work = pd.DataFrame({
+        key: (df[key].astype(str) if key == 'festival_name' else df[key]).to_numpy() for key in keys
+    })
+    work['days'] = np.ones(len(df), dtype='int64')
+    work['rain_days'] = (widen_measure(df['rainfall_mm']) > rain_threshold).astype('int64')
+    aggregations = {'days': ('days', 'sum'), 'rain_days': ('rain_days', 'sum')}
+    for column in MEASURE_COLUMNS:
+        if column not in df.columns:
+            continue
+        work[column] = widen_measure(df[column])
+        aggregations.update({
+            f'{column}_count': (column, 'count'),
+            f'{column}_mean': (column, 'mean'),
+            # pandas computes the grouped variance with Welford's update, so M2 is free of cancellation
+            f'{column}_m2': (column, 'var'),
+            f'{column}_min': (column, 'min'),
+            f'{column}_max': (column, 'max')
+        })
+    states = work.groupby(list(keys), sort=True).agg(**aggregations).reset_index()
+    for column in MEASURE_COLUMNS:
+        if column in df.columns:
+            count = states[f'{column}_count']
+            states[f'{column}_m2'] = states[f'{column}_m2'].fillna(0) * (count - 1).clip(lower=0)
+    return states
+
+def merge_moments(counts, means, m2s, axis=0):
+    """
+    Merges (count, mean, M2) statistics along an axis with Chan et al.'s parallel update
+    Counts may be fractional weights (see climatology_cube.py); means of empty parts are ignored
+    Returns (count, mean, M2), with a NaN mean where the count is 0
+    """
+    present = counts > 0
+    count = counts.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(present, counts * means, 0).sum(axis=axis) / np.where(count > 0, count, np.nan)
+        deviation = np.where(present, means - np.expand_dims(mean, axis), 0)
+    m2 = (np.where(present, m2s, 0) + counts * deviation * deviation).sum(axis=axis)
+    return count, mean, m2
+
+def merge_states(states, by='festival_name'):
+    """
+    Combines partial states over all rows sharing the by column(s)
+    Counts add; minima and maxima take the min and max; means are the exact merged sum over
+    the count, and M2 merges with Chan et al.'s update as in merge_moments
+    """
+    by_columns = [by] if isinstance(by, str) else list(by)
+    aggregations = {}
+    for column in states.columns:
+        if column in KEY_COLUMNS or column in by_columns:
+            continue
+        if column.endswith('_min'):
+            aggregations[column] = 'min'
+        elif column.endswith('_max'):
+            aggregations[column] = 'max'
+        elif not column.endswith(('_mean', '_m2')):
+            aggregations[column] = 'sum'
+    grouped = states.groupby(by, sort=True)
+    merged = grouped.agg(aggregations)
+
+    codes = grouped.ngroup()
+    # Rows with a missing key belong to no group, as in the aggregation above
+    rows = states[codes.notna().to_numpy()]
+    codes = codes.dropna().to_numpy(dtype='int64')
+    for column in MEASURE_COLUMNS:
+        if f'{column}_mean' not in rows.columns:
+            continue
+        count = rows[f'{column}_count'].to_numpy(dtype='float64')
+        mean = rows[f'{column}_mean'].to_numpy(dtype='float64')
+        total = np.bincount(codes, weights=count, minlength=len(merged))
+        # Measures are held to MEASURE_DECIMALS places, so each part's sum comes back exactly from its
+        # count and mean, and the merged mean is the exact sum over the count, as averaging the days gives
+        sums = np.bincount(codes, weights=np.round(np.where(count > 0, count * mean, 0), MEASURE_DECIMALS),
+                           minlength=len(merged))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            merged_mean = np.round(sums, MEASURE_DECIMALS) / np.where(total > 0, total, np.nan)
+        deviation = np.where(count > 0, mean - merged_mean[codes], 0)
+        m2 = np.where(count > 0, rows[f'{column}_m2'].to_numpy(dtype='float64'), 0) + count * deviation * deviation
+        merged[f'{column}_mean'] = merged_mean
+        merged[f'{column}_m2'] = np.bincount(codes, weights=m2, minlength=len(merged))
+    return merged[[column for column in states.columns if column in merged.columns]]
+
+def reduce_states(frames, rain_threshold=RAIN_THRESHOLD_MM):
+    """
+    Reduces an iterable of daily weather DataFrames (e.g. streamed batches) to one partial state table
+    Each batch is reduced and merged into the running table, so only one batch is held at a time
+    """
+    states = None
+    for df in frames:
+        batch_states = partial_states(df, rain_threshold)
+        if states is None:
+            states = batch_states
+        else:
+            states = merge_states(pd.concat([states, batch_states], ignore_index=True), by=KEY_COLUMNS).reset_index()
+    return states
+
+def measure_mean(merged, column):
+    return merged[f'{column}_mean'].where(merged[f'{column}_count'] > 0)
+
+def measure_total(merged, column):
+    """Sum of a measure's values (0 where it has none), exact to MEASURE_DECIMALS places"""
+    total = (merged[f'{column}_mean'] * merged[f'{column}_count']).round(MEASURE_DECIMALS)
+    return total.where(merged[f'{column}_count'] > 0, 0)
+
+def measure_std(merged, column):
+    """Sample standard deviation (ddof=1) from count and M2"""
+    count = merged[f'{column}_count']
+    return np.sqrt(merged[f'{column}_m2'] / (count - 1).where(count > 1))
+
+def update_states(states, new_states):
+    """Replaces (or adds) the partial states for every key present in new_states"""
+    keys = pd.MultiIndex.from_frame(new_states[['festival_id', 'historical_year']])
+    existing = pd.MultiIndex.from_frame(states[['festival_id', 'historical_year']])
+    combined = pd.concat([states[~existing.isin(keys)], new_states], ignore_index=True)
+    return combined.sort_values(KEY_COLUMNS, ignore_index=True)
+
+def partition_fingerprints():
+    """
+    Fingerprints the weather data each part of the state table was built from
+    Each Parquet year partition is fingerprinted by its files' sizes and modification
+    times (see weather_config.source_fingerprint), so checking costs a stat per file
+    rather than a read; a CSV source is a single part
+    Returns {part: fingerprint}, where part is a year or 'csv'
+    """
+    if not dataset_exists(DATASET_DIR):
+        if not os.path.exists(CSV_FILE):
+            raise FileNotFoundError(f"Input file not found: {CSV_FILE}")
+        return {'csv': source_fingerprint(CSV_FILE)}
+
+    return {
+        entry.name.split('=', 1)[1]: source_fingerprint(entry.path)
+        for entry in sorted(os.scandir(DATASET_DIR), key=lambda entry: entry.name)
+        if entry.is_dir() and entry.name.startswith('historical_year=')
+    }
+
+def read_states(stats_file=STATS_FILE):
+    """Returns (states, fingerprints, rain_threshold) from the saved state table, or None"""
+    if not os.path.exists(stats_file):
+        return None
+    table = pq.read_table(stats_file)
+    meta = json.loads(table.schema.metadata[b'festival_stats'])
+    return table.to_pandas(), meta['fingerprints'], meta['rain_threshold']
+
+def write_states(states, fingerprints, rain_threshold, stats_file=STATS_FILE):
+    os.makedirs(os.path.dirname(stats_file), exist_ok=True)
+    table = pa.Table.from_pandas(states, preserve_index=False)
+    meta = {'fingerprints': fingerprints, 'rain_threshold': rain_threshold}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'festival_stats': json.dumps(meta)})
+    temp_file = f'{stats_file}.tmp'
+    pq.write_table(table, temp_file)
+    os.replace(temp_file, stats_file)
+
+def load_states(rain_threshold=RAIN_THRESHOLD_MM, use_cache=True, batch_rows=None):
+    """
+    Returns the partial state table for the current weather data
+    Only year partitions that changed since the saved table was built are re-read
+    and reduced; with a CSV source any change rebuilds the whole table
+    - batch_rows: stream the data in batches of this many rows instead of loading it whole
+    """
+    fingerprints = partition_fingerprints()
+    saved = read_states() if use_cache else None
+    states, saved_fingerprints = None, {}
+    # A table saved with other settings, or in an older state layout, is rebuilt
+    if (saved is not None and saved[2] == rain_threshold and ('csv' in saved[1]) == ('csv' in fingerprints)
+            and list(saved[0].columns) == KEY_COLUMNS + STATE_COLUMNS):
+        states, saved_fingerprints, _ = saved
+
+    stale = [part for part, fingerprint in fingerprints.items() if saved_fingerprints.get(part) != fingerprint]
+    removed = [part for part in saved_fingerprints if part not in fingerprints]
+    if states is not None and not stale and not removed:
+        return states
+
+    years = None if 'csv' in fingerprints else [int(part) for part in stale]
+    if states is not None and not stale:
+        # Partitions were only removed, so there is nothing to read
+        new_states = states.iloc[:0]
+    elif batch_rows:
+        new_states = reduce_states(stream_frames(INPUT_COLUMNS, batch_rows, years), rain_threshold)
+    elif 'csv' in fingerprints:
+        new_states = partial_states(load_weather(columns=INPUT_COLUMNS), rain_threshold)
+    else:
+        df = read_frame(DATASET_DIR, columns=INPUT_COLUMNS, years=years, measure_dtype='float32')
+        new_states = partial_states(df, rain_threshold)
+
+    if states is None or 'csv' in fingerprints:
+        states = new_states
+    else:
+        # Drop every changed or removed year, then add back what the changed partitions now hold
+        changed = [int(part) for part in stale + removed]
+        states = update_states(states[~states['historical_year'].isin(changed)], new_states)
+    print(f"Updated festival statistics for {len(stale)} of {len(fingerprints)} data partitions")
+
+    write_states(states, fingerprints, rain_threshold)
+    return states
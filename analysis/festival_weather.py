@@ -0,0 +1,73 @@
+"""
+Module: festival_weather.py
+Purpose: The festival-weather command, one entry point for every stage and query
+Used by: the festival-weather console script (see pyproject.toml), or run directly
+Author: Dom Barry
+
+Each subcommand hands its remaining arguments to the matching module's own command
+line, so 'festival-weather summarise --stream' behaves exactly like
+'python analysis/festival_weather_summary_5mm.py --stream'. A module is only imported
+once its subcommand is chosen, and the scripts import pandas, pyarrow and scipy in
+the functions that use them, so light commands start in under 200 ms: lookups against
+the prebuilt indexes (query, rank) load only numpy, and collect, validate, outliers
+and summarise parse their options before loading anything heavy. --data-dir (or
+FESTIVAL_WEATHER_DATA_DIR) points every stage at a data directory other than ./data.
+
+Example:
+    pip install -e .
+    festival-weather collect --progress
+    festival-weather pipeline
+    festival-weather query Glastonbury 06-27 --measure rainfall_mm --above 5
+    festival-weather --data-dir /srv/festivals rank --weights rain=2 --camping yes
+"""
+
+import argparse
+import importlib
+import sys
+
+from weather_config import DATA_DIR_VARIABLE, configure
+
+# Subcommand: (module, command line function, description)
+COMMANDS = {
+    'collect': ('historical_weather', 'command_line', 'collect historical weather for every festival'),
+    'validate': ('weather_data_validator_detailed', 'command_line', 'validate the weather data'),
+    'outliers': ('weather_outlier_checker', 'command_line', 'find outliers in the weather data'),
+    'summarise': ('festival_weather_summary_5mm', 'command_line', 'summarise and score festival weather'),
+    'query': ('climatology_index', 'main', 'look up weather distributions for a festival and date'),
+    'pipeline': ('weather_pipeline', 'main', 'run the stages that are out of date'),
+    'rank': ('weather_ranking', 'main', 'rank festivals by weather with custom weights'),
+    'rollup': ('weather_rollup', 'main', 'weather by region, genre, month, camping and capacity'),
+    'similar': ('festival_similarity', 'main', 'festivals with weather like a given festival'),
+    'score-event': ('climatology_cube', 'main', 'score the weather for any UK location and dates'),
+    'hourly': ('hourly_store', 'command_line', 'inspect the hourly store and derive daily metrics'),
+    'cache': ('archive_cache', 'main', 'inspect or trim the archive response cache'),
+    'benchmark': ('weather_benchmark', 'main', 'benchmark the stages on synthetic data'),
+    'mock-server': ('mock_archive_server', 'main', 'serve a local mock of the weather archive')
+}
+
+def main(argv=None):
+    """
+    Command line entry point: runs one subcommand with the rest of the arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='festival-weather', description='UK festival weather analysis',
+        epilog="Run 'festival-weather COMMAND --help' for its options")
+    parser.add_argument('--data-dir', metavar='DIR',
+                        help=f'data directory (default: ${DATA_DIR_VARIABLE}, or ./data)')
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+    # Each subcommand's options belong to its module's own parser, so none are declared
+    # here: building the parsers imports nothing, and the module sees every argument left over
+    for name, (_, _, description) in COMMANDS.items():
+        subparsers.add_parser(name, add_help=False, help=description, description=description)
+    args, command_args = parser.parse_known_args(argv)
+
+    # The data directory has to be set before the command's module reads its paths
+    if args.data_dir:
+        configure(args.data_dir)
+    module_name, function, _ = COMMANDS[args.command]
+    # So the command's usage and error messages name the subcommand
+    sys.argv[0] = f'festival-weather {args.command}'
+    return getattr(importlib.import_module(module_name), function)(command_args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Script: festival_weather_summary_5mm.py
+Purpose: Creates festival-level weather metrics and scoring, considering days with >5mm rain as rain days
+Input: data/all_festivals_historical_weather/ (Parquet) or data/all_festivals_historical_weather.csv
+Output: data/festival_weather_comparison.csv (and data/cache/festival_stats.parquet, see festival_stats.py)
+        data/festival_rain_thresholds.csv when run with --thresholds
+        data/festival_weather_uncertainty.csv when run with --bootstrap (see weather_uncertainty.py)
+        data/score_components for re-ranking under custom weights (see weather_ranking.py)
+Author: Dom Barry
+
+Run with --stream to reduce the dataset in bounded-size batches instead of loading
+it whole (see streaming_stats.py for how closely the results match).
+"""
+
+import argparse
+import os
+
+from run_metrics import RunMetrics
+from weather_config import BATCH_ROWS, DATA_DIR
+
+# pandas, and the modules built on it, are imported by the functions that use them,
+# so the command line (and --help) starts without loading them
+
+# Define file paths
+OUTPUT_FILE = os.path.join(DATA_DIR, 'festival_weather_comparison.csv')
+THRESHOLDS_FILE = os.path.join(DATA_DIR, 'festival_rain_thresholds.csv')
+UNCERTAINTY_FILE = os.path.join(DATA_DIR, 'festival_weather_uncertainty.csv')
+
+# Columns used by this script
+INPUT_COLUMNS = ['festival_id', 'festival_name', 'historical_year', 'max_temp_c', 'min_temp_c', 'rainfall_mm',
+                 'max_windspeed_kmh']
+
+def load_weather_data():
+    """
+    Loads the historical weather data and performs initial validation
+    Returns DataFrame if successful
+    """
+    from weather_loader import describe_source, load_weather
+    print(f"Loading data from {describe_source()}...")
+    df = load_weather(columns=INPUT_COLUMNS)
+    print(f"Loaded {len(df)} records")
+    return df
+
+def load_festival_states(batch_rows=None):
+    """
+    Loads per-festival, per-year partial statistics, recomputing only years whose data changed
+    - batch_rows: stream changed data in batches of this many rows instead of loading it whole
+    Returns the state table (see festival_stats.py)
+    """
+    from festival_stats import load_states
+    from weather_loader import describe_source
+    print(f"Loading festival statistics for {describe_source()}...")
+    states = load_states(batch_rows=batch_rows)
+    print(f"Loaded {len(states)} festival-year states covering {states['days'].sum()} records")
+    return states
+
+def festival_metrics_from_states(states):
+    """
+    Derives festival-level metrics by merging per-year partial states
+    Returns DataFrame with festival-level metrics
+    """
+    import pandas as pd
+    from festival_stats import measure_mean, measure_std, measure_total, merge_states
+    print("Calculating festival weather metrics...")
+    
+    # Merge every year's state into one per festival
+    merged = merge_states(states, by='festival_name')
+    festival_metrics = pd.DataFrame({
+        'mean_max_temp': measure_mean(merged, 'max_temp_c'),
+        'min_max_temp': merged['max_temp_c_min'],
+        'max_max_temp': merged['max_temp_c_max'],
+        'temp_std_dev': measure_std(merged, 'max_temp_c'),
+        'mean_min_temp': measure_mean(merged, 'min_temp_c'),
+        'min_min_temp': merged['min_temp_c_min'],
+        'max_min_temp': merged['min_temp_c_max'],
+        'min_temp_std_dev': measure_std(merged, 'min_temp_c'),
+        'avg_daily_rainfall': measure_mean(merged, 'rainfall_mm'),
+        'max_daily_rainfall': merged['rainfall_mm_max'],
+        'total_rainfall': measure_total(merged, 'rainfall_mm'),
+        'mean_max_wind': measure_mean(merged, 'max_windspeed_kmh'),
+        'overall_max_wind': merged['max_windspeed_kmh_max'],
+        'wind_std_dev': measure_std(merged, 'max_windspeed_kmh'),
+        'total_days': merged['days']
+    }).round(2)
+
+    # Rain days (>5mm rainfall); festivals without any are left blank
+    rain_days = merged['rain_days'][merged['rain_days'] > 0]
+    festival_metrics['total_rain_days'] = rain_days
+    festival_metrics['pct_rain_days'] = (rain_days / festival_metrics['total_days'] * 100).round(2)
+
+    return festival_metrics
+
+def calculate_festival_metrics(df):
+    """
+    Calculates weather metrics for each festival from daily weather rows
+    Returns DataFrame with festival-level metrics
+    """
+    from festival_stats import partial_states
+    return festival_metrics_from_states(partial_states(df))
+
+def calculate_weather_scores(df):
+    """
+    Calculates standardized weather scores based on temperature, rain, and wind
+    Higher scores indicate better weather conditions
+    """
+    from rain_thresholds import zscore
+    print("Calculating weather scores...")
+    
+    # Calculate z-scores (inverse for rain and wind where lower is better)
+    df['temp_z'] = zscore(df['mean_max_temp'])
+    df['rain_z'] = -zscore(df['pct_rain_days'])
+    df['wind_z'] = -zscore(df['mean_max_wind'])
+    
+    # Calculate overall weather score (average of z-scores)
+    df['weather_score'] = df[['temp_z', 'rain_z', 'wind_z']].mean(axis=1).round(2)
+    
+    return df
+
+def calculate_rain_thresholds(festival_metrics, thresholds, batch_rows=None):
+    """
+    Counts rain days and weather scores for several rain-day definitions in one pass
+    - festival_metrics: output of calculate_weather_scores (supplies the temperature and wind z-scores)
+    - thresholds: millimetre values and/or percentiles, e.g. [1, 2, 5, 10, 'p90']
+    - batch_rows: stream the data in batches of this many rows instead of loading it whole
+    Returns a long DataFrame with one row per festival, measure and threshold
+    """
+    from rain_thresholds import RAIN_COLUMNS, add_threshold_scores, rain_day_table
+    from streaming_stats import stream_rain_day_table
+    from weather_loader import load_weather
+    print(f"Calculating rain days for thresholds: {', '.join(str(threshold) for threshold in thresholds)}")
+    if batch_rows:
+        table = stream_rain_day_table(thresholds, batch_rows=batch_rows)
+    else:
+        table = rain_day_table(load_weather(columns=['festival_name'] + RAIN_COLUMNS), thresholds)
+    return add_threshold_scores(table, festival_metrics)
+
+def summarise_rain_thresholds(table):
+    """
+    Prints how the share of rain days and the best-scoring festival change with the threshold
+    """
+    print("\nRain-day sensitivity:")
+    for (measure, threshold), rows in table.groupby(['measure', 'threshold'], sort=False):
+        best = rows.loc[rows['weather_score'].idxmax()]
+        print(f"{measure} > {rows['threshold_mm'].iloc[0]:g}mm ({threshold}): "
+              f"median {rows['pct_rain_days'].median():.1f}% rain days, "
+              f"top festival {best['festival_name']} ({best['weather_score']})")
+
+def summarise_uncertainty(intervals, confidence=None):
+    """
+    Prints the top festivals with their score and rank intervals
+    - confidence: the intervals' confidence level (default: weather_uncertainty.DEFAULT_CONFIDENCE)
+    """
+    from weather_uncertainty import DEFAULT_CONFIDENCE, TOP_K
+    confidence = DEFAULT_CONFIDENCE if confidence is None else confidence
+    print(f"\nTop {TOP_K} festivals with {confidence:.0%} bootstrap intervals:")
+    for name, row in intervals.head(TOP_K).iterrows():
+        print(f"{row['rank']:.0f}. {name}: score {row['weather_score']:.2f} "
+              f"({row['score_lower']:.2f} to {row['score_upper']:.2f}), "
+              f"rank {row['rank_lower']:.0f}-{row['rank_upper']:.0f}, "
+              f"in the top {TOP_K} in {row[f'pct_top_{TOP_K}']:.1f}% of resamples")
+
+def main(thresholds=None, batch_rows=None, replicates=None, workers=None):
+    """
+    Main function to process weather data and generate festival summaries
+    Parameters:
+    - thresholds: optional rain-day thresholds to compare (see rain_thresholds.py)
+    - batch_rows: stream the data in batches of this many rows instead of loading it whole
+    - replicates: also bootstrap the historical years this many times for score and rank intervals
+    - workers: processes for the bootstrap (default: one per CPU)
+    Stage timings and memory are written to data/metrics/summarise.json (and .prom)
+    """
+    from weather_ranking import RANKING_DIR, build_components
+    from weather_uncertainty import score_intervals
+    metrics = RunMetrics('summarise')
+    try:
+        # Load per-year statistics and merge them into festival metrics
+        with metrics.stage('load_states'):
+            states = load_festival_states(batch_rows)
+        with metrics.stage('score'):
+            festival_metrics = festival_metrics_from_states(states)
+            
+            # Calculate weather scores
+            festival_metrics = calculate_weather_scores(festival_metrics)
+        metrics.increment('festivals', len(festival_metrics))
+        
+        # Save results
+        print(f"\nSaving results to {OUTPUT_FILE}")
+        with metrics.stage('save'):
+            festival_metrics.to_csv(OUTPUT_FILE)
+            build_components(festival_metrics)
+        print(f"Saved score components for re-ranking to {RANKING_DIR}")
+        print("Analysis complete!")
+        
+        # Print summary statistics
+        print("\nSummary Statistics:")
+        print(f"Total festivals analyzed: {len(festival_metrics)}")
+        print("\nTop 5 festivals by weather score:")
+        print(festival_metrics.nlargest(5, 'weather_score')[['weather_score', 'pct_rain_days', 'mean_max_temp']])
+        
+        # Compare alternative rain-day definitions
+        if thresholds:
+            with metrics.stage('thresholds'):
+                threshold_table = calculate_rain_thresholds(festival_metrics, thresholds, batch_rows)
+                threshold_table.to_csv(THRESHOLDS_FILE, index=False)
+            summarise_rain_thresholds(threshold_table)
+            print(f"\nSaved rain-day thresholds to {THRESHOLDS_FILE}")
+        
+        # How much the scores and ranks move when different years are sampled
+        if replicates:
+            print(f"\nBootstrapping weather scores over {replicates} resamples of the years...")
+            with metrics.stage('bootstrap'):
+                intervals = score_intervals(states, festival_metrics['weather_score'], replicates, workers=workers)
+                intervals.to_csv(UNCERTAINTY_FILE)
+            summarise_uncertainty(intervals)
+            print(f"\nSaved score and rank intervals to {UNCERTAINTY_FILE}")
+        
+    except Exception as e:
+        print(f"Error during processing: {e}")
+    finally:
+        metrics.write()
+
+def command_line(argv=None):
+    """Command line entry point: summarises the festival weather"""
+    parser = argparse.ArgumentParser(description='Summarise festival weather metrics and scores')
+    parser.add_argument('--thresholds', nargs='+', metavar='THRESHOLD',
+                        help='also compare rain days above these thresholds, in mm or as percentiles (e.g. 1 2 5 10 p90)')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the data in batches so memory use stays flat (see streaming_stats.py)')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS, help='rows per batch with --stream')
+    parser.add_argument('--bootstrap', type=int, metavar='REPLICATES',
+                        help=f'also resample the years this many times (e.g. 2000) for score and rank intervals, '
+                             f'saved to {UNCERTAINTY_FILE}')
+    parser.add_argument('--workers', type=int, help='processes for --bootstrap (default: one per CPU)')
+    args = parser.parse_args(argv)
+    
+    from rain_thresholds import parse_thresholds
+    try:
+        thresholds = parse_thresholds(args.thresholds) if args.thresholds else None
+    except ValueError as e:
+        parser.error(str(e))
+    main(thresholds, args.batch_rows if args.stream else None, args.bootstrap, args.workers)
+
+if __name__ == "__main__":
+    command_line()
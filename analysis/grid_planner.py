@@ -0,0 +1,128 @@
+"""
+Module: grid_planner.py
+Purpose: Plans archive requests so each weather-model grid cell and date window is fetched once
+Used by: historical_weather.py
+Author: Dom Barry
+"""
+
+from datetime import timedelta
+
+# Open-Meteo's archive best_match blends ERA5 (0.25°) with ERA5-Land (0.1°),
+# so festivals within the same 0.1° cell receive identical daily values
+GRID_RESOLUTION = 0.1
+
+def snap_to_grid(lat, long, resolution=GRID_RESOLUTION):
+    """
+    Snaps a location to the nearest grid point of the weather model
+    Returns a (lat, long) pair rounded to avoid floating point noise
+    """
+    return (
+        round(round(float(lat) / resolution) * resolution, 4),
+        round(round(float(long) / resolution) * resolution, 4)
+    )
+
+def merge_windows(windows):
+    """
+    Merges overlapping or back-to-back (start, end) date windows
+    Returns the merged windows sorted by start date
+    """
+    merged = []
+    for start_date, end_date in sorted(windows):
+        if merged and start_date <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_date))
+        else:
+            merged.append((start_date, end_date))
+    return merged
+
+def plan_requests(locations, full_period=False, resolution=GRID_RESOLUTION):
+    """
+    Groups festival windows by grid cell and merges their dates into as few requests as possible
+    Parameters:
+    - locations: iterable of (key, lat, long, date_ranges), where key identifies the festival
+    - full_period: one request per cell covering every window, rather than one per merged window
+      (fewer requests, but the archive charges a call per 14 days of span, so 30 years cost about 780 calls)
+    Returns a list of planned requests, each a dict with:
+    - cell: snapped (lat, long) to request
+    - start_date / end_date: period to request
+    - members: (key, start_date, end_date) festival windows to slice from the response
+    """
+    cells = {}
+    for key, lat, long, date_ranges in locations:
+        cell = snap_to_grid(lat, long, resolution)
+        cells.setdefault(cell, []).extend((key, start_date, end_date) for start_date, end_date in date_ranges)
+
+    plan = []
+    for cell, members in cells.items():
+        if full_period:
+            spans = [(min(start for _, start, _ in members), max(end for _, _, end in members))]
+        else:
+            spans = merge_windows((start, end) for _, start, end in members)
+
+        # Attach each festival window to the request that covers it
+        for span_start, span_end in spans:
+            plan.append({
+                'cell': cell,
+                'start_date': span_start,
+                'end_date': span_end,
+                'members': [
+                    (key, start, end) for key, start, end in members
+                    if span_start <= start and end <= span_end
+                ]
+            })
+    return plan
+
+def summarise_plan(plan, total_windows):
+    """Prints how much the plan saves compared with one request per festival window"""
+    cells = len({request['cell'] for request in plan})
+    print(f"Planned {len(plan)} requests across {cells} grid cells for {total_windows} festival windows")
+
+def plan_batched_requests(locations, max_span_days=14, max_locations=50, resolution=GRID_RESOLUTION):
+    """
+    Packs festival windows from many grid cells into multi-location requests
+    All locations in a request share one date span, so windows are grouped by
+    start date and each group kept within max_span_days (Open-Meteo charges one
+    call per location for spans up to 14 days)
+    Parameters:
+    - locations: iterable of (key, lat, long, date_ranges), as for plan_requests
+    - max_span_days: longest period a shared request may cover (longer windows get their own)
+    - max_locations: most coordinates to pack into one request
+    Returns a list of planned requests, each a dict with:
+    - cells: snapped (lat, long) pairs to request, in response order
+    - start_date / end_date: period shared by every location
+    - members: (cell position, key, start_date, end_date) festival windows to slice out
+    """
+    windows = []
+    for key, lat, long, date_ranges in locations:
+        cell = snap_to_grid(lat, long, resolution)
+        windows.extend((start_date, end_date, cell, key) for start_date, end_date in date_ranges)
+    windows.sort(key=lambda window: (window[0], window[1]))
+
+    # Greedily group windows whose combined span stays within the limit
+    groups = []
+    for window in windows:
+        if groups:
+            group_start, group_end, group = groups[-1]
+            new_end = max(group_end, window[1])
+            if (new_end - group_start).days + 1 <= max_span_days:
+                group.append(window)
+                groups[-1] = (group_start, new_end, group)
+                continue
+        groups.append((window[0], window[1], [window]))
+
+    plan = []
+    for span_start, span_end, group in groups:
+        cells = list(dict.fromkeys(cell for _, _, cell, _ in group))
+
+        for batch_start in range(0, len(cells), max_locations):
+            batch = cells[batch_start:batch_start + max_locations]
+            positions = {cell: position for position, cell in enumerate(batch)}
+            plan.append({
+                'cells': batch,
+                'start_date': span_start,
+                'end_date': span_end,
+                'members': [
+                    (positions[cell], key, start, end)
+                    for start, end, cell, key in group if cell in positions
+                ]
+            })
+    return plan
@@ -0,0 +1,588 @@
+"""
+Script: historical_weather.py
+Purpose: Collects 30 years of historical weather data (1995-2024) for UK festivals
+Input: data/festivals.csv (contains festival details with lat/long)
+Output: data/all_festivals_historical_weather/ (Parquet, see weather_store.py) and
+        data/all_festivals_historical_weather.csv, or data/hourly_weather/ with --hourly (see hourly_store.py)
+Author: Dom Barry
+"""
+
+import argparse
+from bisect import bisect_left
+from datetime import timedelta
+import os
+
+from archive_cache import ArchiveCache
+from grid_planner import plan_batched_requests, plan_requests, summarise_plan
+from run_metrics import RunMetrics
+from weather_config import DATA_DIR, DATASET_DIR, DEFAULT_HOURLY, HOURLY_MEASURES
+
+# pandas, pyarrow, the HTTP client and the modules built on them are imported by the
+# functions that use them, so the command line (and --help) starts without loading them
+
+# Define file paths
+INPUT_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+CHECKPOINT_DIR = os.path.join(DATA_DIR, 'checkpoints')
+OUTPUT_FILE = os.path.join(DATA_DIR, 'all_festivals_historical_weather.csv')
+GAPS_FILE = os.path.join(DATA_DIR, 'weather_gaps.csv')
+
+# Create checkpoint directory if it doesn't exist
+os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+
+def create_historical_dates(start_date, end_date, years=None):
+    """
+    Takes a festival's 2025 dates and creates equivalent dates for years 1995-2024
+    Example: If festival is 11/06/2025 - 15/06/2025
+    Creates date pairs for 11/06-15/06 for each year 1995-2024
+    Pass years to build windows for other seasons (e.g. [2025])
+    """
+    import pandas as pd
+    from festival_calendar import HISTORICAL_YEARS, historical_windows
+    years = HISTORICAL_YEARS if years is None else years
+    # Shared with the validator's expected-day index, see festival_calendar.py
+    starts, ends = historical_windows([start_date], [end_date], years)
+    return [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in zip(starts[0], ends[0])]
+
+def fetch_historical_weather(lat, long, start_date, end_date, base_url=None, cache=None):
+    """
+    Fetches weather data from OpenMeteo API for given dates and location
+    Rate limiting and retries are handled by archive_fetcher
+    """
+    from archive_fetcher import build_archive_params, fetch_all
+    params = build_archive_params(lat, long, start_date, end_date)
+    return fetch_all([params], concurrency=1, base_url=base_url, cache=cache)[0]
+
+def slice_weather_window(weather_data, start_date, end_date, frequency='daily'):
+    """
+    Cuts a single festival window out of a longer API response
+    Returns data in the same shape as the API so it can be passed to
+    process_historical_weather (or process_hourly_weather) unchanged
+    - frequency: 'daily', or 'hourly' to keep every hour of the window's days
+    """
+    if not weather_data or frequency not in weather_data:
+        return None
+    
+    block = weather_data[frequency]
+    
+    # Times are sorted ISO dates (or date-times), so the window can be found by bisection;
+    # everything before the day after the window belongs to it
+    first = bisect_left(block['time'], start_date.strftime('%Y-%m-%d'))
+    last = bisect_left(block['time'], (end_date + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if first >= last:
+        return None
+    
+    window = dict(weather_data)
+    window[frequency] = {key: values[first:last] for key, values in block.items()}
+    return window
+
+def plan_festival_requests(festivals, full_period=False, completed=None):
+    """
+    Plans the API requests for a set of festivals
+    Festivals sharing a weather-model grid cell are fetched together and their
+    date windows merged, so each cell/window is requested only once
+    - full_period: one request per cell covering all years, rather than one per merged window (see plan_requests)
+    - completed: (festival_id, year) windows already saved, which are left out of the plan
+    """
+    completed = completed or set()
+    locations = []
+    for idx, festival in festivals.iterrows():
+        date_ranges = [
+            (start_date, end_date)
+            for start_date, end_date in create_historical_dates(festival['startDate'], festival['endDate'])
+            if (festival['ID'], start_date.year) not in completed
+        ]
+        if date_ranges:
+            locations.append((idx, festival['lat'], festival['long'], date_ranges))
+    
+    plan = plan_requests(locations, full_period)
+    summarise_plan(plan, sum(len(date_ranges) for _, _, _, date_ranges in locations))
+    return plan
+
+def fetch_festival_years(plan, festivals, manifest, concurrency=None, base_url=None, cache=None, limits=None,
+                         metrics=None):
+    """
+    Fetches the planned requests concurrently within the API's rate limits
+    As each response arrives it is fanned back out to the festivals in that grid
+    cell and their windows are checkpointed straight away
+    - metrics: RunMetrics counting saved windows and records (and drawing the progress line, if live)
+    Returns the number of windows that could not be fetched
+    """
+    from archive_fetcher import build_archive_params, fetch_all
+    metrics = metrics or RunMetrics('collect')
+    failed_windows = []
+    total_windows = sum(len(request['members']) for request in plan)
+    metrics.set_gauge('windows_planned', total_windows)
+    
+    def save_response(position, weather_data):
+        request = plan[position]
+        windows = []
+        for idx, start_date, end_date in request['members']:
+            festival = festivals.loc[idx]
+            window = slice_weather_window(weather_data, start_date, end_date)
+            batch = process_historical_weather(window, festival, start_date.year)
+            if batch is not None:
+                windows.append((festival['ID'], start_date.year, batch))
+            else:
+                failed_windows.append((festival['Title'], start_date.year))
+        # The live progress line replaces the per-response messages
+        record_count = save_checkpoint(manifest, windows, quiet=metrics.live)
+        metrics.increment('windows_saved', len(windows))
+        metrics.increment('windows_failed', len(request['members']) - len(windows))
+        metrics.increment('records_saved', record_count)
+        metrics.progress(metrics.counters['windows_saved'] + metrics.counters['windows_failed'], total_windows,
+                         'windows')
+    
+    print(f"Fetching {len(plan)} requests")
+    params_list = [
+        build_archive_params(request['cell'][0], request['cell'][1], request['start_date'], request['end_date'])
+        for request in plan
+    ]
+    fetch_all(params_list, concurrency=concurrency, limits=limits, base_url=base_url, cache=cache,
+              on_result=save_response, metrics=metrics)
+    
+    for title, year in failed_windows:
+        print(f"Failed to get data for {title} {year}")
+    return len(failed_windows)
+
+def process_historical_weather(weather_data, festival_info, year):
+    """
+    Processes raw weather API data into a column batch with one row per festival day
+    Each daily array is converted straight into a typed column, and the festival's
+    id, name, year and location are broadcast rather than copied onto every row
+    Returns a pyarrow RecordBatch with RECORD_SCHEMA (None if there is no data)
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from weather_store import DAILY_VARIABLES, RECORD_SCHEMA
+    if not weather_data or 'daily' not in weather_data:
+        return None
+    
+    daily = weather_data['daily']
+    days = len(daily['time'])
+    if not days:
+        return None
+    
+    times = pa.array(daily['time'], pa.string())
+    columns = {
+        'festival_id': pa.repeat(pa.scalar(festival_info['ID'], pa.int32()), days),
+        # A single-entry dictionary: every row points at the one copy of the name
+        'festival_name': pa.DictionaryArray.from_arrays(
+            pa.repeat(pa.scalar(0, pa.int32()), days), pa.array([festival_info['Title']], pa.string())
+        ),
+        'historical_year': pa.repeat(pa.scalar(year, pa.int16()), days),
+        'calendar_date': pc.utf8_slice_codeunits(times, 5).dictionary_encode(),  # Extract MM-DD
+        'full_date': pc.strptime(times, format='%Y-%m-%d', unit='s').cast(pa.date32()),
+        **{
+            column: pa.array(daily[variable], pa.float64())
+            for column, variable in DAILY_VARIABLES.items()
+        },
+        'lat': pa.repeat(pa.scalar(festival_info['lat'], pa.float64()), days),
+        'long': pa.repeat(pa.scalar(festival_info['long'], pa.float64()), days)
+    }
+    return pa.RecordBatch.from_arrays(
+        [columns[field.name].cast(field.type) for field in RECORD_SCHEMA], schema=RECORD_SCHEMA
+    )
+
+def process_hourly_weather(weather_data, festival_info, year, columns=DEFAULT_HOURLY, hours=None):
+    """
+    Processes an hourly API window into a batch of scaled int16 columns (see hourly_store.py)
+    - hours: only keep this (first, last) local-time window of each day
+    Returns a pyarrow RecordBatch (None if there is no data)
+    """
+    from hourly_store import to_hourly_batch
+    if not weather_data or 'hourly' not in weather_data or not weather_data['hourly']['time']:
+        return None
+    return to_hourly_batch(weather_data['hourly'], festival_info['ID'], year, columns, hours)
+
+def save_checkpoint(manifest, windows, quiet=False):
+    """
+    Saves completed (festival_id, year, batch) windows to the checkpoint manifest
+    Windows are committed together, so a crash never leaves a partial window behind
+    """
+    record_count = manifest.record_windows(windows)
+    if windows and not quiet:
+        festival_names = sorted({batch.column('festival_name').dictionary[0].as_py() for _, _, batch in windows})
+        print(f"Saved {len(windows)} windows ({record_count} records) for {', '.join(festival_names)}")
+    return record_count
+
+def combine_checkpoint_files(manifest, first_id=None, last_id=None):
+    """
+    Combines all checkpointed windows (optionally within a festival_id range) into a single file
+    Windows are streamed out of the checkpoint parts in (festival_id, year) order
+    """
+    from weather_store import convert_csv
+    print("Combining checkpointed windows...")
+    total_records, festival_ids = manifest.combine(OUTPUT_FILE, first_id, last_id)
+    
+    if total_records:
+        print(f"\nCreated combined file: {OUTPUT_FILE}")
+        print(f"Total records: {total_records}")
+        print(f"Unique festivals in combined file: {len(festival_ids)}")
+        print(f"Festival IDs included: {min(festival_ids)} to {max(festival_ids)}")
+        
+        # Stream the combined CSV into the typed, partitioned Parquet dataset
+        convert_csv(OUTPUT_FILE, DATASET_DIR)
+        print(f"Created columnar dataset: {DATASET_DIR}")
+        return OUTPUT_FILE
+    else:
+        print("No checkpointed windows found to combine")
+        return None
+
+def main(start_festival=0, end_festival=207, full_period=False, concurrency=None, base_url=None, use_cache=True,
+         cache_only=False, limits=None, progress=False):
+    """
+    Main function to process festivals and collect weather data
+    Parameters:
+    - start_festival: Index to start processing from (0-based)
+    - end_festival: Index to process up to (exclusive)
+    - full_period: Fetch all years for each grid cell in one request rather than one per merged window; the
+      archive charges long spans as many calls, so this uses far more quota and is only for unmetered servers
+    - concurrency: Maximum number of API requests in flight (default archive_fetcher.MAX_CONCURRENCY)
+    - base_url: Archive API endpoint (e.g. a local mock_archive_server.py; default archive_fetcher.ARCHIVE_URL)
+    - use_cache: Reuse API responses saved by earlier runs (see archive_cache.py)
+    - cache_only: Work offline from the cache; uncached windows are reported as failed
+    - limits: API quota overrides (see archive_fetcher.RATE_LIMITS), e.g. to lift them for a local mock server
+    - progress: show a live progress line with an ETA instead of a message per response
+    Request latency, retries, 429s, bytes, waits and stage timings are written to data/metrics/collect.json
+    (and .prom) when the run ends, even if it fails part way
+    """
+    import pandas as pd
+    from checkpoint_manifest import CheckpointManifest
+    print("Starting historical weather data collection...")
+    
+    # Check if input file exists
+    if not os.path.exists(INPUT_FILE):
+        raise FileNotFoundError(f"Input file not found: {INPUT_FILE}")
+    
+    print(f"Processing festivals {start_festival + 1} to {end_festival}")
+    print("Collecting data for years 1995-2024")
+    
+    # Load and slice festival data
+    festivals_df = pd.read_csv(INPUT_FILE)
+    festivals_to_process = festivals_df.iloc[start_festival:end_festival]
+    total_festivals = len(festivals_to_process)
+    
+    # Resume from the manifest, skipping windows that earlier runs completed
+    manifest = CheckpointManifest(CHECKPOINT_DIR)
+    metrics = RunMetrics('collect', live=progress)
+    try:
+        with metrics.stage('plan'):
+            completed = manifest.completed_windows()
+            festival_ids = set(festivals_to_process['ID'])
+            already_done = len([key for key in completed if key[0] in festival_ids])
+            if already_done:
+                print(f"Resuming: {already_done} windows already saved")
+            
+            # Plan requests across all festivals so shared grid cells are only fetched once
+            plan = plan_festival_requests(festivals_to_process, full_period, completed)
+        
+        # Historical archive data does not change, so earlier responses can be reused
+        cache = ArchiveCache(cache_only=cache_only) if use_cache or cache_only else None
+        
+        with metrics.stage('fetch'):
+            failed_windows = fetch_festival_years(plan, festivals_to_process, manifest, concurrency, base_url, cache,
+                                                  limits, metrics)
+        
+        # Combine checkpointed windows into final dataset
+        print("\nCreating final combined dataset...")
+        with metrics.stage('combine'):
+            combined_file = combine_checkpoint_files(
+                manifest, festivals_to_process['ID'].min(), festivals_to_process['ID'].max()
+            )
+        completed = manifest.completed_windows()
+    finally:
+        manifest.close()
+        write_run_metrics(metrics)
+    
+    if combined_file:
+        print(f"\nFinal dataset saved to: {combined_file}")
+    
+    # Print completion summary
+    completed_festivals = {festival_id for festival_id, _ in completed}
+    failed_festivals = festivals_to_process.loc[~festivals_to_process['ID'].isin(completed_festivals), 'Title']
+    print("\nData collection completed!")
+    print(f"Successfully processed: {total_festivals - len(failed_festivals)}/{total_festivals} festivals")
+    if failed_windows:
+        print(f"Windows still missing: {failed_windows} (rerun to retry them)")
+    if cache is not None:
+        print(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+    
+    if len(failed_festivals):
+        print("\nFailed to process these festivals:")
+        for festival in failed_festivals:
+            print(f"- {festival}")
+
+def write_run_metrics(metrics):
+    """Adds the fetch stage's throughput to the run's metrics and writes them to data/metrics"""
+    fetch_seconds = metrics.stages.get('fetch', {}).get('seconds')
+    if fetch_seconds:
+        metrics.set_gauge('records_per_second', round(metrics.counters.get('records_saved', 0) / fetch_seconds, 2))
+        metrics.set_gauge('requests_per_second', round(metrics.counters.get('requests', 0) / fetch_seconds, 2))
+    print(f"Run metrics saved to {metrics.write()}")
+
+def collect_hourly(start_festival=0, end_festival=207, columns=None, hours=None, concurrency=None, base_url=None,
+                   use_cache=True, cache_only=False, dataset_dir=None, progress=False):
+    """
+    Collects hourly weather for every festival window into the hourly store
+    Requests cover one merged window per grid cell rather than all 30 years, as a
+    30-year hourly response would be huge. Windows already stored are skipped, so
+    an interrupted collection resumes where it stopped.
+    Parameters:
+    - columns: measures to collect, as hourly_store columns or archive variables (default DEFAULT_HOURLY)
+    - hours: (first, last) local hours to keep, e.g. (12, 23); None keeps all 24
+    - dataset_dir: hourly store to append to (its measures and hours must match; default hourly_store.HOURLY_DIR)
+    - progress: show a live progress line with an ETA
+    Run metrics are written to data/metrics/collect_hourly.json (and .prom)
+    Returns the number of windows that could not be fetched
+    """
+    import pandas as pd
+    from archive_fetcher import build_archive_params, fetch_all
+    from hourly_store import (HOURLY_DIR, HourlyWriter, compact_hourly, parse_columns, parse_hours, store_summary,
+                              stored_windows)
+    dataset_dir = dataset_dir or HOURLY_DIR
+    columns = parse_columns(columns or DEFAULT_HOURLY)
+    hours = parse_hours(hours)
+    print(f"Collecting hourly {', '.join(columns)} for "
+          f"{'all hours' if hours is None else 'local hours %02d-%02d' % hours}")
+    
+    festivals = pd.read_csv(INPUT_FILE).iloc[start_festival:end_festival]
+    writer = HourlyWriter(dataset_dir, columns, hours)
+    completed = stored_windows(dataset_dir)
+    if completed:
+        print(f"Resuming: {len(completed)} windows already stored")
+    plan = plan_festival_requests(festivals, full_period=False, completed=completed)
+    
+    variables = [HOURLY_MEASURES[column][0] for column in columns]
+    failed_windows = []
+    metrics = RunMetrics('collect_hourly', live=progress)
+    total_windows = sum(len(request['members']) for request in plan)
+    metrics.set_gauge('windows_planned', total_windows)
+    
+    def save_response(position, weather_data):
+        for idx, start_date, end_date in plan[position]['members']:
+            festival = festivals.loc[idx]
+            window = slice_weather_window(weather_data, start_date, end_date, 'hourly')
+            batch = process_hourly_weather(window, festival, start_date.year, columns, hours)
+            if batch is not None:
+                writer.add(batch)
+                metrics.increment('windows_saved')
+                metrics.increment('records_saved', batch.num_rows)
+            else:
+                failed_windows.append((festival['Title'], start_date.year))
+                metrics.increment('windows_failed')
+        metrics.progress(metrics.counters.get('windows_saved', 0) + len(failed_windows), total_windows, 'windows')
+    
+    params_list = [
+        build_archive_params(request['cell'][0], request['cell'][1], request['start_date'], request['end_date'],
+                             hourly=variables)
+        for request in plan
+    ]
+    cache = ArchiveCache(cache_only=cache_only) if use_cache or cache_only else None
+    print(f"Fetching {len(plan)} requests")
+    try:
+        with metrics.stage('fetch'):
+            try:
+                fetch_all(params_list, concurrency=concurrency, base_url=base_url, cache=cache,
+                          on_result=save_response, metrics=metrics)
+            finally:
+                writer.close()
+        
+        # Sort each year into one file so consecutive hours sit together for the delta encoding
+        with metrics.stage('compact'):
+            compact_hourly(dataset_dir)
+    finally:
+        write_run_metrics(metrics)
+    rows, files, size = store_summary(dataset_dir)
+    print(f"\nStored {writer.windows} windows ({writer.rows} hourly rows) in {dataset_dir}")
+    print(f"Hourly store: {rows} rows, {size / 1e6:.1f} MB ({size / max(rows, 1):.2f} bytes per row)")
+    for title, year in failed_windows:
+        print(f"Failed to get data for {title} {year}")
+    return len(failed_windows)
+
+def find_missing_windows(festivals_df, existing_df, years):
+    """
+    Finds the (festival, year) windows not yet present in the stored dataset
+    Returns a list of (festival index, festival, date_ranges) for festivals with gaps
+    """
+    have = set(zip(existing_df['festival_id'], existing_df['historical_year']))
+    missing = []
+    for idx, festival in festivals_df.iterrows():
+        missing_years = [year for year in years if (festival['ID'], year) not in have]
+        if missing_years:
+            date_ranges = create_historical_dates(festival['startDate'], festival['endDate'], missing_years)
+            missing.append((idx, festival, date_ranges))
+    return missing
+
+def load_existing_dataset():
+    """Reads the stored CSV dataset (an empty frame if there is none yet)"""
+    import pandas as pd
+    if os.path.exists(OUTPUT_FILE):
+        return pd.read_csv(OUTPUT_FILE)
+    return pd.DataFrame(columns=['festival_id', 'historical_year'])
+
+def refetch_windows(missing, existing_df, concurrency=None, base_url=None, use_cache=True, replace=False):
+    """
+    Fetches the given festival windows and merges them into OUTPUT_FILE and the Parquet dataset
+    Many locations are packed into each request
+    Parameters:
+    - missing: list of (festival index, festival, date_ranges), as from find_missing_windows
+    - existing_df: the stored dataset
+    - replace: drop the stored rows of every window fetched successfully (repairing it),
+      rather than only adding days that are not stored yet
+    Returns the number of windows that could not be fetched
+    """
+    import pandas as pd
+    import pyarrow as pa
+    from archive_fetcher import build_multi_location_params, fetch_all, split_locations
+    from checkpoint_manifest import CheckpointManifest
+    from weather_store import convert_csv, decode_dictionaries
+    total_windows = sum(len(date_ranges) for _, _, date_ranges in missing)
+    
+    # Pack windows from many grid cells into shared multi-location requests
+    locations = [(idx, festival['lat'], festival['long'], date_ranges) for idx, festival, date_ranges in missing]
+    plan = plan_batched_requests(locations)
+    print(f"Fetching {total_windows} windows in {len(plan)} requests")
+    
+    params_list = [
+        build_multi_location_params(request['cells'], request['start_date'], request['end_date'])
+        for request in plan
+    ]
+    cache = ArchiveCache() if use_cache else None
+    results = fetch_all(params_list, concurrency=concurrency, base_url=base_url, cache=cache)
+    
+    # Slice each festival window out of its location's response
+    festivals_by_idx = {idx: festival for idx, festival, _ in missing}
+    windows = []
+    failed_windows = 0
+    for request, weather_data in zip(plan, results):
+        payloads = split_locations(weather_data, len(request['cells']))
+        for position, idx, start_date, end_date in request['members']:
+            festival = festivals_by_idx[idx]
+            window = slice_weather_window(payloads[position], start_date, end_date)
+            batch = process_historical_weather(window, festival, start_date.year)
+            if batch is not None:
+                windows.append((festival['ID'], start_date.year, batch))
+            else:
+                failed_windows += 1
+    
+    # Record the new windows in the manifest so later full runs keep them
+    manifest = CheckpointManifest(CHECKPOINT_DIR)
+    try:
+        save_checkpoint(manifest, windows)
+    finally:
+        manifest.close()
+    new_df = pd.DataFrame(columns=existing_df.columns)
+    if windows:
+        new_table = decode_dictionaries(pa.Table.from_batches([batch for _, _, batch in windows]))
+        new_df = new_table.to_pandas()
+        new_df['full_date'] = new_df['full_date'].astype(str)
+    
+    if replace and windows:
+        fetched = pd.MultiIndex.from_tuples([(int(festival_id), int(year)) for festival_id, year, _ in windows])
+        stored = pd.MultiIndex.from_frame(existing_df[['festival_id', 'historical_year']].astype('int64'))
+        existing_df = existing_df[~stored.isin(fetched)]
+    
+    # Merge into the stored dataset, keeping any existing rows for the same day
+    combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+    combined_df = combined_df.drop_duplicates(['festival_id', 'full_date'], keep='first')
+    combined_df = combined_df.sort_values(['festival_id', 'historical_year', 'full_date'])
+    combined_df.to_csv(OUTPUT_FILE, index=False)
+    convert_csv(OUTPUT_FILE, DATASET_DIR)
+    
+    print(f"Added {len(new_df)} records to {OUTPUT_FILE} and {DATASET_DIR}")
+    if failed_windows:
+        print(f"Failed to get data for {failed_windows} windows")
+    return failed_windows
+
+def refresh_missing_years(years, concurrency=None, base_url=None, use_cache=True):
+    """
+    Adds newly finished seasons (or fills gaps) without re-collecting everything
+    Only (festival, year) windows missing from the stored dataset are fetched, with
+    many locations packed into each request, and the results merged into OUTPUT_FILE
+    Parameters:
+    - years: seasons to make sure are present, e.g. [2025]
+    """
+    import pandas as pd
+    print(f"Refreshing weather data for years: {', '.join(str(year) for year in years)}")
+    
+    festivals_df = pd.read_csv(INPUT_FILE)
+    existing_df = load_existing_dataset()
+    
+    missing = find_missing_windows(festivals_df, existing_df, years)
+    if not missing:
+        print("Dataset is already up to date")
+        return OUTPUT_FILE
+    
+    refetch_windows(missing, existing_df, concurrency, base_url, use_cache)
+    return OUTPUT_FILE
+
+def repair_gaps(gaps_file=GAPS_FILE, concurrency=None, base_url=None, use_cache=True):
+    """
+    Re-fetches only the windows listed in the validator's gap report
+    Every (festival, year) window with a missing, duplicated or out-of-window day is
+    fetched again and replaces the stored rows for that window
+    Parameters:
+    - gaps_file: report written by weather_data_validator_detailed.py
+    """
+    import pandas as pd
+    from festival_calendar import gap_windows
+    if not os.path.exists(gaps_file):
+        raise FileNotFoundError(f"Gap report not found: {gaps_file} (run weather_data_validator_detailed.py first)")
+    
+    festivals_df = pd.read_csv(INPUT_FILE)
+    report = pd.read_csv(gaps_file)
+    keys = gap_windows(report, festivals_df)
+    if not keys:
+        print("Gap report lists no windows to repair")
+        return OUTPUT_FILE
+    print(f"Repairing {len(keys)} windows listed in {gaps_file}")
+    
+    # Windows are grouped per festival so create_historical_dates builds each one's dates
+    years_by_festival = {}
+    for festival_id, year in keys:
+        years_by_festival.setdefault(festival_id, []).append(year)
+    missing = [
+        (idx, festival, create_historical_dates(festival['startDate'], festival['endDate'],
+                                                years_by_festival[festival['ID']]))
+        for idx, festival in festivals_df[festivals_df['ID'].isin(years_by_festival)].iterrows()
+    ]
+    
+    refetch_windows(missing, load_existing_dataset(), concurrency, base_url, use_cache, replace=True)
+    return OUTPUT_FILE
+
+def command_line(argv=None):
+    """Command line entry point: collects the weather data"""
+    parser = argparse.ArgumentParser(description='Collect historical weather data for UK festivals')
+    parser.add_argument('--refresh', type=int, nargs='+', metavar='YEAR',
+                        help='only fetch these years where missing from the stored dataset')
+    parser.add_argument('--repair', action='store_true',
+                        help=f'only re-fetch the windows listed in the validator gap report ({GAPS_FILE})')
+    parser.add_argument('--hourly', action='store_true',
+                        help="collect hourly weather into the hourly store instead of daily aggregates "
+                             "(see 'festival-weather hourly')")
+    parser.add_argument('--variables', nargs='+', metavar='NAME',
+                        help=f"hourly measures to collect (default: {' '.join(DEFAULT_HOURLY)}; "
+                             f"available: {' '.join(HOURLY_MEASURES)})")
+    parser.add_argument('--hours', type=int, nargs=2, metavar=('FIRST', 'LAST'),
+                        help='local hours to keep with --hourly (inclusive; 22 6 wraps past midnight)')
+    parser.add_argument('--full-period', action='store_true',
+                        help='fetch every year for each grid cell in one request (the archive charges the span as '
+                             'many calls, so only for unmetered servers)')
+    parser.add_argument('--progress', action='store_true',
+                        help='show a live progress line with an ETA instead of a message per response')
+    args = parser.parse_args(argv)
+    if args.full_period and (args.hourly or args.repair or args.refresh):
+        parser.error('--full-period only applies to a full collection, not --hourly, --repair or --refresh')
+    
+    if args.hourly:
+        collect_hourly(columns=args.variables, hours=args.hours, progress=args.progress)
+    elif args.repair:
+        repair_gaps()
+    elif args.refresh:
+        refresh_missing_years(args.refresh)
+    else:
+        # Run for all festivals
+        main(start_festival=0, end_festival=207, full_period=args.full_period, progress=args.progress)
+
+if __name__ == "__main__":
+    command_line()
@@ -0,0 +1,377 @@
+"""
+Module: hourly_store.py
+Purpose: Compact Parquet storage for hourly festival weather, and the daily metrics derived from it
+Used by: historical_weather.py (--hourly)
+Author: Dom Barry
+
+Hourly data is 24 times the volume of the daily dataset, so every measure is held
+as an int16 count of a fixed unit (0.1 C, 0.1 mm, 0.1 km/h, 1 %). That is exact for
+the archive's one-decimal values and a quarter of the float64 size in memory.
+Files are partitioned by historical_year and sorted by festival and local time.
+Keys and smoothly varying measures (temperature, wind) use Parquet's
+DELTA_BINARY_PACKED encoding, as consecutive hours differ by a few units; mostly-zero
+measures (rain) keep dictionary/run-length encoding, which packs dry spells better.
+Times are the local clock times (Europe/London) the archive returns, stored as
+full_date plus hour.
+
+Example:
+    python analysis/hourly_store.py                       # size of the hourly store
+    python analysis/hourly_store.py --daily --hours 12 23 # daily metrics for afternoons and evenings
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from weather_config import DATA_DIR, DEFAULT_HOURLY, HOURLY_MEASURES
+from weather_store import MEASURE_DECIMALS, ROW_GROUP_SIZE
+
+# Define file paths
+HOURLY_DIR = os.path.join(DATA_DIR, 'hourly_weather')
+HOURLY_DAILY_FILE = os.path.join(DATA_DIR, 'hourly_daily_weather.csv')
+
+KEY_FIELDS = [
+    ('festival_id', pa.int32()),
+    ('historical_year', pa.int16()),
+    ('full_date', pa.date32()),
+    ('hour', pa.int8())
+]
+
+# Daily metric -> (hourly measure, aggregation); names match the daily dataset where they overlap
+DAILY_METRICS = {
+    'max_temp_c': ('temp_c', 'max'),
+    'min_temp_c': ('temp_c', 'min'),
+    'rainfall_mm': ('rain_mm', 'sum'),
+    'total_precipitation_mm': ('precipitation_mm', 'sum'),
+    'max_windspeed_kmh': ('windspeed_kmh', 'max'),
+    'max_windgust_kmh': ('windgust_kmh', 'max'),
+    'mean_humidity_pct': ('humidity_pct', 'mean'),
+    'mean_cloudcover_pct': ('cloudcover_pct', 'mean'),
+    'rain_hours': ('rain_mm', 'wet_hours')
+}
+
+PARTITIONING = ds.partitioning(pa.schema([KEY_FIELDS[1]]), flavor='hive')
+
+# Same festival-days per row group as the daily dataset, so festival filters prune as finely
+HOURLY_ROW_GROUP_SIZE = ROW_GROUP_SIZE * 24
+
+# Buffered rows before the collector writes them out (about 10 MB)
+FLUSH_ROWS = 500_000
+
+def parse_columns(values):
+    """
+    Resolves measure columns or archive variable names (e.g. 'temp_c' or 'temperature_2m')
+    Raises ValueError for unknown names
+    """
+    by_variable = {variable: column for column, (variable, _, _) in HOURLY_MEASURES.items()}
+    columns = []
+    for value in values:
+        column = value if value in HOURLY_MEASURES else by_variable.get(value)
+        if column is None:
+            raise ValueError(f"Unknown hourly variable: {value} (choose from {', '.join(HOURLY_MEASURES)})")
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+def parse_hours(values):
+    """
+    Checks a local-time window given as (first hour, last hour), both 0-23 and inclusive
+    A first hour after the last wraps past midnight, e.g. (22, 6) for overnight
+    """
+    if values is None:
+        return None
+    first, last = (int(value) for value in values)
+    if not (0 <= first <= 23 and 0 <= last <= 23):
+        raise ValueError(f"Hours must be between 0 and 23, not {first}-{last}")
+    return first, last
+
+def hourly_schema(columns=DEFAULT_HOURLY, hours=None):
+    """
+    Schema of collected hourly batches: keys plus one int16 column per measure
+    The unit of each measure and the local-time window are kept in the schema metadata
+    """
+    layout = {'hours': list(hours) if hours else None,
+              'scales': {column: HOURLY_MEASURES[column][1] for column in columns}}
+    return pa.schema(KEY_FIELDS + [(column, pa.int16()) for column in columns],
+                     metadata={'hourly_weather': json.dumps(layout)})
+
+def stored_layout(schema):
+    """Reads the (hours, scales) layout written by hourly_schema"""
+    layout = json.loads((schema.metadata or {}).get(b'hourly_weather', b'{}'))
+    hours = layout.get('hours')
+    return (tuple(hours) if hours else None), layout.get('scales', {})
+
+def hour_mask(hour, hours):
+    """Marks the hours inside a (first, last) local-time window; None keeps every hour"""
+    if hours is None:
+        return pc.is_valid(hour)
+    first, last = hours
+    after_first = pc.greater_equal(hour, first)
+    before_last = pc.less_equal(hour, last)
+    return pc.and_(after_first, before_last) if first <= last else pc.or_(after_first, before_last)
+
+def to_hourly_batch(hourly, festival_id, year, columns=DEFAULT_HOURLY, hours=None):
+    """
+    Converts an archive 'hourly' block into a batch with hourly_schema
+    - hourly: {'time': ['YYYY-MM-DDTHH:MM', ...], variable: [values]} in local time
+    Values are rounded to each measure's unit and cast to int16; a value outside
+    the int16 range raises rather than wrapping. Returns None if no hours are left.
+    """
+    schema = hourly_schema(columns, hours)
+    times = pa.array(hourly['time'], pa.string())
+    rows = len(times)
+    arrays = [
+        pa.repeat(pa.scalar(festival_id, pa.int32()), rows),
+        pa.repeat(pa.scalar(year, pa.int16()), rows),
+        pc.strptime(pc.utf8_slice_codeunits(times, 0, 10), format='%Y-%m-%d', unit='s').cast(pa.date32()),
+        pc.utf8_slice_codeunits(times, 11, 13).cast(pa.int8())
+    ]
+    for column in columns:
+        variable, scale, _ = HOURLY_MEASURES[column]
+        values = pa.array(hourly[variable], pa.float64())
+        arrays.append(pc.round(pc.multiply(values, float(scale))).cast(pa.int16()))
+
+    batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+    if hours is not None:
+        batch = batch.filter(hour_mask(batch.column('hour'), hours))
+    return batch if batch.num_rows else None
+
+def write_options(schema):
+    """Parquet writer options: zstd plus each column's delta or dictionary encoding"""
+    delta = [field.name for field in schema if field.name in dict(KEY_FIELDS) or
+             HOURLY_MEASURES.get(field.name, (None, None, ''))[2] == 'DELTA_BINARY_PACKED']
+    return {
+        'compression': 'zstd',
+        'use_dictionary': [field.name for field in schema if field.name not in delta],
+        'column_encoding': {name: 'DELTA_BINARY_PACKED' for name in delta},
+        'row_group_size': HOURLY_ROW_GROUP_SIZE
+    }
+
+def write_partition_file(table, path):
+    """Writes one file of a year partition via a temporary file, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    pq.write_table(table, temp_path, **write_options(table.schema))
+    os.replace(temp_path, path)
+
+def hourly_files(dataset_dir=HOURLY_DIR, year='*'):
+    return sorted(glob.glob(os.path.join(dataset_dir, f'historical_year={year}', '*.parquet')))
+
+def check_layout(dataset_dir, schema):
+    """
+    Makes sure new batches match the measures and hour window already stored
+    Raises ValueError on a mismatch, as mixing layouts would give days with different coverage
+    """
+    files = hourly_files(dataset_dir)
+    if not files:
+        return
+    stored = pq.read_schema(files[0])
+    if stored_layout(stored) != stored_layout(schema):
+        hours, scales = stored_layout(stored)
+        raise ValueError(
+            f"{dataset_dir} holds {', '.join(scales)} for hours {hours or 'all'}; "
+            "collect into another directory or delete it first"
+        )
+
+class HourlyWriter:
+    """
+    Buffers hourly window batches and appends them to the store as year-partitioned files
+    Each flush writes whole windows and renames complete files into place, so an
+    interrupted run loses at most the buffered windows, which the next run fetches again
+    """
+
+    def __init__(self, dataset_dir=HOURLY_DIR, columns=DEFAULT_HOURLY, hours=None, flush_rows=FLUSH_ROWS):
+        self.dataset_dir = dataset_dir
+        self.schema = hourly_schema(columns, hours)
+        self.flush_rows = flush_rows
+        self.batches = []
+        self.buffered = 0
+        self.rows = 0
+        self.windows = 0
+        check_layout(dataset_dir, self.schema)
+
+    def add(self, batch):
+        self.batches.append(batch)
+        self.buffered += batch.num_rows
+        self.windows += 1
+        if self.buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.batches:
+            return
+        table = pa.Table.from_batches(self.batches, schema=self.schema)
+        token = time.time_ns()
+        for year in pc.unique(table.column('historical_year')).to_pylist():
+            part = table.filter(pc.equal(table.column('historical_year'), year)).drop_columns(['historical_year'])
+            write_partition_file(part, os.path.join(self.dataset_dir, f'historical_year={year}', f'part-{token}.parquet'))
+        self.rows += self.buffered
+        self.batches = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+def open_hourly(dataset_dir=HOURLY_DIR):
+    files = hourly_files(dataset_dir)
+    if not files:
+        raise FileNotFoundError(f"No hourly weather found in {dataset_dir} (run historical_weather.py --hourly)")
+    stored = pq.read_schema(files[0])
+    return ds.dataset(files, schema=stored.insert(1, pa.field(*KEY_FIELDS[1])), format='parquet',
+                      partitioning=PARTITIONING, partition_base_dir=dataset_dir)
+
+def stored_windows(dataset_dir=HOURLY_DIR):
+    """Returns the (festival_id, year) windows present in the store, for resuming a collection"""
+    if not hourly_files(dataset_dir):
+        return set()
+    keys = open_hourly(dataset_dir).to_table(columns=['festival_id', 'historical_year'])
+    keys = keys.group_by(['festival_id', 'historical_year']).aggregate([])
+    return set(zip(keys.column('festival_id').to_pylist(), keys.column('historical_year').to_pylist()))
+
+def compact_hourly(dataset_dir=HOURLY_DIR):
+    """
+    Rewrites each year partition as a single file sorted by festival, date and hour
+    Collection appends many small files in arrival order; sorting puts consecutive
+    hours next to each other, which is what makes the delta encoding small
+    """
+    for year_dir in sorted(glob.glob(os.path.join(dataset_dir, 'historical_year=*'))):
+        files = sorted(glob.glob(os.path.join(year_dir, '*.parquet')))
+        if len(files) == 1 and os.path.basename(files[0]) == 'part-0.parquet':
+            continue
+        table = pa.concat_tables(pq.read_table(path) for path in files)
+        table = table.sort_by([('festival_id', 'ascending'), ('full_date', 'ascending'), ('hour', 'ascending')])
+        write_partition_file(table, os.path.join(year_dir, 'part-0.parquet'))
+        for path in files:
+            if os.path.basename(path) != 'part-0.parquet':
+                os.remove(path)
+
+def read_hourly(dataset_dir=HOURLY_DIR, columns=None, festival_ids=None, years=None, hours=None, as_float=False):
+    """
+    Reads part of the hourly store as a DataFrame sorted by festival, date and hour
+    - columns: measures to load (default all stored)
+    - festival_ids / years: only read these festivals and year partitions
+    - hours: only keep hours inside this (first, last) local-time window
+    - as_float: convert measures to float64 in their natural units, rather than the
+      stored integer units (nullable Int16, 2 bytes per value plus a validity mask)
+    """
+    dataset = open_hourly(dataset_dir)
+    scales = stored_layout(dataset.schema)[1]
+    measures = [column for column in (columns or scales) if column in scales]
+    condition = None
+    if festival_ids is not None:
+        condition = ds.field('festival_id').isin([int(value) for value in festival_ids])
+    if years is not None:
+        year_condition = ds.field('historical_year').isin([int(value) for value in years])
+        condition = year_condition if condition is None else condition & year_condition
+    table = dataset.to_table(columns=[name for name, _ in KEY_FIELDS] + measures, filter=condition)
+    table = table.filter(hour_mask(table.column('hour'), parse_hours(hours)))
+    table = table.sort_by([('festival_id', 'ascending'), ('full_date', 'ascending'), ('hour', 'ascending')])
+
+    if as_float:
+        for column in measures:
+            values = pc.divide(table.column(column).cast(pa.float64()), float(scales[column]))
+            table = table.set_column(table.column_names.index(column), column, values)
+        return table.to_pandas(date_as_object=False)
+
+    df = table.to_pandas(date_as_object=False, types_mapper={pa.int16(): pd.Int16Dtype()}.get)
+    df['historical_year'] = df['historical_year'].astype('int16')
+    return df
+
+def derive_daily(table, scales, hours=None):
+    """
+    Aggregates an hourly table into one row per (festival_id, full_date)
+    - scales: stored units per value of each measure (see stored_layout)
+    - hours: only use hours inside this (first, last) local-time window, e.g. (12, 18) for afternoons
+      A window wrapping past midnight, e.g. (22, 6), gives one row per night keyed by the date it
+      starts, so the early hours count towards the previous evening; the first and last nights of
+      a collected window are partial, as their hours column shows
+    Sums and extremes are taken on the stored integers, so they are exact before converting to units
+    Returns a DataFrame of festival_id, historical_year, full_date, hours and every DAILY_METRICS
+    column whose measure is stored
+    """
+    table = table.filter(hour_mask(table.column('hour'), hours))
+    if hours is not None and hours[0] > hours[1]:
+        days = table.column('full_date').cast(pa.int32())
+        early = pc.less_equal(table.column('hour'), hours[1])
+        night_start = pc.if_else(early, pc.subtract(days, pa.scalar(1, pa.int32())), days)
+        table = table.set_column(table.column_names.index('full_date'), 'full_date', night_start.cast(pa.date32()))
+    metrics = {metric: spec for metric, spec in DAILY_METRICS.items() if spec[0] in scales}
+    for metric, (column, how) in metrics.items():
+        if how == 'wet_hours':
+            table = table.append_column(metric, pc.greater(table.column(column), 0).cast(pa.int32()))
+
+    keys = ['festival_id', 'historical_year', 'full_date']
+    aggregations = [('hour', 'count')] + [
+        (metric, 'sum') if how == 'wet_hours' else (column, how)
+        for metric, (column, how) in metrics.items()
+    ]
+    daily = table.group_by(keys, use_threads=False).aggregate(aggregations)
+    daily = daily.sort_by([(key, 'ascending') for key in keys])
+
+    df = daily.select(keys).to_pandas(date_as_object=False)
+    df['hours'] = daily.column('hour_count').to_numpy()
+    for metric, (column, how) in metrics.items():
+        name = f'{metric}_sum' if how == 'wet_hours' else f'{column}_{how}'
+        values = daily.column(name).to_numpy(zero_copy_only=False)
+        df[metric] = values if how == 'wet_hours' else (values.astype('float64') / scales[column]).round(MEASURE_DECIMALS)
+    return df
+
+def daily_from_hourly(dataset_dir=HOURLY_DIR, hours=None, festival_ids=None):
+    """
+    Derives daily metrics for the whole store, one year partition at a time
+    Only one year of hourly rows is in memory at once
+    """
+    dataset = open_hourly(dataset_dir)
+    scales = stored_layout(dataset.schema)[1]
+    years = sorted(int(path.split('historical_year=')[1]) for path in glob.glob(os.path.join(dataset_dir, 'historical_year=*')))
+    frames = []
+    for year in years:
+        condition = ds.field('historical_year') == year
+        if festival_ids is not None:
+            condition = condition & ds.field('festival_id').isin([int(value) for value in festival_ids])
+        frames.append(derive_daily(dataset.to_table(filter=condition), scales, parse_hours(hours)))
+    return pd.concat(frames, ignore_index=True)
+
+def store_summary(dataset_dir=HOURLY_DIR):
+    """Returns (rows, files, bytes on disk) for the hourly store"""
+    files = hourly_files(dataset_dir)
+    rows = sum(pq.ParquetFile(path).metadata.num_rows for path in files)
+    return rows, len(files), sum(os.path.getsize(path) for path in files)
+
+def main(daily=False, hours=None, output_file=HOURLY_DAILY_FILE):
+    """
+    Reports the size of the hourly store and optionally writes daily metrics derived from it
+    """
+    rows, files, size = store_summary()
+    if not files:
+        raise FileNotFoundError(f"No hourly weather found in {HOURLY_DIR} (run historical_weather.py --hourly)")
+    stored_hours, scales = stored_layout(pq.read_schema(hourly_files()[0]))
+    print(f"Hourly store: {HOURLY_DIR}")
+    print(f"Measures: {', '.join(f'{column} (1/{scale})' for column, scale in scales.items())}")
+    print(f"Hours collected: {'%02d-%02d' % stored_hours if stored_hours else 'all'}")
+    print(f"{rows} hourly rows in {files} files, {size / 1e6:.1f} MB ({size / max(rows, 1):.2f} bytes per row)")
+
+    if daily:
+        daily_df = daily_from_hourly(hours=hours)
+        daily_df.to_csv(output_file, index=False)
+        print(f"Saved {len(daily_df)} daily rows to {output_file}")
+
+def command_line(argv=None):
+    """Command line entry point: inspects the hourly store"""
+    parser = argparse.ArgumentParser(description='Inspect the hourly weather store and derive daily metrics')
+    parser.add_argument('--daily', action='store_true', help=f'write daily metrics to {HOURLY_DAILY_FILE}')
+    parser.add_argument('--hours', type=int, nargs=2, metavar=('FIRST', 'LAST'),
+                        help='only use these local hours (inclusive; 22 6 wraps past midnight, one row per night)')
+    args = parser.parse_args(argv)
+    main(args.daily, args.hours)
+
+if __name__ == "__main__":
+    command_line()
@@ -0,0 +1,202 @@
+"""
+Script: mock_archive_server.py
+Purpose: Local stand-in for the Open-Meteo archive API with simulated latency, 429s and server errors
+Input: Archive-style GET requests (latitude, longitude, start_date, end_date, daily or hourly)
+Output: Deterministic synthetic weather JSON in the archive API format
+Author: Dom Barry
+
+Example:
+    python analysis/mock_archive_server.py --port 8765 --latency 0.2 --rate-limit-prob 0.1
+    then pass base_url='http://127.0.0.1:8765/v1/archive' to the collector
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_DAILY = ['temperature_2m_max', 'temperature_2m_min', 'precipitation_sum', 'rain_sum', 'windspeed_10m_max']
+
+def synthetic_daily_value(variable, lat, long, day):
+    """
+    Returns a repeatable, roughly UK-like value for one variable on one day
+    The same location and date always give the same value
+    """
+    rng = random.Random(f"{variable}|{lat:.4f}|{long:.4f}|{day.isoformat()}")
+    season = math.sin(2 * math.pi * (day.timetuple().tm_yday - 110) / 365.25)
+    if variable == 'temperature_2m_max':
+        return round(14 + 8 * season - (lat - 52) * 0.6 + rng.gauss(0, 3), 1)
+    if variable == 'temperature_2m_min':
+        return round(6 + 6 * season - (lat - 52) * 0.5 + rng.gauss(0, 2.5), 1)
+    if variable in ('precipitation_sum', 'rain_sum'):
+        # Reuse one seed so rain never exceeds total precipitation
+        rain_rng = random.Random(f"rain|{lat:.4f}|{long:.4f}|{day.isoformat()}")
+        amount = round(rain_rng.expovariate(0.35), 1) if rain_rng.random() < 0.45 else 0.0
+        return amount
+    if variable == 'windspeed_10m_max':
+        return round(max(2.0, rng.gauss(20 - 4 * season, 6)), 1)
+    return round(rng.gauss(0, 1), 1)
+
+def synthetic_hourly_value(variable, lat, long, moment):
+    """
+    Returns a repeatable value for one variable in one local hour
+    Each day shares a base value, so hours follow a daily cycle rather than pure noise
+    """
+    day = moment.date()
+    day_rng = random.Random(f"{variable.split('_')[0]}|{lat:.4f}|{long:.4f}|{day.isoformat()}")
+    rng = random.Random(f"{variable}|{lat:.4f}|{long:.4f}|{moment.isoformat()}")
+    season = math.sin(2 * math.pi * (day.timetuple().tm_yday - 110) / 365.25)
+    cycle = math.sin(2 * math.pi * (moment.hour - 9) / 24)
+    if variable == 'temperature_2m':
+        return round(10 + 7 * season - (lat - 52) * 0.55 + day_rng.gauss(0, 3) + 4 * cycle + rng.gauss(0, 0.5), 1)
+    if variable in ('precipitation', 'rain'):
+        # Shared seeds so rain never exceeds total precipitation
+        wet_day = random.Random(f"rain|{lat:.4f}|{long:.4f}|{day.isoformat()}").random() < 0.45
+        hour_rng = random.Random(f"rain|{lat:.4f}|{long:.4f}|{moment.isoformat()}")
+        return round(hour_rng.expovariate(1.5), 1) if wet_day and hour_rng.random() < 0.3 else 0.0
+    if variable in ('windspeed_10m', 'windgusts_10m'):
+        wind_rng = random.Random(f"wind|{lat:.4f}|{long:.4f}|{moment.isoformat()}")
+        speed = max(0.0, day_rng.gauss(14 - 3 * season, 4) + 3 * cycle + wind_rng.gauss(0, 2))
+        return round(speed * 1.6 + rng.uniform(0, 4) if variable == 'windgusts_10m' else speed, 1)
+    if variable == 'relative_humidity_2m':
+        return int(min(100, max(30, 80 - 15 * cycle + rng.gauss(0, 5))))
+    if variable == 'cloudcover':
+        return int(min(100, max(0, day_rng.uniform(0, 100) + rng.gauss(0, 15))))
+    return round(rng.gauss(0, 1), 1)
+
+def build_location_payload(lat, long, start, end, daily, hourly=None):
+    """
+    Builds one location's response in the archive API format
+    Hourly variables, if requested, replace the daily block
+    """
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    payload = {
+        'latitude': lat,
+        'longitude': long,
+        'timezone': 'Europe/London'
+    }
+    if hourly:
+        # Local clock hours, as the archive returns for a named timezone
+        moments = [datetime(day.year, day.month, day.day, hour) for day in days for hour in range(24)]
+        payload['hourly_units'] = {variable: '' for variable in ['time'] + hourly}
+        payload['hourly'] = {'time': [moment.strftime('%Y-%m-%dT%H:%M') for moment in moments]}
+        for variable in hourly:
+            payload['hourly'][variable] = [synthetic_hourly_value(variable, lat, long, moment) for moment in moments]
+        return payload
+
+    payload['daily_units'] = {variable: '' for variable in ['time'] + daily}
+    payload['daily'] = {'time': [day.isoformat() for day in days]}
+    for variable in daily:
+        payload['daily'][variable] = [synthetic_daily_value(variable, lat, long, day) for day in days]
+    return payload
+
+def split_list(values):
+    """Accepts both repeated (a=1&a=2) and comma separated (a=1,2) parameters"""
+    return [item for value in values for item in value.split(',') if item]
+
+def make_handler(latency, jitter, rate_limit_prob, retry_after, stats, server_error_prob=0.0):
+    """Creates a request handler class bound to the given simulation settings"""
+
+    class MockArchiveHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep connections alive between requests
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            with stats['lock']:
+                stats['requests'] += 1
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            if random.random() < rate_limit_prob:
+                with stats['lock']:
+                    stats['rate_limited'] += 1
+                self.send_json(429, {'error': True, 'reason': 'Too many requests'},
+                               {'Retry-After': str(retry_after)})
+                return
+            if random.random() < server_error_prob:
+                with stats['lock']:
+                    stats['server_errors'] += 1
+                self.send_json(503, {'error': True, 'reason': 'Service unavailable'})
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                lats = [float(value) for value in split_list(query['latitude'])]
+                longs = [float(value) for value in split_list(query['longitude'])]
+                start = date.fromisoformat(query['start_date'][0])
+                end = date.fromisoformat(query['end_date'][0])
+                daily = split_list(query.get('daily', [])) or DEFAULT_DAILY
+                hourly = split_list(query.get('hourly', []))
+            except (KeyError, ValueError) as e:
+                self.send_json(400, {'error': True, 'reason': f'Invalid request: {e}'})
+                return
+            if len(lats) != len(longs) or end < start:
+                self.send_json(400, {'error': True, 'reason': 'Invalid request'})
+                return
+
+            payloads = [build_location_payload(lat, long, start, end, daily, hourly) for lat, long in zip(lats, longs)]
+            self.send_json(200, payloads[0] if len(payloads) == 1 else payloads)
+
+    return MockArchiveHandler
+
+def start_mock_server(port=0, latency=0.0, jitter=0.0, rate_limit_prob=0.0, retry_after=1, server_error_prob=0.0):
+    """
+    Starts the mock server on a background thread
+    Returns (server, base_url, stats); call server.shutdown() when finished
+    - port: 0 picks a free port
+    - latency / jitter: seconds added to every response
+    - rate_limit_prob: fraction of requests answered with 429
+    - retry_after: Retry-After seconds sent with each 429
+    - server_error_prob: fraction of requests answered with 503
+    """
+    stats = {'requests': 0, 'rate_limited': 0, 'server_errors': 0, 'lock': threading.Lock()}
+    handler = make_handler(latency, jitter, rate_limit_prob, retry_after, stats, server_error_prob)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1/archive"
+    return server, base_url, stats
+
+def main(argv=None):
+    """
+    Runs the mock server in the foreground until interrupted
+    """
+    parser = argparse.ArgumentParser(description='Mock Open-Meteo archive API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--rate-limit-prob', type=float, default=0.05)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--server-error-prob', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, base_url, stats = start_mock_server(args.port, args.latency, args.jitter,
+                                                args.rate_limit_prob, args.retry_after, args.server_error_prob)
+    print(f"Mock archive API listening on {base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {stats['requests']} requests ({stats['rate_limited']} rate limited, "
+              f"{stats['server_errors']} server errors)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Module: outlier_engine.py
+Purpose: Vectorised IQR and robust z-score outlier detection for every measure and scope at once
+Used by: weather_outlier_checker.py
+Author: Dom Barry
+
+Outliers are judged within a scope: across the whole UK dataset ('global'),
+within each festival's own history ('festival', so a cool Scottish June is
+normal for that festival), and across all festivals on the same calendar date
+('calendar_date', so an August heatwave is compared with other Augusts).
+
+Measures are stored to a fixed number of decimals (see weather_store.py), so
+each value is mapped to an integer grid step and every group's quantiles are
+read off a single bincount histogram per measure and scope. Both rules are then
+evaluated once per (group, value step) and looked up for each row, so there is
+no per-group sort and tens of millions of rows take seconds. Values are checked
+against the grid first: if any lies off it (or a scope has too many groups for
+dense histograms) the values are sorted within their groups instead, which gives
+the same quantiles without the assumption. Rows whose group key is missing
+belong to no group and are never flagged. The robust z-score uses the median
+and the normalised IQR (IQR / 1.349) as the spread, so both rules come from the
+same quantiles.
+"""
+
+import numpy as np
+import pandas as pd
+
+from weather_loader import widen_measure
+from weather_store import MEASURE_COLUMNS, MEASURE_DECIMALS
+
+# Columns that define the groups of each scope
+SCOPES = {
+    'global': [],
+    'festival': ['festival_id'],
+    'calendar_date': ['calendar_date']
+}
+
+# Rule labels in the outlier table, indexed by (iqr fired) + 2 * (robust_z fired) - 1
+RULES = ['iqr', 'robust_z', 'iqr+robust_z']
+
+IQR_FACTOR = 1.5
+ROBUST_Z_LIMIT = 3.5
+
+# IQR of a normal distribution in standard deviations
+NORMAL_IQR = 1.349
+
+# Measures are held to MEASURE_DECIMALS places, so values map exactly onto integer steps of this size
+GRID_SCALE = 10 ** MEASURE_DECIMALS
+
+# Largest (groups x value steps) histogram to build before falling back to sorting
+MAX_HISTOGRAM_CELLS = 20_000_000
+
+def group_codes(df, columns):
+    """
+    Numbers the groups formed by columns (a single group if there are none)
+    Rows with a missing value in any of the columns get code -1 and belong to no group
+    Returns (codes, group count)
+    """
+    if not columns:
+        return np.zeros(len(df), dtype='int64'), 1
+    if len(columns) == 1:
+        codes, uniques = pd.factorize(df[columns[0]])
+    else:
+        codes, uniques = pd.MultiIndex.from_frame(df[columns]).factorize()
+    codes = codes.astype('int64')
+    codes[df[columns].isna().any(axis=1).to_numpy()] = -1
+    return codes, len(uniques)
+
+class ValueGrid:
+    """
+    A measure's values as integer steps of 1 / GRID_SCALE above the lowest value
+    on_grid is False if any value is not exactly a step (or the steps span too far
+    for 32 bits), in which case there are no steps and quantiles come from sorting
+    Computed once per measure and shared by every scope
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.present = ~np.isnan(values)
+        present_values = values[self.present]
+        steps = np.rint(present_values * GRID_SCALE)
+        self.lowest = int(steps.min()) if len(steps) else 0
+        self.bins = int(steps.max()) - self.lowest + 1 if len(steps) else 1
+        self.on_grid = self.bins < 2 ** 31 and np.array_equal(steps / GRID_SCALE, present_values)
+        self.steps = (steps - self.lowest).astype('int32') if self.on_grid else None
+
+    def step_values(self):
+        """The value of every step (identical to the stored values, which are rounded to the grid)"""
+        return (np.arange(self.bins) + self.lowest) / GRID_SCALE
+
+def interpolate(low, high, fraction):
+    """Linear interpolation as numpy does it, so global bounds agree exactly with Series.quantile"""
+    difference = high - low
+    return np.where(fraction >= 0.5, high - difference * (1 - fraction), low + difference * fraction)
+
+def grid_quantiles(grid, codes, group_count, quantiles):
+    """
+    Computes quantiles of a ValueGrid within every group (rows with code -1 are left out)
+    Returns (array of shape (group_count, len(quantiles)) with NaN for empty groups, lookup),
+    where lookup is (rows, flat histogram index of each of those rows' values), or None if
+    the values were sorted instead
+    """
+    keyed = codes >= 0
+    all_keyed = bool(keyed.all())
+    dense = grid.on_grid and group_count * grid.bins <= MAX_HISTOGRAM_CELLS
+
+    if dense:
+        if all_keyed:
+            rows, steps = grid.present, grid.steps
+        else:
+            rows, steps = grid.present & keyed, grid.steps[keyed[grid.present]]
+        index = codes[rows] * grid.bins + steps
+        # One histogram row per group; cumulative counts give each value's rank
+        histogram = np.bincount(index, minlength=group_count * grid.bins)
+        cumulative = np.cumsum(histogram.reshape(group_count, grid.bins), axis=1)
+        counts = cumulative[:, -1]
+
+        # Offsetting each row makes the flattened counts sorted, so one searchsorted finds every order statistic
+        offsets = np.arange(group_count, dtype='int64') * (int(counts.max()) + 1)
+        flat = (cumulative + offsets[:, None]).ravel()
+
+        def order_statistic(rank):
+            steps = np.searchsorted(flat, rank + offsets, side='right') - np.arange(group_count) * grid.bins
+            return (steps + grid.lowest) / GRID_SCALE
+        lookup = (rows, index)
+    else:
+        # Values off the grid, or too many groups for dense histograms: sort the values within their groups
+        rows = grid.present if all_keyed else grid.present & keyed
+        values, row_codes = grid.values[rows], codes[rows]
+        ordered = values[np.lexsort((values, row_codes))]
+        counts = np.bincount(row_codes, minlength=group_count)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        def order_statistic(rank):
+            return ordered[np.minimum(starts + rank, len(ordered) - 1)] if len(ordered) else np.zeros(group_count)
+        lookup = None
+
+    result = np.full((group_count, len(quantiles)), np.nan)
+    has_values = counts > 0
+    for column, quantile in enumerate(quantiles):
+        position = (counts - 1) * quantile
+        below = np.floor(position).astype('int64').clip(min=0)
+        above = np.minimum(below + 1, counts - 1).clip(min=0)
+        result[has_values, column] = interpolate(order_statistic(below), order_statistic(above),
+                                                 position - below)[has_values]
+    return result, lookup
+
+def grouped_quantiles(values, codes, group_count, quantiles):
+    """
+    Computes quantiles of values within every group, matching pandas' linear interpolation
+    Returns an array of shape (group_count, len(quantiles)), NaN for groups without values
+    """
+    return grid_quantiles(ValueGrid(values), codes, group_count, quantiles)[0]
+
+def outlier_masks(matrix, codes, group_count, iqr_factor=IQR_FACTOR, z_limit=ROBUST_Z_LIMIT, grids=None):
+    """
+    Flags outliers in every column of a (rows, measures) matrix within each group
+    - grids: ValueGrid per column, if already computed
+    Returns a dict with (rows, measures) iqr and robust_z masks, plus per-group
+    (groups, measures) lower_bound, upper_bound, median and spread arrays
+    """
+    rows, measures = matrix.shape
+    # Masks are filled a measure at a time, so they are stored measure-major and returned transposed
+    flags = {rule: np.zeros((measures, rows), dtype=bool) for rule in ('iqr', 'robust_z')}
+    result = {
+        **{rule: mask.T for rule, mask in flags.items()},
+        **{name: np.empty((group_count, measures)) for name in ('lower_bound', 'upper_bound', 'median', 'spread')}
+    }
+    for column in range(measures):
+        grid = grids[column] if grids else ValueGrid(matrix[:, column])
+        quantiles, lookup = grid_quantiles(grid, codes, group_count, [0.25, 0.5, 0.75])
+        q1, median, q3 = quantiles.T
+        iqr = q3 - q1
+        lower = q1 - iqr_factor * iqr
+        upper = q3 + iqr_factor * iqr
+
+        # A zero IQR (e.g. mostly dry days) gives no spread to scale by, so no robust z-score
+        spread = np.where(iqr > 0, iqr / NORMAL_IQR, np.nan)
+
+        if lookup is not None:
+            # Judge every (group, value step) once, then look each row's flags up
+            present, index = lookup
+            present = slice(None) if len(index) == rows else present
+            values = grid.step_values()[None, :]
+            iqr_table = (values < lower[:, None]) | (values > upper[:, None])
+            z_table = np.abs(values - median[:, None]) > z_limit * spread[:, None]
+            flags['iqr'][column][present] = iqr_table.ravel()[index]
+            flags['robust_z'][column][present] = z_table.ravel()[index]
+        else:
+            # Rows without a group keep no flags
+            keyed = codes >= 0
+            values, groups = matrix[keyed, column], codes[keyed]
+            flags['iqr'][column][keyed] = (values < lower[groups]) | (values > upper[groups])
+            flags['robust_z'][column][keyed] = np.abs(values - median[groups]) > z_limit * spread[groups]
+
+        result['lower_bound'][:, column] = lower
+        result['upper_bound'][:, column] = upper
+        result['median'][:, column] = median
+        result['spread'][:, column] = spread
+    return result
+
+def take_labels(series, rows):
+    """Picks rows of a label column, staying categorical so names are not copied per row"""
+    labels = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    return pd.Categorical.from_codes(labels.cat.codes.to_numpy()[rows], dtype=labels.dtype)
+
+def find_outliers(df, measures=None, scopes=SCOPES, iqr_factor=IQR_FACTOR, z_limit=ROBUST_Z_LIMIT):
+    """
+    Runs both outlier rules for every measure in every scope
+    Returns a long DataFrame with one row per (record, measure, scope) where a rule fired:
+    festival_id, festival_name, full_date, measure, value, scope, rule ('iqr', 'robust_z' or 'iqr+robust_z'),
+    lower_bound, upper_bound, robust_z
+    """
+    measures = [column for column in (measures or MEASURE_COLUMNS) if column in df.columns]
+    # Widened a measure at a time, so only the float64 copy of the measures is held at once
+    matrix = np.empty((len(df), len(measures)))
+    for position, column in enumerate(measures):
+        matrix[:, position] = widen_measure(df[column])
+    grids = [ValueGrid(matrix[:, column]) for column in range(len(measures))]
+
+    tables = []
+    for scope, columns in scopes.items():
+        codes, group_count = group_codes(df, columns)
+        masks = outlier_masks(matrix, codes, group_count, iqr_factor, z_limit, grids)
+        positions, rows = np.nonzero((masks['iqr'] | masks['robust_z']).T)
+        if not len(rows):
+            continue
+
+        # Bounds and z-scores are only worked out for the flagged values
+        groups = codes[rows]
+        values = matrix[rows, positions]
+        iqr_fired = masks['iqr'][rows, positions]
+        z_fired = masks['robust_z'][rows, positions]
+        tables.append(pd.DataFrame({
+            'festival_id': df['festival_id'].to_numpy()[rows],
+            'festival_name': take_labels(df['festival_name'], rows),
+            'full_date': df['full_date'].to_numpy()[rows],
+            'measure': pd.Categorical.from_codes(positions, categories=measures),
+            'value': values,
+            'scope': pd.Categorical.from_codes(np.full(len(rows), list(scopes).index(scope)), categories=list(scopes)),
+            'rule': pd.Categorical.from_codes(iqr_fired + 2 * z_fired - 1, categories=RULES),
+            'lower_bound': masks['lower_bound'][groups, positions].round(2),
+            'upper_bound': masks['upper_bound'][groups, positions].round(2),
+            'robust_z': ((values - masks['median'][groups, positions]) / masks['spread'][groups, positions]).round(2)
+        }))
+
+    columns = ['festival_id', 'festival_name', 'full_date', 'measure', 'value', 'scope', 'rule',
+               'lower_bound', 'upper_bound', 'robust_z']
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tables, ignore_index=True)
+
+def summarise_outliers(table):
+    """Counts flagged values by measure, scope and rule"""
+    return table.groupby(['measure', 'scope', 'rule'], observed=True).size().unstack(['scope', 'rule'], fill_value=0)
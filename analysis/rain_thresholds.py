@@ -0,0 +1,136 @@
+"""
+Module: rain_thresholds.py
+Purpose: Counts rain days for many thresholds in one pass, for rain-day sensitivity analysis
+Used by: festival_weather_summary_5mm.py, streaming_stats.py
+Author: Dom Barry
+
+Each day's value is placed in a bin between consecutive sorted thresholds, and a
+single bincount per measure gives every festival's count of days in each bin.
+Reverse cumulative sums of those counts are the rain days above each threshold,
+so adding thresholds costs almost nothing. Thresholds are millimetre values
+(e.g. 5) or UK-wide percentiles of the measure written as 'p90'.
+"""
+
+import numpy as np
+import pandas as pd
+
+from weather_loader import widen_measure
+
+# Measures rain days can be defined on
+RAIN_COLUMNS = ['rainfall_mm', 'total_precipitation_mm']
+
+# Thresholds used when none are given
+DEFAULT_THRESHOLDS = [1, 2, 5, 10, 'p90', 'p95']
+
+def zscore(values):
+    """z-scores values (ddof 0, as scipy.stats.zscore); any NaN makes every z-score NaN"""
+    values = np.asarray(values, dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values - values.mean()) / values.std()
+
+def parse_thresholds(values):
+    """
+    Parses thresholds such as ['1', '2.5', 'p90'] into numbers and percentile labels
+    Raises ValueError for anything else
+    """
+    thresholds = []
+    for value in values:
+        text = str(value).strip().lower()
+        try:
+            if text.startswith('p'):
+                percentile = float(text[1:])
+                if not 0 <= percentile <= 100:
+                    raise ValueError
+                thresholds.append(f'p{text[1:]}')
+            else:
+                thresholds.append(float(text))
+        except ValueError:
+            raise ValueError(f"Invalid rain threshold: {value} (use millimetres, e.g. 5, or a percentile, e.g. p90)")
+    return thresholds
+
+def resolve_thresholds(thresholds, percentile):
+    """
+    Converts thresholds to millimetre cut-offs for one measure
+    - percentile: function returning the measure's value at a percentile (0-100) over every day in the dataset
+    Returns a list of (label, millimetres)
+    """
+    resolved = []
+    for threshold in thresholds:
+        if isinstance(threshold, str):
+            resolved.append((threshold, round(float(percentile(float(threshold[1:]))), 2)))
+        else:
+            resolved.append((f'{threshold:g}mm', float(threshold)))
+    return resolved
+
+def count_days_above(codes, group_count, values, cut_offs):
+    """
+    Counts, for every group, the days with a value above each cut-off
+    - codes: group number (0..group_count-1) of each day
+    - values: the measure for each day (missing values never count)
+    - cut_offs: millimetre cut-offs, in any order
+    Returns an array of shape (group_count, len(cut_offs))
+    """
+    cut_offs = np.asarray(cut_offs, dtype='float64')
+    order = np.argsort(cut_offs)
+    bins = len(cut_offs) + 1
+
+    # Bin b holds days above exactly b of the sorted cut-offs
+    positions = np.searchsorted(cut_offs[order], values, side='left')
+    positions[np.isnan(values)] = 0
+    counts = np.bincount(codes * bins + positions, minlength=group_count * bins).reshape(group_count, bins)
+
+    # Days above sorted cut-off j are those in bins j+1 and higher
+    above = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    result = np.empty_like(above)
+    result[:, order] = above
+    return result
+
+def threshold_rows(groups, total_days, column, resolved, rain_days, by='festival_name'):
+    """
+    Lays out one measure's rain-day counts as rows of the long threshold table
+    - resolved: (label, millimetres) per threshold; rain_days: array of shape (groups, thresholds)
+    """
+    return [
+        pd.DataFrame({
+            by: groups,
+            'measure': column,
+            'threshold': label,
+            'threshold_mm': mm,
+            'rain_days': rain_days[:, position],
+            'total_days': total_days,
+            'pct_rain_days': (rain_days[:, position] / total_days * 100).round(2)
+        })
+        for position, (label, mm) in enumerate(resolved)
+    ]
+
+def rain_day_table(df, thresholds=DEFAULT_THRESHOLDS, columns=RAIN_COLUMNS, by='festival_name'):
+    """
+    Counts rain days per festival for every threshold and measure
+    Returns a long DataFrame with one row per (festival, measure, threshold):
+    by, measure, threshold, threshold_mm, rain_days, total_days, pct_rain_days
+    """
+    # Category codes number the festivals without hashing every name
+    names = df[by].astype('category').cat.remove_unused_categories()
+    names = names.cat.reorder_categories(sorted(names.cat.categories))
+    codes = names.cat.codes.to_numpy().astype('int64')
+    groups = names.cat.categories.astype(str)
+    total_days = np.bincount(codes, minlength=len(groups))
+
+    tables = []
+    for column in columns:
+        values = widen_measure(df[column])
+        resolved = resolve_thresholds(thresholds, lambda percentile: np.nanpercentile(values, percentile))
+        rain_days = count_days_above(codes, len(groups), values, [mm for _, mm in resolved])
+        tables.extend(threshold_rows(groups, total_days, column, resolved, rain_days, by))
+    return pd.concat(tables, ignore_index=True)
+
+def add_threshold_scores(table, festival_metrics, by='festival_name'):
+    """
+    Adds a weather score for every (measure, threshold) definition of a rain day
+    Temperature and wind z-scores come from festival_metrics (see calculate_weather_scores);
+    the rain z-score is recomputed from each definition's pct_rain_days
+    """
+    table = table.join(festival_metrics[['temp_z', 'wind_z']], on=by)
+    table['rain_z'] = -table.groupby(['measure', 'threshold'])['pct_rain_days'].transform(zscore)
+    table['weather_score'] = table[['temp_z', 'rain_z', 'wind_z']].mean(axis=1).round(2)
+    return table.drop(columns=['temp_z', 'wind_z'])
@@ -0,0 +1,278 @@
+"""
+Module: run_metrics.py
+Purpose: Runtime instrumentation: counters, latency histograms, stage timings and memory, with an ETA progress line
+Used by: archive_fetcher.py, historical_weather.py, weather_pipeline.py and the analysis scripts
+Author: Dom Barry
+
+A RunMetrics object collects one run's numbers and writes them to
+data/metrics/<run>.json and, in the OpenMetrics text format that Prometheus
+scrapes, data/metrics/<run>.prom. Waits are summed over every worker, so with
+8 concurrent requests quota_wait_seconds + backoff_seconds + network_seconds
+can add up to 8 times the wall time; their split is what shows whether a run
+was held back by the quotas, by retries or by the network.
+
+Each stage's peak memory is its own on Linux, where the kernel's peak-RSS mark
+is reset as the stage starts; elsewhere it is the process peak up to that point.
+Updates come from a single thread (the collector's event loop, or the analysis
+code), so nothing is locked.
+"""
+
+import json
+import math
+import numbers
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+from weather_config import DATA_DIR
+
+# Define file paths
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'festival_weather'
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Quantiles reported for every histogram in the JSON summary
+SUMMARY_QUANTILES = [0.5, 0.9, 0.99]
+
+# Least time between redraws of the live progress line
+PROGRESS_INTERVAL = 0.5
+
+def current_rss_mb():
+    """Resident memory of this process now (None where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process so far
+    On Linux this is VmHWM, as ru_maxrss carries over the parent's peak into a spawned process
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def reset_peak_rss():
+    """Resets the kernel's peak-RSS mark to the current RSS (Linux 4.0+); returns False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, as an OpenMetrics histogram does
+    Quantiles are estimated by interpolating within the bucket that holds them
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        position = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.bounds[position - 1] if position else 0.0
+                high = self.bounds[position] if position < len(self.bounds) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, ending with +Inf"""
+        totals, seen = [], 0
+        for bound, count in zip(self.bounds + [math.inf], self.counts):
+            seen += count
+            totals.append((bound, seen))
+        return totals
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'mean': round(self.sum / self.count, 4) if self.count else None,
+            'max': round(self.max, 4),
+            **{f'p{round(q * 100)}': (round(self.quantile(q), 4) if self.count else None) for q in SUMMARY_QUANTILES},
+            'buckets': {('+Inf' if math.isinf(bound) else f'{bound:g}'): seen for bound, seen in self.cumulative()}
+        }
+
+class RunMetrics:
+    """
+    Counters, gauges, histograms and stage timings for one run
+    Parameters:
+    - name: run name, used for the output files and as a label on every metric
+    - live: draw a progress line with rate and ETA on stderr (see progress)
+    """
+
+    def __init__(self, name='run', live=False):
+        self.name = name
+        self.live = live
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.stages = {}
+        self.open_stages = []
+        self.progress_drawn = 0
+        self.progress_width = 0
+
+    def increment(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(buckets)
+        self.histograms[name].observe(value)
+
+    def _fold_peak(self):
+        """Carries the peak so far into every open stage, before a nested stage resets it"""
+        peak = peak_rss_mb()
+        for open_stage in self.open_stages:
+            open_stage['peak'] = max(open_stage['peak'], peak)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a block of work and records its CPU time and memory
+        A stage run more than once accumulates its time and keeps its highest peak;
+        stages may be nested (e.g. loading the data inside the first stage that needs it)
+        """
+        self._fold_peak()
+        own_peak = reset_peak_rss()
+        tracker = {'peak': 0.0}
+        self.open_stages.append(tracker)
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield
+        finally:
+            self._fold_peak()
+            self.open_stages.pop()
+            previous = self.stages.get(name, {})
+            peak = round(tracker['peak'], 1)
+            rss = current_rss_mb()
+            self.stages[name] = {
+                'seconds': round(previous.get('seconds', 0) + time.perf_counter() - started, 4),
+                'cpu_seconds': round(previous.get('cpu_seconds', 0) + time.process_time() - cpu_started, 4),
+                'rss_mb': round(rss, 1) if rss is not None else None,
+                'peak_rss_mb': max(previous.get('peak_rss_mb', 0), peak),
+                'peak_is_stage_only': own_peak,
+                'runs': previous.get('runs', 0) + 1
+            }
+
+    def progress(self, done, total, unit='items'):
+        """
+        Redraws the live progress line (at most every PROGRESS_INTERVAL seconds) with rate and ETA
+        The rate is over the whole run so far, so it settles rather than jumping with each batch
+        """
+        now = time.time()
+        if not self.live or (now - self.progress_drawn < PROGRESS_INTERVAL and done < total):
+            return
+        self.progress_drawn = now
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = format_duration((total - done) / rate) if rate > 0 else '?'
+        percent = done / total * 100 if total else 100.0
+        line = f"\r[{self.name}] {done}/{total} {unit} ({percent:.1f}%) {rate:.1f} {unit}/s, ETA {eta}"
+        # Pad over any longer line drawn before
+        self.progress_width = max(self.progress_width, len(line))
+        sys.stderr.write(line.ljust(self.progress_width) + ('\n' if done >= total else ''))
+        sys.stderr.flush()
+
+    def to_dict(self):
+        return {
+            'run': self.name,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': round(time.time() - self.started, 3),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'counters': {name: round(value, 4) for name, value in sorted(self.counters.items())},
+            'gauges': dict(sorted(self.gauges.items())),
+            'histograms': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            'stages': self.stages
+        }
+
+    def to_openmetrics(self):
+        """Renders every metric in the OpenMetrics text format"""
+        label = f'run="{self.name}"'
+        lines = []
+
+        def family(name, kind, samples):
+            metric = f'{METRIC_PREFIX}_{name}'
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.extend(f'{metric}{suffix}{{{labels}}} {metric_value(value)}' for suffix, labels, value in samples)
+
+        for name, value in sorted(self.counters.items()):
+            family(name, 'counter', [('_total', label, value)])
+        for name, value in sorted(self.gauges.items()):
+            family(name, 'gauge', [('', label, value)])
+        for name, histogram in sorted(self.histograms.items()):
+            buckets = [('_bucket', f'{label},le="{"+Inf" if math.isinf(bound) else f"{bound:g}"}"', seen)
+                       for bound, seen in histogram.cumulative()]
+            family(name, 'histogram', buckets + [('_count', label, histogram.count), ('_sum', label, histogram.sum)])
+        for field in ('seconds', 'cpu_seconds', 'peak_rss_mb'):
+            samples = [('', f'{label},stage="{stage}"', values[field]) for stage, values in self.stages.items()]
+            if samples:
+                family(f'stage_{field}', 'gauge', samples)
+        family('run_seconds', 'gauge', [('', label, time.time() - self.started)])
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_dir=METRICS_DIR):
+        """Writes <run>.json and <run>.prom, replacing the previous run's files; returns the JSON path"""
+        os.makedirs(metrics_dir, exist_ok=True)
+        json_file = os.path.join(metrics_dir, f'{self.name}.json')
+        for path, content in ((json_file, json.dumps(self.to_dict(), indent=2, default=str)),
+                              (os.path.join(metrics_dir, f'{self.name}.prom'), self.to_openmetrics())):
+            temp_file = f'{path}.tmp'
+            with open(temp_file, 'w') as f:
+                f.write(content)
+            os.replace(temp_file, path)
+        return json_file
+
+def metric_value(value):
+    """Formats a sample value without losing precision (integers stay integers)"""
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value))
+
+def format_duration(seconds):
+    """Formats seconds as e.g. 1h02m or 3m05s"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds}s'
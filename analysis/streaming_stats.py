@@ -0,0 +1,382 @@
+"""
+Module: streaming_stats.py
+Purpose: Bounded-memory (streaming) versions of the validation checks and rain-day counts
+Used by: weather_data_validator_detailed.py, festival_weather_summary_5mm.py, festival_stats.py, weather_pipeline.py
+Author: Dom Barry
+
+The dataset is read in batches of a fixed number of rows and every statistic is
+kept as an online reduction, so peak memory depends on the batch size and the
+number of festivals rather than on the number of records. Means and standard
+deviations are combined batch by batch with Chan's parallel update, and
+quantiles come from a histogram sketch over the storage grid (see
+outlier_engine.py).
+
+Tolerances against the in-memory path:
+- counts, minima, maxima, missing values and IQR outlier counts are exact
+- means and standard deviations agree to floating point rounding (~1e-12), so a
+  value printed or saved to 2 decimals can differ by 0.01 when it sits on a rounding tie
+- quantiles (IQR bounds, percentile rain thresholds) are exact while a measure spans
+  fewer than SKETCH_BINS grid steps (655mm or 655C at 0.01); wider measures
+  merge adjacent bins and are within one bin width (MeasureSketch.resolution)
+- the gap check holds a count per expected festival day (14 bytes each), which grows
+  with the number of festivals and years but not with the number of records
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from festival_calendar import HISTORICAL_YEARS, day_keys, expected_days
+from outlier_engine import GRID_SCALE, IQR_FACTOR, interpolate
+from rain_thresholds import DEFAULT_THRESHOLDS, RAIN_COLUMNS, count_days_above, resolve_thresholds, threshold_rows
+from weather_loader import COLUMN_TYPES, enforce_schema
+from weather_store import (BATCH_ROWS, CSV_FILE, DATASET_DIR, MEASURE_COLUMNS, csv_batches, dataset_exists,
+                           scan_batches, widen_measures)
+
+# Largest histogram kept per measure (512KB of counts)
+SKETCH_BINS = 1 << 16
+
+# Approximate size of a CSV row, used to size CSV reads to batch_rows
+CSV_ROW_BYTES = 128
+
+def stream_frames(columns, batch_rows=BATCH_ROWS, years=None):
+    """
+    Yields the dataset (Parquet preferred, CSV otherwise) as DataFrames of about batch_rows rows
+    Each batch has the loader's column types (see weather_loader.py), except that measures are
+    widened to float64 as every streamed statistic needs their exact values
+    - years: only read these year partitions (Parquet dataset only)
+    """
+    if dataset_exists(DATASET_DIR):
+        batches = scan_batches(DATASET_DIR, columns=columns, years=years, batch_rows=batch_rows)
+    else:
+        if not os.path.exists(CSV_FILE):
+            raise FileNotFoundError(f"Input file not found: {CSV_FILE}")
+        batches = (pa.Table.from_batches([batch.select(columns)])
+                   for batch in csv_batches(CSV_FILE, block_size=batch_rows * CSV_ROW_BYTES))
+
+    for table in batches:
+        yield enforce_schema(widen_measures(table).to_pandas(date_as_object=False), columns, 'float64')
+
+class MeasureSketch:
+    """
+    Online summary of one measure: count, missing values, min, max, mean and
+    variance, plus a histogram of grid steps for quantiles and outlier counts
+    Bins start one grid step wide, where quantiles match Series.quantile exactly;
+    if the values span more than max_bins steps the bin width doubles instead
+    """
+
+    def __init__(self, max_bins=SKETCH_BINS):
+        self.max_bins = max_bins
+        self.count = 0
+        self.missing = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.width = 1
+        self.origin = 0
+        self.bins = np.zeros(0, dtype='int64')
+
+    @property
+    def resolution(self):
+        """Largest quantile error: 0 while bins are one grid step wide, otherwise the bin width"""
+        return 0.0 if self.width == 1 else self.width / GRID_SCALE
+
+    def update(self, values):
+        """Adds a batch of values (NaN counts as missing)"""
+        values = np.asarray(values, dtype='float64')
+        present = values[~np.isnan(values)]
+        self.missing += len(values) - len(present)
+        if not len(present):
+            return
+
+        # Chan et al.: combine the batch's mean and sum of squared deviations with the running ones
+        count = self.count + len(present)
+        mean = present.mean()
+        delta = mean - self.mean
+        self.m2 += np.square(present - mean).sum() + delta * delta * self.count * len(present) / count
+        self.mean += delta * len(present) / count
+        self.count = count
+        self.min = min(self.min, present.min())
+        self.max = max(self.max, present.max())
+
+        steps = np.rint(present * GRID_SCALE).astype('int64')
+        self.cover(int(steps.min()), int(steps.max()))
+        self.bins += np.bincount((steps - self.origin) // self.width, minlength=len(self.bins))
+
+    def cover(self, low, high):
+        """Widens the histogram to hold grid steps low..high, doubling the bin width if it would get too long"""
+        if len(self.bins):
+            low = min(low, self.origin)
+            high = max(high, self.origin + len(self.bins) * self.width - 1)
+        width = self.width
+        while high // width - low // width + 1 > self.max_bins:
+            width *= 2
+        origin = low // width * width
+        length = (high - origin) // width + 1
+        if len(self.bins) and origin == self.origin and width == self.width and length == len(self.bins):
+            return
+
+        # Old bins are aligned to the old width, so each falls entirely inside one new bin
+        bins = np.zeros(length, dtype='int64')
+        starts = self.origin + np.arange(len(self.bins)) * self.width
+        np.add.at(bins, (starts - origin) // width, self.bins)
+        self.bins, self.origin, self.width = bins, origin, width
+
+    def std(self):
+        """Sample standard deviation (ddof=1)"""
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+    def bin_values(self):
+        """The value each bin stands for (its own value at one step wide, otherwise its midpoint)"""
+        return (self.origin + np.arange(len(self.bins)) * self.width + (self.width - 1) / 2) / GRID_SCALE
+
+    def order_statistics(self, ranks):
+        """Values at 0-based ranks in sorted order, spreading a wide bin's values evenly across it"""
+        cumulative = np.cumsum(self.bins)
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        if self.width == 1:
+            return (self.origin + positions) / GRID_SCALE
+        within = (ranks - (cumulative[positions] - self.bins[positions]) + 0.5) / self.bins[positions]
+        return (self.origin + positions * self.width + within * self.width - 0.5) / GRID_SCALE
+
+    def quantiles(self, quantiles):
+        """Quantiles with pandas' (numpy's) linear interpolation, NaN without values"""
+        quantiles = np.asarray(quantiles, dtype='float64')
+        if not self.count:
+            return np.full(len(quantiles), np.nan)
+        position = (self.count - 1) * quantiles
+        below = np.floor(position).astype('int64')
+        above = np.minimum(below + 1, self.count - 1)
+        return interpolate(self.order_statistics(below), self.order_statistics(above), position - below)
+
+    def count_outside(self, lower, upper):
+        """Counts values below lower or above upper"""
+        values = self.bin_values()
+        return int(self.bins[(values < lower) | (values > upper)].sum())
+
+    def range_summary(self, iqr_factor=IQR_FACTOR):
+        """Range statistics and IQR outlier bounds, as returned by the validator's summarise_data_ranges"""
+        q1, q3 = self.quantiles([0.25, 0.75])
+        iqr = q3 - q1
+        lower_bound = q1 - iqr_factor * iqr
+        upper_bound = q3 + iqr_factor * iqr
+        return {
+            'min': float(self.min) if self.count else np.nan,
+            'max': float(self.max) if self.count else np.nan,
+            'mean': float(self.mean) if self.count else np.nan,
+            'std': self.std(),
+            'lower_bound': float(lower_bound),
+            'upper_bound': float(upper_bound),
+            'outliers': self.count_outside(lower_bound, upper_bound)
+        }
+
+class KeyCounter:
+    """
+    Per-key totals gathered batch by batch: summed columns, plus columns that keep
+    the value of each key's first row
+    Batch results are merged once they outnumber the merged keys, so merging stays O(n log n) overall
+    """
+
+    def __init__(self, summed, first=()):
+        self.summed = list(summed)
+        self.first = list(first)
+        self.keys = np.zeros(0, dtype='int64')
+        self.values = {name: np.zeros(0, dtype='int64') for name in self.summed + self.first}
+        self.pending = []
+        self.pending_keys = 0
+
+    def reduce(self, keys, values):
+        """Collapses rows sharing a key (keys need not be sorted)"""
+        unique, first_rows, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        reduced = {name: values[name][first_rows] for name in self.first}
+        for name in self.summed:
+            reduced[name] = np.bincount(inverse, weights=values[name], minlength=len(unique)).astype('int64')
+        return unique, reduced
+
+    def update(self, keys, **values):
+        """Adds a batch: int64 keys plus an array per column"""
+        self.pending.append(self.reduce(keys, values))
+        self.pending_keys += len(self.pending[-1][0])
+        if self.pending_keys > len(self.keys):
+            self.merge()
+
+    def merge(self):
+        if not self.pending:
+            return
+        parts = [(self.keys, self.values)] + self.pending
+        self.keys, self.values = self.reduce(
+            np.concatenate([keys for keys, _ in parts]),
+            {name: np.concatenate([values[name] for _, values in parts]) for name in self.values}
+        )
+        self.pending, self.pending_keys = [], 0
+
+    def result(self):
+        """Returns (sorted keys, {column: array})"""
+        self.merge()
+        return self.keys, self.values
+
+class WindowDays:
+    """
+    Record counts for every expected festival day, gathered batch by batch for the gap check
+    Records are counted in place against the sorted keys of the expected days, so memory
+    grows with the number of festival days rather than records; days outside every
+    window (normally none) are kept in a KeyCounter
+    """
+
+    def __init__(self, festivals, years=HISTORICAL_YEARS):
+        self.festivals = festivals
+        self.years = set()
+        self.keys = np.zeros(0, dtype='int64')
+        self.counts = np.zeros(0, dtype='int32')
+        self.first_years = np.zeros(0, dtype='int16')
+        self.outside = KeyCounter(['records'], first=['historical_year'])
+        self.add_years(years)
+
+    def add_years(self, years):
+        """Adds the expected days of years not seen before (e.g. a season added by --refresh)"""
+        # A year at a time, so only one year's expected days are expanded at once
+        for year in sorted(set(int(year) for year in years) - self.years):
+            self.years.add(year)
+            expected = expected_days(self.festivals, [year])
+            keys = np.sort(day_keys(expected['festival_id'], expected['full_date']))
+            positions = np.searchsorted(self.keys, keys)
+            self.keys = np.insert(self.keys, positions, keys)
+            self.counts = np.insert(self.counts, positions, 0)
+            self.first_years = np.insert(self.first_years, positions, 0)
+
+    def count(self, keys, years, records):
+        """Counts day keys against the expected days, keeping the rest aside"""
+        positions = np.searchsorted(self.keys, keys).clip(max=max(len(self.keys) - 1, 0))
+        inside = (self.keys[positions] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+
+        # The first record of a day supplies its historical_year, as in festival_calendar.day_counts
+        unique, first_rows = np.unique(positions[inside], return_index=True)
+        new = self.counts[unique] == 0
+        self.first_years[unique[new]] = years[inside][first_rows[new]]
+        np.add.at(self.counts, positions[inside], records[inside])
+        return ~inside
+
+    def update(self, df):
+        years = df['historical_year'].to_numpy().astype('int64')
+        self.add_years(np.unique(years))
+        keys = day_keys(df['festival_id'], df['full_date'])
+        outside = self.count(keys, years, np.ones(len(keys), dtype='int32'))
+        if outside.any():
+            self.outside.update(keys[outside], records=np.ones(outside.sum(), dtype='int64'),
+                                historical_year=years[outside])
+
+    def result(self):
+        """Returns (day keys, historical years, record counts) as festival_calendar.day_counts does"""
+        keys, values = self.outside.result()
+        # Days set aside before their year's windows were added belong with the expected days
+        outside = self.count(keys, values['historical_year'], values['records'])
+        seen = self.counts > 0
+        positions = np.searchsorted(self.keys[seen], keys[outside])
+        return (
+            np.insert(self.keys[seen], positions, keys[outside]),
+            np.insert(self.first_years[seen], positions, values['historical_year'][outside]),
+            np.insert(self.counts[seen], positions, values['records'][outside])
+        )
+
+def name_codes(names, numbers):
+    """
+    Numbers a batch's categorical names consistently across batches
+    - numbers: {name: number} shared by every batch, extended with names not seen before
+    """
+    names = names.cat.remove_unused_categories()
+    lookup = np.array([numbers.setdefault(name, len(numbers)) for name in names.cat.categories.astype(str)],
+                      dtype='int64')
+    return lookup[names.cat.codes.to_numpy()]
+
+def scan_validation(festivals=None, batch_rows=BATCH_ROWS):
+    """
+    Reduces the whole dataset, batch by batch, to what the validation report needs
+    - festivals: festival dates (festivals.csv) for the gap check, which is skipped without them
+    Returns a dict with records, missing (per column), sketches (per measure), festival_years
+    (rows and calendar_date counts per festival name and year), first_date, last_date and
+    days (as returned by festival_calendar.day_counts, or None)
+    """
+    columns = list(COLUMN_TYPES)
+    records = 0
+    missing = pd.Series(0, index=columns)
+    sketches = {column: MeasureSketch() for column in MEASURE_COLUMNS}
+    numbers = {}
+    festival_years = KeyCounter(['rows', 'records'])
+    days = WindowDays(festivals) if festivals is not None else None
+    first_date, last_date = pd.NaT, pd.NaT
+
+    for df in stream_frames(columns, batch_rows):
+        records += len(df)
+        missing += df.isnull().sum()
+        for column, sketch in sketches.items():
+            sketch.update(df[column].to_numpy())
+
+        # (festival, year) pairs are packed as name number * 2^16 + year
+        years = df['historical_year'].to_numpy().astype('int64')
+        festival_years.update(
+            name_codes(df['festival_name'], numbers) * 65536 + years,
+            rows=np.ones(len(df), dtype='int64'), records=df['calendar_date'].notna().to_numpy().astype('int64')
+        )
+        if days is not None:
+            days.update(df)
+        first_date = df['full_date'].min() if pd.isna(first_date) else min(first_date, df['full_date'].min())
+        last_date = df['full_date'].max() if pd.isna(last_date) else max(last_date, df['full_date'].max())
+
+    pairs, counts = festival_years.result()
+    names = np.array(list(numbers), dtype=object)
+    return {
+        'records': records,
+        'missing': missing,
+        'sketches': sketches,
+        'festival_years': pd.DataFrame({
+            'festival_name': names[pairs // 65536] if len(pairs) else np.array([], dtype=object),
+            'historical_year': pairs % 65536,
+            **counts
+        }),
+        'first_date': first_date,
+        'last_date': last_date,
+        'days': days.result() if days is not None else None
+    }
+
+def stream_rain_day_table(thresholds=DEFAULT_THRESHOLDS, columns=RAIN_COLUMNS, by='festival_name',
+                          batch_rows=BATCH_ROWS):
+    """
+    Streaming version of rain_thresholds.rain_day_table, with the same output
+    Percentile thresholds take one extra pass to sketch each measure before rain days are counted
+    """
+    if any(isinstance(threshold, str) for threshold in thresholds):
+        sketches = {column: MeasureSketch() for column in columns}
+        for df in stream_frames(columns, batch_rows):
+            for column, sketch in sketches.items():
+                sketch.update(df[column].to_numpy())
+        percentiles = {column: lambda percentile, sketch=sketch: sketch.quantiles([percentile / 100])[0]
+                       for column, sketch in sketches.items()}
+    else:
+        percentiles = {column: None for column in columns}
+    resolved = {column: resolve_thresholds(thresholds, percentiles[column]) for column in columns}
+
+    # Festivals are numbered as they are first seen, and counts grow to match
+    numbers = {}
+    total_days = np.zeros(0, dtype='int64')
+    rain_days = {column: np.zeros((0, len(thresholds)), dtype='int64') for column in columns}
+    for df in stream_frames([by] + columns, batch_rows):
+        codes = name_codes(df[by], numbers)
+        group_count = len(numbers)
+
+        total_days = np.pad(total_days, (0, group_count - len(total_days)))
+        total_days += np.bincount(codes, minlength=group_count)
+        for column in columns:
+            counts = count_days_above(codes, group_count, df[column].to_numpy(dtype='float64'),
+                                      [mm for _, mm in resolved[column]])
+            rain_days[column] = np.pad(rain_days[column], ((0, group_count - len(rain_days[column])), (0, 0)))
+            rain_days[column] += counts
+
+    groups = pd.Index(sorted(numbers))
+    order = np.array([numbers[name] for name in groups], dtype='int64')
+    tables = []
+    for column in columns:
+        tables.extend(threshold_rows(groups, total_days[order], column, resolved[column], rain_days[column][order], by))
+    return pd.concat(tables, ignore_index=True)
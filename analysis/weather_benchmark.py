@@ -0,0 +1,435 @@
+"""
+Script: weather_benchmark.py
+Purpose: Times every pipeline stage on synthetic festivals and weather at a chosen scale, fully offline
+Input: None (synthetic festivals.csv and weather are generated under data/benchmarks/work/)
+Output: data/benchmarks/<run>.json with seconds, throughput and peak memory per stage
+Author: Dom Barry
+
+Each stage runs in a fresh process so its peak RSS is its own, and is timed
+around the work itself (inputs such as the loaded dataset are prepared first
+and excluded from the time but not from the memory). Collection runs the real
+collector against mock_archive_server.py with injected latency and 429s. Each
+run is compared with the last saved run of the same configuration, so a change
+that slows a stage shows up as a percentage.
+
+Example:
+    python analysis/weather_benchmark.py                          # small: 200 festivals x 30 years
+    python analysis/weather_benchmark.py --scale large            # 20,000 festivals x 70 years
+    python analysis/weather_benchmark.py --festivals 500 --years 40 --stages load summarise
+    python analysis/weather_benchmark.py --latency 0.2 --rate-limit-prob 0.1 --stages collect
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from festival_calendar import HISTORICAL_YEARS, expected_days
+from mock_archive_server import start_mock_server
+from run_metrics import METRICS_DIR, peak_rss_mb
+from weather_config import DATA_DIR, DATA_DIR_VARIABLE, data_paths
+from weather_loader import FRAME_CACHE_DIR, load_weather
+from weather_store import BATCH_ROWS, to_table, write_dataset
+
+# Define file paths
+BENCHMARK_DIR = os.path.join(DATA_DIR, 'benchmarks')
+WORK_DIR = os.path.join(BENCHMARK_DIR, 'work')
+
+# Every workspace lays its data out as the repository does, and stages run with it as their data directory
+WORKSPACE_DATA_DIR, WORKSPACE_DATASET_DIR, _ = data_paths('data')
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Preset (festivals, years) scales
+SCALES = {
+    'small': (200, 30),
+    'medium': (2000, 50),
+    'large': (20000, 70)
+}
+
+# Quotas high enough that the collector is never paced against the mock server
+MOCK_LIMITS = {'per_minute': 10 ** 9, 'per_hour': 10 ** 9, 'per_day': 10 ** 9}
+
+# Share of synthetic measure values left blank and of festival days left out, so the validator has work to do
+MISSING_RATE = 0.001
+GAP_RATE = 0.001
+
+def synthetic_festivals(count, seed=0):
+    """
+    Generates a festivals.csv-style table of UK festivals held between May and September 2025
+    Returns DataFrame with ID, Title, startDate, endDate (DD/MM/YYYY), lat and long
+    """
+    rng = np.random.default_rng(seed)
+    starts = np.datetime64('2025-05-01') + rng.integers(0, 125, count)
+    ends = starts + rng.integers(0, 5, count)
+    return pd.DataFrame({
+        'ID': np.arange(1, count + 1),
+        'Title': [f'Synthetic Festival {number}' for number in range(1, count + 1)],
+        'startDate': pd.DatetimeIndex(starts).strftime('%d/%m/%Y'),
+        'endDate': pd.DatetimeIndex(ends).strftime('%d/%m/%Y'),
+        'lat': rng.uniform(50.1, 58.6, count).round(7),
+        'long': rng.uniform(-5.5, 1.7, count).round(7)
+    })
+
+def synthetic_weather(festivals, years, seed=0, missing_rate=MISSING_RATE, gap_rate=GAP_RATE):
+    """
+    Generates daily weather for every festival window, shaped like the collected dataset
+    Values follow the same UK-like model as mock_archive_server.py, rounded to 0.1
+    Returns a pyarrow Table with the dataset schema's columns
+    """
+    rng = np.random.default_rng(seed)
+    days = expected_days(festivals, years)
+    days = days[rng.random(len(days)) >= gap_rate].reset_index(drop=True)
+    rows = len(days)
+
+    positions = festivals['ID'].reset_index(drop=True)
+    codes = pd.Index(positions).get_indexer(days['festival_id'])
+    lat = festivals['lat'].to_numpy()[codes]
+    season = np.sin(2 * np.pi * (days['full_date'].dt.dayofyear.to_numpy() - 110) / 365.25)
+    precipitation = np.where(rng.random(rows) < 0.45, rng.exponential(1 / 0.35, rows), 0.0)
+    measures = {
+        'max_temp_c': 14 + 8 * season - (lat - 52) * 0.6 + rng.normal(0, 3, rows),
+        'min_temp_c': 6 + 6 * season - (lat - 52) * 0.5 + rng.normal(0, 2.5, rows),
+        'rainfall_mm': precipitation * rng.uniform(0.8, 1.0, rows),
+        'total_precipitation_mm': precipitation,
+        'max_windspeed_kmh': np.maximum(2.0, rng.normal(20 - 4 * season, 6, rows))
+    }
+
+    full_date = pa.array(days['full_date'].to_numpy().astype('datetime64[D]'))
+    columns = {
+        'festival_id': pa.array(days['festival_id'].to_numpy(), pa.int32()),
+        'festival_name': pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()),
+                                                        pa.array(festivals['Title'], pa.string())),
+        'historical_year': pa.array(days['historical_year'].to_numpy(), pa.int16()),
+        'calendar_date': pc.strftime(full_date, format='%m-%d').dictionary_encode(),
+        'full_date': full_date
+    }
+    for column, values in measures.items():
+        values = values.round(1)
+        values[rng.random(rows) < missing_rate] = np.nan
+        columns[column] = pa.array(values, from_pandas=True)
+    columns['lat'] = pa.array(lat)
+    columns['long'] = pa.array(festivals['long'].to_numpy()[codes])
+    return pa.table(columns)
+
+def workspace_dir(festivals, years, seed):
+    return os.path.abspath(os.path.join(WORK_DIR, f'{festivals}x{years}-seed{seed}'))
+
+def prepare_workspace(festivals, years, seed=0, regenerate=False):
+    """
+    Generates the synthetic festivals.csv and weather dataset for a scale, once
+    A workspace whose dataset.json matches the scale is reused, as large scales take a while to build
+    Returns (workspace path, dataset description)
+    """
+    workspace = workspace_dir(festivals, years, seed)
+    description_file = os.path.join(workspace, 'dataset.json')
+    if not regenerate and os.path.exists(description_file):
+        with open(description_file) as f:
+            return workspace, json.load(f)
+
+    shutil.rmtree(workspace, ignore_errors=True)
+    os.makedirs(os.path.join(workspace, WORKSPACE_DATA_DIR))
+    print(f"Generating {festivals} festivals x {years} years in {workspace}...")
+    started = time.perf_counter()
+    festivals_df = synthetic_festivals(festivals, seed)
+    festivals_df.to_csv(os.path.join(workspace, WORKSPACE_DATA_DIR, 'festivals.csv'), index=False)
+    table = synthetic_weather(festivals_df, range(max(HISTORICAL_YEARS) + 1 - years, max(HISTORICAL_YEARS) + 1), seed)
+    dataset_dir = os.path.join(workspace, WORKSPACE_DATASET_DIR)
+    write_dataset(to_table(table), dataset_dir)
+
+    description = {
+        'festivals': festivals,
+        'years': years,
+        'seed': seed,
+        'rows': table.num_rows,
+        'parquet_bytes': sum(os.path.getsize(path) for path in glob.glob(os.path.join(dataset_dir, '*', '*'))),
+        'generate_seconds': round(time.perf_counter() - started, 3)
+    }
+    with open(description_file, 'w') as f:
+        json.dump(description, f, indent=2)
+    print(f"Generated {description['rows']} records in {description['generate_seconds']:.1f}s")
+    return workspace, description
+
+def timed(function, *args, **kwargs):
+    """Runs a function and returns (seconds, result)"""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+# Every stage returns (seconds, items processed, item unit, details) and is run in its own process
+
+def stage_collect(config):
+    """Collects weather for the first collect_festivals festivals from a local mock archive server"""
+    festivals = pd.read_csv(os.path.join(WORKSPACE_DATA_DIR, 'festivals.csv')).head(config['collect_festivals'])
+    collect_dir = os.path.abspath('collect')
+    shutil.rmtree(collect_dir, ignore_errors=True)
+    os.makedirs(os.path.join(collect_dir, WORKSPACE_DATA_DIR))
+    festivals.to_csv(os.path.join(collect_dir, WORKSPACE_DATA_DIR, 'festivals.csv'), index=False)
+
+    # The collector resolves its data paths against the working directory
+    os.chdir(collect_dir)
+    import historical_weather as collector
+    server, base_url, stats = start_mock_server(latency=config['latency'], jitter=config['jitter'],
+                                                rate_limit_prob=config['rate_limit_prob'], retry_after=1)
+    try:
+        seconds, _ = timed(collector.main, 0, len(festivals), full_period=False, concurrency=config['concurrency'],
+                           base_url=base_url, use_cache=False, limits=None if config['real_quotas'] else MOCK_LIMITS)
+    finally:
+        server.shutdown()
+    details = {'requests': stats['requests'], 'rate_limited': stats['rate_limited'],
+               'requests_per_second': round(stats['requests'] / seconds, 2)}
+    # Client-side latency quantiles from the collector's own run metrics
+    with open(os.path.join(METRICS_DIR, 'collect.json')) as f:
+        latency = json.load(f)['histograms'].get('request_latency_seconds', {})
+    details.update({f'latency_{q}_seconds': latency[q] for q in ('p50', 'p90', 'p99') if q in latency})
+    return seconds, len(festivals) * len(HISTORICAL_YEARS), 'windows', details
+
+def stage_load(config):
+    """Loads the dataset from Parquet, parsing it and writing the memory-mapped frame cache"""
+    shutil.rmtree(FRAME_CACHE_DIR, ignore_errors=True)
+    seconds, df = timed(load_weather)
+    return seconds, len(df), 'rows', {}
+
+def stage_load_cached(config):
+    """Loads the dataset again from the frame cache written by the load stage"""
+    seconds, df = timed(load_weather)
+    return seconds, len(df), 'rows', {}
+
+def stage_validate(config):
+    import weather_data_validator_detailed as validator
+    df = load_weather()
+    seconds, _ = timed(validator.build_validation_report, df)
+    return seconds, len(df), 'rows', {}
+
+def stage_validate_stream(config):
+    import weather_data_validator_detailed as validator
+    seconds, report = timed(validator.build_validation_report, batch_rows=BATCH_ROWS)
+    return seconds, report['overview']['total_records'], 'rows', {}
+
+def stage_outliers(config):
+    import weather_outlier_checker as checker
+    df = load_weather()
+    seconds, report = timed(checker.build_outlier_report, df)
+    return seconds, len(df), 'rows', {}
+
+def stage_summarise(config):
+    """Festival metrics and weather scores from the daily rows (calculate_festival_metrics/calculate_weather_scores)"""
+    import festival_weather_summary_5mm as summary
+    df = load_weather(columns=summary.INPUT_COLUMNS)
+
+    def summarise():
+        return summary.calculate_weather_scores(summary.calculate_festival_metrics(df))
+
+    seconds, metrics = timed(summarise)
+    return seconds, len(df), 'rows', {'festivals': len(metrics)}
+
+# Stages in run order, with the stages whose output they rely on (e.g. the frame cache)
+STAGES = {
+    'collect': {'run': stage_collect, 'requires': []},
+    'load': {'run': stage_load, 'requires': []},
+    'load_cached': {'run': stage_load_cached, 'requires': ['load']},
+    'validate': {'run': stage_validate, 'requires': ['load']},
+    'validate_stream': {'run': stage_validate_stream, 'requires': []},
+    'outliers': {'run': stage_outliers, 'requires': ['load']},
+    'summarise': {'run': stage_summarise, 'requires': ['load']}
+}
+
+def stage_worker(name, workspace, config, connection):
+    """Runs one stage in a child process and sends back its measurements (or the error)"""
+    try:
+        os.chdir(workspace)
+        with open(os.path.join(workspace, 'benchmark.log'), 'a') as log, contextlib.redirect_stdout(log):
+            print(f"\n=== {name} ===")
+            start_rss = peak_rss_mb()
+            seconds, items, unit, details = STAGES[name]['run'](config)
+        connection.send({'seconds': seconds, 'items': items, 'unit': unit, 'details': details,
+                         'start_rss_mb': start_rss, 'peak_rss_mb': peak_rss_mb()})
+    except Exception:
+        connection.send({'error': traceback.format_exc()})
+    finally:
+        connection.close()
+
+def run_stage(name, workspace, config):
+    """Runs a stage in a freshly spawned process, so memory from earlier stages never counts"""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=stage_worker, args=(name, workspace, config, sender))
+    # The spawned process reads its data paths from the environment it starts with
+    configured = os.environ.get(DATA_DIR_VARIABLE)
+    os.environ[DATA_DIR_VARIABLE] = WORKSPACE_DATA_DIR
+    try:
+        process.start()
+    finally:
+        if configured is None:
+            del os.environ[DATA_DIR_VARIABLE]
+        else:
+            os.environ[DATA_DIR_VARIABLE] = configured
+    sender.close()
+    result = receiver.recv() if receiver.poll(None) else {'error': 'stage process exited without a result'}
+    process.join()
+    if 'error' in result:
+        raise RuntimeError(f"Benchmark stage {name} failed (log: {os.path.join(workspace, 'benchmark.log')}):\n"
+                           f"{result['error']}")
+    return result
+
+def resolve_stages(names):
+    """Adds the stages that the requested ones rely on, keeping run order"""
+    wanted = set(names)
+    for name in names:
+        wanted.update(STAGES[name]['requires'])
+    return [name for name in STAGES if name in wanted]
+
+def run_benchmark(config, stages=None, repeat=1, regenerate=False):
+    """
+    Runs the requested stages and returns the result record
+    Parameters:
+    - config: scale and collection settings (see main)
+    - stages: stage names to run (default all)
+    - repeat: runs per stage; the fastest time and the highest peak memory are kept
+    """
+    workspace, dataset = prepare_workspace(config['festivals'], config['years'], config['seed'], regenerate)
+    results = {}
+    for name in resolve_stages(stages or list(STAGES)):
+        print(f"[{name}] running...")
+        runs = [run_stage(name, workspace, config) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run['seconds'])
+        results[name] = {
+            'seconds': round(best['seconds'], 4),
+            'runs': [round(run['seconds'], 4) for run in runs],
+            'items': best['items'],
+            'unit': best['unit'],
+            'throughput': round(best['items'] / best['seconds'], 1) if best['seconds'] else None,
+            'start_rss_mb': round(max(run['start_rss_mb'] for run in runs), 1),
+            'peak_rss_mb': round(max(run['peak_rss_mb'] for run in runs), 1),
+            **best['details']
+        }
+        print(f"[{name}] {best['seconds']:.2f}s, peak {results[name]['peak_rss_mb']:.0f} MB")
+
+    return {
+        'run_id': time.strftime('%Y%m%d-%H%M%S'),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'pyarrow': pa.__version__
+        },
+        'config': config,
+        'dataset': dataset,
+        'stages': results
+    }
+
+def git_commit():
+    """The checked-out commit of the analysis code, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ANALYSIS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_result(result):
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    config = result['config']
+    path = os.path.join(BENCHMARK_DIR, f"{result['run_id']}-{config['festivals']}x{config['years']}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return path
+
+def find_baseline(result, exclude=None):
+    """Returns the latest saved run with the same configuration (None if there is none)"""
+    for path in sorted(glob.glob(os.path.join(BENCHMARK_DIR, '*.json')), reverse=True):
+        if path == exclude:
+            continue
+        with open(path) as f:
+            previous = json.load(f)
+        if previous.get('config') == result['config']:
+            return path, previous
+    return None
+
+def print_results(result, baseline=None):
+    """Prints a table of stage timings, throughput and memory, with changes against a baseline run"""
+    dataset = result['dataset']
+    print(f"\nBenchmark {result['run_id']} ({result['git_commit'] or 'no commit'}): "
+          f"{dataset['festivals']} festivals x {dataset['years']} years, {dataset['rows']} records")
+    if baseline:
+        print(f"Compared with {baseline[0]} ({baseline[1]['git_commit'] or 'no commit'})")
+    print(f"\n{'Stage':<16}{'Seconds':>10}{'Throughput':>24}{'Peak RSS':>12}{'Time':>10}{'Memory':>10}")
+    for name, stage in result['stages'].items():
+        throughput = f"{stage['throughput']:,.0f} {stage['unit']}/s" if stage['throughput'] else '-'
+        line = f"{name:<16}{stage['seconds']:>10.3f}{throughput:>24}{stage['peak_rss_mb']:>9.0f} MB"
+        previous = baseline[1]['stages'].get(name) if baseline else None
+        if previous:
+            line += f"{(stage['seconds'] / previous['seconds'] - 1) * 100:>+9.1f}%"
+            line += f"{(stage['peak_rss_mb'] / previous['peak_rss_mb'] - 1) * 100:>+9.1f}%"
+        print(line)
+    collect = result['stages'].get('collect')
+    if collect:
+        print(f"\nCollection: {collect['requests']} requests ({collect['rate_limited']} answered 429), "
+              f"{collect['requests_per_second']} requests/s")
+        if 'latency_p50_seconds' in collect:
+            print("Request latency: " + ", ".join(f"{q} {collect[f'latency_{q}_seconds'] * 1000:.0f} ms"
+                                                  for q in ('p50', 'p90', 'p99')))
+
+def main(argv=None):
+    """
+    Command line entry point for the benchmark
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the festival weather pipeline on synthetic data')
+    parser.add_argument('--scale', choices=list(SCALES), default='small',
+                        help=', '.join(f'{name}: {festivals} festivals x {years} years'
+                                       for name, (festivals, years) in SCALES.items()))
+    parser.add_argument('--festivals', type=int, help='festival count (overrides --scale)')
+    parser.add_argument('--years', type=int, help='years of weather per festival (overrides --scale)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help='stages to run (default all)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage, keeping the fastest')
+    parser.add_argument('--collect-festivals', type=int, default=20,
+                        help='festivals to collect from the mock server (30 years each)')
+    parser.add_argument('--latency', type=float, default=0.05, help='mock server seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--rate-limit-prob', type=float, default=0.02, help='share of requests answered 429')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--real-quotas', action='store_true', help="pace collection against Open-Meteo's quotas")
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the synthetic data for this scale')
+    parser.add_argument('--compare', metavar='RESULT_JSON', help='compare with this run instead of the last matching one')
+    args = parser.parse_args(argv)
+
+    festivals, years = SCALES[args.scale]
+    config = {
+        'festivals': args.festivals or festivals,
+        'years': args.years or years,
+        'seed': args.seed,
+        'collect_festivals': args.collect_festivals,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'rate_limit_prob': args.rate_limit_prob,
+        'concurrency': args.concurrency,
+        'real_quotas': args.real_quotas
+    }
+    result = run_benchmark(config, args.stages, args.repeat, args.regenerate)
+    path = save_result(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = (args.compare, json.load(f))
+    else:
+        baseline = find_baseline(result, exclude=path)
+    print_results(result, baseline)
+    print(f"\nSaved results to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Module: weather_config.py
+Purpose: Where the festival and weather data lives, and the measures it holds
+Used by: every analysis module, and festival_weather.py (--data-dir)
+Author: Dom Barry
+
+Every data path is built from DATA_DIR, taken from the FESTIVAL_WEATHER_DATA_DIR
+environment variable or else 'data' under the working directory (the layout of
+this repository). Modules read it when they are imported, so configure() must
+run before any other analysis module is imported; it also sets the variable so
+worker processes see the same directory. Only the standard library is used here,
+so commands that just need to find the data start quickly.
+
+Example:
+    FESTIVAL_WEATHER_DATA_DIR=/srv/festivals festival-weather summarise
+    festival-weather --data-dir /srv/festivals query Glastonbury 06-27
+"""
+
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+
+# Environment variable holding the data directory
+DATA_DIR_VARIABLE = 'FESTIVAL_WEATHER_DATA_DIR'
+
+def data_paths(data_dir):
+    """Returns (data directory, Parquet dataset directory, CSV file) for a data directory"""
+    return (data_dir, os.path.join(data_dir, 'all_festivals_historical_weather'),
+            os.path.join(data_dir, 'all_festivals_historical_weather.csv'))
+
+MEASURE_COLUMNS = ['max_temp_c', 'min_temp_c', 'rainfall_mm', 'total_precipitation_mm', 'max_windspeed_kmh']
+
+# Decimal places the archive reports every measure to (0.1), so float32 storage is
+# lossless once values are rounded back to this many decimals when widened to float64
+MEASURE_DECIMALS = 1
+
+# Rows per batch when streaming the dataset rather than loading it whole
+BATCH_ROWS = 200_000
+
+# Hourly measure column (see hourly_store.py) -> (archive hourly variable, stored units per value, Parquet encoding)
+HOURLY_MEASURES = {
+    'temp_c': ('temperature_2m', 10, 'DELTA_BINARY_PACKED'),
+    'rain_mm': ('rain', 10, 'RLE_DICTIONARY'),
+    'precipitation_mm': ('precipitation', 10, 'RLE_DICTIONARY'),
+    'windspeed_kmh': ('windspeed_10m', 10, 'DELTA_BINARY_PACKED'),
+    'windgust_kmh': ('windgusts_10m', 10, 'DELTA_BINARY_PACKED'),
+    'humidity_pct': ('relative_humidity_2m', 1, 'DELTA_BINARY_PACKED'),
+    'cloudcover_pct': ('cloudcover', 1, 'RLE_DICTIONARY')
+}
+
+# Collected when no variable set is given
+DEFAULT_HOURLY = ['temp_c', 'rain_mm', 'precipitation_mm', 'windspeed_kmh', 'windgust_kmh']
+
+# Define file paths
+DATA_DIR, DATASET_DIR, CSV_FILE = data_paths(os.environ.get(DATA_DIR_VARIABLE) or 'data')
+
+def configure(data_dir):
+    """
+    Points every data path at data_dir
+    Call before importing any other analysis module, as they read the paths when imported
+    """
+    global DATA_DIR, DATASET_DIR, CSV_FILE
+    os.environ[DATA_DIR_VARIABLE] = data_dir
+    DATA_DIR, DATASET_DIR, CSV_FILE = data_paths(data_dir)
+
+def dataset_exists(dataset_dir=None):
+    dataset_dir = DATASET_DIR if dataset_dir is None else dataset_dir
+    return os.path.isdir(dataset_dir) and any(os.scandir(dataset_dir))
+
+def source_fingerprint(path):
+    """Identifies the current version of a file or dataset directory by size and modification time"""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, filename)
+            for root, _, filenames in os.walk(path) for filename in filenames
+        )
+    else:
+        files = [path]
+    digest = hashlib.sha256()
+    for file in files:
+        stat = os.stat(file)
+        digest.update(f'{file}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+@contextmanager
+def replace_directory(path):
+    """
+    Yields a temporary directory to write a new version of path into, then swaps it in
+    The old directory is renamed aside rather than deleted in place, so readers find
+    either the old or the new directory whole: path is missing only between two
+    renames, not for as long as the old files take to delete. If the block raises,
+    path is left as it was and the temporary directory is removed
+    """
+    temp_dir = f'{path}.{os.getpid()}.tmp'
+    old_dir = f'{path}.{os.getpid()}.old'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    try:
+        yield temp_dir
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(path):
+        os.replace(path, old_dir)
+    os.replace(temp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
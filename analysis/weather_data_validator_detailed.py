@@ -0,0 +1,312 @@
+"""
+Script: weather_data_validator_detailed.py
+Purpose: Validates and analyzes weather data completeness and quality for festival data
+Input: data/all_festivals_historical_weather/ (Parquet) or data/all_festivals_historical_weather.csv
+        data/festivals.csv (for the expected festival dates)
+Output: Prints detailed validation report to console and writes the gap report data/weather_gaps.csv
+Author: Dom Barry
+
+Run with --stream to read the dataset in bounded-size batches instead of loading
+it whole (see streaming_stats.py for how closely the results match).
+"""
+
+import argparse
+import os
+
+from run_metrics import RunMetrics
+from weather_config import BATCH_ROWS, DATA_DIR, MEASURE_COLUMNS
+
+# pandas, and the modules built on it, are imported by the functions that use them,
+# so the command line (and --help) starts without loading them
+
+# Define file paths
+FESTIVALS_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+GAPS_FILE = os.path.join(DATA_DIR, 'weather_gaps.csv')
+
+def load_and_validate_data():
+    """
+    Loads weather data and performs detailed validation checks
+    Returns DataFrame if successful
+    """
+    from weather_loader import describe_source, load_weather
+    print(f"Loading data from {describe_source()}...")
+    df = load_weather()
+    print(f"Loaded {len(df)} records\n")
+    return df
+
+def print_section_header(title):
+    """Prints formatted section header"""
+    print("\n" + "="*50)
+    print(title)
+    print("="*50 + "\n")
+
+def summarise_missing_values(df):
+    """Returns {column: missing count} for columns with missing values"""
+    missing_values = df.isnull().sum()
+    return {column: int(count) for column, count in missing_values[missing_values > 0].items()}
+
+def analyze_missing_values(missing_values, total_records):
+    """Reports on missing values in the dataset, from summarise_missing_values"""
+    print_section_header("Missing Values Analysis")
+    
+    print("Missing values by column:")
+    for column, count in missing_values.items():
+        print(f"{column}: {count} missing values ({(count/total_records)*100:.2f}%)")
+
+def summarise_data_ranges(df):
+    """
+    Returns range statistics and IQR outlier bounds for each numeric column
+    """
+    import pandas as pd
+    from weather_loader import widen_measure
+    ranges = {}
+    for column in MEASURE_COLUMNS:
+        # Quantiles and moments of the exact values, not of their float32 storage
+        values = pd.Series(widen_measure(df[column]))
+        # Identify potential outliers using IQR method
+        Q1 = values.quantile(0.25)
+        Q3 = values.quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 1.5 * IQR
+        upper_bound = Q3 + 1.5 * IQR
+        outliers = values[(values < lower_bound) | (values > upper_bound)]
+        
+        ranges[column] = {
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'lower_bound': float(lower_bound),
+            'upper_bound': float(upper_bound),
+            'outliers': len(outliers)
+        }
+    return ranges
+
+def analyze_data_ranges(ranges):
+    """Reports on data ranges and potential outliers, from summarise_data_ranges"""
+    print_section_header("Data Ranges Analysis")
+    
+    for column, summary in ranges.items():
+        print(f"\n{column} Analysis:")
+        print(f"Min: {summary['min']:.2f}")
+        print(f"Max: {summary['max']:.2f}")
+        print(f"Mean: {summary['mean']:.2f}")
+        print(f"Std Dev: {summary['std']:.2f}")
+        
+        if summary['outliers']:
+            print(f"\nPotential outliers detected ({summary['outliers']} records):")
+            print(f"Values outside range: {summary['lower_bound']:.2f} to {summary['upper_bound']:.2f}")
+
+def summarise_completeness_by_festival(df):
+    """Returns festivals with fewer than 30 years of data, with their year and record counts"""
+    festival_summary = df.groupby('festival_name', observed=True).agg({
+        'historical_year': 'nunique',
+        'calendar_date': 'count'
+    }).reset_index()
+    # Categories follow the dataset's order, so sort by the names themselves as the CSV version did
+    festival_summary = festival_summary.sort_values('festival_name', key=lambda names: names.astype(str))
+    
+    incomplete = festival_summary[festival_summary['historical_year'] < 30]
+    return [
+        {'festival_name': row.festival_name, 'years': int(row.historical_year), 'records': int(row.calendar_date)}
+        for row in incomplete.itertuples()
+    ]
+
+def analyze_completeness_by_festival(incomplete):
+    """Reports on data completeness for each festival, from summarise_completeness_by_festival"""
+    print_section_header("Festival-level Completeness Analysis")
+    
+    print("Festivals with incomplete data:")
+    if len(incomplete) > 0:
+        for row in incomplete:
+            print(f"\nFestival: {row['festival_name']}")
+            print(f"Years of data: {row['years']}")
+            print(f"Total records: {row['records']}")
+    else:
+        print("All festivals have complete data for all 30 years")
+
+def summarise_gaps(days, festivals):
+    """
+    Finds missing, duplicated and out-of-window days against every festival's expected dates
+    - days: (day keys, years, record counts) from festival_calendar.day_counts or a streamed scan
+    Returns the gap report (see festival_calendar.find_gaps) with festival names added
+    """
+    from festival_calendar import gaps_from_counts
+    report = gaps_from_counts(*days, festivals)
+    names = festivals.set_index('ID')['Title']
+    report.insert(1, 'festival_name', report['festival_id'].map(names))
+    return report
+
+def analyze_gaps(days):
+    """Analyzes day-level gaps and writes the gap report the collector can repair from"""
+    import pandas as pd
+    from festival_calendar import GAP_ISSUES, gap_windows
+    print_section_header("Day-level Gap Analysis")
+    
+    if not os.path.exists(FESTIVALS_FILE):
+        print(f"Skipped: festival dates not found ({FESTIVALS_FILE})")
+        return None
+    festivals = pd.read_csv(FESTIVALS_FILE)
+    report = summarise_gaps(days, festivals)
+    report.to_csv(GAPS_FILE, index=False, date_format='%Y-%m-%d')
+    
+    counts = report['issue'].value_counts()
+    for issue in GAP_ISSUES:
+        print(f"{issue.replace('_', ' ').capitalize()} days: {counts.get(issue, 0)}")
+    
+    if len(report):
+        worst = report.groupby('festival_name', observed=True).size().nlargest(5)
+        print("\nFestivals with the most issues:")
+        print(worst.to_string(header=False))
+        print(f"\nGap report saved to {GAPS_FILE}")
+        print(f"Windows to re-fetch: {len(gap_windows(report, festivals))} "
+              f"(python analysis/historical_weather.py --repair)")
+    else:
+        print("Every festival window has exactly one record per day")
+    return report
+
+def summarise_temporal_coverage(df):
+    """Returns {year: record count}"""
+    year_counts = df['historical_year'].value_counts().sort_index()
+    return {int(year): int(count) for year, count in year_counts.items()}
+
+def analyze_temporal_coverage(year_counts):
+    """Reports on temporal coverage of the dataset, from summarise_temporal_coverage"""
+    print_section_header("Temporal Coverage Analysis")
+    
+    print("Records per year:")
+    for year, count in year_counts.items():
+        print(f"{year}: {count} records")
+
+def summarise_gap_counts(days):
+    """Returns {issue: day count} and the windows to re-fetch, or None without festival dates"""
+    import pandas as pd
+    from festival_calendar import GAP_ISSUES, gap_windows
+    if not os.path.exists(FESTIVALS_FILE):
+        return None
+    festivals = pd.read_csv(FESTIVALS_FILE)
+    report = summarise_gaps(days, festivals)
+    counts = report['issue'].value_counts()
+    return {
+        **{issue: int(counts.get(issue, 0)) for issue in GAP_ISSUES},
+        'windows_to_refetch': len(gap_windows(report, festivals))
+    }
+
+def summarise_overview(df):
+    """Returns the record count, festival count and date range"""
+    return {
+        'total_records': len(df),
+        'unique_festivals': int(df['festival_name'].nunique()),
+        'first_date': f"{df['full_date'].min():%Y-%m-%d}",
+        'last_date': f"{df['full_date'].max():%Y-%m-%d}"
+    }
+
+def summarise_frame(df):
+    """
+    Runs every validation check on the loaded dataset
+    Returns the JSON-ready report plus the day counts for the gap check
+    """
+    from festival_calendar import day_counts
+    days = day_counts(df)
+    report = {
+        'overview': summarise_overview(df),
+        'missing_values': summarise_missing_values(df),
+        'data_ranges': summarise_data_ranges(df),
+        'incomplete_festivals': summarise_completeness_by_festival(df),
+        'gaps': summarise_gap_counts(days),
+        'records_per_year': summarise_temporal_coverage(df)
+    }
+    return report, days
+
+def summarise_stream(batch_rows=BATCH_ROWS):
+    """
+    Runs every validation check in one pass over the dataset, a batch of rows at a time
+    Returns the same report and day counts as summarise_frame
+    """
+    import pandas as pd
+    from streaming_stats import scan_validation
+    festivals = pd.read_csv(FESTIVALS_FILE) if os.path.exists(FESTIVALS_FILE) else None
+    scan = scan_validation(festivals, batch_rows)
+    festival_years = scan['festival_years']
+    festivals = festival_years.groupby('festival_name').agg(
+        years=('historical_year', 'size'), records=('records', 'sum')
+    )
+    year_counts = festival_years.groupby('historical_year')['rows'].sum()
+    missing = scan['missing']
+    report = {
+        'overview': {
+            'total_records': scan['records'],
+            'unique_festivals': len(festivals),
+            'first_date': f"{scan['first_date']:%Y-%m-%d}",
+            'last_date': f"{scan['last_date']:%Y-%m-%d}"
+        },
+        'missing_values': {column: int(count) for column, count in missing[missing > 0].items()},
+        'data_ranges': {column: sketch.range_summary() for column, sketch in scan['sketches'].items()},
+        'incomplete_festivals': [
+            {'festival_name': name, 'years': int(row.years), 'records': int(row.records)}
+            for name, row in festivals[festivals['years'] < 30].iterrows()
+        ],
+        'gaps': summarise_gap_counts(scan['days']),
+        'records_per_year': {int(year): int(count) for year, count in year_counts.items()}
+    }
+    return report, scan['days']
+
+def build_validation_report(df=None, batch_rows=None):
+    """
+    Runs every validation check and returns the results as a JSON-ready dict
+    Used by weather_pipeline.py in place of the console report
+    - df: the loaded dataset, or None with batch_rows to stream the data instead
+    """
+    report, _ = summarise_frame(df) if df is not None else summarise_stream(batch_rows or BATCH_ROWS)
+    return report
+
+def main(stream=False, batch_rows=BATCH_ROWS):
+    """
+    Main function to run all validation checks
+    Parameters:
+    - stream: read the dataset in batches of batch_rows rows instead of loading it whole
+    Stage timings and memory are written to data/metrics/validate.json (and .prom)
+    """
+    metrics = RunMetrics('validate')
+    try:
+        if stream:
+            from weather_loader import describe_source
+            print(f"Streaming data from {describe_source()} in batches of {batch_rows} rows...")
+            with metrics.stage('scan'):
+                report, days = summarise_stream(batch_rows)
+            print(f"Scanned {report['overview']['total_records']} records\n")
+        else:
+            with metrics.stage('load'):
+                df = load_and_validate_data()
+            with metrics.stage('summarise'):
+                report, days = summarise_frame(df)
+        overview = report['overview']
+        metrics.increment('records', overview['total_records'])
+        
+        print_section_header("Dataset Overview")
+        print(f"Total records: {overview['total_records']}")
+        print(f"Unique festivals: {overview['unique_festivals']}")
+        print(f"Date range: {overview['first_date']} to {overview['last_date']}")
+        
+        analyze_missing_values(report['missing_values'], overview['total_records'])
+        analyze_data_ranges(report['data_ranges'])
+        analyze_completeness_by_festival(report['incomplete_festivals'])
+        analyze_gaps(days)
+        analyze_temporal_coverage(report['records_per_year'])
+        
+    except Exception as e:
+        print(f"Error during validation: {e}")
+    finally:
+        metrics.write()
+
+def command_line(argv=None):
+    """Command line entry point: validates the weather data"""
+    parser = argparse.ArgumentParser(description='Validate the historical weather dataset')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the data in batches so memory use stays flat (see streaming_stats.py)')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS, help='rows per batch with --stream')
+    args = parser.parse_args(argv)
+    main(args.stream, args.batch_rows)
+
+if __name__ == "__main__":
+    command_line()
@@ -0,0 +1,186 @@
+"""
+Module: weather_loader.py
+Purpose: Single schema-aware loader for the historical weather dataset
+Used by: weather_data_validator_detailed.py, weather_outlier_checker.py, festival_weather_summary_5mm.py
+Author: Dom Barry
+
+Loads from the Parquet dataset when present, otherwise from the CSV, and always
+returns the same compact frame: categorical names and calendar dates, small
+integer keys, parsed dates and float32 measures (the storage type, half the
+memory of float64). Code that needs exact decimal values, such as sums, quantiles
+and threshold comparisons, widens one measure at a time with widen_measure. The
+parsed frame is also saved as one .npy file per column under data/cache/frames
+and memory-mapped on later loads, for as long as the source data is unchanged;
+caches built from an earlier version of the data are removed when a new one is saved.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from weather_config import (CSV_FILE, DATA_DIR, DATASET_DIR, MEASURE_DECIMALS, dataset_exists, replace_directory,
+                            source_fingerprint)
+from weather_store import MEASURE_COLUMNS, read_frame
+
+# Define file paths
+FRAME_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'frames')
+
+# In-memory types for every column of the dataset
+COLUMN_TYPES = {
+    'festival_id': 'int32',
+    'festival_name': 'category',
+    'historical_year': 'int16',
+    'calendar_date': 'category',
+    'full_date': 'datetime64[ns]',
+    **{column: 'float32' for column in MEASURE_COLUMNS},
+    'lat': 'float64',
+    'long': 'float64'
+}
+
+def enforce_schema(df, columns, measure_dtype='float32'):
+    """
+    Checks the expected columns are present and converts each to its compact type
+    Raises ValueError naming any missing columns
+    """
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Weather data is missing columns: {', '.join(missing)}")
+
+    df = df[columns]
+    converted = {}
+    for column in columns:
+        dtype = measure_dtype if column in MEASURE_COLUMNS else COLUMN_TYPES.get(column)
+        if dtype is None or str(df[column].dtype) == dtype:
+            converted[column] = df[column]
+        elif dtype.startswith('datetime64'):
+            converted[column] = pd.to_datetime(df[column], format='%Y-%m-%d').astype(dtype)
+        else:
+            converted[column] = df[column].astype(dtype)
+    return pd.DataFrame(converted)
+
+def widen_measure(series):
+    """
+    Returns a measure column as a float64 array holding the exact decimal values the archive reported
+    float32 values are rounded back to MEASURE_DECIMALS (see weather_store.widen_measures)
+    """
+    values = series.to_numpy()
+    if values.dtype == np.float32:
+        return np.round(values.astype('float64'), MEASURE_DECIMALS)
+    return values.astype('float64', copy=False)
+
+def read_source(columns, measure_dtype='float32'):
+    """Reads the dataset (Parquet preferred, CSV otherwise) and applies the schema"""
+    if dataset_exists(DATASET_DIR):
+        df = read_frame(DATASET_DIR, columns=columns, measure_dtype=measure_dtype)
+    else:
+        if not os.path.exists(CSV_FILE):
+            raise FileNotFoundError(f"Input file not found: {CSV_FILE}")
+        csv_types = {
+            column: measure_dtype if column in MEASURE_COLUMNS else dtype
+            for column, dtype in COLUMN_TYPES.items()
+            if column in columns and not dtype.startswith('datetime64')
+        }
+        df = pd.read_csv(CSV_FILE, usecols=columns, dtype=csv_types)
+    return enforce_schema(df, columns, measure_dtype)
+
+def save_frame_cache(df, cache_dir, source=None, fingerprint=None):
+    """
+    Writes each column as a .npy file (categoricals as codes plus a categories list)
+    - source / fingerprint: the data the frame was read from, so later versions can replace it
+    """
+    layout = {}
+    with replace_directory(cache_dir) as temp_dir:
+        for position, column in enumerate(df.columns):
+            series = df[column]
+            path = os.path.join(temp_dir, f'{position}.npy')
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                np.save(path, series.cat.codes.to_numpy())
+                layout[column] = {'kind': 'category', 'categories': series.cat.categories.tolist()}
+            elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+                np.save(path, series.to_numpy().astype('datetime64[ns]').view('int64'))
+                layout[column] = {'kind': 'datetime'}
+            else:
+                np.save(path, series.to_numpy())
+                layout[column] = {'kind': 'plain'}
+        with open(os.path.join(temp_dir, 'layout.json'), 'w') as f:
+            json.dump({'columns': list(df.columns), 'layout': layout, 'rows': len(df), 'source': source,
+                       'fingerprint': fingerprint}, f)
+
+def evict_stale_frames(source, fingerprint, frame_cache_dir=None):
+    """
+    Removes cached frames built from an earlier version of source
+    Frames of the current version (other column sets or measure types) are kept
+    Returns the number of frames removed
+    """
+    frame_cache_dir = frame_cache_dir or FRAME_CACHE_DIR
+    if not os.path.isdir(frame_cache_dir):
+        return 0
+    removed = 0
+    for entry in os.scandir(frame_cache_dir):
+        layout_file = os.path.join(entry.path, 'layout.json')
+        if not entry.is_dir() or not os.path.exists(layout_file):
+            continue
+        with open(layout_file) as f:
+            meta = json.load(f)
+        # Frames saved before sources were recorded cannot be matched to a version, so they go too
+        if meta.get('source', source) == source and meta.get('fingerprint') != fingerprint:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def load_frame_cache(cache_dir):
+    """Memory-maps a cached frame; returns None if there is no complete cache"""
+    layout_file = os.path.join(cache_dir, 'layout.json')
+    if not os.path.exists(layout_file):
+        return None
+    with open(layout_file) as f:
+        meta = json.load(f)
+
+    data = {}
+    for position, column in enumerate(meta['columns']):
+        # Copy-on-write mapping: pages are read lazily and callers may still modify the frame
+        values = np.load(os.path.join(cache_dir, f'{position}.npy'), mmap_mode='c')
+        spec = meta['layout'][column]
+        if spec['kind'] == 'category':
+            dtype = pd.CategoricalDtype(spec['categories'])
+            data[column] = pd.Categorical.from_codes(values, dtype=dtype)
+        elif spec['kind'] == 'datetime':
+            data[column] = values.view('datetime64[ns]')
+        else:
+            data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+def load_weather(columns=None, measure_dtype='float32', use_cache=True):
+    """
+    Loads the historical weather data with the standard schema
+    Parameters:
+    - columns: columns to load (default all)
+    - measure_dtype: 'float32' (half the memory; see widen_measure) or 'float64' (exact values)
+    - use_cache: reuse the memory-mapped copy of the parsed frame while the source is unchanged
+    """
+    columns = list(columns or COLUMN_TYPES)
+    if not use_cache:
+        return read_source(columns, measure_dtype)
+
+    source = DATASET_DIR if dataset_exists(DATASET_DIR) else CSV_FILE
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Input file not found: {source}")
+
+    fingerprint = source_fingerprint(source)
+    key = hashlib.sha256(f'{fingerprint}|{",".join(columns)}|{measure_dtype}'.encode()).hexdigest()[:32]
+    cache_dir = os.path.join(FRAME_CACHE_DIR, key)
+
+    df = load_frame_cache(cache_dir)
+    if df is None:
+        df = read_source(columns, measure_dtype)
+        save_frame_cache(df, cache_dir, source, fingerprint)
+        evict_stale_frames(source, fingerprint)
+    return df
+
+def describe_source():
+    """Returns the path the loader will read from, for progress messages"""
+    return DATASET_DIR if dataset_exists(DATASET_DIR) else CSV_FILE
@@ -0,0 +1,192 @@
+"""
+Script: weather_outlier_checker.py
+Purpose: Identifies and analyzes outliers in festival weather data
+Input: data/all_festivals_historical_weather/ (Parquet) or data/all_festivals_historical_weather.csv
+Output: Prints outlier analysis report to console and writes data/weather_outliers.csv
+Author: Dom Barry
+"""
+
+import argparse
+import os
+
+from run_metrics import RunMetrics
+from weather_config import DATA_DIR, MEASURE_DECIMALS
+
+# pandas, and the modules built on it, are imported by the functions that use them,
+# so the command line (and --help) starts without loading them
+
+# Define file paths
+OUTPUT_FILE = os.path.join(DATA_DIR, 'weather_outliers.csv')
+
+# Columns used by this script
+INPUT_COLUMNS = ['festival_id', 'festival_name', 'calendar_date', 'full_date', 'max_temp_c', 'min_temp_c',
+                 'rainfall_mm', 'total_precipitation_mm', 'max_windspeed_kmh']
+
+def load_data():
+    """
+    Loads weather data and performs initial validation
+    Returns DataFrame if successful
+    """
+    from weather_loader import describe_source, load_weather
+    print(f"Loading data from {describe_source()}...")
+    df = load_weather(columns=INPUT_COLUMNS)
+    print(f"Loaded {len(df)} records")
+    return df
+
+def identify_outliers(data, column):
+    """
+    Identifies outliers using the IQR method across the whole dataset
+    Returns lower bound, upper bound, and outlier mask
+    """
+    import pandas as pd
+    from outlier_engine import SCOPES, group_codes, outlier_masks
+    from weather_loader import widen_measure
+    codes, group_count = group_codes(data, SCOPES['global'])
+    masks = outlier_masks(widen_measure(data[column])[:, None], codes, group_count)
+    outliers = pd.Series(masks['iqr'][:, 0], index=data.index)
+    return masks['lower_bound'][0, 0], masks['upper_bound'][0, 0], outliers
+
+def analyze_scoped_outliers(df):
+    """
+    Flags outliers for every measure globally, within each festival and within each calendar date
+    Writes the outlier table to OUTPUT_FILE and prints counts by scope and rule
+    """
+    from outlier_engine import find_outliers, summarise_outliers
+    print("\nAnalyzing Outliers by Scope:")
+    print("="*50)
+    
+    outlier_table = find_outliers(df)
+    outlier_table.to_csv(OUTPUT_FILE, index=False, date_format='%Y-%m-%d')
+    
+    print("\nFlagged values by measure, scope and rule:")
+    print(summarise_outliers(outlier_table).to_string())
+    print(f"\nSaved {len(outlier_table)} flagged values to {OUTPUT_FILE}")
+    return outlier_table
+
+def analyze_temperature_outliers(df):
+    """
+    Analyzes temperature outliers
+    """
+    print("\nAnalyzing Temperature Outliers:")
+    print("="*50)
+    
+    # Max temperature outliers
+    lower, upper, outliers = identify_outliers(df, 'max_temp_c')
+    outlier_records = df[outliers]
+    
+    print("\nMaximum Temperature Outliers:")
+    print(f"Normal range: {lower:.1f}°C to {upper:.1f}°C")
+    print(f"Found {len(outlier_records)} outliers")
+    
+    if len(outlier_records) > 0:
+        print("\nTop 5 highest temperatures:")
+        for _, row in outlier_records.nlargest(5, 'max_temp_c').iterrows():
+            print(f"{row['festival_name']}: {row['max_temp_c']:.1f}°C on {row['full_date']:%Y-%m-%d}")
+        
+        print("\nTop 5 lowest temperatures:")
+        for _, row in outlier_records.nsmallest(5, 'max_temp_c').iterrows():
+            print(f"{row['festival_name']}: {row['max_temp_c']:.1f}°C on {row['full_date']:%Y-%m-%d}")
+
+def analyze_rainfall_outliers(df):
+    """
+    Analyzes rainfall outliers
+    """
+    print("\nAnalyzing Rainfall Outliers:")
+    print("="*50)
+    
+    lower, upper, outliers = identify_outliers(df, 'rainfall_mm')
+    outlier_records = df[outliers]
+    
+    print(f"\nNormal rainfall range: {lower:.1f}mm to {upper:.1f}mm")
+    print(f"Found {len(outlier_records)} outliers")
+    
+    if len(outlier_records) > 0:
+        print("\nTop 5 heaviest rainfall days:")
+        for _, row in outlier_records.nlargest(5, 'rainfall_mm').iterrows():
+            print(f"{row['festival_name']}: {row['rainfall_mm']:.1f}mm on {row['full_date']:%Y-%m-%d}")
+
+def analyze_wind_outliers(df):
+    """
+    Analyzes wind speed outliers
+    """
+    print("\nAnalyzing Wind Speed Outliers:")
+    print("="*50)
+    
+    lower, upper, outliers = identify_outliers(df, 'max_windspeed_kmh')
+    outlier_records = df[outliers]
+    
+    print(f"\nNormal wind speed range: {lower:.1f}km/h to {upper:.1f}km/h")
+    print(f"Found {len(outlier_records)} outliers")
+    
+    if len(outlier_records) > 0:
+        print("\nTop 5 windiest days:")
+        for _, row in outlier_records.nlargest(5, 'max_windspeed_kmh').iterrows():
+            print(f"{row['festival_name']}: {row['max_windspeed_kmh']:.1f}km/h on {row['full_date']:%Y-%m-%d}")
+
+def build_outlier_report(df):
+    """
+    Returns the outlier analysis as a JSON-ready dict
+    Used by weather_pipeline.py in place of the console report
+    """
+    from outlier_engine import find_outliers
+    report = {}
+    for column in ['max_temp_c', 'rainfall_mm', 'max_windspeed_kmh']:
+        lower, upper, outliers = identify_outliers(df, column)
+        outlier_records = df[outliers]
+        
+        def describe(records):
+            return [
+                {'festival_name': row.festival_name, 'full_date': f"{row.full_date:%Y-%m-%d}",
+                 'value': round(float(getattr(row, column)), MEASURE_DECIMALS)}
+                for row in records.itertuples()
+            ]
+        
+        report[column] = {
+            'lower_bound': float(lower),
+            'upper_bound': float(upper),
+            'outliers': len(outlier_records),
+            'highest': describe(outlier_records.nlargest(5, column)),
+            'lowest': describe(outlier_records.nsmallest(5, column))
+        }
+    
+    # Counts from the scoped engine: {measure: {scope: {rule: count}}}
+    counts = find_outliers(df).groupby(['measure', 'scope', 'rule'], observed=True).size()
+    report['by_scope'] = {}
+    for (measure, scope, rule), count in counts.items():
+        report['by_scope'].setdefault(measure, {}).setdefault(scope, {})[rule] = int(count)
+    return report
+
+def main():
+    """
+    Main function to run outlier analysis
+    Stage timings and memory are written to data/metrics/outliers.json (and .prom)
+    """
+    metrics = RunMetrics('outliers')
+    try:
+        # Load data
+        with metrics.stage('load'):
+            df = load_data()
+        metrics.increment('records', len(df))
+        
+        # Run outlier analyses
+        with metrics.stage('analyse'):
+            analyze_temperature_outliers(df)
+            analyze_rainfall_outliers(df)
+            analyze_wind_outliers(df)
+            analyze_scoped_outliers(df)
+        
+        print("\nOutlier analysis complete!")
+        
+    except Exception as e:
+        print(f"Error during analysis: {e}")
+    finally:
+        metrics.write()
+
+def command_line(argv=None):
+    """Command line entry point: checks the weather data for outliers"""
+    parser = argparse.ArgumentParser(description='Find outliers in the historical weather dataset')
+    parser.parse_args(argv)
+    main()
+
+if __name__ == "__main__":
+    command_line()
@@ -0,0 +1,376 @@
+"""
+Script: weather_pipeline.py
+Purpose: Runs collection, validation, outlier checks, the festival summary, the climatology index, the
+         weather rollup cube and the similarity index as one pipeline
+Input: data/festivals.csv and the historical weather dataset
+Output: data/pipeline/<stage>.json results, data/pipeline/state.json, data/festival_weather_comparison.csv
+        data/festival_rain_thresholds.csv, data/score_components, data/climatology_index, data/weather_rollup
+        and data/similarity_index
+Author: Dom Barry
+
+Each stage is keyed by a hash of its code, parameters and input data. Its code is
+the modules its run function uses plus every analysis module they import, found by
+reading their import statements (including those inside functions). A stage is
+skipped when its key matches the last successful run and its outputs still exist,
+so rerunning the pipeline only does the work affected by what changed. Analysis
+stages share a single in-memory copy of the dataset, loaded only if one of them runs.
+Each stage's time and peak memory go to data/metrics/pipeline.json (and .prom),
+with the shared dataset load timed separately as load_dataset.
+
+Example:
+    python analysis/weather_pipeline.py              # validate, outliers, summarise, climatology, rollup, similarity
+    python analysis/weather_pipeline.py --collect    # fetch weather data first
+    python analysis/weather_pipeline.py --force summarise
+    python analysis/weather_pipeline.py --stream     # validate and summarise in bounded memory
+"""
+
+import argparse
+import ast
+import functools
+import hashlib
+import json
+import math
+import os
+import time
+
+from climatology_index import INDEX_DIR, build_index
+from festival_similarity import SIMILARITY_DIR, build_similarity_index
+from festival_stats import load_states
+from hourly_store import HOURLY_DIR
+from run_metrics import RunMetrics
+from rain_thresholds import DEFAULT_THRESHOLDS, add_threshold_scores, parse_thresholds, rain_day_table
+from streaming_stats import stream_rain_day_table
+from weather_config import DATA_DIR
+from weather_loader import load_weather, source_fingerprint
+from weather_ranking import ATTRIBUTES_FILE, RANKING_DIR, build_components
+from weather_rollup import CUBE_FILE, ROLLUP_DIR, build_rollup
+from weather_store import BATCH_ROWS, CSV_FILE, DATASET_DIR, dataset_exists
+
+# Define file paths
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_DIR = os.path.join(DATA_DIR, 'pipeline')
+STATE_FILE = os.path.join(PIPELINE_DIR, 'state.json')
+FESTIVALS_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+COMPARISON_FILE = os.path.join(DATA_DIR, 'festival_weather_comparison.csv')
+THRESHOLDS_FILE = os.path.join(DATA_DIR, 'festival_rain_thresholds.csv')
+
+# Shared modules whose changes should invalidate every analysis stage that reads the shared dataset
+SHARED_MODULES = ['weather_config.py', 'weather_loader.py', 'weather_store.py']
+
+# The pipeline's own code, part of every stage: each stage's run function is defined
+# here, and every stage runs inside a run_metrics stage
+PIPELINE_MODULES = ['weather_pipeline.py', 'run_metrics.py']
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def weather_fingerprint():
+    """Fingerprint of whichever weather source the loader will read"""
+    source = DATASET_DIR if dataset_exists(DATASET_DIR) else CSV_FILE
+    return source_fingerprint(source) if os.path.exists(source) else 'missing'
+
+def json_number(value):
+    """Converts a numeric value for JSON, with NaN becoming null"""
+    return None if math.isnan(value) else float(value)
+
+def run_collect(context, params):
+    import historical_weather as collector
+    collector.main(**params)
+    return {'dataset': weather_fingerprint()}
+
+def run_validate(context, params):
+    import weather_data_validator_detailed as validator
+    if params.get('stream'):
+        return validator.build_validation_report(batch_rows=params.get('batch_rows', BATCH_ROWS))
+    return validator.build_validation_report(context.dataset())
+
+def run_outliers(context, params):
+    import weather_outlier_checker as checker
+    return checker.build_outlier_report(context.dataset())
+
+def run_summarise(context, params):
+    import festival_weather_summary_5mm as summary
+    batch_rows = params.get('batch_rows', BATCH_ROWS) if params.get('stream') else None
+    # Merged from the per-year state table rather than the daily rows
+    festival_metrics = summary.festival_metrics_from_states(load_states(batch_rows=batch_rows))
+    festival_metrics = summary.calculate_weather_scores(festival_metrics)
+    festival_metrics.to_csv(COMPARISON_FILE)
+    build_components(festival_metrics)
+
+    # Rain-day sensitivity across thresholds, computed in one pass over the shared dataset (or streamed)
+    thresholds = parse_thresholds(params.get('thresholds', DEFAULT_THRESHOLDS))
+    if batch_rows:
+        rain_days = stream_rain_day_table(thresholds, batch_rows=batch_rows)
+    else:
+        rain_days = rain_day_table(context.dataset(), thresholds)
+    threshold_table = add_threshold_scores(rain_days, festival_metrics)
+    threshold_table.to_csv(THRESHOLDS_FILE, index=False)
+
+    top = festival_metrics.nlargest(5, 'weather_score')
+    return {
+        'festivals': len(festival_metrics),
+        'output_file': COMPARISON_FILE,
+        'thresholds_file': THRESHOLDS_FILE,
+        'ranking_dir': RANKING_DIR,
+        'top_by_weather_score': [
+            {'festival_name': name, 'weather_score': float(row['weather_score']),
+             'pct_rain_days': json_number(row['pct_rain_days']),
+             'mean_max_temp': float(row['mean_max_temp'])}
+            for name, row in top.iterrows()
+        ]
+    }
+
+def run_climatology(context, params):
+    keys = build_index(context.dataset())
+    return {'keys': keys, 'index_dir': INDEX_DIR}
+
+def run_rollup(context, params):
+    cells = build_rollup(context.dataset())
+    return {'cells': cells, 'rollup_dir': ROLLUP_DIR}
+
+def run_similarity(context, params):
+    # Built from the summary's metrics and the climatology index's per-day means, not the dataset
+    festivals = build_similarity_index(profile=params.get('profile', True))
+    return {'festivals': festivals, 'similarity_dir': SIMILARITY_DIR}
+
+# The pipeline DAG: each stage lists the stages it depends on, the modules its run
+# function uses (see stage_code for the rest of its code), the inputs it reads and
+# the files it produces
+STAGES = {
+    'collect': {
+        'run': run_collect,
+        'depends_on': [],
+        'code': ['historical_weather.py'] + PIPELINE_MODULES,
+        'inputs': lambda: [file_digest(FESTIVALS_FILE)],
+        'outputs': [CSV_FILE]
+    },
+    'validate': {
+        'run': run_validate,
+        'depends_on': ['collect'],
+        'code': ['weather_data_validator_detailed.py'] + SHARED_MODULES + PIPELINE_MODULES,
+        'inputs': lambda: [weather_fingerprint()],
+        'outputs': []
+    },
+    'outliers': {
+        'run': run_outliers,
+        'depends_on': ['collect'],
+        'code': ['weather_outlier_checker.py'] + SHARED_MODULES + PIPELINE_MODULES,
+        'inputs': lambda: [weather_fingerprint()],
+        'outputs': []
+    },
+    'summarise': {
+        'run': run_summarise,
+        'depends_on': ['collect'],
+        'code': ['festival_weather_summary_5mm.py', 'festival_stats.py', 'rain_thresholds.py',
+                 'streaming_stats.py', 'weather_ranking.py'] + SHARED_MODULES + PIPELINE_MODULES,
+        # The hourly store supplies the ranking's peak gusts
+        'inputs': lambda: [weather_fingerprint(),
+                           file_digest(ATTRIBUTES_FILE) if os.path.exists(ATTRIBUTES_FILE) else 'missing',
+                           source_fingerprint(HOURLY_DIR) if os.path.exists(HOURLY_DIR) else 'missing'],
+        'outputs': [COMPARISON_FILE, THRESHOLDS_FILE, os.path.join(RANKING_DIR, 'meta.json')]
+    },
+    'climatology': {
+        'run': run_climatology,
+        'depends_on': ['collect'],
+        'code': ['climatology_index.py'] + SHARED_MODULES + PIPELINE_MODULES,
+        'inputs': lambda: [weather_fingerprint()],
+        'outputs': [os.path.join(INDEX_DIR, 'meta.json')]
+    },
+    'rollup': {
+        'run': run_rollup,
+        'depends_on': ['collect'],
+        'code': ['weather_rollup.py'] + SHARED_MODULES + PIPELINE_MODULES,
+        'inputs': lambda: [weather_fingerprint(), file_digest(FESTIVALS_FILE),
+                           file_digest(ATTRIBUTES_FILE) if os.path.exists(ATTRIBUTES_FILE) else 'missing'],
+        'outputs': [CUBE_FILE]
+    },
+    'similarity': {
+        'run': run_similarity,
+        'depends_on': ['summarise', 'climatology'],
+        'code': ['festival_similarity.py'] + PIPELINE_MODULES,
+        'inputs': lambda: [file_digest(path) if os.path.exists(path) else 'missing'
+                           for path in (COMPARISON_FILE, os.path.join(INDEX_DIR, 'meta.json'), FESTIVALS_FILE)],
+        'outputs': [os.path.join(SIMILARITY_DIR, 'meta.json')]
+    }
+}
+
+class PipelineContext:
+    """Holds state shared between stages, loading the dataset at most once"""
+
+    def __init__(self, metrics=None):
+        self._dataset = None
+        self.metrics = metrics or RunMetrics('pipeline')
+
+    def dataset(self):
+        if self._dataset is None:
+            with self.metrics.stage('load_dataset'):
+                self._dataset = load_weather()
+        return self._dataset
+
+    def invalidate(self):
+        self._dataset = None
+
+def local_imports(filename):
+    """Analysis modules a module imports, anywhere in the file, as file names"""
+    with open(os.path.join(ANALYSIS_DIR, filename)) as f:
+        tree = ast.parse(f.read(), filename)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return {f'{name}.py' for name in names if os.path.exists(os.path.join(ANALYSIS_DIR, f'{name}.py'))}
+
+@functools.lru_cache(maxsize=None)
+def stage_code(name):
+    """
+    Every analysis module a stage's code depends on: its listed modules and all they import, in name order
+    The pipeline module's own imports are not followed, since it imports every stage's modules
+    """
+    code, pending = set(), list(STAGES[name]['code'])
+    while pending:
+        filename = pending.pop()
+        if filename in code:
+            continue
+        code.add(filename)
+        if filename != 'weather_pipeline.py':
+            pending.extend(local_imports(filename) - code)
+    return sorted(code)
+
+def stage_key(name, params):
+    """Hashes a stage's code, parameters and current inputs"""
+    stage = STAGES[name]
+    parts = {
+        'stage': name,
+        'code': [file_digest(os.path.join(ANALYSIS_DIR, filename)) for filename in stage_code(name)],
+        'params': params,
+        'inputs': stage['inputs']()
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def save_state(state):
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    temp_file = f'{STATE_FILE}.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_file, STATE_FILE)
+
+def result_file(name):
+    return os.path.join(PIPELINE_DIR, f'{name}.json')
+
+def is_current(name, key, state):
+    """A stage is current if its key is unchanged and all its outputs still exist"""
+    previous = state.get(name)
+    if not previous or previous.get('key') != key:
+        return False
+    outputs = STAGES[name]['outputs'] + [result_file(name)]
+    return all(os.path.exists(path) for path in outputs)
+
+def resolve_order(targets):
+    """Returns the requested stages plus their dependencies in dependency order"""
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dependency in STAGES[name]['depends_on']:
+            visit(dependency)
+        order.append(name)
+
+    for target in targets:
+        visit(target)
+    return order
+
+def run_pipeline(targets=None, collect=False, force=(), stage_params=None):
+    """
+    Runs the pipeline, skipping stages whose outputs are already current
+    Parameters:
+    - targets: stages to bring up to date (default: validate, outliers, summarise, climatology, rollup, similarity)
+    - collect: also run the (network-bound) collection stage
+    - force: stage names to rerun even if current
+    - stage_params: {stage name: parameters}, e.g. {'collect': {'end_festival': 20}}
+    Returns {stage name: 'ran' | 'skipped'}
+    """
+    targets = targets or ['validate', 'outliers', 'summarise', 'climatology', 'rollup', 'similarity']
+    stage_params = stage_params or {}
+    state = load_state()
+    context = PipelineContext()
+    statuses = {}
+    try:
+        run_stages(targets, collect, force, stage_params, state, context, statuses)
+    finally:
+        for status in ('ran', 'skipped'):
+            context.metrics.set_gauge(f'stages_{status}', list(statuses.values()).count(status))
+        print(f"Run metrics saved to {context.metrics.write()}")
+    return statuses
+
+def run_stages(targets, collect, force, stage_params, state, context, statuses):
+    """Runs the targets and their dependencies unless current, recording each status in statuses"""
+    for name in resolve_order(targets):
+        if name == 'collect' and not collect and 'collect' not in targets:
+            continue
+
+        params = stage_params.get(name, {})
+        key = stage_key(name, params)
+        if name not in force and is_current(name, key, state):
+            print(f"[{name}] up to date, skipping")
+            statuses[name] = 'skipped'
+            continue
+
+        print(f"[{name}] running...")
+        started = time.time()
+        with context.metrics.stage(name):
+            result = STAGES[name]['run'](context, params)
+        elapsed = time.time() - started
+
+        # Inputs may have changed while the stage ran (e.g. collection), so re-key afterwards
+        key = stage_key(name, params)
+        os.makedirs(PIPELINE_DIR, exist_ok=True)
+        with open(result_file(name), 'w') as f:
+            json.dump(result, f, indent=2, default=str)
+        state[name] = {
+            'key': key,
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seconds': round(elapsed, 3),
+            'peak_rss_mb': context.metrics.stages[name]['peak_rss_mb'],
+            'result_file': result_file(name)
+        }
+        save_state(state)
+        if name == 'collect':
+            context.invalidate()
+
+        print(f"[{name}] finished in {elapsed:.1f}s -> {result_file(name)}")
+        statuses[name] = 'ran'
+
+def main(argv=None):
+    """
+    Command line entry point for the pipeline
+    """
+    parser = argparse.ArgumentParser(description='Run the festival weather pipeline')
+    parser.add_argument('stages', nargs='*',
+                        help='stages to bring up to date '
+                             '(default: validate outliers summarise climatology rollup similarity)')
+    parser.add_argument('--collect', action='store_true', help='run weather collection first')
+    parser.add_argument('--force', nargs='*', default=[], choices=list(STAGES),
+                        help='rerun these stages even if current')
+    parser.add_argument('--stream', action='store_true',
+                        help='validate and summarise in bounded-size batches instead of loading the dataset')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+
+    stage_params = {'validate': {'stream': True}, 'summarise': {'stream': True}} if args.stream else None
+    statuses = run_pipeline(args.stages or None, args.collect, set(args.force), stage_params)
+    print("\nPipeline complete: " + ", ".join(f"{name} {status}" for name, status in statuses.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Module: weather_ranking.py
+Purpose: Re-ranks festivals by weather under custom component weights and festival filters
+Used by: festival_weather_summary_5mm.py, weather_pipeline.py, and run directly for what-if rankings
+Author: Dom Barry
+
+The weather score in calculate_weather_scores is the equal-weight mean of three
+z-scores (temperature, rain days and wind). This module stores the standardised
+components once, alongside a few extra ones (overnight lows, average rainfall, the
+peak wind speed and the peak gust), plus each festival's attributes from festivals_25_cleaned.csv,
+as .npy arrays under data/score_components. A ranking is then a weighted mean of
+the stored z-scores (one matrix-vector product over the festivals that pass the
+filters) and np.argpartition to pick the top festivals, so a query takes well
+under a millisecond rather than a rerun of the summary.
+
+Components are z-scored across every festival (ddof 0, as scipy.stats.zscore) and
+signed so that higher is better. As in calculate_weather_scores, a component
+missing for any festival is left out of every festival's score, and a score is
+the weighted mean of the components that are present, so the default weights
+(temp, rain and wind equally) reproduce weather_score. The daily dataset does not
+collect gusts, so peak_wind is the windiest day's maximum wind speed, and peak_gust
+is the strongest hourly gust from the hourly store (hourly_store.py). peak_gust is
+only available once the hourly store holds gusts for every festival; until then it
+is left out of every score like any other missing component.
+
+Example:
+    python analysis/weather_ranking.py --build
+    python analysis/weather_ranking.py --weights rain=2 --camping yes
+    python analysis/weather_ranking.py --weights temp=0 wind=0 min_temp=1 --region scotland --top 5
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from weather_config import DATA_DIR, replace_directory
+
+# Define file paths
+RANKING_DIR = os.path.join(DATA_DIR, 'score_components')
+COMPARISON_FILE = os.path.join(DATA_DIR, 'festival_weather_comparison.csv')
+ATTRIBUTES_FILE = os.path.join(DATA_DIR, 'festivals_25_cleaned.csv')
+FESTIVALS_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+
+# Score components: name -> (festival metric, +1 if higher is better or -1 if lower is better)
+COMPONENTS = {
+    'temp': ('mean_max_temp', 1),
+    'rain': ('pct_rain_days', -1),
+    'wind': ('mean_max_wind', -1),
+    'min_temp': ('mean_min_temp', 1),
+    'rainfall': ('avg_daily_rainfall', -1),
+    'peak_wind': ('overall_max_wind', -1),
+    'peak_gust': ('overall_max_gust', -1)
+}
+
+# Weights giving calculate_weather_scores' weather_score
+DEFAULT_WEIGHTS = {'temp': 1, 'rain': 1, 'wind': 1}
+
+# Festival attributes stored as category codes, keyed by their festivals_25_cleaned.csv column
+CATEGORY_ATTRIBUTES = {'region': 'region', 'genre': 'Music Genre', 'county': 'county'}
+
+# Festivals shown when no number is given
+DEFAULT_TOP = 10
+
+def parse_capacity(value):
+    """Converts a capacity such as '10,000' to a number (NaN if missing or unreadable)"""
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return np.nan
+
+def standardise(values):
+    """z-scores a column (ddof 0, as scipy.stats.zscore); a column with any NaN becomes all NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values - values.mean()) / values.std()
+
+def gust_metric(names, hourly_dir=None, festivals_file=FESTIVALS_FILE):
+    """
+    Each festival's strongest hourly wind gust (km/h) from the hourly store, in the order of names
+    Festivals are matched to the store's festival IDs through festivals_file; a festival the
+    store does not hold, or every festival if the store has no gusts, gets NaN
+    """
+    import pandas as pd
+    from hourly_store import HOURLY_DIR, daily_from_hourly, hourly_files
+
+    hourly_dir = hourly_dir or HOURLY_DIR
+    gusts = pd.Series(np.nan, index=names)
+    if not hourly_files(hourly_dir) or not os.path.exists(festivals_file):
+        return gusts.to_numpy()
+    daily = daily_from_hourly(hourly_dir)
+    if 'max_windgust_kmh' not in daily:
+        return gusts.to_numpy()
+    festival_names = pd.read_csv(festivals_file, usecols=['ID', 'Title']).set_index('ID')['Title'].astype(str)
+    peaks = daily.groupby(daily['festival_id'].map(festival_names))['max_windgust_kmh'].max()
+    return gusts.fillna(peaks).to_numpy(dtype='float64')
+
+def build_components(festival_metrics=None, ranking_dir=RANKING_DIR, attributes_file=ATTRIBUTES_FILE,
+                     hourly_dir=None):
+    """
+    Stores the standardised score components and festival attributes for fast re-ranking
+    Parameters:
+    - festival_metrics: festival metrics indexed by festival_name (default: read from COMPARISON_FILE)
+    - ranking_dir: directory to write the arrays to
+    - attributes_file: festival details (region, genre, county, camping and capacity), matched by name
+    - hourly_dir: hourly store to take peak gusts from, if festival_metrics has no overall_max_gust
+      (default: hourly_store.HOURLY_DIR)
+    Returns the number of festivals stored
+    """
+    # Imported here so ranking from the stored components does not load pandas
+    import pandas as pd
+
+    if festival_metrics is None:
+        festival_metrics = pd.read_csv(COMPARISON_FILE, index_col='festival_name')
+    names = festival_metrics.index.astype(str).to_numpy()
+    if 'overall_max_gust' not in festival_metrics:
+        festival_metrics = festival_metrics.assign(overall_max_gust=gust_metric(names, hourly_dir))
+    components = np.column_stack([
+        direction * standardise(festival_metrics[metric].to_numpy(dtype='float64'))
+        for metric, direction in COMPONENTS.values()
+    ])
+    present = ~np.isnan(components)
+
+    # Festival details; festivals not listed get unknown attributes and drop out of any attribute filter
+    if os.path.exists(attributes_file):
+        details = pd.read_csv(attributes_file).drop_duplicates('Title').set_index('Title').reindex(names)
+    else:
+        details = pd.DataFrame(index=names, columns=['Camping', 'Capacity'] + list(CATEGORY_ATTRIBUTES.values()))
+    camping = details['Camping'].astype(str).str.strip().str.lower().map({'yes': 1, 'no': 0})
+    arrays = {
+        'components': np.where(present, components, 0.0),
+        'present': present,
+        'camping': camping.fillna(-1).to_numpy(dtype='int8'),
+        'capacity': details['Capacity'].map(parse_capacity).to_numpy(dtype='float64')
+    }
+    categories = {}
+    for attribute, column in CATEGORY_ATTRIBUTES.items():
+        values = details[column].astype('category')
+        categories[attribute] = [str(value) for value in values.cat.categories]
+        arrays[attribute] = values.cat.codes.to_numpy(dtype='int16')
+
+    meta = {
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'components': {name: {'metric': metric, 'direction': direction}
+                       for name, (metric, direction) in COMPONENTS.items()},
+        'festivals': names.tolist(),
+        'categories': categories,
+        'attributes_file': attributes_file if os.path.exists(attributes_file) else None
+    }
+
+    # Built aside and swapped in by replace_directory, so readers never see a partial set
+    # and the old one stays readable until the swap
+    with replace_directory(ranking_dir) as temp_dir:
+        for name, array in arrays.items():
+            np.save(os.path.join(temp_dir, f'{name}.npy'), array)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+    return len(names)
+
+def parse_weights(items):
+    """
+    Parses weights such as ['rain=2', 'temp=0.5'] on top of DEFAULT_WEIGHTS
+    Raises ValueError for an unknown component or a value that is not a number
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in items or []:
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in COMPONENTS:
+            raise ValueError(f"Unknown component: {name} (choose from {', '.join(COMPONENTS)})")
+        try:
+            weights[name] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid weight for {name}: {value!r} (use e.g. {name}=2)")
+    return weights
+
+class FestivalRanking:
+    """
+    In-memory view of the stored score components, answering weighted top-k queries
+    Weights are {component: weight}; components not given are left out. Negative weights
+    are allowed (e.g. temp=-1 to prefer cooler festivals) and count by their size when averaging.
+    """
+
+    def __init__(self, ranking_dir=RANKING_DIR):
+        meta_file = os.path.join(ranking_dir, 'meta.json')
+        if not os.path.exists(meta_file):
+            raise FileNotFoundError(f"No score components in {ranking_dir} (build them with --build)")
+        with open(meta_file) as f:
+            self.meta = json.load(f)
+        self.component_names = list(self.meta['components'])
+        self.names = np.array(self.meta['festivals'], dtype=object)
+        self.categories = self.meta['categories']
+        arrays = ['components', 'present', 'camping', 'capacity'] + list(self.categories)
+        self.arrays = {name: np.load(os.path.join(ranking_dir, f'{name}.npy')) for name in arrays}
+        self.components = self.arrays['components']
+        self.present = self.arrays['present'].astype('float64')
+
+    def weight_vector(self, weights):
+        """Weights as an array in component order"""
+        unknown = [name for name in weights if name not in self.component_names]
+        if unknown:
+            raise KeyError(f"Unknown components: {', '.join(unknown)} (choose from {', '.join(self.component_names)})")
+        return np.array([float(weights.get(name, 0)) for name in self.component_names])
+
+    def category_mask(self, attribute, text):
+        """Festivals whose attribute contains text (case-insensitive), e.g. region 'wales'"""
+        text = text.strip().lower()
+        matches = np.array([text in value.lower() for value in self.categories[attribute]] + [False])
+        # Code -1 (unknown) picks the trailing False
+        return matches[self.arrays[attribute]]
+
+    def filter_mask(self, camping=None, region=None, genre=None, county=None, min_capacity=None, max_capacity=None):
+        """
+        Festivals passing every given filter, or None if no filter is given
+        Parameters:
+        - camping: True for festivals with camping, False for those without
+        - region, genre, county: case-insensitive part of the value, e.g. 'scotland' or 'rock'
+        - min_capacity, max_capacity: bounds on the listed capacity
+        """
+        mask = None
+
+        def combine(condition):
+            return condition if mask is None else mask & condition
+
+        if camping is not None:
+            mask = combine(self.arrays['camping'] == int(bool(camping)))
+        for attribute, text in (('region', region), ('genre', genre), ('county', county)):
+            if text:
+                mask = combine(self.category_mask(attribute, text))
+        capacity = self.arrays['capacity']
+        if min_capacity is not None:
+            mask = combine(capacity >= min_capacity)
+        if max_capacity is not None:
+            mask = combine(capacity <= max_capacity)
+        return mask
+
+    def scores(self, weights, rows=None):
+        """Weighted mean of the present components for the given festival positions (default: all)"""
+        vector = self.weight_vector(weights)
+        components = self.components if rows is None else self.components[rows]
+        present = self.present if rows is None else self.present[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (components @ vector) / (present @ np.abs(vector))
+
+    def top(self, weights=None, k=DEFAULT_TOP, mask=None):
+        """
+        Positions and scores of the k best festivals, best first
+        - mask: boolean array of festivals to consider (see filter_mask)
+        """
+        rows = None if mask is None else np.flatnonzero(mask)
+        scores = self.scores(DEFAULT_WEIGHTS if weights is None else weights, rows)
+        # Missing scores sort last
+        keys = np.nan_to_num(scores, nan=-np.inf)
+        k = min(k, len(keys))
+        if k <= 0:
+            return np.zeros(0, dtype='int64'), np.zeros(0)
+        best = np.argpartition(-keys, k - 1)[:k] if k < len(keys) else np.arange(len(keys))
+        best = best[np.argsort(-keys[best], kind='stable')]
+        positions = best if rows is None else rows[best]
+        return positions, scores[best]
+
+    def rank(self, weights=None, k=DEFAULT_TOP, **filters):
+        """
+        The k best festivals under the weights and filters (see filter_mask)
+        Returns a DataFrame indexed by festival_name with the weighted score and each weighted component's z-score
+        """
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        positions, scores = self.top(weights, k, self.filter_mask(**filters))
+        return self.frame(positions, scores, weights)
+
+    def columns(self, positions, scores, weights):
+        """Top festivals from top() as {column: values}: the weighted score and each weighted component's z-score"""
+        columns = {'weather_score': np.round(scores, 2)}
+        for position, name in enumerate(self.component_names):
+            if weights.get(name):
+                z = np.where(self.present[positions, position] > 0, self.components[positions, position], np.nan)
+                columns[f'{name}_z'] = z.round(2)
+        return columns
+
+    def frame(self, positions, scores, weights):
+        """Top festivals from top() as a DataFrame indexed by festival_name (see columns)"""
+        import pandas as pd
+
+        return pd.DataFrame(self.columns(positions, scores, weights),
+                            index=pd.Index(self.names[positions], name='festival_name'))
+
+def print_table(names, columns):
+    """Prints festival names and their columns as an aligned table, without needing pandas"""
+    rows = [['festival_name'] + list(columns)]
+    rows += [[str(name)] + [f'{values[row]:.2f}' for values in columns.values()] for row, name in enumerate(names)]
+    widths = [max(len(row[position]) for row in rows) for position in range(len(rows[0]))]
+    for row in rows:
+        print('  '.join([row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]))
+
+def main(argv=None):
+    """
+    Command line entry point: builds the components or ranks the festivals
+    """
+    parser = argparse.ArgumentParser(description='Rank festivals by weather with custom component weights')
+    default_weights = ' '.join(f'{name}={weight}' for name, weight in DEFAULT_WEIGHTS.items())
+    parser.add_argument('--build', action='store_true',
+                        help=f'(re)build {RANKING_DIR} from {COMPARISON_FILE} first')
+    parser.add_argument('--weights', nargs='+', default=[], metavar='COMPONENT=WEIGHT',
+                        help=f"weights on top of the default ({default_weights}), "
+                             f"e.g. rain=2 or wind=0 min_temp=1 (components: {', '.join(COMPONENTS)})")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='number of festivals to show')
+    parser.add_argument('--camping', choices=['yes', 'no'], help='only festivals with (or without) camping')
+    parser.add_argument('--region', help="only regions containing this text, e.g. 'south west' or wales")
+    parser.add_argument('--genre', help='only genres containing this text, e.g. folk')
+    parser.add_argument('--county', help='only counties containing this text')
+    parser.add_argument('--min-capacity', type=float, help='only festivals with at least this capacity')
+    parser.add_argument('--max-capacity', type=float, help='only festivals with at most this capacity')
+    args = parser.parse_args(argv)
+
+    try:
+        weights = parse_weights(args.weights)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.build:
+        print("Building score components...")
+        festivals = build_components()
+        print(f"Stored {len(COMPONENTS)} components for {festivals} festivals -> {RANKING_DIR}")
+
+    try:
+        ranking = FestivalRanking()
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    filters = {
+        'camping': None if args.camping is None else args.camping == 'yes',
+        'region': args.region,
+        'genre': args.genre,
+        'county': args.county,
+        'min_capacity': args.min_capacity,
+        'max_capacity': args.max_capacity
+    }
+    started = time.perf_counter()
+    try:
+        positions, scores = ranking.top(weights, args.top, ranking.filter_mask(**filters))
+    except KeyError as e:
+        # Components stored by an older build lack newer ones; --build adds them
+        parser.error(str(e).strip('"'))
+    elapsed = time.perf_counter() - started
+    columns = ranking.columns(positions, scores, weights)
+
+    used = ', '.join(f'{name}={weight:g}' for name, weight in weights.items() if weight)
+    print(f"Top {len(positions)} festivals by weather ({used}):")
+    if len(positions):
+        print_table(ranking.names[positions], columns)
+    else:
+        print("No festivals match the filters")
+    unavailable = [name for name in ranking.component_names
+                   if weights.get(name) and not ranking.present[:, ranking.component_names.index(name)].any()]
+    if unavailable:
+        print(f"Note: no data for {', '.join(unavailable)}, so it is left out of the scores"
+              + (" (collect gusts with historical_weather.py --hourly)" if 'peak_gust' in unavailable else ""))
+    print(f"\nRanked in {elapsed * 1e3:.2f} milliseconds")
+
+if __name__ == "__main__":
+    main()
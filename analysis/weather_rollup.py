@@ -0,0 +1,295 @@
+"""
+Module: weather_rollup.py
+Purpose: Pre-aggregated weather cube by region, genre, month, camping and capacity band
+Used by: weather_pipeline.py, and run directly for slice-and-dice weather questions
+Author: Dom Barry
+
+The weather data is keyed by festival_id, while festival details (region, genre,
+camping, capacity) sit in festivals_25_cleaned.csv keyed by name. The build joins
+them once: festivals.csv maps each name to its integer festival_id, giving a small
+festival table, and the daily rows are reduced to one mergeable partial state per
+(festival_id, month) with festival_stats.partial_states. Those states are merged
+into every combination of the five dimensions, with 'All' standing for a dimension
+that is rolled up, so any slice such as "camping festivals in Wales in July" or
+"rain by genre and month" is a read of precomputed cells rather than a pass over
+the daily rows.
+
+Only non-empty cells are stored, with dictionary-encoded dimensions, in
+data/weather_rollup/cube.parquet next to the festival table. Cells hold the
+partial states (counts, means, sums of squared deviations, minima and maxima), so
+metrics for several cells merged together are still exact; festivals counts each
+festival in the cell once, and is summed when a query merges several cells.
+
+Example:
+    python analysis/weather_rollup.py --build
+    python analysis/weather_rollup.py --by region month
+    python analysis/weather_rollup.py --by genre --camping Yes --month July August
+"""
+
+import argparse
+import calendar
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from festival_stats import RAIN_THRESHOLD_MM, measure_mean, measure_std, merge_states, partial_states
+from weather_config import DATA_DIR, replace_directory
+from weather_loader import load_weather
+from weather_store import MEASURE_COLUMNS
+
+# Define file paths
+ROLLUP_DIR = os.path.join(DATA_DIR, 'weather_rollup')
+CUBE_FILE = os.path.join(ROLLUP_DIR, 'cube.parquet')
+FESTIVAL_TABLE_FILE = os.path.join(ROLLUP_DIR, 'festivals.parquet')
+FESTIVALS_FILE = os.path.join(DATA_DIR, 'festivals.csv')
+ATTRIBUTES_FILE = os.path.join(DATA_DIR, 'festivals_25_cleaned.csv')
+
+# Columns the build reads from the weather data
+INPUT_COLUMNS = ['festival_id', 'calendar_date'] + MEASURE_COLUMNS
+
+# Cube dimensions, in display order
+DIMENSIONS = ['region', 'genre', 'month', 'camping', 'capacity_band']
+
+# Value of a rolled-up dimension, and of a festival detail that is not known
+ALL = 'All'
+UNKNOWN = 'Unknown'
+
+# Capacity bands: lower bounds and labels
+CAPACITY_BANDS = [(0, 'Under 1,000'), (1000, '1,000-4,999'), (5000, '5,000-19,999'), (20000, '20,000-49,999'),
+                  (50000, '50,000+')]
+
+def capacity_band(capacity):
+    """Band label for a capacity such as '10,000' or 10000 (UNKNOWN if missing or unreadable)"""
+    try:
+        value = float(str(capacity).replace(',', ''))
+    except ValueError:
+        return UNKNOWN
+    if np.isnan(value):
+        return UNKNOWN
+    label = UNKNOWN
+    for lower, band in CAPACITY_BANDS:
+        if value >= lower:
+            label = band
+    return label
+
+def month_number(name):
+    return list(calendar.month_name).index(name)
+
+def festival_table(festivals_file=FESTIVALS_FILE, attributes_file=ATTRIBUTES_FILE):
+    """
+    Festival details keyed by the integer festival_id used in the weather data
+    Details are matched by name; festivals without them get UNKNOWN
+    Returns a DataFrame indexed by festival_id
+    """
+    festivals = pd.read_csv(festivals_file, usecols=['ID', 'Title'])
+    details = pd.read_csv(attributes_file).drop_duplicates('Title') if os.path.exists(attributes_file) else None
+    table = pd.DataFrame({'festival_id': festivals['ID'].astype('int32'), 'festival_name': festivals['Title']})
+    if details is None:
+        details = pd.DataFrame(columns=['Title', 'region', 'Music Genre', 'county', 'Camping', 'Capacity', 'duration'])
+    # Indexed by festival_id before the columns are derived, so each keeps its own festival's row
+    table = table.merge(details, how='left', left_on='festival_name', right_on='Title').set_index('festival_id')
+    return pd.DataFrame({
+        'festival_name': table['festival_name'].astype(str),
+        'region': table['region'].fillna(UNKNOWN).astype(str).str.strip(),
+        'genre': table['Music Genre'].fillna(UNKNOWN).astype(str).str.strip(),
+        'county': table['county'].fillna(UNKNOWN).astype(str).str.strip(),
+        'camping': table['Camping'].fillna(UNKNOWN).astype(str).str.strip().str.capitalize(),
+        'capacity': pd.to_numeric(table['Capacity'].astype(str).str.replace(',', ''), errors='coerce'),
+        'capacity_band': table['Capacity'].map(capacity_band),
+        'duration': pd.to_numeric(table['duration'], errors='coerce').astype('Int16')
+    }, index=table.index)
+
+def festival_month_states(df, rain_threshold=RAIN_THRESHOLD_MM):
+    """Partial states per (festival_id, month name) from daily rows with a MM-DD calendar_date"""
+    dates = df['calendar_date'].astype('category')
+    month_of_date = np.array([calendar.month_name[int(str(value)[:2])] for value in dates.cat.categories], dtype=object)
+    rows = df[['festival_id', 'rainfall_mm'] + [column for column in MEASURE_COLUMNS if column != 'rainfall_mm']]
+    rows = rows.assign(month=month_of_date[dates.cat.codes.to_numpy()])
+    return partial_states(rows, rain_threshold, keys=['festival_id', 'month'])
+
+def build_cube(festivals, states):
+    """
+    Merges (festival_id, month) partial states into every roll-up of DIMENSIONS
+    Returns one row per non-empty cell with the dimensions, festivals and the merged states
+    """
+    cells = festivals.loc[states['festival_id'], [dimension for dimension in DIMENSIONS if dimension != 'month']]
+    cells = pd.concat([cells.reset_index(), states.drop(columns='festival_id')], axis=1)
+
+    cuboids = []
+    for kept in itertools.product([True, False], repeat=len(DIMENSIONS)):
+        rolled = cells.copy()
+        for dimension, keep in zip(DIMENSIONS, kept):
+            if not keep:
+                rolled[dimension] = ALL
+        merged = merge_states(rolled.drop(columns='festival_id'), by=DIMENSIONS)
+        merged.insert(0, 'festivals', rolled.groupby(DIMENSIONS, sort=True)['festival_id'].nunique())
+        cuboids.append(merged.reset_index())
+    cube = pd.concat(cuboids, ignore_index=True)
+
+    # Compact storage: dictionary-encoded dimensions, 32-bit counts, minima and maxima
+    for dimension in DIMENSIONS:
+        cube[dimension] = cube[dimension].astype('category')
+    for column in cube.columns:
+        if column in ('festivals', 'days', 'rain_days') or column.endswith('_count'):
+            cube[column] = cube[column].astype('int32')
+        elif column.endswith(('_min', '_max')):
+            cube[column] = cube[column].astype('float32')
+    return cube
+
+def build_rollup(df=None, rollup_dir=ROLLUP_DIR, festivals_file=FESTIVALS_FILE, attributes_file=ATTRIBUTES_FILE):
+    """
+    Builds the festival table and rollup cube from the weather data (loaded if df is not given)
+    Returns the number of cells stored
+    """
+    if df is None:
+        df = load_weather(columns=INPUT_COLUMNS)
+    festivals = festival_table(festivals_file, attributes_file)
+    states = festival_month_states(df)
+    missing = ~states['festival_id'].isin(festivals.index)
+    if missing.any():
+        # Weather for a festival no longer listed still counts, with unknown details
+        extra = pd.DataFrame(index=pd.Index(states.loc[missing, 'festival_id'].unique(), name='festival_id'))
+        festivals = pd.concat([festivals, extra]).fillna({column: UNKNOWN for column in DIMENSIONS if column != 'month'})
+    cube = build_cube(festivals, states)
+
+    # Built aside and swapped in by replace_directory, so readers never see a partial cube
+    # and the old one stays readable until the swap
+    with replace_directory(rollup_dir) as temp_dir:
+        festivals.to_parquet(os.path.join(temp_dir, os.path.basename(FESTIVAL_TABLE_FILE)), compression='zstd')
+        cube.to_parquet(os.path.join(temp_dir, os.path.basename(CUBE_FILE)), index=False, compression='zstd')
+    return len(cube)
+
+def cell_metrics(cells):
+    """Weather metrics from merged cell states, as the festival summary derives them"""
+    result = pd.DataFrame({
+        'festivals': cells['festivals'],
+        'days': cells['days'],
+        'mean_max_temp': measure_mean(cells, 'max_temp_c'),
+        'max_max_temp': cells['max_temp_c_max'],
+        'temp_std_dev': measure_std(cells, 'max_temp_c'),
+        'mean_min_temp': measure_mean(cells, 'min_temp_c'),
+        'min_min_temp': cells['min_temp_c_min'],
+        'avg_daily_rainfall': measure_mean(cells, 'rainfall_mm'),
+        'max_daily_rainfall': cells['rainfall_mm_max'],
+        'pct_rain_days': cells['rain_days'] / cells['days'].where(cells['days'] > 0) * 100,
+        'mean_max_wind': measure_mean(cells, 'max_windspeed_kmh'),
+        'overall_max_wind': cells['max_windspeed_kmh_max']
+    }, index=cells.index)
+    return result.astype('float64').round(2).astype({'festivals': 'int64', 'days': 'int64'})
+
+class WeatherRollup:
+    """
+    Reads slices of the rollup cube
+    Filters take one value or a list of values per dimension (case-insensitive; months also as
+    numbers). A slice reads the cells grouped by the requested dimensions with every other
+    unfiltered dimension rolled up, merging cells only when a filter lists several values.
+    """
+
+    def __init__(self, rollup_dir=ROLLUP_DIR):
+        cube_file = os.path.join(rollup_dir, os.path.basename(CUBE_FILE))
+        if not os.path.exists(cube_file):
+            raise FileNotFoundError(f"No rollup cube in {rollup_dir} (build it with --build)")
+        self.cube = pd.read_parquet(cube_file)
+        self.festivals = pd.read_parquet(os.path.join(rollup_dir, os.path.basename(FESTIVAL_TABLE_FILE)))
+        # Category codes and each value's code, so cells are picked with integer comparisons
+        self.codes = {dimension: self.cube[dimension].cat.codes.to_numpy() for dimension in DIMENSIONS}
+        self.value_codes = {dimension: {value: code for code, value in enumerate(self.cube[dimension].cat.categories)}
+                            for dimension in DIMENSIONS}
+
+    def values(self, dimension):
+        """Stored values of a dimension, excluding ALL (months in calendar order)"""
+        values = [value for value in self.value_codes[dimension] if value != ALL]
+        return sorted(values, key=month_number) if dimension == 'month' else values
+
+    def resolve(self, dimension, wanted):
+        """Matches filter values to stored ones; raises KeyError for a value not in the cube"""
+        stored = {value.lower(): value for value in self.values(dimension)}
+        resolved = []
+        for value in wanted if isinstance(wanted, (list, tuple)) else [wanted]:
+            text = str(value).strip()
+            if dimension == 'month' and text.isdigit() and 1 <= int(text) <= 12:
+                text = calendar.month_name[int(text)]
+            if text.lower() not in stored:
+                raise KeyError(f"No {dimension} '{value}' in the cube (choose from {', '.join(self.values(dimension))})")
+            resolved.append(stored[text.lower()])
+        return resolved
+
+    def slice(self, by=(), **filters):
+        """
+        Weather metrics grouped by the by dimensions, for the cells matching the filters
+        e.g. slice(by=['month'], region='Wales', camping='Yes')
+        Returns a DataFrame indexed by the by dimensions (one row if by is empty)
+        """
+        by = list(by)
+        unknown = [dimension for dimension in by + list(filters) if dimension not in DIMENSIONS]
+        if unknown:
+            raise KeyError(f"Unknown dimensions: {', '.join(unknown)} (choose from {', '.join(DIMENSIONS)})")
+        filters = {dimension: self.resolve(dimension, wanted) for dimension, wanted in filters.items()
+                   if wanted is not None}
+
+        # The cuboid keeping exactly the grouped and filtered dimensions
+        mask = np.ones(len(self.cube), dtype=bool)
+        for dimension in DIMENSIONS:
+            codes = self.codes[dimension]
+            all_code = self.value_codes[dimension].get(ALL, -1)
+            if dimension in filters:
+                mask &= np.isin(codes, [self.value_codes[dimension][value] for value in filters[dimension]])
+            elif dimension in by:
+                mask &= codes != all_code
+            else:
+                mask &= codes == all_code
+        cells = self.cube[mask]
+
+        if any(len(wanted) > 1 and dimension not in by for dimension, wanted in filters.items()):
+            cells = cells.assign(**{dimension: ALL for dimension in filters if dimension not in by})
+            cells = merge_states(cells, by=DIMENSIONS).reset_index()
+        if not by:
+            return cell_metrics(cells.reset_index(drop=True))
+        # Months in calendar order rather than alphabetically
+        cells = cells.sort_values(by, key=lambda column: column.astype(str).map(month_number) if column.name == 'month'
+                                  else column.astype(str))
+        return cell_metrics(cells.set_index(by))
+
+def main(argv=None):
+    """
+    Command line entry point: builds the cube or prints a slice of it
+    """
+    parser = argparse.ArgumentParser(description='Slice festival weather by region, genre, month, camping and capacity')
+    parser.add_argument('--build', action='store_true', help=f'(re)build the cube in {ROLLUP_DIR} first')
+    parser.add_argument('--by', nargs='+', default=[], choices=DIMENSIONS, help='dimensions to group by')
+    parser.add_argument('--region', nargs='+', help='only these regions')
+    parser.add_argument('--genre', nargs='+', help='only these genres')
+    parser.add_argument('--month', nargs='+', help='only these months (names or numbers)')
+    parser.add_argument('--camping', nargs='+', help='Yes or No')
+    parser.add_argument('--capacity-band', nargs='+',
+                        help=f"only these capacity bands ({', '.join(band for _, band in CAPACITY_BANDS)})")
+    args = parser.parse_args(argv)
+
+    if args.build:
+        print("Building weather rollup cube...")
+        started = time.perf_counter()
+        cells = build_rollup()
+        print(f"Stored {cells} cells in {time.perf_counter() - started:.1f}s -> {ROLLUP_DIR}")
+
+    try:
+        rollup = WeatherRollup()
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    filters = {dimension: getattr(args, dimension) for dimension in DIMENSIONS}
+    started = time.perf_counter()
+    try:
+        result = rollup.slice(args.by, **filters)
+    except KeyError as e:
+        parser.error(str(e).strip('"'))
+    elapsed = time.perf_counter() - started
+
+    described = ', '.join(f"{dimension} {' or '.join(wanted)}" for dimension, wanted in filters.items() if wanted)
+    print(f"Weather by {', '.join(args.by) or 'all festivals'}" + (f" for {described}" if described else "") + ":")
+    print(result.to_string())
+    print(f"\nRead {len(result)} cells in {elapsed * 1e3:.1f} milliseconds")
+
+if __name__ == "__main__":
+    main()
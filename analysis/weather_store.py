@@ -0,0 +1,204 @@
+"""
+Module: weather_store.py
+Purpose: Typed, columnar (Parquet) storage for the historical weather dataset
+Used by: historical_weather.py and the analysis scripts
+Author: Dom Barry
+
+The dataset is written as Parquet files partitioned by historical_year
+(data/all_festivals_historical_weather/historical_year=1995/part-0.parquet), with rows
+sorted by festival_id inside each file so festival filters skip row groups using
+the Parquet statistics. Readers load only the columns, festivals and years they need.
+The CSV copy is still produced for the Tableau dashboards.
+"""
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from weather_config import (BATCH_ROWS, CSV_FILE, DATASET_DIR, MEASURE_COLUMNS, MEASURE_DECIMALS, dataset_exists,
+                            replace_directory)
+
+# Archive daily variable behind each measure column
+DAILY_VARIABLES = {
+    'max_temp_c': 'temperature_2m_max',
+    'min_temp_c': 'temperature_2m_min',
+    'rainfall_mm': 'rain_sum',
+    'total_precipitation_mm': 'precipitation_sum',
+    'max_windspeed_kmh': 'windspeed_10m_max'
+}
+
+# Explicit schema: small integer keys, dictionary-encoded names, a real date type and float32 measures
+SCHEMA = pa.schema(
+    [
+        ('festival_id', pa.int32()),
+        ('festival_name', pa.dictionary(pa.int32(), pa.string())),
+        ('historical_year', pa.int16()),
+        ('calendar_date', pa.dictionary(pa.int16(), pa.string())),
+        ('full_date', pa.date32()),
+    ] +
+    [(column, pa.float32()) for column in MEASURE_COLUMNS] +
+    [
+        ('lat', pa.float64()),
+        ('long', pa.float64()),
+    ]
+)
+
+# Freshly collected records keep the API's float64 values until they are stored
+RECORD_SCHEMA = pa.schema([
+    pa.field(field.name, pa.float64()) if field.name in MEASURE_COLUMNS else field
+    for field in SCHEMA
+])
+
+# A partition per (festival, year) would mean thousands of files holding a few rows each,
+# so only year is a directory level; festival_id is pruned via row-group statistics
+PARTITIONING = ds.partitioning(pa.schema([('historical_year', pa.int16())]), flavor='hive')
+ROW_GROUP_SIZE = 4096
+
+def to_table(data):
+    """Converts a DataFrame (or Table) of weather records to a Table with the dataset schema"""
+    if not isinstance(data, pa.Table):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    columns = []
+    for field in SCHEMA:
+        column = data.column(field.name)
+        if field.name == 'full_date' and pa.types.is_string(column.type):
+            column = pc.strptime(column, format='%Y-%m-%d', unit='s')
+        columns.append(column.cast(field.type))
+    return pa.Table.from_arrays(columns, schema=SCHEMA)
+
+def csv_batches(csv_file=CSV_FILE, block_size=1 << 22):
+    """Streams a weather CSV as record batches typed with the dataset schema"""
+    convert_options = pa_csv.ConvertOptions(
+        column_types={field.name: field.type for field in SCHEMA if not pa.types.is_dictionary(field.type)},
+        timestamp_parsers=['%Y-%m-%d']
+    )
+    reader = pa_csv.open_csv(csv_file, read_options=pa_csv.ReadOptions(block_size=block_size),
+                             convert_options=convert_options)
+    for batch in reader:
+        yield to_table(pa.Table.from_batches([batch])).to_batches()[0]
+
+def write_dataset(data, dataset_dir=DATASET_DIR):
+    """
+    Writes weather records to the partitioned Parquet dataset
+    - data: DataFrame, Table, or iterable of record batches with the dataset schema,
+      sorted by festival_id, historical_year and full_date
+    Years present in data replace the stored partition for that year; other years are kept
+    """
+    if not isinstance(data, pa.Table) and hasattr(data, 'columns'):
+        data = to_table(data)
+    if isinstance(data, pa.Table):
+        data = data.sort_by([('festival_id', 'ascending'), ('historical_year', 'ascending'), ('full_date', 'ascending')])
+    ds.write_dataset(
+        data,
+        dataset_dir,
+        schema=SCHEMA,
+        format='parquet',
+        partitioning=PARTITIONING,
+        existing_data_behavior='delete_matching',
+        max_rows_per_group=ROW_GROUP_SIZE,
+        min_rows_per_group=ROW_GROUP_SIZE,
+        basename_template='part-{i}.parquet',
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd')
+    )
+    return dataset_dir
+
+def convert_csv(csv_file=CSV_FILE, dataset_dir=DATASET_DIR):
+    """
+    Rebuilds the Parquet dataset from a weather CSV without loading it all into memory
+    The CSV must already be sorted by festival_id, historical_year and full_date
+    The new dataset is written aside and swapped in, so readers keep the old one until it is complete
+    """
+    with replace_directory(dataset_dir) as temp_dir:
+        write_dataset(csv_batches(csv_file), temp_dir)
+    return dataset_dir
+
+def open_dataset(dataset_dir=DATASET_DIR):
+    return ds.dataset(dataset_dir, schema=SCHEMA, format='parquet', partitioning=PARTITIONING)
+
+def read_table(dataset_dir=DATASET_DIR, columns=None, festival_ids=None, years=None):
+    """
+    Reads part of the dataset as an Arrow table
+    - columns: columns to load (default all)
+    - festival_ids / years: only read these festivals and year partitions
+    """
+    condition = None
+    if festival_ids is not None:
+        condition = ds.field('festival_id').isin([int(value) for value in festival_ids])
+    if years is not None:
+        year_condition = ds.field('historical_year').isin([int(value) for value in years])
+        condition = year_condition if condition is None else condition & year_condition
+    table = open_dataset(dataset_dir).to_table(columns=columns, filter=condition)
+    sort_keys = [key for key in ('festival_id', 'historical_year', 'full_date') if key in table.column_names]
+    if sort_keys:
+        table = table.sort_by([(key, 'ascending') for key in sort_keys])
+    return table
+
+def scan_batches(dataset_dir=DATASET_DIR, columns=None, years=None, batch_rows=BATCH_ROWS):
+    """
+    Streams part of the dataset as tables of about batch_rows rows, in storage order
+    Files are read one row group at a time on the calling thread: the dataset scanner
+    reads ahead in the background and buffers more the slower batches are consumed
+    """
+    columns = list(columns or SCHEMA.names)
+    file_columns = [column for column in columns if column != 'historical_year']
+    condition = None
+    if years is not None:
+        condition = ds.field('historical_year').isin([int(value) for value in years])
+
+    pending, pending_rows = [], 0
+    for fragment in open_dataset(dataset_dir).get_fragments(filter=condition):
+        year = ds.get_partition_keys(fragment.partition_expression)['historical_year']
+        for batch in pq.ParquetFile(fragment.path).iter_batches(
+            batch_size=batch_rows, columns=file_columns, use_threads=False
+        ):
+            table = pa.Table.from_batches([batch])
+            if 'historical_year' in columns:
+                table = table.append_column('historical_year', pa.array(
+                    [year] * batch.num_rows, type=SCHEMA.field('historical_year').type
+                ))
+            pending.append(table.select(columns))
+            pending_rows += batch.num_rows
+            if pending_rows >= batch_rows:
+                yield pa.concat_tables(pending)
+                pending, pending_rows = [], 0
+    if pending:
+        yield pa.concat_tables(pending)
+
+def widen_measures(table):
+    """
+    Casts float32 measures to float64 holding the exact decimal values the API returned
+    Keeps threshold comparisons (e.g. rain > 5mm, IQR bounds) identical to the CSV
+    """
+    for column in MEASURE_COLUMNS:
+        if column in table.column_names:
+            index = table.column_names.index(column)
+            values = pc.round(table.column(column).cast(pa.float64()), MEASURE_DECIMALS)
+            table = table.set_column(index, column, values)
+    return table
+
+def read_frame(dataset_dir=DATASET_DIR, columns=None, festival_ids=None, years=None, measure_dtype='float64'):
+    """
+    Reads part of the dataset as a DataFrame
+    Names become categoricals and full_date a datetime column
+    - measure_dtype: 'float64' for exact decimal values, 'float32' to keep the compact storage type
+    """
+    table = read_table(dataset_dir, columns, festival_ids, years)
+    if measure_dtype == 'float64':
+        table = widen_measures(table)
+    return table.to_pandas(date_as_object=False)
+
+def decode_dictionaries(table):
+    """Casts dictionary-encoded columns back to plain strings"""
+    return table.cast(pa.schema([
+        pa.field(field.name, field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+        for field in table.schema
+    ]))
+
+def export_csv(dataset_dir=DATASET_DIR, csv_file=CSV_FILE):
+    """Writes the dataset back out as a single CSV (for the Tableau dashboards)"""
+    table = decode_dictionaries(widen_measures(read_table(dataset_dir)))
+    pa_csv.write_csv(table.select([field.name for field in SCHEMA]), csv_file,
+                     pa_csv.WriteOptions(quoting_style='needed'))
+    return csv_file
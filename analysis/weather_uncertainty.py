@@ -0,0 +1,195 @@
+"""
+Module: weather_uncertainty.py
+Purpose: Bootstrap confidence intervals for festival weather scores and ranks
+Used by: festival_weather_summary_5mm.py (--bootstrap)
+Author: Dom Barry
+
+Each replicate resamples every festival's historical years with replacement and
+recomputes its weather score the way calculate_weather_scores does: mean max
+temperature, percentage of rain days and mean max wind, rounded as the summary
+rounds them, z-scored across festivals and averaged. The resampling works on the
+per-year partial states from festival_stats.py, so a replicate never touches the
+daily rows. Resampled years become a count of how often each year was drawn, and
+a (replicate x festival x year) count matrix times the (festival x year) state
+totals gives every replicate's festival sums at once. Replicates are split into
+chunks, each with its own seed, and spread over a process pool, so the results
+depend on the seed but not on the number of workers.
+
+The point score and rank are the summary's own (calculate_weather_scores), so the
+uncertainty file always agrees with the comparison file; only the intervals come
+from the replicates. A replicate that happens to draw only dry years for a festival
+scores it at 0% rain days. Only a festival with no rain day in any year has no
+rain-day percentage, as in the summary, and then the rain component is left out of
+every festival's score, in the summary and in every replicate alike.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from festival_stats import KEY_COLUMNS, measure_total
+
+# Replicates drawn when none are given
+DEFAULT_REPLICATES = 2000
+
+# Replicates per task, fewer for many festivals so a task's (replicate x festival x year) arrays stay
+# within CHUNK_CELLS; chunks depend only on the data, so a seed gives the same draws with any number of workers
+CHUNK_REPLICATES = 100
+CHUNK_CELLS = 2_000_000
+
+# Central interval reported for scores and ranks
+DEFAULT_CONFIDENCE = 0.95
+
+# Festivals counted as the top when reporting how often each one makes it
+TOP_K = 5
+
+# Per-year totals the score needs, in the order of the state array's last axis
+# (measure sums are derived from each year's count and mean)
+STATE_FIELDS = ['days', 'rain_days', 'max_temp_c_sum', 'max_temp_c_count', 'max_windspeed_kmh_sum',
+                'max_windspeed_kmh_count']
+
+# Set in each worker by init_worker, so the state array is sent once per process rather than once per task
+_worker_states = None
+
+def festival_year_states(states):
+    """
+    Arranges the partial state table as a (festival x year) array of the score's totals
+    Festivals are grouped by name, as festival_metrics_from_states groups them
+    Returns (festival names, year counts, states array padded with zeros past each festival's years)
+    """
+    states = states.sort_values(KEY_COLUMNS)
+    states = states.assign(**{
+        f'{column}_sum': measure_total(states, column) for column in ('max_temp_c', 'max_windspeed_kmh')
+    })
+    names, codes = np.unique(states['festival_name'].astype(str).to_numpy(), return_inverse=True)
+    year_counts = np.bincount(codes, minlength=len(names))
+    # Position of each row among its festival's years
+    first_rows = np.cumsum(year_counts) - year_counts
+    order = np.argsort(codes, kind='stable')
+    positions = np.empty(len(codes), dtype='int64')
+    positions[order] = np.arange(len(codes)) - first_rows[codes[order]]
+
+    array = np.zeros((len(names), year_counts.max(), len(STATE_FIELDS)))
+    array[codes, positions] = states[STATE_FIELDS].to_numpy(dtype='float64')
+    return names, year_counts, array
+
+def year_draw_counts(rng, year_counts, replicates, max_years):
+    """
+    Resamples every festival's years with replacement
+    Returns a (replicate x festival x year) array of how many times each year was drawn
+    """
+    festivals = len(year_counts)
+    size = (replicates, festivals, max_years)
+    first_cells = (np.arange(replicates * festivals, dtype='int64') * max_years).reshape(replicates, festivals, 1)
+    if (year_counts == max_years).all():
+        # Usual case: every festival has every year, so one bounded draw covers them all
+        cells = first_cells + rng.integers(0, max_years, size=size, dtype='int32')
+    else:
+        draws = rng.integers(0, year_counts[None, :, None], size=size)
+        # Only the first year_count draws of each festival are real; the rest fall in a discarded bin
+        real = np.arange(max_years)[None, None, :] < year_counts[None, :, None]
+        cells = np.where(real, first_cells + draws, replicates * festivals * max_years)
+    counts = np.bincount(cells.ravel(), minlength=replicates * festivals * max_years + 1)
+    return counts[:-1].reshape(replicates, festivals, max_years)
+
+def zscore_rows(values):
+    """z-scores each row (ddof 0, as scipy.stats.zscore); a row with any NaN becomes all NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values - values.mean(axis=1, keepdims=True)) / values.std(axis=1, keepdims=True)
+
+def replicate_scores(totals, never_wet=None):
+    """
+    Weather scores from (replicate x festival x field) totals of STATE_FIELDS
+    Follows festival_metrics_from_states and calculate_weather_scores, including their rounding
+    - never_wet: festivals with no rain day in any year, whose rain-day percentage is missing as in the summary;
+      any other festival drawing no rain days in a replicate scores 0%
+    Returns a (replicate x festival) array
+    """
+    days, rain_days, temp_sum, temp_count, wind_sum, wind_count = np.moveaxis(totals, -1, 0)
+    if never_wet is not None:
+        rain_days = np.where(never_wet[None, :], np.nan, rain_days)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_max_temp = np.round(temp_sum / np.where(temp_count > 0, temp_count, np.nan), 2)
+        mean_max_wind = np.round(wind_sum / np.where(wind_count > 0, wind_count, np.nan), 2)
+        pct_rain_days = np.round(rain_days / np.where(days > 0, days, np.nan) * 100, 2)
+    components = np.stack([zscore_rows(mean_max_temp), -zscore_rows(pct_rain_days), -zscore_rows(mean_max_wind)])
+    with np.errstate(invalid='ignore'):
+        counted = (~np.isnan(components)).sum(axis=0)
+        scores = np.nansum(components, axis=0) / np.where(counted > 0, counted, np.nan)
+    return np.round(scores, 2)
+
+def score_ranks(scores):
+    """Rank of every festival in each replicate (1 is the best score; missing scores rank last)"""
+    order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, scores.shape[1] + 1)[None, :], axis=1)
+    return ranks
+
+def init_worker(states):
+    global _worker_states
+    _worker_states = states
+
+def bootstrap_chunk(seed, replicates, year_counts):
+    """Scores and ranks for one chunk of replicates (runs in a worker process)"""
+    rng = np.random.default_rng(seed)
+    counts = year_draw_counts(rng, year_counts, replicates, _worker_states.shape[1])
+    # A batched (year counts x year totals) product per festival
+    totals = np.matmul(counts.astype('float64').transpose(1, 0, 2), _worker_states).transpose(1, 0, 2)
+    scores = replicate_scores(totals, _worker_states[:, :, STATE_FIELDS.index('rain_days')].sum(axis=1) == 0)
+    return scores.astype('float32'), score_ranks(scores).astype('int32')
+
+def bootstrap_scores(states, replicates=DEFAULT_REPLICATES, workers=None, seed=0):
+    """
+    Draws bootstrap replicates of every festival's weather score and rank
+    Parameters:
+    - states: per-festival, per-year partial state table (festival_stats.load_states)
+    - replicates: number of resamples of the years
+    - workers: processes to use (default: one per CPU, at most one per chunk)
+    - seed: seed for the resampling
+    Returns (festival names, replicate scores, replicate ranks)
+    """
+    names, year_counts, array = festival_year_states(states)
+
+    chunk = max(1, min(CHUNK_REPLICATES, CHUNK_CELLS // array.shape[0] // array.shape[1]))
+    sizes = [min(chunk, replicates - first) for first in range(0, replicates, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    if workers <= 1:
+        init_worker(array)
+        results = [bootstrap_chunk(chunk_seed, size, year_counts) for chunk_seed, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(array,)) as pool:
+            results = list(pool.map(bootstrap_chunk, seeds, sizes, [year_counts] * len(sizes)))
+    scores = np.concatenate([chunk_scores for chunk_scores, _ in results])
+    ranks = np.concatenate([chunk_ranks for _, chunk_ranks in results])
+    return names, scores, ranks
+
+def score_intervals(states, weather_scores, replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE,
+                    workers=None, seed=0, top_k=TOP_K):
+    """
+    Bootstrap intervals for every festival's weather score and rank
+    Parameters:
+    - states: per-festival, per-year partial state table (festival_stats.load_states)
+    - weather_scores: the summary's weather_score by festival_name (calculate_weather_scores), reported as the
+      point score and ranked for the point rank
+    Returns a DataFrame indexed by festival_name with the point score and rank, the score's
+    standard error and interval, the rank interval and the share of replicates in the top top_k
+    """
+    names, scores, ranks = bootstrap_scores(states, replicates, workers, seed)
+    scores = scores.astype('float64')
+    tail = (1 - confidence) / 2 * 100
+    point = weather_scores.reindex(names).to_numpy(dtype='float64')
+    point_ranks = score_ranks(point[None])[0]
+    result = pd.DataFrame({
+        'weather_score': point,
+        'rank': point_ranks,
+        'score_se': np.nanstd(scores, axis=0, ddof=1).round(3),
+        'score_lower': np.nanpercentile(scores, tail, axis=0).round(2),
+        'score_upper': np.nanpercentile(scores, 100 - tail, axis=0).round(2),
+        'rank_lower': np.percentile(ranks, tail, axis=0, method='lower'),
+        'rank_upper': np.percentile(ranks, 100 - tail, axis=0, method='higher'),
+        f'pct_top_{top_k}': ((ranks <= top_k).mean(axis=0) * 100).round(1)
+    }, index=pd.Index(names, name='festival_name'))
+    return result.sort_values('rank')
@@ -0,0 +1,42 @@
+"""
+Shared fixtures: a small synthetic weather dataset laid out as the repository's data directory
+
+Every analysis module resolves its paths against 'data' under the working directory,
+so each test that needs data runs from its own temporary directory.
+"""
+
+import os
+
+import pytest
+
+# Tests always use the default data directory under their working directory
+os.environ.pop('FESTIVAL_WEATHER_DATA_DIR', None)
+
+from weather_benchmark import synthetic_festivals, synthetic_weather  # noqa: E402
+from weather_store import DATASET_DIR, to_table, write_dataset  # noqa: E402
+
+FESTIVALS = 12
+YEARS = range(2010, 2025)
+
+@pytest.fixture
+def festivals():
+    return synthetic_festivals(FESTIVALS, seed=1)
+
+@pytest.fixture
+def weather_table(festivals):
+    return synthetic_weather(festivals, YEARS, seed=1)
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch, festivals, weather_table):
+    """Working directory holding data/festivals.csv and the Parquet weather dataset"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    festivals.to_csv(os.path.join('data', 'festivals.csv'), index=False)
+    write_dataset(to_table(weather_table), DATASET_DIR)
+    return tmp_path / 'data'
+
+@pytest.fixture
+def weather(data_dir):
+    """The synthetic dataset as load_weather returns it"""
+    from weather_loader import load_weather
+    return load_weather()
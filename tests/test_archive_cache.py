@@ -0,0 +1,73 @@
+"""Archive cache: equivalent requests share an entry, repeat fetches stay local and eviction removes the oldest"""
+
+import os
+import time
+from datetime import date
+
+from archive_cache import ArchiveCache, cache_key
+from archive_fetcher import build_archive_params, fetch_all
+from mock_archive_server import start_mock_server
+
+UNLIMITED = {'per_minute': 10 ** 9, 'per_hour': 10 ** 9, 'per_day': 10 ** 9}
+
+def requests_for(count):
+    return [build_archive_params(51.1 + i * 0.1, -2.6, date(2020, 6, 24), date(2020, 6, 28)) for i in range(count)]
+
+def test_equivalent_requests_share_a_key():
+    params = {'latitude': 51.1, 'longitude': -2.6, 'start_date': '2020-06-24', 'end_date': '2020-06-28',
+              'daily': 'rain_sum,temperature_2m_max', 'timezone': 'GMT'}
+    reordered = {'end_date': '2020-06-28', 'start_date': '2020-06-24', 'longitude': '-2.60000',
+                 'latitude': '51.10001', 'daily': ['temperature_2m_max', 'rain_sum']}
+    assert cache_key(reordered) == cache_key(params)
+    assert cache_key({**params, 'latitude': 51.2}) != cache_key(params)
+    assert cache_key({**params, 'daily': 'rain_sum'}) != cache_key(params)
+    assert cache_key(params, 'http://other') != cache_key(params)
+
+def test_entries_round_trip_and_count_hits(tmp_path):
+    cache = ArchiveCache(tmp_path / 'cache')
+    params = requests_for(1)[0]
+    assert cache.get(params) is None
+    data = {'daily': {'time': ['2020-06-24'], 'rain_sum': [1.5]}}
+    cache.put(params, data)
+    assert cache.get(params) == data
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert [os.path.basename(path) for path, _, _ in cache.entries()] == [f'{cache_key(params)}.json.gz']
+
+def test_repeat_fetches_are_served_from_the_cache(tmp_path):
+    server, base_url, stats = start_mock_server()
+    try:
+        cache = ArchiveCache(tmp_path / 'cache')
+        fetched = fetch_all(requests_for(5), limits=UNLIMITED, base_url=base_url, cache=cache)
+        assert stats['requests'] == 5
+        assert fetch_all(requests_for(5), limits=UNLIMITED, base_url=base_url, cache=cache) == fetched
+        assert stats['requests'] == 5 and cache.hits == 5
+    finally:
+        server.shutdown()
+
+def test_cache_only_reports_misses_as_failures(tmp_path):
+    server, base_url, stats = start_mock_server()
+    try:
+        cache = ArchiveCache(tmp_path / 'cache', cache_only=True)
+        cache.put(requests_for(1)[0], {'daily': {}}, base_url)
+        assert fetch_all(requests_for(2), limits=UNLIMITED, base_url=base_url, cache=cache) == [{'daily': {}}, None]
+        assert stats['requests'] == 0
+    finally:
+        server.shutdown()
+
+def test_eviction_removes_stale_then_least_recently_used_entries(tmp_path):
+    cache = ArchiveCache(tmp_path / 'cache')
+    params_list = requests_for(4)
+    now = time.time()
+    for age_days, params in zip([400, 3, 2, 1], params_list):
+        cache.put(params, {'daily': {'rain_sum': [0.0] * 100}})
+        path = cache.path_for(cache_key(params))
+        os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+
+    assert cache.evict(max_age_days=365) == 1
+    assert cache.get(params_list[0]) is None
+    # Reading an entry marks it as recently used, so the untouched oldest goes first
+    assert cache.get(params_list[1]) is not None
+    size = max(size for _, size, _ in cache.entries())
+    assert cache.evict(max_bytes=2 * size) == 1
+    assert cache.get(params_list[2]) is None
+    assert cache.get(params_list[1]) is not None and cache.get(params_list[3]) is not None
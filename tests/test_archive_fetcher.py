@@ -0,0 +1,106 @@
+"""Archive fetcher: quota accounting and retries, driven against the local mock archive server"""
+
+import asyncio
+import random
+import time
+from datetime import date
+
+import pytest
+
+import archive_fetcher
+from archive_fetcher import RateLimiter, TokenBucket, build_archive_params, fetch_all
+from mock_archive_server import start_mock_server
+from run_metrics import RunMetrics
+
+# Quotas high enough that only the limit under test ever applies
+UNLIMITED = {'per_minute': 10 ** 9, 'per_hour': 10 ** 9, 'per_day': 10 ** 9}
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**settings):
+        server, base_url, stats = start_mock_server(**settings)
+        servers.append(server)
+        return base_url, stats
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def requests_for(count):
+    return [build_archive_params(51.1 + i * 0.1, -2.6, date(2020, 6, 24), date(2020, 6, 28)) for i in range(count)]
+
+def test_bucket_charges_the_full_cost_of_a_heavy_request():
+    bucket = TokenBucket(capacity=600, period=60)
+    assert bucket.wait_time(783) == 0
+    bucket.consume(783)
+    assert bucket.tokens == pytest.approx(-183, abs=1)
+    # The next request waits for the debt and its own token to be refilled at 10 tokens a second
+    assert bucket.wait_time(1) == pytest.approx(18.4, abs=0.1)
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(capacity=10, period=1)
+    bucket.consume(10)
+    assert bucket.wait_time(5) == pytest.approx(0.5, abs=0.05)
+    time.sleep(0.3)
+    assert bucket.wait_time(5) == pytest.approx(0.2, abs=0.05)
+
+async def acquire_all(limiter, costs):
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire(cost) for cost in costs))
+    return time.monotonic() - started
+
+def test_limiter_spaces_requests_beyond_the_quota():
+    # 60 calls a minute: the first 60 go at once and the last 3 wait for a token a second
+    limiter = RateLimiter({**UNLIMITED, 'per_minute': 60})
+    assert asyncio.run(acquire_all(limiter, [30, 30, 3])) == pytest.approx(3, abs=0.3)
+
+def test_limiter_does_not_hold_the_lock_while_waiting():
+    limiter = RateLimiter(UNLIMITED)
+    limiter.pause(0.3)
+
+    async def run():
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.05)
+        # A sleeping worker must leave the lock free for others to check the quotas
+        assert not limiter.lock.locked()
+        await waiter
+
+    asyncio.run(run())
+
+def test_fetch_all_throttles_to_the_quota(mock_server):
+    base_url, stats = mock_server()
+    started = time.monotonic()
+    results = fetch_all(requests_for(13), concurrency=4, limits={**UNLIMITED, 'per_minute': 600}, base_url=base_url)
+    elapsed = time.monotonic() - started
+    assert all(result is not None for result in results)
+    assert stats['requests'] == 13
+    assert elapsed < 1
+
+    # Each single-location, 5-day request costs one call, so at 60 a minute the last 3 of 63 wait 3 seconds
+    started = time.monotonic()
+    results = fetch_all(requests_for(63), concurrency=8, limits={**UNLIMITED, 'per_minute': 60}, base_url=base_url)
+    assert all(result is not None for result in results)
+    assert time.monotonic() - started == pytest.approx(3, abs=0.6)
+
+def test_fetch_all_retries_rate_limits_and_server_errors(mock_server, monkeypatch):
+    monkeypatch.setattr(archive_fetcher, 'backoff_delay', lambda attempt: 0.01)
+    random.seed(3)
+    base_url, stats = mock_server(rate_limit_prob=0.2, server_error_prob=0.2, retry_after=0)
+    metrics = RunMetrics('test')
+    results = fetch_all(requests_for(40), concurrency=4, limits=UNLIMITED, base_url=base_url, max_retries=20,
+                        metrics=metrics)
+    assert all(result is not None for result in results)
+    assert stats['rate_limited'] > 0 and stats['server_errors'] > 0
+    assert metrics.counters['rate_limited'] == stats['rate_limited']
+    assert metrics.counters['server_errors'] == stats['server_errors']
+    assert metrics.counters['retries'] == stats['rate_limited'] + stats['server_errors']
+    assert stats['requests'] == 40 + metrics.counters['retries']
+
+def test_fetch_all_gives_up_after_max_retries(mock_server, monkeypatch):
+    monkeypatch.setattr(archive_fetcher, 'backoff_delay', lambda attempt: 0.01)
+    base_url, stats = mock_server(server_error_prob=1.0)
+    results = fetch_all(requests_for(2), limits=UNLIMITED, base_url=base_url, max_retries=3)
+    assert results == [None, None]
+    assert stats['server_errors'] == 6
@@ -0,0 +1,56 @@
+"""Checkpoint manifest: windows combine in key order, re-saved windows replace old rows, unrecorded rows are ignored"""
+
+import pandas as pd
+
+from checkpoint_manifest import CheckpointManifest
+from historical_weather import process_historical_weather
+
+FESTIVALS = {
+    1: {'ID': 1, 'Title': 'First, with a comma', 'lat': 51.1, 'long': -2.6},
+    2: {'ID': 2, 'Title': 'Second', 'lat': 55.9, 'long': -3.2}
+}
+
+def window(festival_id, year, rain=0.5):
+    days = [f'{year}-06-{day:02d}' for day in range(24, 29)]
+    daily = {'time': days, 'temperature_2m_max': [20.0] * 5, 'temperature_2m_min': [10.0] * 5,
+             'precipitation_sum': [rain] * 5, 'rain_sum': [rain] * 5, 'windspeed_10m_max': [15.0] * 5}
+    return festival_id, year, process_historical_weather({'daily': daily}, FESTIVALS[festival_id], year)
+
+def test_windows_combine_in_key_order_across_runs(tmp_path):
+    manifest = CheckpointManifest(tmp_path)
+    assert manifest.record_windows([window(2, 2001), window(1, 2002)]) == 10
+    manifest.close()
+
+    # A later run appends to its own part file and replaces a window it fetched again
+    manifest = CheckpointManifest(tmp_path)
+    manifest.part_file = 'part_resumed.csv'
+    manifest.record_windows([window(1, 2001), window(2, 2001, rain=3.0)])
+    assert manifest.completed_windows() == {(1, 2001), (1, 2002), (2, 2001)}
+    total_records, festival_ids = manifest.combine(tmp_path / 'combined.csv')
+    manifest.close()
+
+    combined = pd.read_csv(tmp_path / 'combined.csv')
+    assert (total_records, festival_ids) == (15, [1, 2])
+    assert list(zip(combined['festival_id'], combined['historical_year'])) == (
+        [(1, 2001)] * 5 + [(1, 2002)] * 5 + [(2, 2001)] * 5)
+    assert combined['festival_name'].iloc[0] == 'First, with a comma'
+    assert (combined.loc[combined['festival_id'] == 2, 'rainfall_mm'] == 3.0).all()
+
+def test_rows_the_manifest_never_recorded_are_left_out(tmp_path):
+    manifest = CheckpointManifest(tmp_path)
+    manifest.record_windows([window(1, 2001)])
+    # Rows written by a run that stopped before committing them to the manifest
+    with open(tmp_path / manifest.part_file, 'ab') as f:
+        f.write(b'1,"First, with a comma",2002,"06-24",2002-06-24,20,10,0.5,0.5,15,51.1,-2.6\n')
+    total_records, _ = manifest.combine(tmp_path / 'combined.csv')
+    manifest.close()
+    assert total_records == 5
+    assert set(pd.read_csv(tmp_path / 'combined.csv')['historical_year']) == {2001}
+
+def test_forgotten_windows_are_fetched_again(tmp_path):
+    manifest = CheckpointManifest(tmp_path)
+    manifest.record_windows([window(1, 2001), window(1, 2002), window(2, 2001)])
+    manifest.forget_windows([(1, 2002)])
+    assert manifest.completed_windows() == {(1, 2001), (2, 2001)}
+    assert manifest.combine(tmp_path / 'combined.csv') == (10, [1, 2])
+    manifest.close()
@@ -0,0 +1,83 @@
+"""Climatology cube: accumulated payloads and window states agree with the festival statistics"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from climatology_cube import STAT_FIELDS, ClimatologyCube, accumulate_payload, empty_stats
+from festival_stats import measure_mean, measure_std, merge_states, partial_states
+from weather_store import DAILY_VARIABLES, MEASURE_COLUMNS
+
+LATS = np.array([51.0, 51.5])
+LONGS = np.array([-1.0])
+YEARS = range(1995, 2025)
+
+def point_weather(rng, offset):
+    """Daily June weather for every year at one grid point, with some values missing"""
+    frames = []
+    for year in YEARS:
+        dates = pd.date_range(f'{year}-06-01', f'{year}-06-30')
+        frame = pd.DataFrame({'date': dates, 'historical_year': year})
+        for column in MEASURE_COLUMNS:
+            values = np.round(rng.gamma(2, 3, len(dates)) + offset, 1)
+            values[rng.random(len(dates)) < 0.05] = np.nan
+            frame[column] = values
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def payload(frame):
+    daily = {'time': frame['date'].dt.strftime('%Y-%m-%d').tolist()}
+    for column, variable in DAILY_VARIABLES.items():
+        daily[variable] = frame[column].tolist()
+    return {'daily': daily}
+
+def write_cube(cube_dir, weathers):
+    stats = empty_stats((len(LATS), len(LONGS)))
+    for row, weather in enumerate(weathers):
+        for _, frame in weather.groupby('historical_year'):
+            assert accumulate_payload(stats[row, 0], payload(frame))
+    stats[np.isinf(stats)] = np.nan
+    os.makedirs(cube_dir)
+    np.save(os.path.join(cube_dir, 'stats.npy'), stats.astype('float32'))
+    np.save(os.path.join(cube_dir, 'years.npy'), np.full((len(LATS), len(LONGS)), len(YEARS), dtype='int16'))
+    meta = {'resolution': 0.5, 'months': [6, 6], 'lats': LATS.tolist(), 'longs': LONGS.tolist(), 'fields': STAT_FIELDS}
+    with open(os.path.join(cube_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return ClimatologyCube(cube_dir)
+
+def window_rows(weather, first_day, last_day):
+    return weather[weather['date'].dt.day.between(first_day, last_day)].assign(
+        festival_id=1, festival_name='Event')
+
+def test_window_state_at_a_grid_point_matches_the_festival_statistics(tmp_path):
+    rng = np.random.default_rng(5)
+    weathers = [point_weather(rng, 10), point_weather(rng, 14)]
+    cube = write_cube(tmp_path / 'cube', weathers)
+
+    state = pd.DataFrame([cube.window_state(51.0, -1.0, '10/06/2025', '14/06/2025')], index=['Event'])
+    direct = merge_states(partial_states(window_rows(weathers[0], 10, 14)), by='festival_name')
+    assert state['days'].iloc[0] == direct['days'].iloc[0]
+    for column in MEASURE_COLUMNS:
+        assert state[f'{column}_count'].iloc[0] == direct[f'{column}_count'].iloc[0]
+        # The cube stores float32 statistics
+        np.testing.assert_allclose(measure_mean(state, column), measure_mean(direct, column), rtol=1e-6)
+        np.testing.assert_allclose(measure_std(state, column), measure_std(direct, column), rtol=1e-5)
+        np.testing.assert_allclose(state[f'{column}_min'], direct[f'{column}_min'], rtol=1e-6)
+        np.testing.assert_allclose(state[f'{column}_max'], direct[f'{column}_max'], rtol=1e-6)
+
+def test_window_state_between_points_blends_them_bilinearly(tmp_path):
+    rng = np.random.default_rng(6)
+    weathers = [point_weather(rng, 10), point_weather(rng, 14)]
+    cube = write_cube(tmp_path / 'cube', weathers)
+
+    state = cube.window_state(51.375, -1.0, '01/06/2025', '30/06/2025')
+    low, high = (window_rows(weather, 1, 30) for weather in weathers)
+    assert state['days'] == 0.25 * len(low) + 0.75 * len(high)
+    for column in MEASURE_COLUMNS:
+        count = 0.25 * low[column].count() + 0.75 * high[column].count()
+        mean = (0.25 * low[column].sum() + 0.75 * high[column].sum()) / count
+        assert state[f'{column}_count'] == count
+        np.testing.assert_allclose(state[f'{column}_mean'], mean, rtol=1e-6)
+        np.testing.assert_allclose(state[f'{column}_max'], max(low[column].max(), high[column].max()), rtol=1e-6)
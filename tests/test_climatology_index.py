@@ -0,0 +1,72 @@
+"""Climatology index: stored statistics and lookups match numpy on each festival's values for the calendar date"""
+
+import numpy as np
+import pytest
+
+from climatology_index import STORED_EXCEEDANCE, STORED_QUANTILES, ClimatologyIndex, build_index, date_code
+from weather_config import MEASURE_COLUMNS
+
+@pytest.fixture
+def index(weather, tmp_path):
+    index_dir = str(tmp_path / 'index')
+    assert build_index(weather, index_dir) == weather.groupby(['festival_id', 'calendar_date'], observed=True).ngroups
+    return ClimatologyIndex(index_dir)
+
+def year_values(weather, festival_id, calendar_date, measure):
+    """The measure's values for the festival across the years, as the index stores them"""
+    rows = weather['festival_id'].eq(festival_id)
+    if calendar_date is not None:
+        rows &= weather['calendar_date'].astype(str).eq(calendar_date)
+    values = weather.loc[rows, measure].to_numpy(dtype='float64')
+    return np.sort(values[~np.isnan(values)].astype('float32').astype('float64'))
+
+def test_lookups_match_numpy_on_the_years_values(weather, index):
+    for festival_id in (1, 6, 12):
+        dates = index.dates(festival_id)
+        festival_dates = weather.loc[weather['festival_id'].eq(festival_id), 'calendar_date'].astype(str)
+        assert dates == sorted(festival_dates.unique())
+        for calendar_date in dates[::3] + [None]:
+            for measure in MEASURE_COLUMNS:
+                values = year_values(weather, festival_id, calendar_date, measure)
+                np.testing.assert_array_equal(index.samples(festival_id, calendar_date, measure), values.round(1))
+                for q in (0, 0.33, 0.5, 0.9, 1):
+                    assert index.quantile(festival_id, calendar_date, measure, q) == pytest.approx(
+                        np.quantile(values.round(1), q), abs=1e-9)
+                for threshold in (0, 2.5, 12):
+                    assert index.exceedance(festival_id, calendar_date, measure, threshold) == (
+                        values.round(1) > threshold).mean()
+                    assert index.exceedance(festival_id, calendar_date, measure, threshold, below=True) == (
+                        values.round(1) < threshold).mean()
+
+def test_stored_statistics_match_numpy(weather, index):
+    for festival_id in (2, 9):
+        for calendar_date in index.dates(festival_id):
+            summary = index.summary(festival_id, calendar_date)
+            for measure in MEASURE_COLUMNS:
+                values = year_values(weather, festival_id, calendar_date, measure)
+                stats = summary[measure]
+                assert stats['years'] == len(values)
+                # Stored statistics are of the float32 samples, rounded to 4 decimals
+                assert stats['mean'] == pytest.approx(values.mean(), abs=1e-4)
+                for q in STORED_QUANTILES:
+                    assert stats[f'p{round(q * 100):02d}'] == pytest.approx(np.quantile(values, q), abs=1e-4)
+                for threshold in STORED_EXCEEDANCE.get(measure, []):
+                    assert stats[f'>{threshold:g}'] == pytest.approx((values > threshold).mean(), abs=1e-4)
+    pooled = index.summary(4)
+    values = year_values(weather, 4, None, 'rainfall_mm').round(1)
+    assert pooled['rainfall_mm']['days'] == len(values)
+    assert pooled['rainfall_mm']['p90'] == round(np.quantile(values, 0.9), 4)
+
+def test_festivals_and_dates_are_resolved(index):
+    assert index.festival_id('synthetic festival 1') == 1
+    assert index.festival_id('Festival 12') == index.festival_id(12) == index.festival_id('12') == 12
+    with pytest.raises(KeyError):
+        index.festival_id('Festival 1')
+    with pytest.raises(KeyError):
+        index.festival_id(99)
+    with pytest.raises(KeyError):
+        index.positions(1, '01-01')
+    assert [date_code(text) for text in ('06-27', '27/06', '27 June', 'Jun 27', '2025-06-27')] == [627] * 5
+    assert date_code('29 Feb') == 229
+    with pytest.raises(ValueError):
+        date_code('31/06')
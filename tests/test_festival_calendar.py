@@ -0,0 +1,60 @@
+"""Festival calendar: the expected-day index and gap report agree with checking every window day by day"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from festival_calendar import expected_days, find_gaps, gap_windows, historical_windows
+
+YEARS = range(2010, 2025)
+
+def window_days(festivals, years):
+    """Every expected (festival_id, year, date), built one window at a time"""
+    days = set()
+    for _, festival in festivals.iterrows():
+        start = pd.to_datetime(festival['startDate'], format='%d/%m/%Y')
+        end = pd.to_datetime(festival['endDate'], format='%d/%m/%Y')
+        for year in years:
+            for day in pd.date_range(start.replace(year=year), end.replace(year=year)):
+                days.add((festival['ID'], year, day))
+    return days
+
+def test_expected_days_match_building_each_window(festivals):
+    expected = expected_days(festivals, YEARS)
+    rows = list(zip(expected['festival_id'], expected['historical_year'], expected['full_date']))
+    assert len(rows) == len(set(rows))
+    assert set(rows) == window_days(festivals, YEARS)
+
+def test_dates_missing_from_a_year_are_rejected():
+    with pytest.raises(ValueError):
+        historical_windows(['29/02/2024'], ['01/03/2024'], [2023, 2024])
+
+def test_gap_report_matches_a_day_by_day_check(weather, festivals):
+    weather = weather[['festival_id', 'historical_year', 'full_date']]
+    extra = pd.DataFrame({'festival_id': [1, 1, 999], 'historical_year': [2015, 2015, 2015],
+                          'full_date': pd.to_datetime(['2015-01-01', '2015-01-01', '2015-06-01'])})
+    # Drop some days, record others two or three times, and add days outside any window
+    weather = pd.concat([weather.drop(index=[10, 11, 200]), weather.iloc[[5, 5, 40]], extra], ignore_index=True)
+    report = find_gaps(weather, festivals, YEARS)
+
+    expected = window_days(festivals, YEARS)
+    counts = weather.groupby(['festival_id', 'historical_year', 'full_date']).size()
+    recorded = set(counts.index)
+    issues = {
+        'missing': expected - recorded,
+        'duplicate': {day for day, count in counts.items() if count > 1},
+        'out_of_window': recorded - expected
+    }
+    assert len(issues['missing']) == 3 and len(issues['duplicate']) == 3 and len(issues['out_of_window']) == 2
+    for issue, days in issues.items():
+        found = report[report['issue'] == issue]
+        assert set(zip(found['festival_id'], found['historical_year'], found['full_date'])) == days, issue
+        if issue != 'missing':
+            assert (found['records'].to_numpy() == counts.loc[list(zip(
+                found['festival_id'], found['historical_year'], found['full_date']))].to_numpy()).all()
+
+    windows = gap_windows(report, festivals)
+    assert (999, 2015) not in windows and (999, 2015) in gap_windows(report)
+    assert windows == sorted({(int(festival_id), int(year)) for festival_id, year, _ in
+                              set().union(*issues.values()) if festival_id != 999})
+    assert np.all(np.diff(report['festival_id']) >= 0)
@@ -0,0 +1,62 @@
+"""Festival similarity: tree searches, with and without constraints, agree with a brute-force scan"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import festival_similarity
+from festival_similarity import SIMILARITY_METRICS, FestivalSimilarity, build_similarity_index
+
+FESTIVALS = 300
+
+@pytest.fixture
+def similarity(tmp_path):
+    rng = np.random.default_rng(11)
+    names = [f'Festival {number}' for number in range(FESTIVALS)]
+    metrics = pd.DataFrame(rng.normal(10, 3, (FESTIVALS, len(SIMILARITY_METRICS))), columns=SIMILARITY_METRICS,
+                           index=pd.Index(names, name='festival_name'))
+    starts = pd.Timestamp('2024-05-01') + pd.to_timedelta(rng.integers(0, 120, FESTIVALS), unit='D')
+    festivals = pd.DataFrame({'Title': names, 'ID': np.arange(FESTIVALS), 'startDate': starts.strftime('%d/%m/%Y'),
+                              'lat': rng.uniform(50, 58, FESTIVALS), 'long': rng.uniform(-5, 1.5, FESTIVALS)})
+    festivals_file = tmp_path / 'festivals.csv'
+    festivals.to_csv(festivals_file, index=False)
+    build_similarity_index(metrics, similarity_dir=tmp_path / 'similarity', festivals_file=festivals_file)
+    return FestivalSimilarity(tmp_path / 'similarity')
+
+def brute_force(similarity, position, k, mask=None):
+    distances = np.sqrt(((similarity.features - similarity.features[position]) ** 2).sum(axis=1))
+    allowed = np.ones(len(distances), dtype=bool) if mask is None else mask.copy()
+    allowed[position] = False
+    rows = np.flatnonzero(allowed)
+    order = rows[np.argsort(distances[rows], kind='stable')][:k]
+    return order, distances[order]
+
+def check_against_brute_force(similarity, position, k, mask=None):
+    positions, distances = similarity.nearest(similarity.features[position], k, mask, exclude=position)
+    expected_positions, expected_distances = brute_force(similarity, position, k, mask)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-12)
+    np.testing.assert_array_equal(positions, expected_positions)
+
+def test_unconstrained_neighbours_match_brute_force(similarity):
+    for position in (0, 57, 299):
+        for k in (1, 5, 40):
+            check_against_brute_force(similarity, position, k)
+
+@pytest.mark.parametrize('direct_candidates', [0, festival_similarity.DIRECT_CANDIDATES])
+def test_constrained_neighbours_match_brute_force(similarity, monkeypatch, direct_candidates):
+    # With no direct comparisons allowed, every constrained query goes through the widening tree search
+    monkeypatch.setattr(festival_similarity, 'DIRECT_CANDIDATES', direct_candidates)
+    for position in (3, 150):
+        for constraints in ({'within_km': 200}, {'lower': ['pct_rain_days']}, {'starts_between': ('01/06', '30/06')},
+                            {'within_km': 300, 'higher': ['mean_max_temp']}):
+            mask = similarity.candidate_mask(position, **constraints)
+            assert 0 < mask.sum() < FESTIVALS
+            check_against_brute_force(similarity, position, 5, mask)
+
+def test_within_km_matches_the_haversine_distance(similarity):
+    query = similarity.position('Festival 10')
+    mask = similarity.candidate_mask(query, within_km=150)
+    km = similarity.frame(query, np.arange(FESTIVALS), np.zeros(FESTIVALS))['km_away'].to_numpy()
+    # km_away is rounded to the kilometre, so festivals right at the boundary are left out
+    clear = np.abs(km - 150) > 1
+    np.testing.assert_array_equal(mask[clear], km[clear] <= 150)
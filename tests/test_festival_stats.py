@@ -0,0 +1,89 @@
+"""Festival statistics: merged states match a direct reduction, and the state table tracks partition changes"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from festival_stats import (KEY_COLUMNS, STATE_COLUMNS, load_states, measure_mean, measure_std, measure_total,
+                            merge_states, partial_states, partition_fingerprints, reduce_states)
+from weather_config import MEASURE_COLUMNS, MEASURE_DECIMALS
+from weather_store import DATASET_DIR
+
+def check_merged(merged, df, column, std_rtol=1e-9):
+    """Asserts merged states hold the same statistics as a direct groupby of the daily rows"""
+    direct = df.groupby(df['festival_name'].astype(str))[column].agg(['count', 'mean', 'std', 'min', 'max', 'sum'])
+    np.testing.assert_array_equal(merged[f'{column}_count'], direct['count'])
+    # Exactly the decimal total over the count, so rounding for reports never lands on the other side of a tie
+    np.testing.assert_array_equal(measure_mean(merged, column), direct['sum'].round(MEASURE_DECIMALS) / direct['count'])
+    np.testing.assert_allclose(measure_mean(merged, column), direct['mean'], rtol=1e-14)
+    np.testing.assert_allclose(measure_std(merged, column), direct['std'], rtol=std_rtol)
+    np.testing.assert_array_equal(measure_total(merged, column), direct['sum'].round(MEASURE_DECIMALS))
+    np.testing.assert_array_equal(merged[f'{column}_min'], direct['min'])
+    np.testing.assert_array_equal(merged[f'{column}_max'], direct['max'])
+
+def test_merged_states_match_a_direct_reduction(weather):
+    states = partial_states(weather)
+    assert list(states.columns) == KEY_COLUMNS + STATE_COLUMNS
+    merged = merge_states(states, by='festival_name')
+    exact = weather.astype({column: 'float64' for column in MEASURE_COLUMNS})
+    exact[MEASURE_COLUMNS] = exact[MEASURE_COLUMNS].round(MEASURE_DECIMALS)
+    for column in MEASURE_COLUMNS:
+        check_merged(merged, exact, column)
+    np.testing.assert_array_equal(merged['days'], exact.groupby(exact['festival_name'].astype(str)).size())
+
+def test_merged_std_stays_accurate_far_from_zero():
+    # Values around 1e9 with a spread of 1: a sum of squares loses every digit of the variance,
+    # while merged M2 keeps it to the precision the values themselves are held to
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({
+        'festival_id': 1, 'festival_name': 'Offset', 'historical_year': np.repeat(np.arange(2000, 2030), 40),
+        **{column: np.round(1e9 + rng.normal(0, 1, 1200), MEASURE_DECIMALS) for column in MEASURE_COLUMNS}
+    })
+    df['rainfall_mm'] = rng.gamma(1, 2, 1200)
+    merged = merge_states(partial_states(df), by='festival_name')
+    check_merged(merged, df, 'max_temp_c', std_rtol=1e-6)
+
+def test_reducing_batches_matches_one_pass(weather):
+    batches = [weather.iloc[start:start + 997] for start in range(0, len(weather), 997)]
+    streamed = reduce_states(batches)
+    whole = partial_states(weather)
+    pd.testing.assert_frame_equal(streamed[KEY_COLUMNS + ['days', 'rain_days']],
+                                  whole[KEY_COLUMNS + ['days', 'rain_days']])
+    pd.testing.assert_frame_equal(streamed, whole, check_exact=False, rtol=1e-9, atol=1e-9)
+
+def test_fingerprints_follow_file_versions_without_reading_them(data_dir):
+    fingerprints = partition_fingerprints()
+    assert sorted(fingerprints) == [str(year) for year in range(2010, 2025)]
+    assert partition_fingerprints() == fingerprints
+
+    partition = os.path.join(DATASET_DIR, 'historical_year=2015')
+    for filename in os.listdir(partition):
+        path = os.path.join(partition, filename)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    changed = partition_fingerprints()
+    assert [part for part in fingerprints if changed[part] != fingerprints[part]] == ['2015']
+
+def test_saved_states_are_reused_until_a_partition_changes(data_dir, capsys):
+    built = load_states()
+    assert 'for 15 of 15 data partitions' in capsys.readouterr().out
+    pd.testing.assert_frame_equal(load_states(), built)
+    assert capsys.readouterr().out == ''
+
+    partition = os.path.join(DATASET_DIR, 'historical_year=2012')
+    for filename in os.listdir(partition):
+        os.utime(os.path.join(partition, filename))
+    pd.testing.assert_frame_equal(load_states(), built)
+    assert 'for 1 of 15 data partitions' in capsys.readouterr().out
+
+@pytest.mark.parametrize('batch_rows', [None, 500])
+def test_removed_partitions_drop_their_years(data_dir, batch_rows):
+    built = load_states(batch_rows=batch_rows)
+    shutil.rmtree(os.path.join(DATASET_DIR, 'historical_year=2013'))
+    states = load_states(batch_rows=batch_rows)
+    pd.testing.assert_frame_equal(states, built[built['historical_year'] != 2013].reset_index(drop=True))
+    pd.testing.assert_frame_equal(load_states(use_cache=False, batch_rows=batch_rows), states, check_dtype=False,
+                                  check_categorical=False, rtol=1e-12)
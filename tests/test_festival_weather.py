@@ -0,0 +1,68 @@
+"""The festival-weather command: subcommands dispatch lazily and light ones start without the heavy libraries"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import festival_weather
+
+ANALYSIS_DIR = os.path.dirname(festival_weather.__file__)
+
+HEAVY_MODULES = ['pandas', 'pyarrow', 'scipy']
+
+# Subcommands whose command line (and, for query and rank, lookups) must not load the heavy libraries
+LIGHT_COMMANDS = ['collect', 'validate', 'outliers', 'summarise', 'query', 'rank', 'cache', 'mock-server']
+
+def run_command(argv, cwd, env=None):
+    """Runs festival_weather.main(argv) in a fresh interpreter and returns (output, modules it loaded)"""
+    script = ("import sys, festival_weather\n"
+              "try:\n"
+              f"    festival_weather.main({argv!r})\n"
+              "except SystemExit:\n"
+              "    pass\n"
+              "print(' '.join(sorted(sys.modules)))")
+    result = subprocess.run([sys.executable, '-c', script], cwd=cwd, capture_output=True, text=True, check=True,
+                            env={**os.environ, 'PYTHONPATH': ANALYSIS_DIR, **(env or {})})
+    output, _, modules = result.stdout.rstrip('\n').rpartition('\n')
+    return output, set(modules.split())
+
+@pytest.mark.parametrize('command', LIGHT_COMMANDS)
+def test_light_command_help_loads_no_heavy_modules(command, tmp_path):
+    output, modules = run_command([command, '--help'], tmp_path)
+    assert f'festival-weather {command}' in output
+    assert modules.isdisjoint(HEAVY_MODULES)
+
+def test_top_level_help_imports_no_command_module(tmp_path):
+    output, modules = run_command(['--help'], tmp_path)
+    for name, (module, _, description) in festival_weather.COMMANDS.items():
+        assert name in output and description in output
+        assert module not in modules
+    assert modules.isdisjoint(HEAVY_MODULES)
+
+def test_data_dir_reaches_the_command(tmp_path):
+    os.makedirs(tmp_path / 'work')
+    output, _ = run_command(['--data-dir', str(tmp_path / 'elsewhere'), 'cache'], tmp_path / 'work')
+    assert 'Cache now holds 0 entries' in output
+    assert os.path.isdir(tmp_path / 'elsewhere' / 'cache' / 'archive')
+    assert not os.path.exists(tmp_path / 'work' / 'data')
+
+def test_query_and_rank_run_from_the_indexes_without_pandas(data_dir, capsys):
+    festival_weather.main(['summarise'])
+    festival_weather.main(['query', '--build'])
+    capsys.readouterr()
+
+    output, modules = run_command(['rank', '--top', '3', '--weights', 'rain=2'], data_dir.parent)
+    assert 'Top 3 festivals by weather (temp=1, rain=2, wind=1)' in output
+    assert modules.isdisjoint(HEAVY_MODULES)
+
+    output, modules = run_command(['query', 'Synthetic Festival 1', '06-29', '--measure', 'rainfall_mm'],
+                                  data_dir.parent)
+    assert 'rainfall_mm:' in output
+    assert modules.isdisjoint(HEAVY_MODULES)
+
+def test_unknown_command_is_rejected(capsys):
+    with pytest.raises(SystemExit):
+        festival_weather.main(['forecast'])
+    assert "invalid choice: 'forecast'" in capsys.readouterr().err
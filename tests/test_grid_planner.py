@@ -0,0 +1,70 @@
+"""Request planning: grid cells are shared and default requests stay close to one archive call"""
+
+import random
+from datetime import date
+
+from archive_fetcher import build_archive_params, estimate_call_weight
+from grid_planner import plan_batched_requests, plan_requests, snap_to_grid
+
+YEARS = range(1995, 2025)
+
+def festival(key, lat, long, month=6, day=25, days=4):
+    windows = [(date(year, month, day), date(year, month, day + days)) for year in YEARS]
+    return key, lat, long, windows
+
+def test_snap_to_grid():
+    assert snap_to_grid(51.149, -2.587) == (51.1, -2.6)
+    assert snap_to_grid(51.151, -2.551) == (51.2, -2.6)
+
+def test_festivals_in_one_cell_share_requests():
+    plan = plan_requests([festival('a', 51.14, -2.58), festival('b', 51.13, -2.61, day=24)])
+    assert len(plan) == len(YEARS)
+    assert all(len(request['members']) == 2 for request in plan)
+    assert {request['start_date'].year for request in plan} == set(YEARS)
+
+def test_default_plan_costs_about_one_call_per_request():
+    plan = plan_requests([festival('a', 51.14, -2.58), festival('b', 55.9, -3.2, month=8, day=1)])
+    weights = [
+        estimate_call_weight(build_archive_params(*request['cell'], request['start_date'], request['end_date']))
+        for request in plan
+    ]
+    assert max(weights) == 1.0
+    assert sum(weights) == 2 * len(YEARS)
+
+def test_full_period_is_one_long_request_per_cell():
+    plan = plan_requests([festival('a', 51.14, -2.58)], full_period=True)
+    assert len(plan) == 1
+    assert len(plan[0]['members']) == len(YEARS)
+    weight = estimate_call_weight(build_archive_params(*plan[0]['cell'], plan[0]['start_date'], plan[0]['end_date']))
+    assert weight > 700
+
+def test_every_window_is_covered_by_exactly_one_request_of_its_cell():
+    rng = random.Random(4)
+    locations = [festival(key, rng.uniform(50, 58), rng.uniform(-5, 1.5), rng.randint(5, 8), rng.randint(1, 20),
+                          rng.randint(0, 6)) for key in range(40)]
+    plan = plan_requests(locations)
+    covering = {}
+    for request in plan:
+        for key, start, end in request['members']:
+            assert request['start_date'] <= start and end <= request['end_date']
+            covering.setdefault((key, start), []).append(request['cell'])
+    for key, lat, long, windows in locations:
+        for start, _ in windows:
+            assert covering[(key, start)] == [snap_to_grid(lat, long)]
+
+def test_batched_requests_cover_each_window_within_the_span_and_location_limits():
+    rng = random.Random(5)
+    locations = [festival(key, rng.uniform(50, 58), rng.uniform(-5, 1.5), rng.randint(5, 8), rng.randint(1, 20),
+                          rng.randint(0, 6)) for key in range(120)]
+    plan = plan_batched_requests(locations, max_span_days=14, max_locations=25)
+    covering = {}
+    for request in plan:
+        assert len(request['cells']) <= 25
+        assert (request['end_date'] - request['start_date']).days < 14
+        for position, key, start, end in request['members']:
+            assert request['start_date'] <= start and end <= request['end_date']
+            covering.setdefault((key, start), []).append(request['cells'][position])
+    for key, lat, long, windows in locations:
+        for start, _ in windows:
+            assert covering[(key, start)] == [snap_to_grid(lat, long)]
+    assert len(plan) < sum(len(windows) for _, _, _, windows in locations) / 10
@@ -0,0 +1,161 @@
+"""Historical weather collector: planned, batched and resumed collection agree with fetching each window alone"""
+
+import os
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import historical_weather as collector
+from archive_fetcher import build_archive_params, fetch_all
+from checkpoint_manifest import CheckpointManifest
+from festival_calendar import find_gaps
+from grid_planner import snap_to_grid
+from mock_archive_server import build_location_payload, start_mock_server
+from weather_benchmark import MOCK_LIMITS
+from weather_store import DAILY_VARIABLES, RECORD_SCHEMA, decode_dictionaries
+
+COLLECTED = 4
+
+@pytest.fixture
+def archive(data_dir, festivals):
+    # The second festival sits in the first one's grid cell and overlaps its dates, so the two share requests
+    festivals.loc[1, ['lat', 'long']] = festivals.loc[0, ['lat', 'long']] + 0.01
+    festivals.loc[1, 'startDate'] = festivals.loc[0, 'startDate']
+    festivals.head(COLLECTED).to_csv(collector.INPUT_FILE, index=False)
+    server, base_url, stats = start_mock_server()
+    yield base_url, stats
+    server.shutdown()
+
+def collect(base_url, **settings):
+    collector.main(0, COLLECTED, base_url=base_url, use_cache=False, limits=MOCK_LIMITS, **settings)
+    with open(collector.OUTPUT_FILE, 'rb') as f:
+        return f.read()
+
+def window_by_window(base_url, festivals, output_file):
+    """Fetches every festival window on its own and combines them as the collector would"""
+    windows = [
+        (festival, start_date, end_date) for _, festival in festivals.iterrows()
+        for start_date, end_date in collector.create_historical_dates(festival['startDate'], festival['endDate'])
+    ]
+    params_list = [
+        build_archive_params(*snap_to_grid(festival['lat'], festival['long']), start_date, end_date)
+        for festival, start_date, end_date in windows
+    ]
+    results = fetch_all(params_list, base_url=base_url, limits=MOCK_LIMITS)
+    manifest = CheckpointManifest(os.path.join(os.path.dirname(output_file), 'reference'))
+    try:
+        manifest.record_windows([
+            (festival['ID'], start_date.year, collector.process_historical_weather(data, festival, start_date.year))
+            for (festival, start_date, _), data in zip(windows, results)
+        ])
+        manifest.combine(output_file)
+    finally:
+        manifest.close()
+    with open(output_file, 'rb') as f:
+        return f.read()
+
+def test_grid_cell_requests_match_fetching_each_window(archive):
+    base_url, stats = archive
+    collected = collect(base_url)
+    years = len(collector.create_historical_dates('01/06/2025', '02/06/2025'))
+    assert stats['requests'] == (COLLECTED - 1) * years
+    festivals = pd.read_csv(collector.INPUT_FILE).head(COLLECTED)
+    assert collected == window_by_window(base_url, festivals, 'reference.csv')
+
+def test_full_period_requests_match_fetching_each_window(archive, monkeypatch):
+    base_url, stats = archive
+    collected = collect(base_url, full_period=True)
+    # One request per grid cell, spanning every year
+    assert stats['requests'] == COLLECTED - 1
+    festivals = pd.read_csv(collector.INPUT_FILE).head(COLLECTED)
+    assert collected == window_by_window(base_url, festivals, 'reference.csv')
+
+    runs = []
+    monkeypatch.setattr(collector, 'main', lambda **settings: runs.append(settings))
+    collector.command_line(['--full-period'])
+    assert runs[0]['full_period'] is True
+    for mode in (['--refresh', '2000'], ['--repair'], ['--hourly']):
+        with pytest.raises(SystemExit):
+            collector.command_line(['--full-period', *mode])
+
+def test_refresh_fetches_only_missing_windows_in_shared_requests(archive):
+    base_url, stats = archive
+    collect(base_url)
+    stored = pd.read_csv(collector.OUTPUT_FILE)
+    missing = (stored['historical_year'] == 2000) | ((stored['festival_id'] == 2) & (stored['historical_year'] == 2010))
+    stored[~missing].to_csv(collector.OUTPUT_FILE, index=False)
+
+    requests = stats['requests']
+    collector.refresh_missing_years([2000, 2010], base_url=base_url, use_cache=False)
+    # Five windows missing across four festivals come back in fewer, multi-location requests
+    assert stats['requests'] - requests < COLLECTED + 1
+    pd.testing.assert_frame_equal(pd.read_csv(collector.OUTPUT_FILE), stored)
+
+    requests = stats['requests']
+    collector.refresh_missing_years([2000, 2010], base_url=base_url, use_cache=False)
+    assert stats['requests'] == requests
+
+def test_interrupted_collection_resumes_with_only_the_missing_windows(archive, monkeypatch):
+    base_url, stats = archive
+    process = collector.process_historical_weather
+    with monkeypatch.context() as patch:
+        # Windows from 2005 on are lost, as if the run had stopped part way
+        patch.setattr(collector, 'process_historical_weather',
+                      lambda data, festival, year: process(data, festival, year) if year < 2005 else None)
+        collect(base_url)
+    requests = stats['requests']
+    collected = collect(base_url)
+    assert stats['requests'] - requests == (COLLECTED - 1) * len(range(2005, 2025))
+
+    festivals = pd.read_csv(collector.INPUT_FILE).head(COLLECTED)
+    assert collected == window_by_window(base_url, festivals, 'reference.csv')
+    requests = stats['requests']
+    assert collect(base_url) == collected
+    assert stats['requests'] == requests
+
+def day_records(weather_data, festival_info, year):
+    """The collector's original conversion: one record per day"""
+    daily = weather_data['daily']
+    return [
+        {'festival_id': festival_info['ID'], 'festival_name': festival_info['Title'], 'historical_year': year,
+         'calendar_date': daily['time'][i][-5:], 'full_date': daily['time'][i],
+         **{column: daily[variable][i] for column, variable in DAILY_VARIABLES.items()},
+         'lat': festival_info['lat'], 'long': festival_info['long']}
+        for i in range(len(daily['time']))
+    ]
+
+def test_payload_columns_match_the_per_day_records():
+    festival = {'ID': 7, 'Title': 'Synthetic Festival 7', 'lat': 51.15, 'long': -2.59}
+    payload = build_location_payload(51.2, -2.6, date(1995, 6, 1), date(2024, 8, 31), list(DAILY_VARIABLES.values()))
+    payload['daily']['rain_sum'][3] = None
+    window = collector.slice_weather_window(payload, pd.Timestamp('2010-06-29'), pd.Timestamp('2010-07-02'))
+    assert window['daily']['time'] == ['2010-06-29', '2010-06-30', '2010-07-01', '2010-07-02']
+
+    for weather_data in (payload, window):
+        batch = collector.process_historical_weather(weather_data, festival, 2010)
+        assert batch.schema == RECORD_SCHEMA
+        rows = decode_dictionaries(pa.Table.from_batches([batch])).to_pylist()
+        for row in rows:
+            row['full_date'] = row['full_date'].isoformat()
+        assert rows == day_records(weather_data, festival, 2010)
+    assert collector.process_historical_weather({'daily': {'time': []}}, festival, 2010) is None
+    assert collector.slice_weather_window(payload, pd.Timestamp('2030-06-01'), pd.Timestamp('2030-06-02')) is None
+
+def test_repair_refetches_the_windows_in_the_gap_report(archive):
+    base_url, stats = archive
+    collect(base_url)
+    stored = pd.read_csv(collector.OUTPUT_FILE, parse_dates=['full_date'])
+    damaged = pd.concat([stored.drop(index=[3, 100]), stored.iloc[[50]]]).sort_values(
+        ['festival_id', 'historical_year', 'full_date'])
+    damaged.to_csv(collector.OUTPUT_FILE, index=False, date_format='%Y-%m-%d')
+    festivals = pd.read_csv(collector.INPUT_FILE)
+    report = find_gaps(damaged, festivals)
+    assert len(report) == 3
+    report.to_csv(collector.GAPS_FILE, index=False, date_format='%Y-%m-%d')
+
+    collector.repair_gaps(base_url=base_url, use_cache=False)
+    repaired = pd.read_csv(collector.OUTPUT_FILE, parse_dates=['full_date'])
+    assert find_gaps(repaired, festivals).empty
+    pd.testing.assert_frame_equal(repaired, stored)
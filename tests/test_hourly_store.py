@@ -0,0 +1,108 @@
+"""Hourly store: scaled integers round-trip the archive's values and daily metrics match a pandas groupby"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from hourly_store import (DAILY_METRICS, HourlyWriter, compact_hourly, daily_from_hourly, hourly_files, read_hourly,
+                          stored_windows, to_hourly_batch)
+from mock_archive_server import build_location_payload
+from weather_config import HOURLY_MEASURES
+
+COLUMNS = list(HOURLY_MEASURES)
+WINDOWS = [(festival_id, year) for festival_id in (1, 2, 3) for year in (2019, 2020, 2021)]
+
+def window_payload(festival_id, year):
+    variables = [HOURLY_MEASURES[column][0] for column in COLUMNS]
+    payload = build_location_payload(50 + festival_id, -2.0, date(year, 6, 28), date(year, 7, 1), [], variables)
+    return payload['hourly']
+
+def expected_frame(hours=None):
+    """The archive's hourly values as a float DataFrame, built directly from the payloads"""
+    frames = []
+    for festival_id, year in WINDOWS:
+        hourly = window_payload(festival_id, year)
+        times = pd.to_datetime(pd.Series(hourly['time']))
+        frame = pd.DataFrame({'festival_id': festival_id, 'historical_year': year,
+                              'full_date': times.dt.normalize(), 'hour': times.dt.hour})
+        for column in COLUMNS:
+            frame[column] = pd.Series(hourly[HOURLY_MEASURES[column][0]], dtype='float64')
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    if hours is not None:
+        first, last = hours
+        inside = frame['hour'].between(first, last) if first <= last else ~frame['hour'].between(last + 1, first - 1)
+        frame = frame[inside]
+        if first > last:
+            # A night is keyed by the date it starts
+            early = (frame['hour'] <= last).astype(int)
+            frame = frame.assign(full_date=frame['full_date'] - pd.to_timedelta(early, unit='D'))
+    return frame.reset_index(drop=True)
+
+@pytest.fixture
+def store(tmp_path):
+    dataset_dir = str(tmp_path / 'hourly')
+    writer = HourlyWriter(dataset_dir, COLUMNS, flush_rows=200)
+    for festival_id, year in WINDOWS:
+        writer.add(to_hourly_batch(window_payload(festival_id, year), festival_id, year, COLUMNS))
+    writer.close()
+    assert len(hourly_files(dataset_dir)) > 3
+    compact_hourly(dataset_dir)
+    return dataset_dir
+
+def test_stored_integers_read_back_as_the_archive_values(store):
+    assert [len(hourly_files(store, year)) for year in (2019, 2020, 2021)] == [1, 1, 1]
+    assert stored_windows(store) == set(WINDOWS)
+    stored = read_hourly(store, as_float=True)
+    expected = expected_frame()
+    assert list(stored.columns) == list(expected.columns)
+    np.testing.assert_array_equal(stored['full_date'].to_numpy(dtype='datetime64[D]'),
+                                  expected['full_date'].to_numpy(dtype='datetime64[D]'))
+    for column in expected.columns.drop('full_date'):
+        np.testing.assert_array_equal(stored[column].to_numpy(dtype='float64'),
+                                      expected[column].to_numpy(dtype='float64'), err_msg=column)
+    assert read_hourly(store)['temp_c'].dtype == 'Int16'
+
+@pytest.mark.parametrize('hours', [None, (12, 18), (22, 6)])
+def test_daily_metrics_match_a_groupby_of_the_hourly_values(store, hours):
+    hourly = expected_frame(hours)
+    grouped = hourly.groupby(['festival_id', 'historical_year', 'full_date'])
+    daily = daily_from_hourly(store, hours=hours).sort_values(['festival_id', 'historical_year', 'full_date'])
+    assert (daily['hours'] == grouped.size().to_numpy()).all()
+    # Windows run 28 June to 1 July, so the first and last nights are partial
+    assert set(daily['hours']) == ({24} if hours is None else {7} if hours == (12, 18) else {7, 9, 2})
+    for metric, (column, how) in DAILY_METRICS.items():
+        if how == 'wet_hours':
+            expected = grouped[column].agg(lambda values: int((values > 0).sum()))
+        else:
+            expected = grouped[column].agg(how).round(1)
+        np.testing.assert_array_equal(daily[metric].to_numpy(dtype='float64'), expected.to_numpy(dtype='float64'),
+                                      err_msg=metric)
+
+def test_overnight_window_spans_midnight(store):
+    hourly = window_payload(2, 2020)
+    # The night of 29 June, built by hand from the archive's local times
+    night = [position for position, time in enumerate(hourly['time'])
+             if '2020-06-29T22:00' <= time <= '2020-06-30T06:00']
+    temps = [hourly['temperature_2m'][position] for position in night]
+    daily = daily_from_hourly(store, hours=(22, 6), festival_ids=[2])
+    row = daily[(daily['historical_year'] == 2020) & (daily['full_date'] == pd.Timestamp('2020-06-29'))].iloc[0]
+    assert row['hours'] == len(night) == 9
+    assert row['min_temp_c'] == min(temps) and row['max_temp_c'] == max(temps)
+
+def test_collected_hours_and_layout_are_checked(store):
+    batch = to_hourly_batch(window_payload(1, 2019), 1, 2019, COLUMNS, hours=(22, 6))
+    assert sorted(set(batch.column('hour').to_pylist())) == [0, 1, 2, 3, 4, 5, 6, 22, 23]
+    with pytest.raises(ValueError):
+        HourlyWriter(store, COLUMNS, hours=(22, 6))
+    with pytest.raises(ValueError):
+        HourlyWriter(store, ['temp_c'])
+
+    hourly = window_payload(1, 2019)
+    # 4000C is 40000 tenths, beyond int16
+    hourly['temperature_2m'][0] = 4000.0
+    with pytest.raises(pa.ArrowInvalid):
+        to_hourly_batch(hourly, 1, 2019, COLUMNS)
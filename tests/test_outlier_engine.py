@@ -0,0 +1,56 @@
+"""Outlier engine: histogram and sorted quantiles agree with pandas, on and off the value grid"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import outlier_engine
+from outlier_engine import SCOPES, ValueGrid, find_outliers, group_codes, grouped_quantiles, outlier_masks
+
+QUANTILES = [0.25, 0.5, 0.75]
+
+def pandas_quantiles(values, keys):
+    frame = pd.DataFrame({'key': keys, 'value': values})
+    return frame.groupby('key', sort=False)['value'].quantile(QUANTILES).unstack().to_numpy()
+
+@pytest.mark.parametrize('decimals', [1, 3])
+@pytest.mark.parametrize('max_cells', [outlier_engine.MAX_HISTOGRAM_CELLS, 0])
+def test_grouped_quantiles_match_pandas(monkeypatch, decimals, max_cells):
+    monkeypatch.setattr(outlier_engine, 'MAX_HISTOGRAM_CELLS', max_cells)
+    rng = np.random.default_rng(2)
+    keys = rng.integers(0, 40, 5000)
+    values = np.round(rng.gamma(2, 4, 5000), decimals)
+    values[rng.random(5000) < 0.05] = np.nan
+    assert ValueGrid(values).on_grid == (decimals == 1)
+
+    codes, group_count = group_codes(pd.DataFrame({'key': keys}), ['key'])
+    np.testing.assert_allclose(grouped_quantiles(values, codes, group_count, QUANTILES),
+                               pandas_quantiles(values, keys), rtol=1e-12)
+
+def test_off_grid_values_are_sorted_not_snapped():
+    values = np.array([0.01, 0.02, 0.03, 0.04, 0.05, 10.0])
+    grid = ValueGrid(values)
+    assert not grid.on_grid and grid.steps is None
+    quantiles = grouped_quantiles(values, np.zeros(len(values), dtype='int64'), 1, QUANTILES)
+    np.testing.assert_allclose(quantiles[0], pd.Series(values).quantile(QUANTILES), rtol=1e-12)
+    masks = outlier_masks(values[:, None], np.zeros(len(values), dtype='int64'), 1)
+    assert masks['iqr'][:, 0].tolist() == [False] * 5 + [True]
+
+def test_histogram_and_sort_paths_flag_the_same_outliers(weather, monkeypatch):
+    dense = find_outliers(weather)
+    monkeypatch.setattr(outlier_engine, 'MAX_HISTOGRAM_CELLS', 0)
+    pd.testing.assert_frame_equal(find_outliers(weather), dense)
+    assert set(dense['scope']) == set(SCOPES)
+
+def test_rows_with_a_missing_key_belong_to_no_group(weather):
+    weather = weather.assign(calendar_date=weather['calendar_date'].astype(object))
+    missing = np.zeros(len(weather), dtype=bool)
+    missing[::7] = True
+    weather.loc[missing, 'calendar_date'] = None
+    codes, group_count = group_codes(weather, ['calendar_date'])
+    assert (codes[missing] == -1).all() and (codes[~missing] >= 0).all()
+
+    scopes = {'calendar_date': ['calendar_date']}
+    flagged = find_outliers(weather, scopes=scopes)
+    kept = find_outliers(weather[~missing].reset_index(drop=True), scopes=scopes)
+    pd.testing.assert_frame_equal(flagged, kept)
@@ -0,0 +1,54 @@
+"""Rain thresholds: one-pass counts match counting each threshold directly, in memory and streamed"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rain_thresholds import DEFAULT_THRESHOLDS, RAIN_COLUMNS, count_days_above, parse_thresholds, rain_day_table
+from streaming_stats import stream_rain_day_table
+
+def test_counts_match_comparing_each_cut_off():
+    rng = np.random.default_rng(3)
+    codes = rng.integers(0, 30, 10000)
+    values = np.round(rng.exponential(3, 10000), 1)
+    values[rng.random(10000) < 0.05] = np.nan
+    # Unsorted, with a repeat and cut-offs that equal stored values
+    cut_offs = [5.0, 0.0, 10.0, 2.5, 5.0, 0.1]
+    counts = count_days_above(codes, 30, values, cut_offs)
+    for position, cut_off in enumerate(cut_offs):
+        np.testing.assert_array_equal(counts[:, position], np.bincount(codes, values > cut_off, minlength=30))
+
+def direct_table(weather, thresholds, column):
+    """Counts rain days one threshold at a time with a groupby"""
+    values = weather[column].astype('float64').round(1)
+    names = weather['festival_name'].astype(str)
+    rows = []
+    for threshold in thresholds:
+        if isinstance(threshold, str):
+            label, mm = threshold, round(float(np.nanpercentile(values, float(threshold[1:]))), 2)
+        else:
+            label, mm = f'{threshold:g}mm', float(threshold)
+        rain_days = (values > mm).groupby(names).sum()
+        total_days = names.value_counts().reindex(rain_days.index)
+        rows.append(pd.DataFrame({'festival_name': rain_days.index, 'measure': column, 'threshold': label,
+                                  'threshold_mm': mm, 'rain_days': rain_days.to_numpy(),
+                                  'total_days': total_days.to_numpy(),
+                                  'pct_rain_days': (rain_days / total_days * 100).round(2).to_numpy()}))
+    return pd.concat(rows, ignore_index=True)
+
+def test_table_matches_a_groupby_per_threshold(weather):
+    thresholds = parse_thresholds(['0', '1', '2.5', '5', 'p75', 'p90'])
+    table = rain_day_table(weather, thresholds)
+    expected = pd.concat([direct_table(weather, thresholds, column) for column in RAIN_COLUMNS], ignore_index=True)
+    pd.testing.assert_frame_equal(table, expected, check_dtype=False)
+
+@pytest.mark.parametrize('thresholds', [[1, 5, 10], DEFAULT_THRESHOLDS])
+def test_streamed_table_matches_the_in_memory_table(weather, thresholds):
+    streamed = stream_rain_day_table(thresholds, batch_rows=1000)
+    pd.testing.assert_frame_equal(streamed, rain_day_table(weather, thresholds), check_dtype=False)
+
+def test_invalid_thresholds_are_rejected():
+    assert parse_thresholds([' 5 ', 'P90', 2]) == [5.0, 'p90', 2.0]
+    for value in ('p101', 'heavy', '', 'p'):
+        with pytest.raises(ValueError):
+            parse_thresholds([value])
@@ -0,0 +1,90 @@
+"""Run metrics: histogram buckets and quantiles, stage accounting, and the JSON and OpenMetrics output"""
+
+import json
+import re
+
+import numpy as np
+import pytest
+
+from run_metrics import LATENCY_BUCKETS, METRIC_PREFIX, Histogram, RunMetrics, format_duration
+
+SAMPLE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+def test_histogram_counts_and_quantiles_match_the_observations():
+    rng = np.random.default_rng(9)
+    values = rng.lognormal(-1, 1.2, 5000)
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+
+    for bound, seen in histogram.cumulative():
+        assert seen == (values <= bound).sum()
+    assert histogram.count == len(values) and histogram.sum == pytest.approx(values.sum())
+    bounds = [0.0] + LATENCY_BUCKETS + [values.max()]
+    for q in (0.1, 0.5, 0.9, 0.99):
+        # The estimate lies in the bucket that holds the true quantile
+        exact = np.quantile(values, q)
+        bucket = np.searchsorted(LATENCY_BUCKETS, exact)
+        assert bounds[bucket] <= histogram.quantile(q) <= bounds[bucket + 1]
+    assert Histogram().quantile(0.5) is None
+
+def test_stages_accumulate_time_and_memory():
+    metrics = RunMetrics('test')
+    for _ in range(2):
+        with metrics.stage('load'):
+            block = np.ones(40 * 1024 * 1024 // 8)
+            with metrics.stage('parse'):
+                pass
+            del block
+    with pytest.raises(RuntimeError):
+        with metrics.stage('fail'):
+            raise RuntimeError('stage failed')
+
+    assert metrics.stages['load']['runs'] == 2 and metrics.stages['parse']['runs'] == 2
+    assert metrics.stages['load']['seconds'] >= metrics.stages['parse']['seconds']
+    # The 40 MB allocated inside the stage shows in its peak, whether or not the peak was reset for it
+    assert metrics.stages['load']['peak_rss_mb'] >= 40
+    assert metrics.stages['fail']['runs'] == 1
+
+def test_written_metrics_parse_as_openmetrics(tmp_path):
+    metrics = RunMetrics('collect')
+    metrics.increment('requests', 3)
+    metrics.increment('bytes', 1.5)
+    metrics.set_gauge('windows_planned', 12)
+    for value in (0.01, 0.2, 0.2, 7.0, 90.0):
+        metrics.observe('request_latency_seconds', value)
+    with metrics.stage('fetch'):
+        pass
+
+    json_file = metrics.write(tmp_path)
+    with open(json_file) as f:
+        saved = json.load(f)
+    assert saved['counters'] == {'bytes': 1.5, 'requests': 3}
+    assert saved['histograms']['request_latency_seconds']['buckets']['+Inf'] == 5
+    assert saved['stages']['fetch']['runs'] == 1
+
+    with open(tmp_path / 'collect.prom') as f:
+        lines = f.read().splitlines()
+    assert lines[-1] == '# EOF'
+    samples = {}
+    for line in lines[:-1]:
+        if line.startswith('# TYPE '):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        assert 'run="collect"' in labels
+        samples[(name, labels)] = float(value)
+    assert samples[(f'{METRIC_PREFIX}_requests_total', 'run="collect"')] == 3
+    assert samples[(f'{METRIC_PREFIX}_windows_planned', 'run="collect"')] == 12
+    latency = f'{METRIC_PREFIX}_request_latency_seconds'
+    buckets = [value for (name, _), value in samples.items() if name == f'{latency}_bucket']
+    assert buckets == sorted(buckets) and buckets[-1] == samples[(f'{latency}_count', 'run="collect"')] == 5
+    assert samples[(f'{METRIC_PREFIX}_stage_seconds', 'run="collect",stage="fetch"')] >= 0
+
+def test_progress_line_reports_rate_and_eta(capsys):
+    metrics = RunMetrics('collect', live=True)
+    metrics.started -= 10
+    metrics.progress(50, 200, 'windows')
+    assert '50/200 windows (25.0%) 5.0 windows/s, ETA 30s' in capsys.readouterr().err
+    metrics.progress(200, 200, 'windows')
+    assert capsys.readouterr().err.endswith('\n')
+    assert [format_duration(seconds) for seconds in (59, 61, 3725)] == ['59s', '1m01s', '1h02m']
@@ -0,0 +1,60 @@
+"""Streaming statistics: batch-by-batch validation and summary states match the in-memory results"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from festival_stats import load_states
+from streaming_stats import MeasureSketch
+from weather_data_validator_detailed import summarise_frame, summarise_stream
+from weather_loader import load_weather
+from weather_store import to_table, write_dataset
+
+def damage_dataset(weather_table):
+    """Drops and repeats some days, and adds a season the festival dates do not cover yet"""
+    rows = np.arange(weather_table.num_rows)
+    rows = np.concatenate([np.delete(rows, [7, 300, 301]), [50, 50, 90]])
+    table = weather_table.take(np.sort(rows))
+    season = table.slice(0, 3).set_column(2, 'historical_year', pa.array([2030] * 3, pa.int16()))
+    season = season.set_column(4, 'full_date', pa.array(
+        np.array(['2030-06-29', '2030-06-30', '2030-07-01'], dtype='datetime64[D]')))
+    write_dataset(to_table(pa.concat_tables([table, season])))
+
+def test_streamed_report_matches_the_in_memory_report(data_dir, weather_table):
+    damage_dataset(weather_table)
+    report, days = summarise_frame(load_weather())
+    streamed_report, streamed_days = summarise_stream(batch_rows=700)
+    for left, right in zip(days, streamed_days):
+        np.testing.assert_array_equal(left, right)
+    assert report['gaps']['missing'] > 0 and report['gaps']['duplicate'] == 2
+
+    ranges, streamed_ranges = report.pop('data_ranges'), streamed_report.pop('data_ranges')
+    assert streamed_report == report
+    for column, summary in ranges.items():
+        # Means and standard deviations are combined batch by batch, so agree to rounding
+        assert streamed_ranges[column] == pytest.approx(summary, rel=1e-12)
+
+def test_sketch_quantiles_are_exact_on_the_grid_and_bounded_when_merged():
+    rng = np.random.default_rng(8)
+    values = np.round(rng.normal(12, 5, 20000), 1)
+    quantiles = [0, 0.1, 0.25, 0.5, 0.75, 0.99, 1]
+    sketch, merged = MeasureSketch(), MeasureSketch(max_bins=64)
+    for batch in np.array_split(values, 13):
+        sketch.update(batch)
+        merged.update(np.append(batch, np.nan))
+    expected = pd.Series(values).quantile(quantiles).to_numpy()
+
+    np.testing.assert_allclose(sketch.quantiles(quantiles), expected, rtol=0, atol=1e-9)
+    assert merged.resolution > 0 and merged.missing == 13
+    assert np.abs(merged.quantiles(quantiles) - expected).max() <= merged.resolution
+    for summary in (sketch, merged):
+        assert summary.count == len(values)
+        assert summary.mean == pytest.approx(values.mean(), rel=1e-12)
+        assert summary.std() == pytest.approx(values.std(ddof=1), rel=1e-12)
+        assert (summary.min, summary.max) == (values.min(), values.max())
+
+def test_streamed_states_match_the_in_memory_states(data_dir):
+    states = load_states(use_cache=False)
+    streamed = load_states(use_cache=False, batch_rows=500)
+    pd.testing.assert_frame_equal(streamed, states, check_dtype=False, check_categorical=False, rtol=1e-12)
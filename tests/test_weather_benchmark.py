@@ -0,0 +1,44 @@
+"""Weather benchmark: synthetic data has the collected dataset's shape, and a small run times every requested stage"""
+
+import json
+import os
+
+import numpy as np
+
+import weather_benchmark
+from festival_calendar import expected_days
+from weather_benchmark import BENCHMARK_DIR, find_baseline, synthetic_festivals, synthetic_weather
+from weather_config import MEASURE_COLUMNS
+
+def test_synthetic_weather_covers_the_festival_windows(festivals):
+    table = synthetic_weather(festivals, range(2015, 2025), seed=4, missing_rate=0.05, gap_rate=0.05)
+    assert table.equals(synthetic_weather(festivals, range(2015, 2025), seed=4, missing_rate=0.05, gap_rate=0.05))
+    weather = table.to_pandas()
+    expected = expected_days(festivals, range(2015, 2025))
+    days = set(zip(weather['festival_id'], weather['full_date']))
+    assert len(days) == len(weather)
+    assert days < set(zip(expected['festival_id'], expected['full_date'].dt.date))
+    assert 0.9 < len(weather) / len(expected) < 1
+    for column in MEASURE_COLUMNS:
+        values = weather[column].to_numpy()
+        assert 0.02 < np.isnan(values).mean() < 0.08
+        present = values[~np.isnan(values)]
+        np.testing.assert_array_equal(present, np.round(present, 1))
+    assert not (weather['rainfall_mm'] > weather['total_precipitation_mm']).any()
+    assert synthetic_festivals(3, seed=4).equals(synthetic_festivals(3, seed=4))
+
+def test_small_run_times_each_stage_and_compares_with_the_last(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    weather_benchmark.main(['--festivals', '4', '--years', '3', '--stages', 'summarise'])
+    [saved] = [name for name in os.listdir(BENCHMARK_DIR) if name.endswith('.json')]
+    with open(os.path.join(BENCHMARK_DIR, saved)) as f:
+        result = json.load(f)
+    # summarise relies on the frame cache, so load runs first
+    assert list(result['stages']) == ['load', 'summarise']
+    assert result['stages']['load']['items'] == result['dataset']['rows']
+    assert result['stages']['summarise']['festivals'] == 4
+    assert all(stage['seconds'] > 0 and stage['peak_rss_mb'] > 0 for stage in result['stages'].values())
+
+    later = dict(result, run_id='later')
+    assert find_baseline(later)[1]['run_id'] == result['run_id']
+    assert find_baseline(dict(later, config=dict(later['config'], festivals=5))) is None
@@ -0,0 +1,42 @@
+"""Weather config: directories are replaced whole, and a failed rebuild leaves the old one in place"""
+
+import os
+
+import pytest
+
+from weather_config import replace_directory
+
+def write_version(directory, version):
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        f.write(version)
+
+def read_version(directory):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return f.read()
+
+def test_replace_directory_swaps_in_the_new_version(tmp_path):
+    target = tmp_path / 'index'
+    with replace_directory(target) as temp_dir:
+        write_version(temp_dir, 'first')
+        assert not os.path.exists(target)
+    assert read_version(target) == 'first'
+
+    with replace_directory(target) as temp_dir:
+        write_version(temp_dir, 'second')
+        os.makedirs(os.path.join(temp_dir, 'part'))
+        # The old version stays readable while the new one is written
+        assert read_version(target) == 'first'
+    assert read_version(target) == 'second'
+    assert os.path.isdir(target / 'part')
+    assert os.listdir(tmp_path) == ['index']
+
+def test_failed_build_keeps_the_old_directory(tmp_path):
+    target = tmp_path / 'index'
+    with replace_directory(target) as temp_dir:
+        write_version(temp_dir, 'first')
+    with pytest.raises(RuntimeError):
+        with replace_directory(target) as temp_dir:
+            write_version(temp_dir, 'partial')
+            raise RuntimeError('build failed')
+    assert read_version(target) == 'first'
+    assert os.listdir(tmp_path) == ['index']
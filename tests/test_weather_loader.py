@@ -0,0 +1,89 @@
+"""Weather loader: compact types, exact widening, and the memory-mapped frame cache"""
+
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import weather_data_validator_detailed as validator
+from festival_stats import INPUT_COLUMNS, load_states
+from weather_config import MEASURE_COLUMNS
+from weather_loader import COLUMN_TYPES, FRAME_CACHE_DIR, load_weather, widen_measure
+from weather_store import DATASET_DIR, export_csv
+
+def test_measures_load_as_float32_and_widen_to_the_exact_values(data_dir):
+    compact = load_weather(use_cache=False)
+    exact = load_weather(measure_dtype='float64', use_cache=False)
+    assert {column: str(dtype) for column, dtype in compact.dtypes.items()} == COLUMN_TYPES
+    for column in MEASURE_COLUMNS:
+        assert compact[column].dtype == 'float32'
+        np.testing.assert_array_equal(widen_measure(compact[column]), exact[column].to_numpy())
+        np.testing.assert_array_equal(widen_measure(exact[column]), exact[column].to_numpy())
+
+def is_mapped(values):
+    while isinstance(values, np.ndarray):
+        if isinstance(values, np.memmap):
+            return True
+        values = values.base
+    return False
+
+def test_cached_frame_matches_a_fresh_read(data_dir):
+    first = load_weather()
+    assert len(os.listdir(FRAME_CACHE_DIR)) == 1
+    cached = load_weather()
+    assert is_mapped(cached['max_temp_c'].to_numpy()) and not is_mapped(first['max_temp_c'].to_numpy())
+    # Copied, as assert_frame_equal also compares the array classes
+    pd.testing.assert_frame_equal(cached.copy(), first)
+    pd.testing.assert_frame_equal(cached.copy(), load_weather(use_cache=False))
+
+def rewrite_partition(year):
+    """Rewrites one year partition in place, which changes the source fingerprint"""
+    partition = os.path.join(DATASET_DIR, f'historical_year={year}')
+    for filename in os.listdir(partition):
+        path = os.path.join(partition, filename)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+def test_new_source_version_evicts_older_frames(data_dir):
+    load_weather()
+    load_weather(columns=['festival_id', 'rainfall_mm'])
+    assert len(os.listdir(FRAME_CACHE_DIR)) == 2
+
+    rewrite_partition(2015)
+    load_weather()
+    # The old version's frames are gone; only the frame just built remains
+    assert len(os.listdir(FRAME_CACHE_DIR)) == 1
+    load_weather(columns=['festival_id', 'rainfall_mm'])
+    assert len(os.listdir(FRAME_CACHE_DIR)) == 2
+
+def test_csv_loads_the_same_frame_as_the_dataset(data_dir):
+    from_parquet = load_weather(use_cache=False)
+    export_csv()
+    shutil.rmtree(DATASET_DIR)
+    from_csv = load_weather()
+    # Categories may be ordered differently, but every value and type matches
+    assert {column: str(dtype) for column, dtype in from_csv.dtypes.items()} == COLUMN_TYPES
+    for column in ['festival_name', 'calendar_date']:
+        from_csv[column] = from_csv[column].astype(str)
+        from_parquet[column] = from_parquet[column].astype(str)
+    pd.testing.assert_frame_equal(from_csv.copy(), from_parquet)
+
+def test_csv_states_match_the_parquet_states(data_dir):
+    from_parquet = load_states(use_cache=False)
+    export_csv()
+    shutil.rmtree(DATASET_DIR)
+    from_csv = load_states(use_cache=False)
+    # The CSV is read through the loader, so it shares the Parquet path's types and frame cache
+    assert any(os.scandir(FRAME_CACHE_DIR))
+    assert list(from_csv.columns) == list(from_parquet.columns)
+    pd.testing.assert_frame_equal(from_csv, from_parquet, check_dtype=False)
+    assert set(INPUT_COLUMNS) <= set(load_weather(columns=INPUT_COLUMNS).columns)
+
+def test_incomplete_festivals_are_listed_in_name_order(weather, capsys):
+    # The synthetic data holds 15 years, so every festival is incomplete; festival 10 sorts before festival 2
+    validator.analyze_completeness_by_festival(validator.summarise_completeness_by_festival(weather))
+    listed = re.findall(r'Festival: (.+)', capsys.readouterr().out)
+    assert listed == sorted(weather['festival_name'].astype(str).unique())
+    assert listed[:2] == ['Synthetic Festival 1', 'Synthetic Festival 10']
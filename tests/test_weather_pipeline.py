@@ -0,0 +1,68 @@
+"""Weather pipeline: stages rerun only when their code, parameters or inputs change"""
+
+import io
+import os
+from modulefinder import ModuleFinder
+
+import pandas as pd
+import pytest
+
+import festival_weather_summary_5mm as summary
+import weather_pipeline
+from weather_loader import load_weather
+from weather_pipeline import (ANALYSIS_DIR, COMPARISON_FILE, PIPELINE_MODULES, STAGES, run_pipeline, stage_code,
+                              stage_key)
+
+def test_every_stage_is_keyed_by_the_pipeline_code():
+    for name, stage in STAGES.items():
+        assert set(PIPELINE_MODULES) <= set(stage['code']), name
+        for filename in stage['code']:
+            assert os.path.exists(os.path.join(ANALYSIS_DIR, filename)), filename
+
+@pytest.mark.parametrize('name', list(STAGES))
+def test_stage_code_covers_every_local_import(name):
+    code = set(stage_code(name))
+    for filename in STAGES[name]['code']:
+        if filename == 'weather_pipeline.py':
+            continue
+        # modulefinder follows imports inside functions too; only modules in analysis/ can be found
+        finder = ModuleFinder(path=[ANALYSIS_DIR])
+        finder.run_script(os.path.join(ANALYSIS_DIR, filename))
+        imported = {f'{module}.py' for module, found in finder.modules.items() if found.__file__}
+        assert imported - {'__main__.py'} <= code, filename
+
+@pytest.mark.parametrize('changed', ['weather_pipeline.py', 'run_metrics.py', 'festival_stats.py', 'outlier_engine.py'])
+def test_a_code_change_reruns_the_stages_that_use_it(data_dir, monkeypatch, changed):
+    assert run_pipeline(['summarise', 'rollup']) == {'summarise': 'ran', 'rollup': 'ran'}
+    assert run_pipeline(['summarise', 'rollup']) == {'summarise': 'skipped', 'rollup': 'skipped'}
+
+    file_digest = weather_pipeline.file_digest
+    monkeypatch.setattr(weather_pipeline, 'file_digest', lambda path: file_digest(path) + (
+        'edited' if os.path.basename(path) == changed else ''))
+    assert run_pipeline(['summarise', 'rollup']) == {'summarise': 'ran', 'rollup': 'ran'}
+    assert run_pipeline(['summarise', 'rollup']) == {'summarise': 'skipped', 'rollup': 'skipped'}
+
+def test_parameters_and_inputs_are_part_of_the_key(data_dir):
+    key = stage_key('outliers', {})
+    assert stage_key('outliers', {}) == key
+    assert stage_key('outliers', {'stream': True}) != key
+
+    partition = os.path.join(weather_pipeline.DATASET_DIR, 'historical_year=2020')
+    for filename in os.listdir(partition):
+        path = os.path.join(partition, filename)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert stage_key('outliers', {}) != key
+
+def test_missing_outputs_rerun_a_stage(data_dir):
+    assert run_pipeline(['climatology']) == {'climatology': 'ran'}
+    os.remove(os.path.join(weather_pipeline.INDEX_DIR, 'meta.json'))
+    assert run_pipeline(['climatology']) == {'climatology': 'ran'}
+    assert run_pipeline(['climatology']) == {'climatology': 'skipped'}
+
+def test_summarise_matches_the_standalone_summary(data_dir):
+    run_pipeline(['summarise'])
+    expected = summary.calculate_weather_scores(
+        summary.calculate_festival_metrics(load_weather()))
+    pd.testing.assert_frame_equal(pd.read_csv(COMPARISON_FILE, index_col=0),
+                                  pd.read_csv(io.StringIO(expected.to_csv()), index_col=0), check_exact=True)
@@ -0,0 +1,111 @@
+"""Weather ranking: stored components reproduce weather_score, and custom weights and filters match a direct ranking"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from festival_stats import partial_states
+from festival_weather_summary_5mm import calculate_weather_scores, festival_metrics_from_states
+from hourly_store import HourlyWriter, to_hourly_batch
+from mock_archive_server import build_location_payload
+from rain_thresholds import zscore
+from weather_ranking import COMPONENTS, FestivalRanking, build_components, parse_weights
+
+@pytest.fixture
+def metrics(weather):
+    return calculate_weather_scores(festival_metrics_from_states(partial_states(weather)))
+
+@pytest.fixture
+def ranking(metrics, tmp_path):
+    names = metrics.index.astype(str)
+    # Every third festival is left unlisted, so it has unknown attributes
+    details = pd.DataFrame({
+        'Title': names,
+        'Camping': ['Yes', 'no ', 'YES'] * (len(names) // 3),
+        'Capacity': [f'{capacity:,}' for capacity in range(5000, 5000 * (len(names) + 1), 5000)],
+        'region': ['Wales', 'South West', 'North West', 'Scotland'] * (len(names) // 4),
+        'Music Genre': ['Folk', 'Rock', 'Folk Rock'] * (len(names) // 3),
+        'county': 'Somerset'
+    }).iloc[[position for position in range(len(names)) if position % 3 != 2]]
+    details.to_csv(tmp_path / 'details.csv', index=False)
+    ranking_dir = str(tmp_path / 'ranking')
+    assert build_components(metrics, ranking_dir, str(tmp_path / 'details.csv')) == len(names)
+    return FestivalRanking(ranking_dir)
+
+def direct_scores(metrics, weights):
+    """Weighted mean of the signed z-scores computed straight from the metrics"""
+    total, size = 0, 0
+    for name, weight in weights.items():
+        metric, direction = COMPONENTS[name]
+        z = direction * zscore(metrics[metric])
+        if weight and not np.isnan(z).any():
+            total, size = total + weight * z, size + abs(weight)
+    return pd.Series(total / size, index=metrics.index)
+
+def test_default_weights_reproduce_the_weather_score(metrics, ranking):
+    table = ranking.rank(k=len(metrics))
+    assert list(table.index) == list(metrics['weather_score'].sort_values(ascending=False, kind='stable').index)
+    pd.testing.assert_series_equal(table['weather_score'], metrics['weather_score'].loc[table.index])
+    np.testing.assert_allclose(table['temp_z'], metrics.loc[table.index, 'temp_z'].round(2))
+
+@pytest.mark.parametrize('items', [['rain=2'], ['temp=0', 'wind=0', 'min_temp=1', 'peak_wind=0.5'], ['temp=-1']])
+def test_custom_weights_match_a_direct_ranking(metrics, ranking, items):
+    weights = parse_weights(items)
+    expected = direct_scores(metrics, weights).sort_values(ascending=False, kind='stable')
+    positions, scores = ranking.top(weights, k=5)
+    assert list(ranking.names[positions]) == list(expected.index[:5])
+    np.testing.assert_allclose(scores, expected.to_numpy()[:5], rtol=1e-12)
+
+def test_filters_match_the_festival_details(metrics, ranking):
+    listed = np.arange(len(metrics)) % 3 != 2
+    position = np.arange(len(metrics))
+    np.testing.assert_array_equal(ranking.filter_mask(camping=True), listed & (position % 3 == 0))
+    np.testing.assert_array_equal(ranking.filter_mask(camping=False), position % 3 == 1)
+    np.testing.assert_array_equal(ranking.filter_mask(genre='folk', min_capacity=20000),
+                                  listed & (position % 3 == 0) & (position >= 3))
+    np.testing.assert_array_equal(ranking.filter_mask(region='wales', max_capacity=25000),
+                                  listed & (position % 4 == 0) & (position < 5))
+    assert ranking.filter_mask() is None
+
+    mask = ranking.filter_mask(county='somerset')
+    expected = direct_scores(metrics, parse_weights([]))[mask].sort_values(ascending=False, kind='stable')
+    table = ranking.rank(k=20, county='somerset')
+    assert list(table.index) == list(expected.index)
+    assert len(ranking.rank(genre='jazz')) == 0
+    with pytest.raises(ValueError):
+        parse_weights(['gusts=1'])
+    with pytest.raises(ValueError):
+        parse_weights(['rain=lots'])
+
+def write_gusts(hourly_dir, festival_ids):
+    """Hourly wind for the festivals over two years; returns each festival's strongest gust by name"""
+    writer = HourlyWriter(hourly_dir, ['windspeed_kmh', 'windgust_kmh'])
+    peaks = {}
+    for festival_id in festival_ids:
+        for year in (2019, 2020):
+            payload = build_location_payload(50 + festival_id / 10, -2.0, date(year, 7, 1), date(year, 7, 3), [],
+                                             ['windspeed_10m', 'windgusts_10m'])['hourly']
+            writer.add(to_hourly_batch(payload, festival_id, year, ['windspeed_kmh', 'windgust_kmh']))
+            name = f'Synthetic Festival {festival_id}'
+            peaks[name] = max(peaks.get(name, 0), max(payload['windgusts_10m']))
+    writer.close()
+    return peaks
+
+def test_peak_gusts_come_from_the_hourly_store(metrics, tmp_path):
+    peaks = write_gusts(str(tmp_path / 'hourly'), range(1, len(metrics) + 1))
+    build_components(metrics, str(tmp_path / 'ranking'), str(tmp_path / 'missing.csv'), str(tmp_path / 'hourly'))
+    ranking = FestivalRanking(str(tmp_path / 'ranking'))
+    gust = ranking.component_names.index('peak_gust')
+    expected = -zscore([peaks[name] for name in ranking.names])
+    assert ranking.present[:, gust].all()
+    np.testing.assert_allclose(ranking.components[:, gust], expected, rtol=1e-12)
+    _, scores = ranking.top({'peak_gust': 1}, k=3)
+    np.testing.assert_allclose(scores, np.sort(expected)[::-1][:3], rtol=1e-12)
+
+    # Without gusts for every festival the component is left out, as for any missing component
+    write_gusts(str(tmp_path / 'partial'), range(1, len(metrics)))
+    for hourly_dir in ('partial', 'no_store'):
+        build_components(metrics, str(tmp_path / 'ranking'), str(tmp_path / 'missing.csv'), str(tmp_path / hourly_dir))
+        assert not FestivalRanking(str(tmp_path / 'ranking')).present[:, gust].any()
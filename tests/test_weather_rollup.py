@@ -0,0 +1,106 @@
+"""Weather rollup: cube slices match a direct groupby of the daily rows joined with the festival details"""
+
+import calendar
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from festival_stats import RAIN_THRESHOLD_MM
+from weather_rollup import ALL, UNKNOWN, WeatherRollup, build_rollup, capacity_band
+
+@pytest.fixture
+def details(festivals):
+    """Details for all but the last two festivals, with names and values as loosely written as the real file"""
+    listed = festivals.iloc[:-2]
+    return pd.DataFrame({
+        'Title': listed['Title'],
+        'region': [' Wales', 'Scotland ', 'South West'] * (len(listed) // 3) + ['Wales'] * (len(listed) % 3),
+        'Music Genre': ['Folk', 'Rock'] * (len(listed) // 2),
+        'county': 'Powys',
+        'Camping': ['yes', 'No', 'YES', 'no'] * (len(listed) // 4) + ['yes'] * (len(listed) % 4),
+        'Capacity': ['900', '4,999', '5,000', '', '60,000'] * (len(listed) // 5) + ['1,200'] * (len(listed) % 5),
+        'duration': 3
+    })
+
+@pytest.fixture
+def rollup(weather, details, data_dir):
+    details.to_csv(os.path.join('data', 'festivals_25_cleaned.csv'), index=False)
+    assert build_rollup(weather) > 0
+    return WeatherRollup()
+
+def daily_rows(weather, details):
+    """Daily rows with the festival's dimensions, joined directly by name"""
+    dimensions = pd.DataFrame({
+        'festival_name': details['Title'],
+        'region': details['region'].str.strip(),
+        'genre': details['Music Genre'],
+        'camping': details['Camping'].str.capitalize(),
+        'capacity_band': details['Capacity'].map(capacity_band)
+    })
+    rows = weather.assign(festival_name=weather['festival_name'].astype(str),
+                          month=weather['full_date'].dt.month.map(lambda month: calendar.month_name[month]))
+    rows = rows.merge(dimensions, how='left', on='festival_name')
+    return rows.fillna({dimension: UNKNOWN for dimension in ('region', 'genre', 'camping', 'capacity_band')})
+
+def direct_metrics(rows, by):
+    grouped = rows.groupby(by, sort=False) if by else rows.groupby(np.zeros(len(rows)))
+    result = pd.DataFrame({
+        'festivals': grouped['festival_id'].nunique(),
+        'days': grouped.size(),
+        'mean_max_temp': grouped['max_temp_c'].mean(),
+        'max_max_temp': grouped['max_temp_c'].max(),
+        'temp_std_dev': grouped['max_temp_c'].std(),
+        'mean_min_temp': grouped['min_temp_c'].mean(),
+        'min_min_temp': grouped['min_temp_c'].min(),
+        'avg_daily_rainfall': grouped['rainfall_mm'].mean(),
+        'pct_rain_days': grouped['rainfall_mm'].agg(lambda values: (values > RAIN_THRESHOLD_MM).mean() * 100),
+        'overall_max_wind': grouped['max_windspeed_kmh'].max()
+    })
+    return result.astype('float64').round(2)
+
+def assert_matches(result, expected, by):
+    assert len(result) == len(expected)
+    if by:
+        expected = expected.loc[result.index]
+    for column in expected.columns:
+        # Cells merge partial states, so a mean may differ from pandas' in the last place before rounding
+        np.testing.assert_allclose(result[column].to_numpy(dtype='float64'), expected[column].to_numpy(),
+                                   atol=0.0100001, err_msg=column)
+
+@pytest.mark.parametrize('by, filters', [
+    ([], {}),
+    (['region'], {}),
+    (['genre', 'month'], {}),
+    (['capacity_band'], {'camping': 'yes'}),
+    (['month'], {'region': ['wales', 'Scotland'], 'camping': 'No'}),
+    ([], {'genre': 'Folk', 'month': [6, 'july']})
+])
+def test_slices_match_a_direct_groupby(weather, details, rollup, by, filters):
+    rows = daily_rows(weather, details)
+    for dimension, wanted in filters.items():
+        wanted = wanted if isinstance(wanted, list) else [wanted]
+        names = [calendar.month_name[value] if isinstance(value, int) else value for value in wanted]
+        rows = rows[rows[dimension].str.lower().isin([str(name).lower() for name in names])]
+    result = rollup.slice(by, **filters)
+    assert_matches(result, direct_metrics(rows, by), by)
+    if by == ['region']:
+        assert set(result.index) == {'Wales', 'Scotland', 'South West', UNKNOWN}
+    if 'month' in by:
+        # Months come in calendar order within each group
+        months = result.reset_index().groupby(by[:-1] or np.zeros(len(result)), sort=False)['month']
+        assert all(list(group) == sorted(group, key=list(calendar.month_name).index) for _, group in months)
+
+def test_festival_table_and_filters(weather, rollup):
+    festivals = rollup.festivals
+    assert list(festivals['capacity_band'].iloc[:5]) == ['Under 1,000', '1,000-4,999', '5,000-19,999', UNKNOWN,
+                                                         '50,000+']
+    assert list(festivals['camping'].iloc[:4]) == ['Yes', 'No', 'Yes', 'No']
+    assert (festivals['region'].iloc[-2:] == UNKNOWN).all()
+    assert ALL not in rollup.values('region')
+    assert rollup.values('month') == sorted(rollup.values('month'), key=list(calendar.month_name).index)
+    with pytest.raises(KeyError):
+        rollup.slice(['region'], region='Atlantis')
+    with pytest.raises(KeyError):
+        rollup.slice(['weather'])
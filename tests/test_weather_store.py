@@ -0,0 +1,60 @@
+"""Weather store: the Parquet dataset round-trips the CSV exactly and filtered or streamed reads match a full read"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from weather_config import MEASURE_COLUMNS
+from weather_store import (DATASET_DIR, SCHEMA, convert_csv, export_csv, read_frame, read_table, scan_batches,
+                           to_table, write_dataset)
+
+def read_csv(csv_file):
+    return pd.read_csv(csv_file, parse_dates=['full_date'])
+
+def test_csv_round_trips_through_the_dataset(data_dir, weather_table):
+    csv_file = data_dir / 'exported.csv'
+    export_csv(csv_file=csv_file)
+    exported = read_csv(csv_file)
+    expected = weather_table.to_pandas().sort_values(['festival_id', 'historical_year', 'full_date'])
+    assert list(exported.columns) == SCHEMA.names
+    assert len(exported) == len(expected)
+    for column in MEASURE_COLUMNS + ['festival_id', 'historical_year', 'lat', 'long']:
+        pd.testing.assert_series_equal(exported[column], expected[column].reset_index(drop=True),
+                                       check_dtype=False, check_names=False)
+    assert (exported['festival_name'] == expected['festival_name'].astype(str).to_numpy()).all()
+
+    # Reading the rebuilt dataset gives the exact decimal values in the CSV
+    convert_csv(csv_file, DATASET_DIR)
+    frame = read_frame()
+    for column in exported.columns:
+        pd.testing.assert_series_equal(frame[column].astype(exported[column].dtype), exported[column],
+                                       check_names=False)
+    assert read_table().schema == SCHEMA
+
+def test_filtered_reads_match_filtering_a_full_read(data_dir):
+    full = read_frame()
+    festival_ids, years = [3, 7, 11], [2012, 2020]
+    expected = full[full['festival_id'].isin(festival_ids) & full['historical_year'].isin(years)]
+    pd.testing.assert_frame_equal(read_frame(festival_ids=festival_ids, years=years),
+                                  expected.reset_index(drop=True))
+    pd.testing.assert_frame_equal(read_frame(columns=['festival_id', 'rainfall_mm']),
+                                  full[['festival_id', 'rainfall_mm']])
+
+def test_streamed_batches_hold_every_row_once(data_dir):
+    batches = list(scan_batches(batch_rows=500))
+    assert all(batch.num_rows >= 500 for batch in batches[:-1])
+    streamed = pa.concat_tables(batches).sort_by([('festival_id', 'ascending'), ('historical_year', 'ascending'),
+                                                  ('full_date', 'ascending')])
+    assert streamed.equals(read_table())
+
+def test_writing_some_years_replaces_only_their_partitions(data_dir, weather_table):
+    before = read_frame()
+    rewritten = weather_table.filter(pc.equal(weather_table['historical_year'], 2020)).slice(0, 10)
+    write_dataset(to_table(rewritten))
+    after = read_frame()
+    kept = before[before['historical_year'] != 2020].reset_index(drop=True)
+    pd.testing.assert_frame_equal(after[after['historical_year'] != 2020].reset_index(drop=True), kept)
+    assert (after['historical_year'] == 2020).sum() == 10
+    assert sorted(os.listdir(DATASET_DIR)) == [f'historical_year={year}' for year in range(2010, 2025)]
@@ -0,0 +1,64 @@
+"""Bootstrap intervals: point scores agree with the summary, and draws depend only on the seed"""
+
+import numpy as np
+import pandas as pd
+
+from festival_stats import partial_states
+from festival_weather_summary_5mm import calculate_weather_scores, festival_metrics_from_states
+from rain_thresholds import zscore
+from weather_uncertainty import (STATE_FIELDS, bootstrap_scores, festival_year_states, replicate_scores,
+                                 score_intervals, year_draw_counts)
+
+def summary_scores(states):
+    return calculate_weather_scores(festival_metrics_from_states(states))['weather_score']
+
+def test_point_scores_and_ranks_match_the_summary(weather):
+    states = partial_states(weather)
+    scores = summary_scores(states)
+    intervals = score_intervals(states, scores, replicates=40, workers=1)
+    pd.testing.assert_series_equal(intervals['weather_score'], scores.loc[intervals.index], check_names=False)
+    assert (intervals['rank'].to_numpy() == np.arange(1, len(scores) + 1)).all()
+    assert intervals['weather_score'].is_monotonic_decreasing
+    assert (intervals['score_lower'] <= intervals['score_upper']).all()
+    assert (intervals['rank_lower'] <= intervals['rank']).mean() > 0.8
+
+def test_replicates_depend_on_the_seed_not_the_workers(weather):
+    states = partial_states(weather)
+    names, scores, ranks = bootstrap_scores(states, replicates=250, workers=1, seed=7)
+    _, parallel_scores, parallel_ranks = bootstrap_scores(states, replicates=250, workers=2, seed=7)
+    np.testing.assert_array_equal(scores, parallel_scores)
+    np.testing.assert_array_equal(ranks, parallel_ranks)
+    _, other_scores, _ = bootstrap_scores(states, replicates=250, workers=1, seed=8)
+    assert not np.array_equal(scores, other_scores)
+    assert scores.shape == (250, len(names))
+
+def test_replicates_drawing_only_dry_years_keep_the_rain_component(weather):
+    states = partial_states(weather)
+    # Every festival is wet in 2015, and festival 1 only then, so many replicates draw none of its rain days
+    wet_year = states['historical_year'] == 2015
+    states.loc[wet_year, 'rain_days'] = states.loc[wet_year, 'rain_days'].clip(lower=1)
+    dry = states['festival_name'].astype(str).eq('Synthetic Festival 1')
+    states.loc[dry & ~wet_year, 'rain_days'] = 0
+    names, year_counts, array = festival_year_states(states)
+    counts = year_draw_counts(np.random.default_rng(3), year_counts, 200, array.shape[1])
+    totals = np.einsum('rfy,fys->rfs', counts.astype('float64'), array)
+    scores = replicate_scores(totals, array[:, :, STATE_FIELDS.index('rain_days')].sum(axis=1) == 0)
+
+    rain_days = totals[:, :, STATE_FIELDS.index('rain_days')]
+    assert (rain_days == 0).any(axis=1).mean() > 0.3
+    for replicate in range(len(counts)):
+        days, _, temp_sum, temp_count, wind_sum, wind_count = totals[replicate].T
+        z = [zscore(np.round(temp_sum / temp_count, 2)), -zscore(np.round(rain_days[replicate] / days * 100, 2)),
+             -zscore(np.round(wind_sum / wind_count, 2))]
+        np.testing.assert_allclose(scores[replicate], np.round(np.mean(z, axis=0), 2), atol=1e-9)
+
+    # A festival that is never wet has no rain-day percentage, so rain is left out as in the summary
+    states.loc[dry, 'rain_days'] = 0
+    metrics = calculate_weather_scores(festival_metrics_from_states(states))
+    assert metrics['rain_z'].isna().all() and not metrics['weather_score'].isna().any()
+    names, year_counts, array = festival_year_states(states)
+    totals = np.einsum('rfy,fys->rfs', counts.astype('float64'), array)
+    scores = replicate_scores(totals, array[:, :, STATE_FIELDS.index('rain_days')].sum(axis=1) == 0)
+    temp_sum, temp_count, wind_sum, wind_count = np.moveaxis(totals[:, :, 2:], -1, 0)
+    z = [zscore(np.round(temp_sum[0] / temp_count[0], 2)), -zscore(np.round(wind_sum[0] / wind_count[0], 2))]
+    np.testing.assert_allclose(scores[0], np.round(np.mean(z, axis=0), 2), atol=1e-9)